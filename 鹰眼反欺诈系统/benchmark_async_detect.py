@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步检测性能测试脚本
+在独立进程中启动 uvicorn，用并发HTTP连接对比两种处理方式的尾延迟：
+- 改造前：async 处理函数内联调用同步 detect()
+- 改造后：await detect_async()
+
+用法:
+    python3 benchmark_async_detect.py --connections 200 --requests 10 --sink-ms 2
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+
+import httpx
+import numpy as np
+
+PORT = 5099
+
+
+def build_app(sink_ms: float):
+    """构建只包含两个检测接口的测试应用"""
+    from fastapi import FastAPI
+
+    try:
+        from core.fraud_detection_engine_lite import FraudDetectionEngine
+    except Exception:
+        from core.fraud_detection_engine import FraudDetectionEngine
+
+    engine = FraudDetectionEngine('config/config.yaml')
+
+    if sink_ms > 0 and not hasattr(engine, 'pg_conn'):
+        # 精简版引擎没有存储环节，用阻塞 sleep 模拟同步的 Redis/PostgreSQL/Kafka 写入
+        detect = engine.detect
+
+        def detect_with_sink(transaction, *args):
+            result = detect(transaction, *args)
+            time.sleep(sink_ms / 1000.0)
+            return result
+
+        engine.detect = detect_with_sink
+
+    app = FastAPI()
+
+    @app.post("/detect/sync")
+    async def detect_sync(transaction: dict):
+        return engine.detect(transaction).to_dict()
+
+    @app.post("/detect/async")
+    async def detect_async(transaction: dict):
+        result = await engine.detect_async(transaction)
+        return result.to_dict()
+
+    return app
+
+
+def serve(sink_ms: float):
+    """子进程入口：启动 uvicorn"""
+    import uvicorn
+
+    logging.disable(logging.WARNING)
+    uvicorn.run(build_app(sink_ms), host="127.0.0.1", port=PORT, log_level="error")
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    """等待服务启动"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("测试服务启动超时")
+
+
+async def run_mode(path: str, connections: int, requests: int) -> dict:
+    """connections 个并发连接，每个连接顺序发送 requests 个请求"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}",
+                                 limits=limits, timeout=60.0) as client:
+        await wait_ready(client)
+
+        async def connection(conn_id: int):
+            nonlocal errors
+            for seq in range(requests):
+                transaction = {
+                    'user_id': f'bench_user_{conn_id}',
+                    'item_id': f'item_{seq % 10}',
+                    'amount': float(np.random.uniform(10, 2000)),
+                    'timestamp': time.time(),
+                    'ip': f'10.0.{conn_id % 255}.{seq % 255}',
+                    'device_id': f'device_{conn_id}',
+                    'action': 'purchase'
+                }
+                start = time.perf_counter()
+                response = await client.post(path, json=transaction)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*[connection(i) for i in range(connections)])
+        wall = time.perf_counter() - wall_start
+
+    return {
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'throughput': len(latencies) / wall,
+        'errors': errors
+    }
+
+
+def print_result(title: str, stats: dict):
+    print(f"\n[{title}]")
+    print(f"  p50 延迟: {stats['p50']:.2f}ms")
+    print(f"  p99 延迟: {stats['p99']:.2f}ms")
+    print(f"  吞吐量: {stats['throughput']:.0f} req/s")
+    print(f"  失败请求: {stats['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步检测性能测试")
+    parser.add_argument('--connections', type=int, default=200, help="并发连接数")
+    parser.add_argument('--requests', type=int, default=10, help="每个连接的请求数")
+    parser.add_argument('--sink-ms', type=float, default=2.0,
+                        help="精简版引擎模拟的同步I/O耗时（毫秒，0表示不模拟）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⚡ 异步检测性能测试")
+    print("=" * 60)
+    print(f"并发连接: {args.connections}, 每连接请求: {args.requests}, "
+          f"模拟I/O: {args.sink_ms}ms")
+
+    server = multiprocessing.Process(target=serve, args=(args.sink_ms,), daemon=True)
+    server.start()
+    try:
+        before = asyncio.run(run_mode("/detect/sync", args.connections, args.requests))
+        after = asyncio.run(run_mode("/detect/async", args.connections, args.requests))
+    finally:
+        server.terminate()
+        server.join()
+
+    print_result("改造前: 处理函数内联 detect()", before)
+    print_result("改造后: await detect_async()", after)
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
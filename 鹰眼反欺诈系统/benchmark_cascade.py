@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+两级级联检测性能测试脚本
+用合成流量（正常交易为主，混入大额、高频、黑名单设备交易）对比：
+- 精简版单独评分
+- 完整版单独评分（全部阶段，不含落库）
+- 级联：精简版先评分，不确定区间内升级到完整版
+输出平均/p99 延迟、升级率与各级判定的风险等级分布
+
+完整版引擎不可用（未安装 torch）时只运行精简版，按 --full-ms 估算级联的平均延迟
+
+用法:
+    python3 benchmark_cascade.py --requests 5000
+    python3 benchmark_cascade.py --low 40 --high 85
+"""
+
+import argparse
+import logging
+import random
+import time
+from collections import Counter
+
+import numpy as np
+import yaml
+
+from core.extensions.cascade import CascadeDetectionEngine, in_uncertain_band
+from core.fraud_detection_engine_lite import FraudDetectionEngine
+
+CONFIG_PATH = 'config/config.yaml'
+
+
+def synthetic_traffic(count: int, seed: int):
+    """
+    合成交易流：85% 正常小额、8% 大额、5% 同一批用户高频操作、2% 黑名单设备
+    """
+    rng = random.Random(seed)
+    transactions = []
+    for i in range(count):
+        kind = rng.random()
+        transaction = {
+            'user_id': f'user_{rng.randrange(2000)}',
+            'item_id': f'item_{rng.randrange(500)}',
+            'amount': round(rng.uniform(10, 800), 2),
+            'ip': f'10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            'device_id': f'device_{rng.randrange(3000)}',
+            'action': 'purchase'
+        }
+        if kind < 0.08:
+            transaction['amount'] = round(rng.uniform(2000, 20000), 2)
+        elif kind < 0.13:
+            transaction['user_id'] = f'burst_{rng.randrange(5)}'
+        elif kind < 0.15:
+            transaction['device_id'] = f'blocked_{rng.randrange(10)}'
+        transactions.append(transaction)
+    return transactions
+
+
+def blacklist(engine):
+    for i in range(10):
+        engine.device_detector.add_to_blacklist(device_id=f'blocked_{i}')
+
+
+def run(detect, transactions):
+    """逐笔检测，返回 (结果列表, 每笔耗时ms)"""
+    results, latencies = [], []
+    for transaction in transactions:
+        start = time.perf_counter()
+        results.append(detect(transaction))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def report(name: str, latencies, results=None):
+    print(f"\n[{name}]")
+    print(f"  平均: {latencies.mean():.3f}ms, p50: {np.percentile(latencies, 50):.3f}ms, "
+          f"p99: {np.percentile(latencies, 99):.3f}ms")
+    if results is not None:
+        levels = Counter(r.risk_level.name for r in results)
+        print(f"  风险等级: {dict(sorted(levels.items()))}")
+
+
+def load_full_engine():
+    try:
+        from core.fraud_detection_engine import FraudDetectionEngine as FullDetectionEngine
+        return FullDetectionEngine(CONFIG_PATH), None
+    except Exception as e:
+        return None, e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两级级联检测性能测试")
+    parser.add_argument('--requests', type=int, default=5000, help="合成交易数")
+    parser.add_argument('--low', type=float, default=None, help="不确定区间下界（默认取配置）")
+    parser.add_argument('--high', type=float, default=None, help="不确定区间上界（默认取配置）")
+    parser.add_argument('--full-ms', type=float, default=20.0,
+                        help="完整版引擎不可用时，估算级联延迟使用的单笔GNN升级耗时")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        cascade_cfg = (yaml.safe_load(f) or {}).get('performance', {}).get('cascade', {})
+    low = args.low if args.low is not None else cascade_cfg.get('uncertain_low', 30.0)
+    high = args.high if args.high is not None else cascade_cfg.get('uncertain_high', 85.0)
+    
+    print("=" * 60)
+    print(f"🪜 两级级联检测性能测试（{args.requests} 笔合成交易，不确定区间 [{low:g}, {high:g})）")
+    print("=" * 60)
+    
+    transactions = synthetic_traffic(args.requests, args.seed)
+    warmup = synthetic_traffic(200, args.seed + 1)
+    
+    lite = FraudDetectionEngine(CONFIG_PATH)
+    blacklist(lite)
+    np.random.seed(args.seed)
+    run(lite.detect, warmup)
+    lite_results, lite_latencies = run(lite.detect, transactions)
+    report("精简版", lite_latencies, lite_results)
+    band_rate = sum(in_uncertain_band(r, low, high) for r in lite_results) / len(lite_results)
+    print(f"  落在不确定区间: {band_rate:.1%}")
+    
+    full, error = load_full_engine()
+    if full is None:
+        print(f"\n⚠️  完整版引擎不可用（{type(error).__name__}: {error}），跳过完整版与级联实测")
+        estimate = lite_latencies.mean() + band_rate * args.full_ms
+        print(f"\n[级联（估算）] 升级率 {band_rate:.1%}, 按单笔升级 {args.full_ms:g}ms 估算平均延迟 "
+              f"{estimate:.3f}ms（全部走完整版约 {args.full_ms + lite_latencies.mean():.3f}ms）")
+        lite.close()
+        return
+    
+    blacklist(full)
+    run(lambda t: full.score_with_stages(t, {}), warmup)
+    full_results, full_latencies = run(lambda t: full.score_with_stages(t, {}), transactions)
+    report("完整版（全部阶段，不含落库）", full_latencies, full_results)
+    
+    cascade = CascadeDetectionEngine(FraudDetectionEngine(CONFIG_PATH), full, low, high)
+    blacklist(cascade.lite)
+    np.random.seed(args.seed)
+    run(cascade.detect, warmup)
+    cascade.stats.update(total_requests=0, escalated=0, escalation_errors=0, avg_response_time=0.0)
+    cascade_results, cascade_latencies = run(cascade.detect, transactions)
+    report("级联", cascade_latencies, cascade_results)
+    stats = cascade.get_stats()
+    tiers = Counter(r.decision_tier for r in cascade_results)
+    print(f"  升级率: {stats['escalation_rate']:.1%}, 判定: {dict(tiers)}, "
+          f"升级失败: {stats['escalation_errors']}")
+    
+    print("\n" + "=" * 60)
+    print(f"级联平均延迟为完整版的 {cascade_latencies.mean() / full_latencies.mean():.1%}")
+    cascade.close()
+    lite.close()
+
+
+if __name__ == "__main__":
+    main()
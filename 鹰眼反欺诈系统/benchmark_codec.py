@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编解码性能测试脚本
+对比单笔请求的编解码开销：
+- 默认路径：Pydantic 校验 DetectionRequest + to_dict() + FastAPI 默认JSON编码，
+  Redis/Kafka 使用 json.dumps
+- 快速路径：FastCodec 直接解码请求字节、直接编码检测结果
+
+用法:
+    python3 benchmark_codec.py --iterations 50000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'core'))
+logging.disable(logging.WARNING)
+
+from fastapi.encoders import jsonable_encoder
+
+from api_server import DetectionRequest, _to_transaction
+from core.extensions.fast_codec import FastCodec, MSGSPEC_AVAILABLE, ORJSON_AVAILABLE
+from fraud_detection_engine_lite import DetectionResult, RiskLevel
+
+
+REQUEST_BODY = json.dumps({
+    'user_id': 'bench_user_001',
+    'item_id': 'item_042',
+    'amount': 1288.5,
+    'timestamp': time.time(),
+    'ip': '203.0.113.7',
+    'device_id': 'device_abc123',
+    'action': 'purchase',
+    'features': {'login_count': 3, 'channel': 'app'}
+}).encode('utf-8')
+
+
+def sample_result() -> DetectionResult:
+    """构造一个典型的检测结果（分数为 numpy 浮点数，与引擎输出一致）"""
+    return DetectionResult(
+        user_id='bench_user_001',
+        risk_score=np.float64(0.4375),
+        risk_level=RiskLevel.MEDIUM,
+        fraud_probability=np.float64(0.5),
+        detected_patterns=['VPN_PROXY', 'HIGH_AMOUNT'],
+        defense_layers_triggered=[2, 5],
+        timestamp=time.time(),
+        response_time_ms=1.83,
+        vpn_detected=True,
+        vpn_type='OpenVPN',
+        vpn_confidence=0.82
+    )
+
+
+def default_path(result: DetectionResult):
+    """默认路径：Pydantic + FastAPI 默认编码 + json.dumps 存储"""
+    transaction = _to_transaction(DetectionRequest.model_validate_json(REQUEST_BODY))
+    response = json.dumps(
+        jsonable_encoder(result.to_dict()),
+        ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode('utf-8')
+    stored = json.dumps(result.to_dict())
+    return transaction, response, stored
+
+
+def fast_path(codec: FastCodec, result: DetectionResult):
+    """快速路径：FastCodec 解码 + 编码，存储复用同一编码器"""
+    transaction = codec.decode_transaction(REQUEST_BODY)
+    response = codec.encode_result(result)
+    stored = codec.dumps(result.to_dict())
+    return transaction, response, stored
+
+
+def measure(fn, iterations: int) -> dict:
+    """返回每次调用的平均耗时与p99（微秒）"""
+    for _ in range(min(1000, iterations)):
+        fn()
+    
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples[i] = (time.perf_counter() - start) * 1e6
+    
+    return {
+        'mean': float(samples.mean()),
+        'p99': float(np.percentile(samples, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编解码性能测试")
+    parser.add_argument('--iterations', type=int, default=50000, help="每种路径的测试次数")
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print("⚡ 编解码性能测试（请求解码 + 响应编码 + 存储序列化）")
+    print("=" * 60)
+    
+    result = sample_result()
+    baseline = measure(lambda: default_path(result), args.iterations)
+    print(f"\n[默认路径: Pydantic + jsonable_encoder + json]")
+    print(f"  平均: {baseline['mean']:.2f}µs, p99: {baseline['p99']:.2f}µs")
+    
+    backends = [name for name, available in
+                (('msgspec', MSGSPEC_AVAILABLE), ('orjson', ORJSON_AVAILABLE)) if available]
+    if not backends:
+        print("\n⚠️  未安装 msgspec/orjson，无法测试快速路径")
+        return
+    
+    for backend in backends:
+        codec = FastCodec(backend)
+        # 两条路径的解码与编码结果应一致
+        fast_txn, fast_body, _ = fast_path(codec, result)
+        slow_txn, slow_body, _ = default_path(result)
+        assert fast_txn == slow_txn, f"{backend} 解码结果与默认路径不一致"
+        assert json.loads(fast_body) == json.loads(slow_body), f"{backend} 编码结果与默认路径不一致"
+        
+        stats = measure(lambda: fast_path(codec, result), args.iterations)
+        print(f"\n[快速路径: {backend}]")
+        print(f"  平均: {stats['mean']:.2f}µs, p99: {stats['p99']:.2f}µs, "
+              f"加速: {baseline['mean'] / stats['mean']:.1f}x")
+    
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
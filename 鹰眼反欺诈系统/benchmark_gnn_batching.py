@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 批量推理性能测试脚本（CPU）
+从合成交易流构建交易关系图，对同一组以用户为中心的子图分别按批次大小 1/8/32/128
+合并为不相交并图推理，输出每批耗时、每笔耗时、吞吐量，以及与第一个批次大小（默认逐笔）结果的最大偏差；
+随后测试节点嵌入缓存命中时的耗时（查表 + numpy 分类层）及其与完整前向传播的偏差；
+最后用多个线程并发提交单笔推理，验证 GNNInferenceBatcher 的合并效果
+
+需要 torch 与 torch_geometric
+
+用法:
+    python3 benchmark_gnn_batching.py --subgraphs 1024
+    python3 benchmark_gnn_batching.py --batch-sizes 1 8 32 128 256 --threads 1
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+
+from benchmark_graph_store import synthetic_traffic
+from core.extensions.embedding_cache import ClassifierHead, NodeEmbeddingCache
+from core.extensions.gnn_batching import GNNInferenceBatcher, predict_batched
+from core.extensions.graph_store import TransactionGraphStore
+
+
+def load_model():
+    try:
+        import torch
+        from core.fraud_detection_engine import GNN_INPUT_DIM, GraphNeuralNetworkDetector
+    except ImportError as e:
+        return None, None, e
+    model = GraphNeuralNetworkDetector(input_dim=GNN_INPUT_DIM, hidden_dim=64)
+    model.eval()
+    return torch, model, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GNN 批量推理性能测试")
+    parser.add_argument('--transactions', type=int, default=50000, help="写入关系图的合成交易数")
+    parser.add_argument('--subgraphs', type=int, default=1024, help="参与推理的子图数")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--threads', type=int, default=0, help="torch 线程数（0 为默认）")
+    parser.add_argument('--concurrency', type=int, default=32, help="并发提交测试的线程数")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    print("=" * 60)
+    print(f"🧮 GNN 批量推理性能测试（{args.subgraphs} 个子图，CPU）")
+    print("=" * 60)
+    
+    torch, model, error = load_model()
+    if model is None:
+        print(f"\n⚠️  torch / torch_geometric 不可用（{type(error).__name__}: {error}），无法测试")
+        return
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    print(f"torch {torch.__version__}, 线程数 {torch.get_num_threads()}")
+    
+    def infer(x, edge_index, edge_weight):
+        with torch.no_grad():
+            output = model(torch.from_numpy(x), torch.from_numpy(edge_index), torch.from_numpy(edge_weight))
+            return torch.exp(output)[:, 1].numpy()
+    
+    def embed(x, edge_index, edge_weight):
+        with torch.no_grad():
+            return model.embed(torch.from_numpy(x), torch.from_numpy(edge_index),
+                               torch.from_numpy(edge_weight)).numpy()
+    
+    store = TransactionGraphStore()
+    transactions = synthetic_traffic(args.transactions, 20000, args.seed)
+    for transaction in transactions:
+        store.append(transaction)
+    subgraphs = [store.sample(transaction) for transaction in transactions[-args.subgraphs:]]
+    print(f"子图平均 {np.mean([len(s.x) for s in subgraphs]):.1f} 个节点")
+    
+    # 预热
+    predict_batched(infer, subgraphs[:64], 8)
+    reference = None
+    baseline = None
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        probs = predict_batched(infer, subgraphs, batch_size)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = np.array(probs)
+        per_item_ms = elapsed * 1000 / len(subgraphs)
+        batches = -(-len(subgraphs) // batch_size)
+        baseline = baseline or per_item_ms
+        print(f"\n[batch={batch_size}] 每批 {elapsed * 1000 / batches:.2f}ms, 每笔 {per_item_ms:.3f}ms, "
+              f"吞吐 {len(subgraphs) / elapsed:.0f} 笔/s, 加速 {baseline / per_item_ms:.1f}x")
+        print(f"  与 batch={args.batch_sizes[0]} 结果的最大偏差: {np.abs(np.array(probs) - reference).max():.2e}")
+    
+    # 嵌入缓存命中：查表后只计算分类层
+    head = ClassifierHead.from_linear([model.fc1, model.fc2])
+    cache = NodeEmbeddingCache(model.fc1.in_features, max_entries=len(subgraphs))
+    cache.set_model_version('benchmark')
+    embeddings = predict_batched(embed, subgraphs, 32)
+    for i, (subgraph, embedding) in enumerate(zip(subgraphs, embeddings)):
+        cache.put((0, str(i)), subgraph.version, embedding, 'benchmark')
+    start = time.perf_counter()
+    cached_probs = [head.predict(cache.get((0, str(i)), subgraph.version)[None])[0]
+                    for i, subgraph in enumerate(subgraphs)]
+    elapsed = time.perf_counter() - start
+    per_item_ms = elapsed * 1000 / len(subgraphs)
+    print(f"\n[嵌入缓存命中] 每笔 {per_item_ms:.3f}ms, 比逐笔推理快 {baseline / per_item_ms:.0f}x")
+    print(f"  与完整前向传播结果的最大偏差: {np.abs(np.array(cached_probs) - reference).max():.2e}")
+    
+    # 并发单笔请求经批处理器合并
+    batcher = GNNInferenceBatcher(infer, max_batch_size=max(args.batch_sizes), max_wait_ms=1.0)
+    latencies = [[] for _ in range(args.concurrency)]
+    
+    def client(k):
+        for i in range(k, len(subgraphs), args.concurrency):
+            t = time.perf_counter()
+            batcher.predict(subgraphs[i])
+            latencies[k].append((time.perf_counter() - t) * 1000)
+    
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    all_latencies = np.concatenate([np.array(l) for l in latencies if l])
+    stats = batcher.get_stats()
+    batcher.close()
+    print(f"\n[并发 {args.concurrency} 线程，批处理器] 吞吐 {len(subgraphs) / elapsed:.0f} 笔/s, "
+          f"p50 {np.percentile(all_latencies, 50):.2f}ms, p99 {np.percentile(all_latencies, 99):.2f}ms, "
+          f"平均批次 {stats['avg_batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易关系图性能测试脚本
+用合成交易流（用户活跃度服从 Zipf 分布、少量共享出口IP）写入关系图，输出：
+- 单笔追加耗时（含摊还的 CSR 重建）
+- 以用户为中心的 k 跳采样耗时（安装 torch_geometric 时含构建 Data 对象）
+- 子图规模、节点/边数量与数组内存
+
+用法:
+    python3 benchmark_graph_store.py --transactions 200000
+    python3 benchmark_graph_store.py --fanout 15 10 --max-edges 500000
+"""
+
+import argparse
+import gc
+import logging
+import random
+import time
+
+import numpy as np
+
+from core.extensions.graph_store import TransactionGraphStore
+
+
+def synthetic_traffic(count: int, users: int, seed: int):
+    """合成交易流：用户按 Zipf 分布活跃，5% 的交易来自 20 个共享出口IP"""
+    rng = random.Random(seed)
+    ranks = np.minimum(np.random.default_rng(seed).zipf(1.3, count), users)
+    transactions = []
+    for rank in ranks.tolist():
+        transactions.append({
+            'user_id': f'user_{rank}',
+            'item_id': f'item_{rng.randrange(5000)}',
+            'device_id': f'device_{rank}_{rng.randrange(3)}',
+            'ip': (f'nat_{rng.randrange(20)}' if rng.random() < 0.05
+                   else f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rank % 250}'),
+            'amount': round(rng.uniform(10, 800), 2)
+        })
+    return transactions
+
+
+def load_data_class():
+    try:
+        import torch
+        from torch_geometric.data import Data
+        return torch, Data
+    except ImportError:
+        return None, None
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies)
+    return (f"平均 {latencies.mean() * 1000:.1f}us, p50 {np.percentile(latencies, 50) * 1000:.1f}us, "
+            f"p99 {np.percentile(latencies, 99) * 1000:.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="交易关系图性能测试")
+    parser.add_argument('--transactions', type=int, default=200000, help="写入的合成交易数")
+    parser.add_argument('--users', type=int, default=50000, help="用户数")
+    parser.add_argument('--samples', type=int, default=2000, help="采样次数")
+    parser.add_argument('--hops', type=int, default=2)
+    parser.add_argument('--fanout', type=int, nargs='+', default=[10, 5])
+    parser.add_argument('--max-edges', type=int, default=2000000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    print("=" * 60)
+    print(f"🕸️  交易关系图性能测试（{args.transactions} 笔交易，{args.hops} 跳，fanout {args.fanout}）")
+    print("=" * 60)
+    
+    transactions = synthetic_traffic(args.transactions, args.users, args.seed)
+    # 合成交易本身不参与垃圾回收扫描，避免把测试数据的 GC 停顿计入追加耗时
+    gc.collect()
+    gc.freeze()
+    store = TransactionGraphStore(hops=args.hops, fanout=args.fanout, max_edges=args.max_edges)
+    
+    append_latencies = []
+    for transaction in transactions:
+        start = time.perf_counter()
+        store.append(transaction)
+        append_latencies.append((time.perf_counter() - start) * 1000)
+    stats = store.get_stats()
+    print(f"\n[追加] {percentiles(append_latencies)}, 最大 {max(append_latencies):.1f}ms（含 GC 停顿）")
+    print(f"  节点 {stats['nodes']}, 边 {stats['edges']}, 重建 {stats['compactions']} 次, "
+          f"淘汰边 {stats['evicted_edges']}, 数组内存 {stats['array_bytes'] / 1024 / 1024:.1f}MB")
+    
+    rng = random.Random(args.seed)
+    queries = [rng.choice(transactions) for _ in range(args.samples)]
+    sample_latencies, sizes = [], []
+    for transaction in queries:
+        start = time.perf_counter()
+        subgraph = store.sample(transaction)
+        sample_latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append((len(subgraph.x), subgraph.edge_index.shape[1]))
+    nodes, edges = np.array(sizes).mean(axis=0)
+    print(f"\n[采样] {percentiles(sample_latencies)}")
+    print(f"  子图平均 {nodes:.1f} 个节点, {edges:.1f} 条边（双向）")
+    
+    torch, Data = load_data_class()
+    if Data is None:
+        print("\n⚠️  未安装 torch_geometric，跳过 Data 对象构建")
+        return
+    data_latencies = []
+    for transaction in queries:
+        start = time.perf_counter()
+        subgraph = store.sample(transaction)
+        Data(x=torch.from_numpy(subgraph.x), edge_index=torch.from_numpy(subgraph.edge_index),
+             edge_weight=torch.from_numpy(subgraph.edge_weight))
+        data_latencies.append((time.perf_counter() - start) * 1000)
+    print(f"\n[采样 + 构建 Data] {percentiles(data_latencies)}")
+
+
+if __name__ == "__main__":
+    main()
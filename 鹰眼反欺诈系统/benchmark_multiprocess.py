@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程扩展性测试脚本
+依次以 1..N 个 uvicorn worker 启动 API 服务（检测状态统一存放在 Redis），
+用多个客户端进程施压，输出吞吐量、延迟和相对单 worker 的加速比；
+每轮结束后对同一用户连续发送请求，验证跨 worker 的频率检测是否一致
+
+需要可访问的 Redis（REDIS_HOST / REDIS_PORT，默认 localhost:6379）
+
+用法:
+    python3 benchmark_multiprocess.py --max-workers 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+PORT = 5098
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def start_server(workers: int) -> subprocess.Popen:
+    """以指定 worker 数启动 API 服务"""
+    env = dict(os.environ, API_WORKERS=str(workers), API_STATE_STORE='redis')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api_server:app',
+         '--app-dir', 'core', '--host', '127.0.0.1', '--port', str(PORT),
+         '--workers', str(workers), '--log-level', 'error'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(timeout: float = 60.0):
+    """等待服务启动"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{BASE_URL}/health", timeout=1.0).json().get('status') == 'healthy':
+                return
+        except Exception:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("测试服务启动超时")
+
+
+def client_process(client_id: int, connections: int, duration: float, queue):
+    """客户端进程：connections 个并发连接持续发送请求 duration 秒"""
+    
+    async def run():
+        latencies = []
+        errors = 0
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        deadline = time.perf_counter() + duration
+        
+        async with httpx.AsyncClient(base_url=BASE_URL, limits=limits, timeout=30.0) as client:
+            async def connection(conn_id: int):
+                nonlocal errors
+                seq = 0
+                while time.perf_counter() < deadline:
+                    transaction = {
+                        'user_id': f'bench_user_{client_id}_{conn_id}',
+                        'item_id': f'item_{seq % 10}',
+                        'amount': float(np.random.uniform(10, 2000)),
+                        'ip': f'10.{client_id}.{conn_id % 255}.{seq % 255}',
+                        'device_id': f'device_{client_id}_{conn_id}',
+                        'action': 'purchase'
+                    }
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post('/detect', json=transaction)
+                        if response.status_code != 200:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    seq += 1
+            
+            await asyncio.gather(*[connection(i) for i in range(connections)])
+        
+        return latencies, errors
+    
+    queue.put(asyncio.run(run()))
+
+
+def run_load(clients: int, connections: int, duration: float) -> dict:
+    """启动多个客户端进程并汇总结果"""
+    queue = multiprocessing.Queue()
+    per_client = max(1, connections // clients)
+    procs = [
+        multiprocessing.Process(target=client_process, args=(i, per_client, duration, queue))
+        for i in range(clients)
+    ]
+    wall_start = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    results = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = time.perf_counter() - wall_start
+    
+    latencies = np.concatenate([np.asarray(lat) for lat, _ in results if lat])
+    return {
+        'throughput': len(latencies) / wall,
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'errors': sum(err for _, err in results)
+    }
+
+
+def check_consistency(requests: int = 110) -> bool:
+    """同一用户的请求分散到各 worker，超过频率上限后应触发高频告警"""
+    user_id = f'consistency_{uuid.uuid4().hex[:8]}'
+    patterns = []
+    with httpx.Client(base_url=BASE_URL, timeout=30.0) as client:
+        for i in range(requests):
+            # 每个请求新建连接，让请求分散到不同 worker
+            response = client.post('/detect', json={'user_id': user_id, 'ip': '10.9.9.9',
+                                                    'device_id': f'consistency_device_{i}'},
+                                    headers={'Connection': 'close'})
+            patterns = response.json().get('detected_patterns', [])
+    return "高频操作异常" in patterns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程扩展性测试")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="最大 worker 数")
+    parser.add_argument('--clients', type=int, default=2, help="客户端进程数")
+    parser.add_argument('--connections', type=int, default=64, help="总并发连接数")
+    parser.add_argument('--duration', type=float, default=10.0, help="每轮施压时长（秒）")
+    args = parser.parse_args()
+    
+    try:
+        import redis
+        redis.Redis(host=os.getenv('REDIS_HOST', 'localhost'),
+                    port=int(os.getenv('REDIS_PORT', 6379))).ping()
+    except Exception as e:
+        print(f"❌ 无法连接 Redis（REDIS_HOST/REDIS_PORT）: {e}")
+        return
+    
+    print("=" * 72)
+    print("⚡ 多进程扩展性测试")
+    print("=" * 72)
+    print(f"CPU核数: {os.cpu_count()}, 客户端进程: {args.clients}, "
+          f"并发连接: {args.connections}, 每轮: {args.duration}s")
+    
+    rows = []
+    for workers in range(1, args.max_workers + 1):
+        server = start_server(workers)
+        try:
+            wait_ready()
+            stats = run_load(args.clients, args.connections, args.duration)
+            stats['consistent'] = check_consistency()
+        finally:
+            server.terminate()
+            server.wait()
+        rows.append((workers, stats))
+        print(f"  workers={workers}: {stats['throughput']:.0f} req/s")
+    
+    base = rows[0][1]['throughput']
+    print(f"\n{'workers':>8} {'req/s':>10} {'加速比':>8} {'效率':>8} "
+          f"{'p50(ms)':>10} {'p99(ms)':>10} {'失败':>6} {'状态一致':>8}")
+    for workers, stats in rows:
+        speedup = stats['throughput'] / base if base > 0 else 0
+        print(f"{workers:>8} {stats['throughput']:>10.0f} {speedup:>8.2f} "
+              f"{speedup / workers:>8.0%} {stats['p50']:>10.2f} {stats['p99']:>10.2f} "
+              f"{stats['errors']:>6} {'✅' if stats['consistent'] else '❌':>8}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN int8 量化评估脚本（CPU）
+在留出集上比较 float 模型与动态 int8 量化模型（detection.model.runtime.backend: int8），输出：
+- 精度变化：欺诈概率偏差（平均 / p99 / 最大）、各风险阈值下判定一致率；
+  留出集带标签时另外输出两者的准确率与 AUC
+- 权重内存（序列化后的 state_dict 大小）
+- 逐笔推理耗时与按 --batch-size 合并为不相交并图时的吞吐量
+
+留出集为 JSONL（每行一笔交易，is_fraud 为 0/1 标签），按顺序写入关系图并采样以用户为中心的子图；
+未指定时用合成交易流：前 80% 只写入关系图，后 20% 作为留出集（无标签）。
+需要 torch 与 torch_geometric
+
+用法:
+    python3 benchmark_quantization.py --threads 1
+    python3 benchmark_quantization.py --holdout data/holdout.jsonl
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+import yaml
+
+from benchmark_graph_store import synthetic_traffic
+from core.extensions.gnn_batching import merge_subgraphs
+from core.extensions.graph_store import TransactionGraphStore
+
+
+def auc(labels: np.ndarray, scores: np.ndarray) -> float:
+    """ROC AUC（秩和法，并列取平均秩）"""
+    positives = labels == 1
+    n_pos, n_neg = int(positives.sum()), int((~positives).sum())
+    if n_pos == 0 or n_neg == 0:
+        return float('nan')
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    return float((ranks[positives].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def load_holdout(path, feature_dim, limit):
+    """按顺序写入关系图并采样留出集子图，返回 (子图列表, 标签或 None)"""
+    store = TransactionGraphStore(feature_dim=feature_dim)
+    subgraphs, labels = [], []
+    if path:
+        with open(path, encoding='utf-8') as f:
+            transactions = [json.loads(line) for line in f if line.strip()][-limit:]
+        for transaction in transactions:
+            store.append(transaction)
+            subgraphs.append(store.sample(transaction))
+            labels.append(int(transaction.get('is_fraud', 0)))
+        return subgraphs, np.array(labels)
+    
+    transactions = synthetic_traffic(limit * 5, 20000, seed=13)
+    split = len(transactions) - limit
+    for transaction in transactions[:split]:
+        store.append(transaction)
+    for transaction in transactions[split:]:
+        store.append(transaction)
+        subgraphs.append(store.sample(transaction))
+    return subgraphs, None
+
+
+def fraud_probabilities(runtime, subgraphs):
+    return np.array([np.exp(runtime.run(s.x, s.edge_index, s.edge_weight)[1][s.center, 1]) for s in subgraphs])
+
+
+def timing(runtime, subgraphs, batch_size):
+    """逐笔 p50 耗时（毫秒）与批量吞吐（笔/秒）"""
+    for subgraph in subgraphs[:32]:
+        runtime.run(subgraph.x, subgraph.edge_index, subgraph.edge_weight)
+    latencies = []
+    for subgraph in subgraphs:
+        start = time.perf_counter()
+        runtime.run(subgraph.x, subgraph.edge_index, subgraph.edge_weight)
+        latencies.append((time.perf_counter() - start) * 1000)
+    batches = [merge_subgraphs(subgraphs[i:i + batch_size]) for i in range(0, len(subgraphs), batch_size)]
+    start = time.perf_counter()
+    for x, edge_index, edge_weight, _ in batches:
+        runtime.run(x, edge_index, edge_weight)
+    return float(np.percentile(latencies, 50)), len(subgraphs) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GNN int8 量化评估")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--holdout', help="带 is_fraud 标签的留出集 JSONL")
+    parser.add_argument('--limit', type=int, default=2000, help="留出集交易数上限")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=1, help="算子内线程数（0 为默认）")
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    print("=" * 60)
+    print("🔢 GNN int8 量化评估（CPU）")
+    print("=" * 60)
+    try:
+        import torch
+        from core.extensions import model_runtime
+        from core.fraud_detection_engine import GNN_INPUT_DIM, GraphNeuralNetworkDetector
+    except ImportError as e:
+        print(f"\n⚠️  torch / torch_geometric 不可用（{type(e).__name__}: {e}），无法测试")
+        return
+    
+    with open(args.config, encoding='utf-8') as f:
+        detection_cfg = (yaml.safe_load(f) or {}).get('detection', {})
+    model_cfg = detection_cfg.get('model', {})
+    model = GraphNeuralNetworkDetector(input_dim=GNN_INPUT_DIM, hidden_dim=model_cfg.get('hidden_dim', 64),
+                                       output_dim=model_cfg.get('output_dim', 2))
+    weights_path = model_cfg.get('gnn_model', 'models/gnn_detector.pt')
+    if not model_runtime.load_weights(model, weights_path):
+        print(f"⚠️  未找到训练权重 {weights_path}，使用随机初始化的权重（精度结论不代表线上模型）")
+    model_runtime.configure_threads(args.threads, 1)
+    float_runtime = model_runtime.EagerRuntime(model)
+    int8_runtime = model_runtime.QuantizedRuntime(model)
+    
+    subgraphs, labels = load_holdout(args.holdout, GNN_INPUT_DIM, args.limit)
+    print(f"留出集 {len(subgraphs)} 笔（{'带标签' if labels is not None else '合成，无标签'}），"
+          f"子图平均 {np.mean([len(s.x) for s in subgraphs]):.1f} 个节点")
+    
+    float_probs = fraud_probabilities(float_runtime, subgraphs)
+    int8_probs = fraud_probabilities(int8_runtime, subgraphs)
+    delta = np.abs(int8_probs - float_probs)
+    print(f"\n[精度] 欺诈概率偏差 平均 {delta.mean():.2e}, p99 {np.percentile(delta, 99):.2e}, 最大 {delta.max():.2e}")
+    for level, threshold in detection_cfg.get('threshold', {'high': 0.85}).items():
+        agreement = np.mean((float_probs >= threshold) == (int8_probs >= threshold))
+        print(f"  阈值 {level}={threshold}: 判定一致率 {agreement:.2%}")
+    if labels is not None:
+        for name, probs in (('float', float_probs), ('int8', int8_probs)):
+            print(f"  {name}: 准确率 {np.mean((probs >= 0.5) == labels):.4f}, AUC {auc(labels, probs):.4f}")
+        print(f"  AUC 变化 {auc(labels, int8_probs) - auc(labels, float_probs):+.4f}")
+    
+    float_bytes = model_runtime.state_dict_bytes(float_runtime.model)
+    int8_bytes = model_runtime.state_dict_bytes(int8_runtime.model)
+    print(f"\n[内存] 权重 float {float_bytes / 1024:.1f}KB → int8 {int8_bytes / 1024:.1f}KB "
+          f"({float_bytes / int8_bytes:.1f}x)")
+    
+    print(f"\n[性能] torch {torch.__version__}, 算子内线程 {torch.get_num_threads()}")
+    baseline = None
+    for runtime in (float_runtime, int8_runtime):
+        p50, throughput = timing(runtime, subgraphs, args.batch_size)
+        baseline = baseline or (p50, throughput)
+        print(f"  {runtime.backend}: 逐笔 p50 {p50:.3f}ms（{baseline[0] / p50:.2f}x）, "
+              f"batch={args.batch_size} 吞吐 {throughput:.0f} 笔/s（{throughput / baseline[1]:.2f}x）")
+
+
+if __name__ == "__main__":
+    main()
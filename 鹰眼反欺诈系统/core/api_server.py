@@ -5,18 +5,19 @@ FastAPI Web服务器
 提供实时反欺诈检测API
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import uvicorn
+import asyncio
 import logging
-try:
-    from fraud_detection_engine_lite import FraudDetectionEngine
-    logger.info("使用精简版检测引擎（无深度学习依赖）")
-except:
-    from fraud_detection_engine import FraudDetectionEngine
-    logger.info("使用完整版检测引擎")
+import json
+import os
+import socket
+import sys
 import time
 
 # 配置日志
@@ -26,6 +27,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 以 `python core/api_server.py` 启动时（Dockerfile CMD）sys.path 中只有 core/，
+# 加入项目根目录，引擎与扩展功能的 core.extensions 导入才能生效
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+try:
+    from fraud_detection_engine_lite import FraudDetectionEngine
+    logger.info("使用精简版检测引擎（无深度学习依赖）")
+except:
+    from fraud_detection_engine import FraudDetectionEngine
+    logger.info("使用完整版检测引擎")
+
 # 创建FastAPI应用
 app = FastAPI(
     title="鹰眼反欺诈API",
@@ -45,6 +59,42 @@ app.add_middleware(
 # 全局检测引擎实例
 detection_engine: Optional[FraudDetectionEngine] = None
 
+# 微批处理器（performance.micro_batch.enabled 开启时创建）
+micro_batcher = None
+
+# 准入控制器（performance.admission.enabled 开启时创建）
+admission_controller = None
+
+# 批量检测引擎（/detect/batch 使用）
+batch_engine = None
+
+# 快速编解码器（performance.fast_codec.enabled 开启且 msgspec/orjson 可用时创建）
+codec = None
+
+# 监控指标（performance.metrics.enabled 开启时与检测引擎共享）
+metrics = None
+
+# 幂等结果缓存（performance.idempotency.enabled 开启时创建）
+idempotency_cache = None
+
+# 多 worker 部署时定期发布本进程统计的后台任务
+stats_publisher = None
+
+# 本 worker 的标识（多进程统计汇总使用）
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    边读请求体边输出的流式响应
+    
+    StreamingResponse 会另起任务监听客户端断开并消费 receive()，
+    与读取请求体冲突；这里由读取请求体的一方感知断开
+    """
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
 
 class DetectionRequest(BaseModel):
     user_id: str
@@ -69,6 +119,218 @@ async def startup_event():
         logger.error(f"❌ 检测引擎初始化失败: {e}")
         # 即使失败也启动服务，但检测会返回错误
         detection_engine = None
+        return
+    
+    _init_cascade()
+    _init_failover()
+    _init_codec()
+    _init_idempotency_cache()
+    _init_admission_controller()
+    await _init_micro_batcher()
+    _init_batch_engine()
+    _init_metrics()
+    _init_stats_publisher()
+
+
+def _init_cascade():
+    """按配置启用两级级联检测：精简版先评分，不确定的交易升级到完整版GNN推理"""
+    global detection_engine
+    cascade_cfg = detection_engine.config.get('performance', {}).get('cascade', {})
+    if not cascade_cfg.get('enabled', False):
+        return
+    if not hasattr(detection_engine, 'detect_staged'):
+        logger.warning("级联检测需要精简版引擎作为第一级，使用单一引擎")
+        return
+    try:
+        from core.extensions.cascade import CascadeDetectionEngine
+        detection_engine = CascadeDetectionEngine.from_config(detection_engine, 'config/config.yaml')
+    except Exception as e:
+        logger.error(f"级联检测初始化失败（完整版引擎不可用），仅使用精简版引擎: {e}")
+
+
+def _init_failover():
+    """按配置启用引擎故障切换：完整版超出延迟 SLO 时切换到精简版，恢复后切回"""
+    global detection_engine
+    failover_cfg = detection_engine.config.get('performance', {}).get('failover', {})
+    if not failover_cfg.get('enabled', False):
+        return
+    if not hasattr(detection_engine, 'lite') and not hasattr(detection_engine, 'detect_staged'):
+        logger.warning("故障切换需要精简版引擎作为降级引擎，使用单一引擎")
+        return
+    try:
+        from core.extensions.engine_supervisor import EngineSupervisor
+        detection_engine = EngineSupervisor.from_config(detection_engine, 'config/config.yaml')
+    except Exception as e:
+        logger.error(f"故障切换初始化失败（完整版引擎不可用），仅使用精简版引擎: {e}")
+
+
+def _init_codec():
+    """按配置启用快速编解码"""
+    global codec
+    perf_cfg = detection_engine.config.get('performance', {})
+    try:
+        from core.extensions.fast_codec import FastCodec
+        codec = FastCodec.from_config(perf_cfg)
+    except Exception as e:
+        logger.warning(f"快速编解码初始化失败，使用默认编解码: {e}")
+        codec = None
+
+
+def _init_idempotency_cache():
+    """按配置启用 /detect 幂等结果缓存"""
+    global idempotency_cache
+    perf_cfg = detection_engine.config.get('performance', {})
+    idem_cfg = perf_cfg.get('idempotency', {})
+    if not idem_cfg.get('enabled', False):
+        return
+    
+    try:
+        from core.extensions.idempotency import IdempotencyCache
+        backend = idem_cfg.get('backend', 'auto')
+        store = _shared_state_store()
+        redis_client = None
+        if backend == 'redis' and store is None:
+            from core.extensions.shared_state import RedisStateStore
+            store = RedisStateStore.from_config(detection_engine.config)
+        if backend != 'local' and store is not None:
+            redis_client = store.client
+        idempotency_cache = IdempotencyCache.from_config(idem_cfg, redis_client)
+        logger.info(f"幂等结果缓存已启用: ttl={idempotency_cache.ttl}s, "
+                    f"backend={idempotency_cache.get_stats()['backend']}")
+    except Exception as e:
+        logger.warning(f"幂等结果缓存初始化失败: {e}")
+        idempotency_cache = None
+
+
+def _init_admission_controller():
+    """按配置启用准入控制与过载保护"""
+    global admission_controller
+    perf_cfg = detection_engine.config.get('performance', {})
+    if not perf_cfg.get('admission', {}).get('enabled', False):
+        return
+    
+    try:
+        from core.extensions.admission_control import AdmissionController
+        admission_controller = AdmissionController.from_config(perf_cfg)
+        logger.info(f"准入控制已启用: 在途上限={admission_controller.max_limit}, "
+                    f"队列上限={admission_controller.max_queue}")
+    except Exception as e:
+        logger.warning(f"准入控制初始化失败: {e}")
+        admission_controller = None
+
+
+async def _init_micro_batcher():
+    """按配置启用 /detect 微批处理"""
+    global micro_batcher
+    perf_cfg = detection_engine.config.get('performance', {})
+    batch_cfg = perf_cfg.get('micro_batch', {})
+    if not batch_cfg.get('enabled', False):
+        return
+    
+    try:
+        from core.extensions.micro_batcher import MicroBatcher
+        micro_batcher = MicroBatcher(
+            detection_engine.detect_batch,
+            max_batch_size=perf_cfg.get('batch_size', 64),
+            max_wait_ms=batch_cfg.get('max_wait_ms', 2)
+        )
+        await micro_batcher.start()
+    except Exception as e:
+        logger.warning(f"微批处理初始化失败，使用逐笔检测: {e}")
+        micro_batcher = None
+
+
+def _init_batch_engine():
+    """初始化 /detect/batch 使用的批量检测引擎"""
+    global batch_engine
+    perf_cfg = detection_engine.config.get('performance', {})
+    try:
+        from core.extensions.batch_detection import BatchDetectionEngine
+        batch_engine = BatchDetectionEngine(
+            detection_engine,
+            max_workers=perf_cfg.get('batch_workers', 4)
+        )
+    except Exception as e:
+        logger.warning(f"批量检测引擎初始化失败: {e}")
+        batch_engine = None
+
+
+def _init_metrics():
+    """注册 /metrics 的队列深度指标"""
+    global metrics
+    metrics = getattr(detection_engine, 'metrics', None)
+    if metrics is None:
+        return
+    
+    def queue_depth():
+        depth = {}
+        if admission_controller is not None:
+            depth[('admission',)] = admission_controller.get_stats()['queue_depth']
+        if micro_batcher is not None:
+            depth[('micro_batch',)] = micro_batcher.get_stats()['queue_depth']
+        return depth
+    
+    metrics.gauge('fraud_queue_depth', '等待处理的请求数', queue_depth, ('queue',))
+    metrics.gauge(
+        'fraud_requests_in_flight', '准入控制放行、正在处理的请求数',
+        lambda: admission_controller.get_stats()['in_flight'] if admission_controller else 0
+    )
+    metrics.gauge(
+        'fraud_admission_limit', '准入控制当前并发上限',
+        lambda: admission_controller.get_stats()['limit'] if admission_controller else 0
+    )
+    
+    try:
+        from core.extensions.circuit_breaker import STATE_VALUES, breaker_states
+        metrics.gauge(
+            'fraud_circuit_state', '依赖熔断器状态（0=关闭，1=半开，2=打开）',
+            lambda: {(name,): STATE_VALUES[state['state']] for name, state in breaker_states().items()},
+            ('dependency',)
+        )
+    except Exception as e:
+        logger.warning(f"熔断器指标注册失败: {e}")
+    
+    if hasattr(detection_engine, 'mode'):
+        metrics.gauge(
+            'fraud_engine_mode', '当前检测模式（1=完整版，0=精简版降级）',
+            lambda: int(detection_engine.mode == 'full')
+        )
+
+
+def _shared_state_store():
+    """多 worker 共享的状态存储，单进程部署时返回 None"""
+    store = getattr(detection_engine, 'state_store', None)
+    return store if getattr(store, 'shared', False) else None
+
+
+def _init_stats_publisher():
+    """多 worker 部署时定期发布本进程统计与指标，供 /stats、/metrics 汇总"""
+    global stats_publisher
+    store = _shared_state_store()
+    if store is None:
+        return
+    
+    async def publish_loop(interval: float = 1.0):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, store.publish_stats, WORKER_ID, detection_engine.get_stats())
+            if metrics is not None:
+                await loop.run_in_executor(None, store.publish_metrics, WORKER_ID, metrics.collect())
+            await asyncio.sleep(interval)
+    
+    stats_publisher = asyncio.create_task(publish_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时处理完微批队列，写完缓冲中的检测结果"""
+    if stats_publisher is not None:
+        stats_publisher.cancel()
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+    close = getattr(detection_engine, 'close', None)
+    if close is not None:
+        await asyncio.get_running_loop().run_in_executor(None, close)
 
 
 @app.get("/")
@@ -89,35 +351,161 @@ async def health_check():
             "status": "unhealthy",
             "error": "Detection engine not initialized"
         }
-    return {
-        "status": "healthy",
-        "service": "python_engine"
+    dependencies = _dependency_states()
+    # 需要共享状态却回退到进程内存储时，各 worker 只按自己的部分流量执行频率与设备规则
+    state_store_error = getattr(getattr(detection_engine, 'state_store', None), 'degraded_reason', None)
+    health = {
+        # 依赖熔断时引擎仍可检测（跳过该依赖），状态为 degraded
+        "status": "degraded" if (state_store_error or any(state != 'closed' for state in dependencies.values()))
+                  else "healthy",
+        "service": "python_engine",
+        "worker": WORKER_ID,
+        "state_store": "redis" if _shared_state_store() is not None else "local",
+        "dependencies": dependencies
     }
+    if state_store_error:
+        health["state_store_error"] = state_store_error
+    return health
+
+
+def _dependency_states() -> Dict[str, str]:
+    """各依赖的熔断器状态（closed / half_open / open）"""
+    try:
+        from core.extensions.circuit_breaker import breaker_states
+    except ImportError:
+        return {}
+    return {name: state['state'] for name, state in breaker_states().items()}
 
 
-@app.post("/detect")
-async def detect(request: DetectionRequest):
+@app.post("/detect", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": DetectionRequest.model_json_schema()}}
+    }
+})
+async def detect(request: Request):
     """实时欺诈检测接口"""
+    status = 200
+    try:
+        return await _handle_detect(request)
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        if metrics is not None:
+            metrics.count_request('/detect', status)
+
+
+async def _handle_detect(request: Request):
+    """解码、准入控制并执行检测"""
     if detection_engine is None:
         raise HTTPException(status_code=503, detail="Detection engine not available")
     
+    transaction = await _decode_transaction(request)
+    
+    if idempotency_cache is None:
+        return await _admit_detection(transaction)
+    
+    body, replayed = await _detect_body(transaction, request.headers.get('Idempotency-Key'))
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _detect_body(transaction: Dict[str, Any],
+                       idempotency_key: Optional[str] = None) -> Tuple[bytes, bool]:
+    """
+    执行检测并返回响应字节
+    
+    启用幂等缓存时，重试请求直接返回首次检测的响应，并发的重复请求只检测一次
+    
+    Returns:
+        (响应字节, 是否为重放结果)
+    """
+    if idempotency_cache is None:
+        return _response_bytes(await _admit_detection(transaction)), False
+    
+    from core.extensions.idempotency import IdempotencyConflict
+    key = idempotency_cache.make_key(transaction, idempotency_key)
+    # 客户端键需校验请求内容；交易字段哈希键本身已包含内容
+    fingerprint = idempotency_cache.make_fingerprint(transaction) if idempotency_key else ''
+    
+    async def detect_once() -> bytes:
+        return _response_bytes(await _admit_detection(transaction))
+    
+    try:
+        return await idempotency_cache.get_or_run(key, detect_once, fingerprint)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422,
+                            detail="Idempotency-Key reused with a different request payload")
+
+
+async def _admit_detection(transaction: Dict[str, Any]):
+    """经准入控制执行检测"""
+    if admission_controller is None:
+        return await _run_detection(transaction)
+    
+    from core.extensions.admission_control import Overloaded
+    try:
+        # 高金额交易优先处理
+        async with admission_controller.admit(transaction['amount']):
+            return await _run_detection(transaction)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server overloaded: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def _response_bytes(result) -> bytes:
+    """_run_detection 的返回值转为响应字节"""
+    return result.body if isinstance(result, Response) else _encode_result_dict(result)
+
+
+def _encode_result_dict(result: Dict[str, Any]) -> bytes:
+    """按 FastAPI 默认方式编码检测结果"""
+    return json.dumps(
+        jsonable_encoder(result), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode('utf-8')
+
+
+def _to_transaction(request: DetectionRequest) -> Dict[str, Any]:
+    """转换为引擎需要的格式"""
+    return {
+        'user_id': request.user_id,
+        'item_id': request.item_id or '',
+        'amount': request.amount or 0.0,
+        'timestamp': request.timestamp or time.time(),
+        'ip': request.ip or '',
+        'device_id': request.device_id or '',
+        'action': request.action,
+        'features': request.features or {}
+    }
+
+
+async def _decode_transaction(request: Request) -> Dict[str, Any]:
+    """解码并校验请求体（启用快速编解码时跳过 Pydantic）"""
+    body = await request.body()
+    try:
+        if codec is not None:
+            return codec.decode_transaction(body)
+        return _to_transaction(DetectionRequest.model_validate_json(body))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+async def _run_detection(transaction: Dict[str, Any]):
+    """执行单笔检测"""
     try:
-        # 转换为引擎需要的格式
-        transaction = {
-            'user_id': request.user_id,
-            'item_id': request.item_id or '',
-            'amount': request.amount or 0.0,
-            'timestamp': request.timestamp or time.time(),
-            'ip': request.ip or '',
-            'device_id': request.device_id or '',
-            'action': request.action,
-            'features': request.features or {}
-        }
-        
         # 执行检测
-        result = detection_engine.detect(transaction)
+        if micro_batcher is not None:
+            result = await micro_batcher.submit(transaction)
+        else:
+            result = await detection_engine.detect_async(transaction)
         
         # 返回结果
+        if codec is not None:
+            return Response(content=codec.encode_result(result), media_type="application/json")
         return result.to_dict()
         
     except Exception as e:
@@ -125,6 +513,216 @@ async def detect(request: DetectionRequest):
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
 
+@app.post("/detect/batch")
+async def detect_batch(request: Request):
+    """
+    批量欺诈检测接口
+    
+    请求体为 JSON 数组或 NDJSON（每行一笔交易），边读取边检测，
+    结果以 NDJSON 流式返回，顺序与输入一致；单笔失败时该行带 error 字段
+    
+    每个分块经准入控制占用一个在途名额，过载时被拒绝的分块中每行带 status=503 与 retry_after；
+    请求计数在响应流结束后记录（有分块被拒绝时记为 503，流中断时记为 500）
+    """
+    if detection_engine is None or batch_engine is None:
+        if metrics is not None:
+            metrics.count_request('/detect/batch', 503)
+        raise HTTPException(status_code=503, detail="Detection engine not available")
+    
+    chunk_size = detection_engine.config.get('performance', {}).get('batch_size', 64)
+    
+    async def stream():
+        status = 500
+        shed = False
+        try:
+            transactions = _iter_batch_transactions(request)
+            async for entry in batch_engine.detect_stream(transactions, chunk_size,
+                                                          admission_controller):
+                shed = shed or entry.get('status') == 503
+                if codec is not None:
+                    yield codec.dumps(entry) + b'\n'
+                else:
+                    yield json.dumps(entry, ensure_ascii=False) + '\n'
+            status = 503 if shed else 200
+        finally:
+            if metrics is not None:
+                metrics.count_request('/detect/batch', status)
+    
+    return DuplexStreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def _iter_batch_transactions(request: Request):
+    """逐条解析并校验批量请求体"""
+    from core.extensions.batch_detection import iter_json_items
+    
+    async for item in iter_json_items(request.stream()):
+        if isinstance(item, Exception):
+            yield item
+            continue
+        try:
+            yield _item_to_transaction(item)
+        except ValueError as e:
+            yield e
+
+
+def _item_to_transaction(item: Any) -> Dict[str, Any]:
+    """校验已解析的单笔请求，格式错误时抛出 ValueError"""
+    try:
+        if codec is not None:
+            return codec.to_transaction(item)
+        return _to_transaction(DetectionRequest(**item))
+    except Exception as e:
+        raise ValueError(f"请求格式错误: {e}")
+
+
+@app.websocket("/ws")
+async def detect_ws(websocket: WebSocket):
+    """
+    WebSocket 检测通道
+    
+    客户端在同一连接上连续发送检测请求（每帧一个JSON对象，或一个JSON数组），
+    每笔请求用 id 字段作为关联标识，可选 idempotency_key；结果按完成顺序返回：
+    {"id": ..., "result": {...}} 或 {"id": ..., "error": "...", "status": 422/500/503}
+    
+    每个连接最多 max_in_flight 笔请求在途（结果发出后才释放），
+    达到上限后暂停读取，由 TCP 反压到客户端
+    """
+    await websocket.accept()
+    if detection_engine is None:
+        # 1013: Try Again Later
+        await websocket.close(code=1013)
+        return
+    
+    ws_cfg = detection_engine.config.get('performance', {}).get('websocket', {})
+    slots = asyncio.Semaphore(ws_cfg.get('max_in_flight', 64))
+    outbox: asyncio.Queue = asyncio.Queue()
+    writer = asyncio.create_task(_ws_writer(websocket, outbox, slots))
+    tasks = set()
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            data = message.get('text')
+            if data is None:
+                data = message.get('bytes') or b''
+            
+            for item in _ws_items(data):
+                if not await _ws_acquire(slots, writer):
+                    return
+                if isinstance(item, Exception):
+                    await outbox.put(_ws_error(None, str(item), 422))
+                    continue
+                task = asyncio.create_task(_ws_detect(item, outbox))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 客户端已断开，在途结果无处发送
+        for task in list(tasks) + [writer]:
+            task.cancel()
+
+
+async def _ws_acquire(slots: asyncio.Semaphore, writer: asyncio.Task) -> bool:
+    """占用一个在途名额；名额用尽时等待结果发出，发送任务退出（连接已断开）时返回 False"""
+    if not slots.locked():
+        await slots.acquire()
+        return True
+    
+    acquire = asyncio.ensure_future(slots.acquire())
+    await asyncio.wait({acquire, writer}, return_when=asyncio.FIRST_COMPLETED)
+    if acquire.done():
+        return True
+    acquire.cancel()
+    return False
+
+
+def _ws_items(data) -> List[Any]:
+    """解析一帧消息，返回请求列表（整帧无法解析时返回单个异常）"""
+    try:
+        if codec is not None:
+            # FastCodec.loads 的异常信息已带前缀
+            payload = codec.loads(data)
+        else:
+            payload = json.loads(data)
+    except ValueError as e:
+        return [e if codec is not None else ValueError(f"JSON解析失败: {e}")]
+    return payload if isinstance(payload, list) else [payload]
+
+
+async def _ws_detect(item: Any, outbox: asyncio.Queue):
+    """执行一笔 WebSocket 检测请求，结果放入发送队列"""
+    request_id = item.get('id') if isinstance(item, dict) else None
+    status = 200
+    try:
+        transaction = _item_to_transaction(item)
+        body, _ = await _detect_body(transaction, item.get('idempotency_key'))
+        reply = b'{"id":' + _dumps(request_id) + b',"result":' + body + b'}'
+    except ValueError as e:
+        status = 422
+        reply = _ws_error(request_id, str(e), status)
+    except HTTPException as e:
+        status = e.status_code
+        reply = _ws_error(request_id, e.detail, status, (e.headers or {}).get('Retry-After'))
+    except Exception as e:
+        status = 500
+        logger.error(f"WebSocket 检测失败: {e}", exc_info=True)
+        reply = _ws_error(request_id, f"Detection failed: {e}", status)
+    finally:
+        if metrics is not None:
+            metrics.count_request('/ws', status)
+    await outbox.put(reply)
+
+
+async def _ws_writer(websocket: WebSocket, outbox: asyncio.Queue, slots: asyncio.Semaphore):
+    """单一发送任务：按完成顺序发出结果，发出后释放在途名额"""
+    while True:
+        reply = await outbox.get()
+        try:
+            await websocket.send_text(reply.decode('utf-8'))
+        except Exception:
+            # 连接已关闭，由接收循环收尾
+            return
+        slots.release()
+
+
+def _ws_error(request_id: Any, detail: str, status: int, retry_after: Optional[str] = None) -> bytes:
+    error = {'id': request_id, 'error': detail, 'status': status}
+    if retry_after is not None:
+        error['retry_after'] = int(retry_after)
+    return _dumps(error)
+
+
+def _dumps(obj: Any) -> bytes:
+    if codec is not None:
+        return codec.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 指标"""
+    if metrics is None:
+        raise HTTPException(status_code=503, detail="Metrics not available")
+    
+    # 多 worker 部署共用一个端口，抓取随机落到某个 worker：输出所有 worker 的指标（按 worker 标签区分）
+    store = _shared_state_store()
+    if store is None:
+        content = metrics.render()
+    else:
+        from core.extensions.metrics import merge_worker_families, render_families
+        loop = asyncio.get_running_loop()
+        families = metrics.collect()
+        await loop.run_in_executor(None, store.publish_metrics, WORKER_ID, families)
+        snapshots = await loop.run_in_executor(None, store.collect_metrics)
+        snapshots = [s for s in snapshots if s.get('worker') != WORKER_ID]
+        snapshots.append({'worker': WORKER_ID, 'families': families})
+        content = render_families(merge_worker_families(snapshots))
+    return Response(content=content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/stats")
 async def get_stats():
     """获取统计信息"""
@@ -133,22 +731,66 @@ async def get_stats():
     
     try:
         stats = detection_engine.get_stats()
+        
+        # 多 worker 部署：汇总所有 worker 的统计
+        store = _shared_state_store()
+        if store is not None:
+            from core.extensions.shared_state import aggregate_stats
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, store.publish_stats, WORKER_ID, stats)
+            snapshots = await loop.run_in_executor(None, store.collect_stats)
+            stats['cluster'] = aggregate_stats(snapshots)
+        
+        if micro_batcher is not None:
+            stats['micro_batch'] = micro_batcher.get_stats()
+        if admission_controller is not None:
+            stats['admission'] = admission_controller.get_stats()
+        if idempotency_cache is not None:
+            stats['idempotency'] = idempotency_cache.get_stats()
+        if 'circuit_breakers' not in stats:
+            from core.extensions.circuit_breaker import breaker_states
+            stats['circuit_breakers'] = breaker_states()
         return stats
     except Exception as e:
         logger.error(f"获取统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
 
+def _serving_workers(config_path: str = 'config/config.yaml') -> int:
+    """读取 performance.serving.workers（环境变量 API_WORKERS 优先）"""
+    try:
+        import yaml
+        from core.extensions.shared_state import serving_workers
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        return serving_workers(config)
+    except Exception as e:
+        logger.warning(f"读取 worker 配置失败，使用单进程: {e}")
+        return 1
+
+
 if __name__ == "__main__":
     logger.info("=" * 60)
     logger.info("🐍 Python 反欺诈检测API服务器")
     logger.info("基于图对抗算法的7层防御体系")
     logger.info("=" * 60)
     
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=5000,
-        log_level="info"
-    )
+    workers = _serving_workers()
+    if workers > 1:
+        # 多进程模式：每个 worker 独立加载引擎，检测状态通过 Redis 共享
+        logger.info(f"多进程模式: {workers} 个 worker")
+        uvicorn.run(
+            "api_server:app",
+            host="0.0.0.0",
+            port=5000,
+            workers=workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=5000,
+            log_level="info"
+        )
 
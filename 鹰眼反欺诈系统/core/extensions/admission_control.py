@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+准入控制 - 扩展功能
+限制在途请求数和排队深度，按延迟自适应调整并发上限，
+超出容量时立即拒绝（503 + Retry-After），而不是让所有请求一起超时
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """服务过载，请求被拒绝"""
+    
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶（QPS上限）"""
+    
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class AdmissionController:
+    """
+    准入控制器
+    
+    - 在途上限：同时处理的请求数不超过 limit
+    - 排队上限：超过 limit 的请求按优先级（交易金额）排队，队列满或等待超时即拒绝
+    - 自适应并发：每个统计窗口比较 p90 延迟与目标延迟，
+      超标时乘性下调 limit，达标时加性上调（AIMD）
+    - QPS上限：令牌桶限制 performance.max_qps
+    """
+    
+    def __init__(self,
+                 max_in_flight: int = 256,
+                 max_queue: int = 1024,
+                 queue_timeout_ms: float = 50.0,
+                 max_qps: float = 0,
+                 adaptive: bool = True,
+                 target_latency_ms: float = 50.0,
+                 min_limit: int = 16,
+                 window_size: int = 200,
+                 retry_after: int = 1):
+        self.max_limit = max(1, int(max_in_flight))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = float(self.max_limit)
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = max(0.0, float(queue_timeout_ms)) / 1000.0
+        self.adaptive = adaptive
+        self.target_latency_ms = float(target_latency_ms)
+        self.window_size = max(10, int(window_size))
+        self.retry_after = max(1, int(retry_after))
+        self.rate_limiter = TokenBucket(max_qps) if max_qps and max_qps > 0 else None
+        
+        self._in_flight = 0
+        self._queued = 0
+        self._waiters: List = []
+        self._seq = itertools.count()
+        self._samples: List[float] = []
+        
+        # 统计信息
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'shed_rate_limit': 0,
+            'shed_queue_full': 0,
+            'shed_timeout': 0,
+            'limit_decreases': 0
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> 'AdmissionController':
+        """从 performance 配置段创建"""
+        adm_cfg = config.get('admission', {})
+        return cls(
+            max_in_flight=adm_cfg.get('max_in_flight', 256),
+            max_queue=adm_cfg.get('max_queue', 1024),
+            queue_timeout_ms=adm_cfg.get('queue_timeout_ms', 50),
+            max_qps=config.get('max_qps', 0),
+            adaptive=adm_cfg.get('adaptive', True),
+            target_latency_ms=adm_cfg.get('target_latency_ms', 50),
+            min_limit=adm_cfg.get('min_limit', 16),
+            retry_after=adm_cfg.get('retry_after_seconds', 1)
+        )
+    
+    @asynccontextmanager
+    async def admit(self, priority: float = 0.0):
+        """
+        获取处理许可，退出时释放并记录延迟
+        
+        Args:
+            priority: 优先级，数值越大越先处理（通常为交易金额）
+        
+        Raises:
+            Overloaded: 超出QPS、队列已满或排队超时
+        """
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release((time.perf_counter() - start) * 1000)
+    
+    async def acquire(self, priority: float = 0.0):
+        """获取处理许可"""
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+            self.stats['shed_rate_limit'] += 1
+            raise Overloaded("超出QPS上限", self.retry_after)
+        
+        if self._in_flight < int(self.limit) and self._queued == 0:
+            self._in_flight += 1
+            self.stats['admitted'] += 1
+            return
+        
+        if self._queued >= self.max_queue:
+            self.stats['shed_queue_full'] += 1
+            raise Overloaded("请求队列已满", self.retry_after)
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._seq), future))
+        self._queued += 1
+        self.stats['queued'] += 1
+        
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # 客户端断开：已分配的许可要归还
+            if future.done() and not future.cancelled():
+                self.release(None)
+            else:
+                future.cancel()
+                self._queued -= 1
+            raise
+        
+        if not future.done():
+            future.cancel()
+            self._queued -= 1
+            self.stats['shed_timeout'] += 1
+            raise Overloaded("排队超时", self.retry_after)
+        
+        self.stats['admitted'] += 1
+    
+    def release(self, latency_ms: float = None):
+        """释放许可，并唤醒排队中优先级最高的请求"""
+        self._in_flight -= 1
+        if latency_ms is not None and self.adaptive:
+            self._record_latency(latency_ms)
+        self._grant()
+    
+    def _grant(self):
+        while self._waiters and self._in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._queued -= 1
+            self._in_flight += 1
+            future.set_result(None)
+    
+    def _record_latency(self, latency_ms: float):
+        """AIMD：按窗口内p90延迟调整并发上限"""
+        self._samples.append(latency_ms)
+        if len(self._samples) < self.window_size:
+            return
+        
+        samples = sorted(self._samples)
+        self._samples = []
+        p90 = samples[int(len(samples) * 0.9) - 1]
+        
+        if p90 > self.target_latency_ms:
+            new_limit = max(self.min_limit, self.limit * 0.9)
+            if int(new_limit) < int(self.limit):
+                self.stats['limit_decreases'] += 1
+                logger.warning(f"p90延迟 {p90:.1f}ms 超过目标 {self.target_latency_ms}ms，"
+                               f"并发上限降至 {int(new_limit)}")
+            self.limit = new_limit
+        else:
+            self.limit = min(self.max_limit, self.limit + max(1.0, math.sqrt(self.limit)))
+    
+    def get_stats(self) -> Dict:
+        """获取准入控制统计"""
+        return {
+            **self.stats,
+            'limit': int(self.limit),
+            'in_flight': self._in_flight,
+            'queue_depth': self._queued
+        }
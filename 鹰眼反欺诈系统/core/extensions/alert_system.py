@@ -202,7 +202,7 @@ class AlertSystem:
     
     def fraud_detected_alert(self, user_id: str, risk_score: float, details: Dict):
         """欺诈检测告警"""
-        level = AlertLevel.CRITICAL if risk_score > 0.85 else AlertLevel.WARNING
+        level = AlertLevel.CRITICAL if risk_score > 85 else AlertLevel.WARNING
         
         self.send_alert(
             level=level,
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有界线程池 - 扩展功能
+在事件循环中执行同步代码，限制在途任务数，避免阻塞 uvicorn 事件循环
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """
+    有界线程池
+
+    ThreadPoolExecutor 的任务队列是无界的；这里用信号量限制
+    同时提交的任务数，超出部分在事件循环上等待，而不是堆积在线程池队列里
+    """
+
+    def __init__(self, max_workers: int = 16, max_pending: int = None,
+                 name: str = 'detect'):
+        """
+        Args:
+            max_workers: 线程数
+            max_pending: 最大在途任务数（含排队），默认等于线程数
+            name: 线程名前缀
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending or self.max_workers))
+        self.name = name
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=name
+        )
+        self._slots = None
+        self._in_flight = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """在线程池中执行 fn(*args)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, fn, *args)
+            finally:
+                self._in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self.executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict:
+        """获取线程池统计"""
+        return {
+            'name': self.name,
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'in_flight': self._in_flight
+        }
@@ -6,12 +6,138 @@
 """
 
 import asyncio
-from typing import List, Dict
+import codecs
+import json
+from collections import deque
+from typing import List, Dict, AsyncIterator, Optional, Union
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 
+from core.extensions.admission_control import Overloaded
+
 logger = logging.getLogger(__name__)
 
+# 单条记录的长度上限（字符），超出仍不完整时视为请求体损坏
+MAX_ITEM_CHARS = 1 << 20
+
+
+def _element_end(buffer: str, pos: int) -> int:
+    """
+    JSON 数组中从 pos 开始的元素的结束位置（顶层的 ',' 或 ']'）
+    
+    只按字符串与括号嵌套扫描，不校验内容；元素尚不完整时返回 -1
+    """
+    depth = 0
+    in_string = escape = False
+    for i in range(pos, len(buffer)):
+        c = buffer[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '{[':
+            depth += 1
+        elif c in '}]':
+            if depth == 0:
+                return i
+            depth -= 1
+        elif c == ',' and depth == 0:
+            return i
+    return -1
+
+
+async def iter_json_items(chunks: AsyncIterator[bytes],
+                          max_item_chars: int = MAX_ITEM_CHARS) -> AsyncIterator[Union[Dict, Exception]]:
+    """
+    增量解析请求体，支持 JSON 数组和 NDJSON 两种格式
+    
+    逐条产出交易字典；单条格式错误时产出 ValueError，跳到下一条继续解析。
+    数组元素已完整（扫描到顶层的 ',' 或 ']'）但无法解析时跳过该元素；
+    单条记录超过 max_item_chars 仍不完整时产出一个错误后结束，不会无限缓冲
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    mode = None
+    ended = False
+    
+    def parse_line(line: str):
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            return ValueError(f"JSON解析失败: {e}")
+        if not isinstance(item, dict):
+            return ValueError("每条记录必须是JSON对象")
+        return item
+    
+    async for chunk in chunks:
+        if ended:
+            continue
+        buffer += text_decoder.decode(chunk)
+        
+        if mode is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] == '[':
+                mode = 'array'
+                buffer = stripped[1:]
+            else:
+                mode = 'ndjson'
+        
+        if mode == 'ndjson':
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                if line.strip():
+                    yield parse_line(line)
+            if len(buffer) > max_item_chars:
+                yield ValueError(f"单条记录超过 {max_item_chars} 字符仍未结束")
+                buffer = ''
+                ended = True
+            continue
+        
+        # JSON数组：逐个取出完整的元素，不完整的部分留到下一块
+        while True:
+            pos = 0
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                ended = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError as e:
+                element_end = _element_end(buffer, pos)
+                if element_end >= 0:
+                    # 元素已完整仍无法解析：跳过该元素，从下一个元素继续
+                    yield ValueError(f"JSON解析失败: {e}")
+                    buffer = buffer[element_end:]
+                    if buffer[0] == ',':
+                        buffer = buffer[1:]
+                    continue
+                buffer = buffer[pos:]
+                if len(buffer) > max_item_chars:
+                    yield ValueError(f"单条记录超过 {max_item_chars} 字符仍未结束，或JSON数组格式错误")
+                    ended = True
+                break
+            buffer = buffer[end:]
+            if isinstance(item, dict):
+                yield item
+            else:
+                yield ValueError("每条记录必须是JSON对象")
+    
+    buffer += text_decoder.decode(b'', final=True)
+    if mode == 'ndjson':
+        if buffer.strip():
+            yield parse_line(buffer)
+    elif mode == 'array' and not ended:
+        yield ValueError("JSON数组不完整或格式错误")
+
 
 class BatchDetectionEngine:
     """批量检测引擎"""
@@ -83,6 +209,121 @@ class BatchDetectionEngine:
         )
         return result.to_dict()
     
+    async def detect_stream(self, items: AsyncIterator[Union[Dict, Exception]],
+                            chunk_size: int = 64,
+                            admission=None) -> AsyncIterator[Dict]:
+        """
+        流式批量检测
+        
+        从异步迭代器读取交易，按 chunk_size 分块提交，按输入顺序逐条产出结果。
+        同时在途的分块不超过 max_workers 个，读取输入随之背压，
+        内存占用与交易总数无关
+        
+        Args:
+            items: 交易字典的异步迭代器；异常对象表示该条解析失败
+            chunk_size: 每块交易数
+            admission: 可选准入控制器，每个分块占用一个在途名额（按块内最高金额排队）；
+                       被拒绝的分块中每条输出 status=503 与 retry_after
+        
+        Yields:
+            带 index 字段的检测结果，失败的条目带 error 字段
+        """
+        pending = deque()
+        chunk = []
+        index = 0
+        
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                pending.append(asyncio.ensure_future(self._detect_chunk_async(chunk, index, admission)))
+                index += len(chunk)
+                chunk = []
+                
+                # 在途分块已满时等待最早的分块完成
+                while len(pending) >= self.max_workers:
+                    for result in await pending.popleft():
+                        yield result
+            
+            # 已完成的分块尽早输出
+            while pending and pending[0].done():
+                for result in pending.popleft().result():
+                    yield result
+        
+        if chunk:
+            pending.append(asyncio.ensure_future(self._detect_chunk_async(chunk, index, admission)))
+        
+        while pending:
+            for result in await pending.popleft():
+                yield result
+    
+    async def _detect_chunk_async(self, chunk: List, base_index: int, admission=None) -> List[Dict]:
+        """在线程池中检测一个分块，单条错误只影响该条"""
+        results = [None] * len(chunk)
+        valid = []
+        for i, item in enumerate(chunk):
+            if isinstance(item, Exception):
+                results[i] = self._error_entry(base_index + i, None, item)
+            else:
+                valid.append(i)
+        
+        if valid:
+            transactions = [chunk[i] for i in valid]
+            try:
+                detected = await self._run_admitted(transactions, admission)
+            except Exception as e:
+                detected = [e] * len(transactions)
+            
+            for i, result in zip(valid, detected):
+                if isinstance(result, Exception):
+                    results[i] = self._error_entry(base_index + i, chunk[i].get('user_id'), result)
+                else:
+                    results[i] = {'index': base_index + i, **result.to_dict()}
+        
+        return results
+    
+    async def _run_admitted(self, transactions: List[Dict], admission=None) -> List:
+        """经准入控制在线程池中检测一个分块（分块耗时不计入自适应并发的延迟样本）"""
+        loop = asyncio.get_running_loop()
+        if admission is None:
+            return await loop.run_in_executor(self.executor, self._detect_chunk, transactions)
+        await admission.acquire(max(float(t.get('amount') or 0.0) for t in transactions))
+        try:
+            return await loop.run_in_executor(self.executor, self._detect_chunk, transactions)
+        finally:
+            admission.release(None)
+    
+    def _detect_chunk(self, transactions: List[Dict]) -> List:
+        """检测一个分块，引擎支持时一次调用完成"""
+        if hasattr(self.detection_engine, 'detect_batch'):
+            return self.detection_engine.detect_batch(transactions)
+        
+        results = []
+        for txn in transactions:
+            try:
+                results.append(self.detection_engine.detect(txn))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def _error_entry(self, index: int, user_id, error: Exception) -> Dict:
+        """单条失败的输出"""
+        if isinstance(error, Overloaded):
+            return {
+                'index': index,
+                'user_id': user_id,
+                'error': f"Server overloaded: {error.reason}",
+                'risk_level': 'UNKNOWN',
+                'status': 503,
+                'retry_after': error.retry_after
+            }
+        logger.error(f"批量检测失败: #{index} {user_id}, {str(error)}")
+        return {
+            'index': index,
+            'user_id': user_id,
+            'error': str(error),
+            'risk_level': 'UNKNOWN'
+        }
+    
     def get_stats(self) -> Dict:
         """获取批量处理统计"""
         return {
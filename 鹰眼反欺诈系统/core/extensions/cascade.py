@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+两级级联检测 - 扩展功能
+所有交易先由精简版引擎（规则 + VPN + 设备指纹）评分，只有风险分落在不确定区间
+[uncertain_low, uncertain_high) 内的交易升级到完整版引擎做GNN推理
+
+- 升级时复用精简版已完成的阶段输出，完整版只补充GNN推理与环境检测，
+  操作计数与设备历史不重复记录
+- 结果 decision_tier 记录作出决定的一级（lite / full）
+- 统计与监控指标只由作出决定的引擎记录一次
+- 决定性规则提前拒绝的结果（early_exit）不升级
+- 精简版的受信实体缓存按最终结果（含完整版判定）晋升或失效
+- 除提前拒绝外的交易（含未升级的）都写入完整版引擎的交易关系图
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def in_uncertain_band(result, low: float, high: float) -> bool:
+    """精简版结果是否需要升级到完整版引擎"""
+    if getattr(result, 'early_exit', None):
+        return False
+    return low <= result.risk_score < high
+
+
+class CascadeDetectionEngine:
+    """
+    级联检测引擎
+    
+    对外接口与检测引擎一致（detect / detect_async / detect_batch / get_stats / close），
+    可直接替换 api_server、流式 worker 使用的引擎
+    """
+    
+    def __init__(self, lite_engine, full_engine,
+                 uncertain_low: float = 30.0,
+                 uncertain_high: float = 85.0):
+        """
+        Args:
+            lite_engine: 精简版引擎（需提供 detect_staged / record_result / update_reputation）
+            full_engine: 完整版引擎（需提供 score_with_stages）
+            uncertain_low: 不确定区间下界（含），低于该值由精简版判定
+            uncertain_high: 不确定区间上界（不含），不低于该值由精简版判定
+        """
+        if uncertain_low > uncertain_high:
+            raise ValueError(f"不确定区间无效: [{uncertain_low}, {uncertain_high})")
+        self.lite = lite_engine
+        self.full = full_engine
+        self.uncertain_low = float(uncertain_low)
+        self.uncertain_high = float(uncertain_high)
+        
+        # 与精简版引擎共享配置、状态存储与监控指标
+        self.config = lite_engine.config
+        self.state_store = getattr(lite_engine, 'state_store', None)
+        self.metrics = getattr(lite_engine, 'metrics', None)
+        
+        # 统计信息（detect_async 在线程池中并发执行，计数在锁内更新）
+        self._lock = threading.Lock()
+        self.stats = {
+            'total_requests': 0,
+            'escalated': 0,
+            'escalation_errors': 0,
+            'avg_response_time': 0.0
+        }
+    
+    @classmethod
+    def from_config(cls, lite_engine, config_path: str = 'config/config.yaml') -> 'CascadeDetectionEngine':
+        """按 performance.cascade 配置创建（完整版引擎在此加载，依赖 torch）"""
+        from core.fraud_detection_engine import FraudDetectionEngine as FullDetectionEngine
+        
+        cascade_cfg = lite_engine.config.get('performance', {}).get('cascade', {})
+        engine = cls(
+            lite_engine,
+            FullDetectionEngine(config_path),
+            cascade_cfg.get('uncertain_low', 30.0),
+            cascade_cfg.get('uncertain_high', 85.0)
+        )
+        logger.info(f"级联检测已启用: 风险分 [{engine.uncertain_low:g}, {engine.uncertain_high:g}) "
+                    f"升级到完整版引擎")
+        return engine
+    
+    def detect(self, transaction: Dict, deadline: Optional[float] = None):
+        """单笔级联检测"""
+        start_time = time.time()
+        result, outputs = self.lite.detect_staged([transaction], deadline)[0]
+        if isinstance(result, Exception):
+            raise result
+        return self._decide(transaction, result, outputs, start_time, deadline)
+    
+    async def detect_async(self, transaction: Dict, deadline: Optional[float] = None):
+        """异步检测：在精简版引擎的有界线程池中执行"""
+        if deadline is None and self.lite.timeout_ms:
+            # 排队等待线程的时间也计入预算
+            deadline = time.time() + self.lite.timeout_ms / 1000.0
+        executor = getattr(self.lite, 'cpu_executor', None)
+        if executor is not None:
+            return await executor.run(self.detect, transaction, deadline)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.detect, transaction, deadline
+        )
+    
+    def detect_batch(self, transactions: List[Dict],
+                     return_exceptions: bool = True,
+                     deadline: Optional[float] = None) -> List:
+        """批量级联检测：整批先由精简版评分（共享状态一次预取），再逐笔升级不确定的交易"""
+        start_time = time.time()
+        results = []
+        for transaction, (result, outputs) in zip(transactions,
+                                                  self.lite.detect_staged(transactions, deadline)):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                results.append(self._decide(transaction, result, outputs, start_time, deadline))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                logger.error(f"级联检测失败: {transaction.get('user_id')}, {e}")
+                results.append(e)
+        return results
+    
+    def _decide(self, transaction: Dict, result, outputs: Optional[Dict],
+                start_time: float, deadline: Optional[float]):
+        """确定最终结果：不确定区间内升级到完整版，否则采用精简版结果"""
+        if in_uncertain_band(result, self.uncertain_low, self.uncertain_high):
+            try:
+                escalated = self.full.score_with_stages(transaction, outputs or {},
+                                                        start_time, deadline)
+            except Exception as e:
+                # 完整版失败时采用精简版结果，不影响请求
+                with self._lock:
+                    self.stats['escalation_errors'] += 1
+                logger.warning(f"升级到完整版引擎失败，采用精简版结果: {e}")
+            else:
+                escalated.stage_timings_ms = {**result.stage_timings_ms,
+                                              **escalated.stage_timings_ms}
+                escalated.decision_tier = 'full'
+                with self._lock:
+                    self.stats['escalated'] += 1
+                return self._record(transaction, escalated)
+        
+        result.decision_tier = 'lite'
+        self.lite.record_result(result)
+        # 未升级的交易同样写入完整版引擎的交易关系图，升级时GNN能看到完整的关系；
+        # 升级的交易由完整版的GNN阶段写入（环境检测通过后）
+        record_transaction = getattr(self.full, 'record_transaction', None)
+        if record_transaction is not None and not result.early_exit:
+            record_transaction(transaction)
+        return self._record(transaction, result)
+    
+    def _record(self, transaction: Dict, result):
+        # 受信实体按最终结果晋升或失效
+        self.lite.update_reputation(transaction, result)
+        with self._lock:
+            self.stats['total_requests'] += 1
+            n = self.stats['total_requests']
+            old_avg = self.stats['avg_response_time']
+            self.stats['avg_response_time'] = (old_avg * (n - 1) + result.response_time_ms) / n
+        return result
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息（合并两级引擎，tiers 中为各级引擎自身的统计）"""
+        lite_stats = self.lite.get_stats()
+        full_stats = self.full.get_stats()
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats['total_requests']
+        
+        def combined(key: str) -> int:
+            return lite_stats.get(key, 0) + full_stats.get(key, 0)
+        
+        return {
+            'total_requests': total,
+            'fraud_detected': combined('fraud_detected'),
+            'fraud_rate': combined('fraud_detected') / total if total > 0 else 0,
+            'avg_response_time': round(stats['avg_response_time'], 2),
+            'vpn_detected': combined('vpn_detected'),
+            'environment_threats': combined('environment_threats'),
+            'degraded_requests': combined('degraded_requests'),
+            'early_exits': combined('early_exits'),
+            'escalated': stats['escalated'],
+            'escalation_rate': round(stats['escalated'] / total, 4) if total > 0 else 0.0,
+            'escalation_errors': stats['escalation_errors'],
+            'uncertain_band': [self.uncertain_low, self.uncertain_high],
+            'tiers': {'lite': lite_stats, 'full': full_stats}
+        }
+    
+    def close(self):
+        """关闭两级引擎"""
+        for engine in (self.lite, self.full):
+            close = getattr(engine, 'close', None)
+            if close is not None:
+                close()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+依赖熔断器 - 扩展功能
+Redis / PostgreSQL / Kafka 不可用时，每次检测都会重试连接、等待超时并记录错误，
+一个后端故障会放大为整个服务的延迟事故
+
+- 关闭（closed）：正常调用，连续失败达到 failure_threshold 后打开
+- 打开（open）：直接跳过该依赖，不发起连接；recovery_timeout_s 后进入半开。
+  打开期间未经 allow 的调用（后台写入、投递回调）成功也不关闭，只有半开试探能关闭
+- 半开（half_open）：放行 half_open_max_calls 个试探调用，
+  连续成功 success_threshold 次后关闭，任一失败重新打开
+
+熔断器按依赖名称在进程内共享（同一进程的引擎、共享状态、幂等缓存共用 Redis 熔断器）
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 监控指标中的状态取值
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreakerOpen(Exception):
+    """熔断器打开时调用被拒绝"""
+
+
+class CircuitBreaker:
+    """
+    单个依赖的熔断器
+    
+    用法：
+        if breaker.allow():
+            try:
+                ...
+                breaker.record_success()
+            except Exception:
+                breaker.record_failure()
+    或 breaker.call(fn, *args)
+    """
+    
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 recovery_timeout_s: float = 10.0,
+                 half_open_max_calls: int = 1,
+                 success_threshold: int = 1):
+        """
+        Args:
+            name: 依赖名称
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout_s: 打开后多久进入半开
+            half_open_max_calls: 半开状态同时放行的试探调用数
+            success_threshold: 半开状态连续成功多少次后关闭
+        """
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = max(0.0, float(recovery_timeout_s))
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+        self.success_threshold = max(1, int(success_threshold))
+        
+        self._state = CLOSED
+        self._failures = 0
+        self._successes = 0
+        self._trials = 0
+        self._opened_at = 0.0
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        
+        # 统计信息
+        self.stats = {
+            'calls': 0,
+            'failures': 0,
+            'rejected': 0,
+            'opened': 0
+        }
+    
+    def configure(self, **settings):
+        """更新阈值（保留当前状态）"""
+        with self._lock:
+            if 'failure_threshold' in settings:
+                self.failure_threshold = max(1, int(settings['failure_threshold']))
+            if 'recovery_timeout_s' in settings:
+                self.recovery_timeout = max(0.0, float(settings['recovery_timeout_s']))
+            if 'half_open_max_calls' in settings:
+                self.half_open_max_calls = max(1, int(settings['half_open_max_calls']))
+            if 'success_threshold' in settings:
+                self.success_threshold = max(1, int(settings['success_threshold']))
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+    
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
+            self._successes = 0
+            logger.info(f"熔断器 {self.name} 进入半开状态，放行试探调用")
+        return self._state
+    
+    def allow(self) -> bool:
+        """是否放行本次调用（放行后必须调用 record_success 或 record_failure）"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                self.stats['calls'] += 1
+                return True
+            if state == HALF_OPEN and self._trials < self.half_open_max_calls:
+                self._trials += 1
+                self.stats['calls'] += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+    
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                self._failures = 0
+                return
+            if state == OPEN:
+                # 打开前已放行的调用或未经 allow 的后台调用：单次成功不代表依赖恢复，
+                # 等到 recovery_timeout_s 后由半开试探决定
+                return
+            self._trials = max(0, self._trials - 1)
+            self._successes += 1
+            if self._successes < self.success_threshold:
+                return
+            self._state = CLOSED
+            self._failures = 0
+            logger.info(f"熔断器 {self.name} 已关闭，依赖恢复")
+    
+    def record_failure(self, error: Optional[BaseException] = None):
+        """记录一次失败调用"""
+        with self._lock:
+            self.stats['failures'] += 1
+            if error is not None:
+                self._last_error = f"{type(error).__name__}: {error}"
+            if self._state == CLOSED:
+                self._failures += 1
+                if self._failures < self.failure_threshold:
+                    return
+            self._trip()
+    
+    def trip(self, error: Optional[BaseException] = None):
+        """立即打开（调用方已自行判定依赖不可用，如 Kafka 发布器转入本地暂存）"""
+        with self._lock:
+            self.stats['failures'] += 1
+            if error is not None:
+                self._last_error = f"{type(error).__name__}: {error}"
+            self._trip()
+    
+    def recover(self):
+        """立即关闭（调用方已自行确认依赖恢复，如 Kafka 发布器同步回放完暂存记录）"""
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"熔断器 {self.name} 已关闭，依赖恢复")
+            self._state = CLOSED
+            self._failures = 0
+            self._trials = 0
+            self._successes = 0
+    
+    def _trip(self):
+        if self._state != OPEN:
+            self.stats['opened'] += 1
+            logger.error(f"熔断器 {self.name} 已打开，{self.recovery_timeout:g}s 内跳过该依赖: "
+                         f"{self._last_error}")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._trials = 0
+        self._successes = 0
+    
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """经熔断器调用 fn；打开时抛出 CircuitBreakerOpen"""
+        if not self.allow():
+            raise CircuitBreakerOpen(f"{self.name} 熔断中")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+    
+    def get_stats(self) -> Dict:
+        """获取状态与统计信息"""
+        with self._lock:
+            state = self._current_state()
+            stats = {
+                **self.stats,
+                'state': state,
+                'consecutive_failures': self._failures,
+                'last_error': self._last_error
+            }
+            if state == OPEN:
+                stats['retry_in_s'] = round(
+                    max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at)), 2
+                )
+            return stats
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_settings: Dict[str, Dict] = {}
+_enabled = True
+_breakers_lock = threading.Lock()
+
+
+def configure_breakers(config: Dict):
+    """
+    按 performance.circuit_breaker 配置熔断器
+    
+    顶层阈值为默认值，dependencies 下可按依赖名覆盖；enabled: false 时所有调用直接放行
+    """
+    global _enabled
+    defaults = {key: value for key, value in config.items()
+                if key not in ('enabled', 'dependencies')}
+    with _breakers_lock:
+        _enabled = config.get('enabled', True)
+        _settings.clear()
+        _settings['*'] = defaults
+        for name, overrides in (config.get('dependencies') or {}).items():
+            _settings[name] = {**defaults, **(overrides or {})}
+        for name, breaker in _breakers.items():
+            breaker.configure(**_settings.get(name, defaults))
+
+
+def get_breaker(name: str) -> Optional[CircuitBreaker]:
+    """进程内共享的依赖熔断器；熔断已禁用时返回 None"""
+    if not _enabled:
+        return None
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, **_settings.get(name, _settings.get('*', {})))
+                _breakers[name] = breaker
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict]:
+    """所有熔断器的状态（/health、/stats 使用）"""
+    return {name: breaker.get_stats() for name, breaker in list(_breakers.items())}
@@ -9,9 +9,10 @@ import hashlib
 import time
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
-from collections import defaultdict
 import logging
 
+from .shared_state import LocalStateStore
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -57,13 +58,9 @@ class DeviceRiskResult:
 class DeviceFingerprintDetector:
     """设备指纹检测器"""
     
-    def __init__(self):
-        # 设备历史记录
-        self.device_history = defaultdict(list)
-        # IP-设备映射
-        self.ip_device_mapping = defaultdict(set)
-        # 设备-IP映射
-        self.device_ip_mapping = defaultdict(set)
+    def __init__(self, state_store=None):
+        # 设备历史记录、IP-设备映射、设备-IP映射（多 worker 部署时为共享存储）
+        self.state = state_store if state_store is not None else LocalStateStore()
         # 黑名单
         self.blacklisted_devices = set()
         self.blacklisted_ips = set()
@@ -94,6 +91,11 @@ class DeviceFingerprintDetector:
         is_emulator = False
         is_suspicious = False
         
+        # 读取历史状态并记录本次请求（一次存储往返）
+        state = self.state.observe_device(
+            device_id, ip, self._history_record(device_id, ip, transaction)
+        )
+        
         # 1. 检测Root/越狱
         is_rooted = self._check_root_jailbreak(transaction)
         if is_rooted:
@@ -107,20 +109,20 @@ class DeviceFingerprintDetector:
             risk_score += 0.35
         
         # 3. 设备指纹变化检测（刷机识别）
-        fingerprint_change = self._check_fingerprint_change(device_id, transaction)
+        fingerprint_change = self._check_fingerprint_change(device_id, transaction, state.history)
         if fingerprint_change:
             risk_factors.append("🔄 设备指纹异常变化（疑似刷机）")
             risk_score += 0.5
             is_suspicious = True
         
         # 4. 多设备共享IP检测
-        shared_ip_risk = self._check_ip_sharing(ip, device_id)
+        shared_ip_risk = self._check_ip_sharing(state.devices_on_ip)
         if shared_ip_risk > 0.3:
             risk_factors.append(f"🌐 IP共享异常 (风险:{shared_ip_risk:.0%})")
             risk_score += shared_ip_risk * 0.3
         
         # 5. 设备频繁更换IP
-        ip_change_risk = self._check_ip_hopping(device_id, ip)
+        ip_change_risk = self._check_ip_hopping(state.history, state.device_ip_count)
         if ip_change_risk > 0.4:
             risk_factors.append(f"🔀 设备频繁更换IP (风险:{ip_change_risk:.0%})")
             risk_score += ip_change_risk * 0.25
@@ -137,14 +139,11 @@ class DeviceFingerprintDetector:
             is_suspicious = True
         
         # 7. 设备信息不一致检测
-        inconsistency = self._check_device_inconsistency(transaction)
+        inconsistency = self._check_device_inconsistency(transaction, state.history)
         if inconsistency:
             risk_factors.append("⚠️ 设备信息不一致")
             risk_score += 0.3
         
-        # 更新记录
-        self._update_device_history(device_id, ip, transaction)
-        
         # 归一化风险分数
         risk_score = min(1.0, risk_score)
         
@@ -158,6 +157,55 @@ class DeviceFingerprintDetector:
             timestamp=time.time()
         )
     
+    def detect_quick(self, transaction: Dict) -> DeviceRiskResult:
+        """
+        快速检测（延迟预算不足时使用）
+        只检查Root/模拟器/黑名单，跳过指纹变化、IP共享等历史比对，
+        但仍记录设备历史，保证后续完整检测的数据连续
+        """
+        device_id = transaction.get('device_id', 'unknown')
+        ip = transaction.get('ip', 'unknown')
+        
+        risk_factors = []
+        risk_score = 0.0
+        is_suspicious = False
+        
+        is_rooted = self._check_root_jailbreak(transaction)
+        if is_rooted:
+            risk_factors.append("🔓 设备已Root/越狱")
+            risk_score += 0.4
+        
+        is_emulator = self._check_emulator(transaction)
+        if is_emulator:
+            risk_factors.append("📱 检测到模拟器")
+            risk_score += 0.35
+        
+        if device_id in self.blacklisted_devices:
+            risk_factors.append("⛔ 设备已被拉黑")
+            risk_score += 0.6
+            is_suspicious = True
+        
+        if ip in self.blacklisted_ips:
+            risk_factors.append("⛔ IP已被拉黑")
+            risk_score += 0.4
+            is_suspicious = True
+        
+        self.state.observe_device(
+            device_id, ip, self._history_record(device_id, ip, transaction), read=False
+        )
+        
+        risk_score = min(1.0, risk_score)
+        
+        return DeviceRiskResult(
+            device_id=device_id,
+            is_rooted=is_rooted,
+            is_emulator=is_emulator,
+            is_suspicious=is_suspicious or risk_score > 0.6,
+            risk_score=risk_score,
+            risk_factors=risk_factors,
+            timestamp=time.time()
+        )
+    
     def _check_root_jailbreak(self, transaction: Dict) -> bool:
         """检测Root/越狱"""
         device_info = transaction.get('device_info', {})
@@ -205,10 +253,9 @@ class DeviceFingerprintDetector:
         
         return False
     
-    def _check_fingerprint_change(self, device_id: str, transaction: Dict) -> bool:
+    def _check_fingerprint_change(self, device_id: str, transaction: Dict,
+                                  history: List[Dict]) -> bool:
         """检测设备指纹变化（刷机识别）"""
-        history = self.device_history.get(device_id, [])
-        
         if len(history) < 2:
             return False
         
@@ -239,13 +286,8 @@ class DeviceFingerprintDetector:
         
         return False
     
-    def _check_ip_sharing(self, ip: str, device_id: str) -> float:
-        """检测IP共享异常"""
-        devices_on_ip = self.ip_device_mapping.get(ip, set())
-        
-        # 同一IP下的设备数量
-        device_count = len(devices_on_ip)
-        
+    def _check_ip_sharing(self, device_count: int) -> float:
+        """检测IP共享异常（device_count: 同一IP下的设备数量）"""
         # 正常情况下，一个IP可能有几个设备（家庭、公司网络）
         if device_count <= 3:
             return 0.0
@@ -257,15 +299,9 @@ class DeviceFingerprintDetector:
             # 超过50个设备共享同一IP，极度可疑
             return 0.9
     
-    def _check_ip_hopping(self, device_id: str, current_ip: str) -> float:
-        """检测设备频繁更换IP"""
-        ips = self.device_ip_mapping.get(device_id, set())
-        
-        # IP数量
-        ip_count = len(ips)
-        
+    def _check_ip_hopping(self, history: List[Dict], ip_count: int) -> float:
+        """检测设备频繁更换IP（ip_count: 设备使用过的IP数量）"""
         # 检查最近的IP变化频率
-        history = self.device_history.get(device_id, [])
         if len(history) >= 5:
             recent_ips = [h.get('ip') for h in history[-5:]]
             unique_recent_ips = len(set(recent_ips))
@@ -286,11 +322,8 @@ class DeviceFingerprintDetector:
         
         return 0.0
     
-    def _check_device_inconsistency(self, transaction: Dict) -> bool:
+    def _check_device_inconsistency(self, transaction: Dict, history: List[Dict]) -> bool:
         """检测设备信息不一致"""
-        device_id = transaction.get('device_id', '')
-        
-        history = self.device_history.get(device_id, [])
         if len(history) < 2:
             return False
         
@@ -317,8 +350,17 @@ class DeviceFingerprintDetector:
         
         return False
     
-    def _update_device_history(self, device_id: str, ip: str, transaction: Dict):
-        """更新设备历史记录"""
+    def history_entry(self, transaction: Dict) -> Tuple[str, str, Dict]:
+        """
+        返回 (device_id, ip, 本次历史记录)
+        供批量检测预取设备状态（state_store.prefetch）使用
+        """
+        device_id = transaction.get('device_id', 'unknown')
+        ip = transaction.get('ip', 'unknown')
+        return device_id, ip, self._history_record(device_id, ip, transaction)
+    
+    def _history_record(self, device_id: str, ip: str, transaction: Dict) -> Dict:
+        """生成本次请求的设备历史记录"""
         # 生成指纹
         fp = DeviceFingerprint(
             device_id=device_id,
@@ -332,23 +374,13 @@ class DeviceFingerprintDetector:
             webgl_hash=transaction.get('webgl_hash', '')
         )
         
-        record = {
+        return {
             'timestamp': time.time(),
             'ip': ip,
             'fingerprint_hash': fp.generate_fingerprint(),
             'device_model': transaction.get('device_model', ''),
             'os_version': transaction.get('os_version', '')
         }
-        
-        self.device_history[device_id].append(record)
-        
-        # 只保留最近50条记录
-        if len(self.device_history[device_id]) > 50:
-            self.device_history[device_id] = self.device_history[device_id][-50:]
-        
-        # 更新映射关系
-        self.ip_device_mapping[ip].add(device_id)
-        self.device_ip_mapping[device_id].add(ip)
     
     def add_to_blacklist(self, device_id: str = None, ip: str = None):
         """添加到黑名单"""
@@ -361,8 +393,7 @@ class DeviceFingerprintDetector:
     
     def get_device_profile(self, device_id: str) -> Dict:
         """获取设备画像"""
-        history = self.device_history.get(device_id, [])
-        ips = self.device_ip_mapping.get(device_id, set())
+        history, ips = self.state.device_profile(device_id)
         
         return {
             'device_id': device_id,
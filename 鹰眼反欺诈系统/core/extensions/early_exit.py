@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+决定性规则提前结束 - 扩展功能
+IP 或设备已在黑名单中时结论已经确定，不再执行 GNN、VPN 分析等耗时阶段，
+直接返回拒绝结果并附带命中的规则（攻击期间滥用流量占比高，应当是拒绝成本最低的流量）
+
+规则（performance.early_exit.rules，按顺序检查）:
+- ip_blacklist: 请求 IP 在第1层 IP 黑名单或设备指纹检测器的 IP 黑名单中
+- device_blacklist: 设备在设备指纹检测器的设备黑名单中
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from core.extensions.stage_graph import ShortCircuit
+
+logger = logging.getLogger(__name__)
+
+# 规则 → (对应防御层, 检测模式描述)
+EARLY_EXIT_RULES = {
+    'ip_blacklist': (1, "IP在黑名单中"),
+    'device_blacklist': (8, "⛔ 设备已被拉黑")
+}
+
+
+class EarlyExit(ShortCircuit):
+    """决定性规则命中（reason 为规则名）"""
+    
+    __slots__ = ('layer', 'message')
+    
+    def __init__(self, rule: str):
+        super().__init__(rule)
+        self.layer, self.message = EARLY_EXIT_RULES[rule]
+
+
+class EarlyExitPolicy:
+    """
+    提前结束策略
+    
+    黑名单按引用保存，运行中加入黑名单（add_to_blacklist 等）的条目立即生效
+    """
+    
+    def __init__(self, rules: List[str],
+                 ip_blacklists: Iterable[set] = (),
+                 device_blacklists: Iterable[set] = ()):
+        """
+        Args:
+            rules: 启用的规则（EARLY_EXIT_RULES 中的名称），按顺序检查
+            ip_blacklists: IP 黑名单集合
+            device_blacklists: 设备黑名单集合
+        """
+        unknown = [rule for rule in rules if rule not in EARLY_EXIT_RULES]
+        if unknown:
+            raise ValueError(f"未知的提前结束规则: {unknown}")
+        self.rules = list(rules)
+        self.ip_blacklists = [s for s in ip_blacklists if s is not None]
+        self.device_blacklists = [s for s in device_blacklists if s is not None]
+        self._decisions = {rule: EarlyExit(rule) for rule in self.rules}
+    
+    @classmethod
+    def from_config(cls, config: Dict, ip_blacklists: Iterable[set] = (),
+                    device_blacklists: Iterable[set] = ()) -> Optional['EarlyExitPolicy']:
+        """按 performance.early_exit 配置创建，未启用时返回 None"""
+        if not config.get('enabled', True):
+            return None
+        rules = config.get('rules', list(EARLY_EXIT_RULES))
+        if not rules:
+            return None
+        policy = cls(rules, ip_blacklists, device_blacklists)
+        logger.info(f"决定性规则提前结束已启用: {policy.rules}")
+        return policy
+    
+    def check(self, transaction: Dict) -> Optional[EarlyExit]:
+        """返回命中的第一条规则，未命中时返回 None"""
+        for rule in self.rules:
+            if rule == 'ip_blacklist':
+                ip = transaction.get('ip')
+                if ip and any(ip in blacklist for blacklist in self.ip_blacklists):
+                    return self._decisions[rule]
+            elif rule == 'device_blacklist':
+                device_id = transaction.get('device_id')
+                if device_id and any(device_id in blacklist for blacklist in self.device_blacklists):
+                    return self._decisions[rule]
+        return None
+    
+    def passing(self, transactions: List[Dict]) -> List[Dict]:
+        """未命中任何规则、需要完整检测的交易"""
+        return [t for t in transactions if self.check(t) is None]
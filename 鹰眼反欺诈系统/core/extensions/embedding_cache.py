@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+节点嵌入缓存 - 扩展功能
+GraphNeuralNetworkDetector 拆成两段：embed（GCN + GAT 消息传递，耗时的部分）与
+classify（两层全连接分类头）。中心实体的嵌入按实体缓存在 float32（可选 float16）矩阵中，
+请求时只要实体的邻域结构没有变化，就直接查表后用 numpy 计算分类头，不再调用 torch：
+
+- NodeEmbeddingCache: 实体 (类型, 值) → 矩阵行，LRU 淘汰；每行记录计算时实体的结构版本与模型版本，
+  结构版本不一致（新增或淘汰了相连的边）、模型权重变化或超过 max_staleness_s 即视为失效
+- EmbeddingRefresher: 后台线程定期取走关系图中结构变化过的实体，只重算其中已缓存（活跃）的实体，
+  合并为不相交并图批量推理后写回缓存
+- ClassifierHead: 分类头权重导出为 numpy 数组
+- model_fingerprint: 模型权重指纹（缓存的模型版本）
+
+节点特征（交易数、金额、活跃度）在结构不变时也会变化，这部分漂移以及两跳以外的结构变化
+由 max_staleness_s 限定
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.extensions.gnn_batching import predict_batched
+
+logger = logging.getLogger(__name__)
+
+EntityKey = Tuple[int, str]
+
+
+def model_fingerprint(model) -> str:
+    """按参数名与权重内容计算模型指纹（state_dict 中的张量需支持 .detach().cpu().numpy()）"""
+    digest = hashlib.sha1()
+    for name, tensor in sorted(model.state_dict().items()):
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(tensor.detach().cpu().numpy()).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ClassifierHead:
+    """全连接分类头（层间 ReLU，输出按 softmax 取欺诈类概率）"""
+    
+    def __init__(self, layers: Sequence[Tuple[np.ndarray, np.ndarray]]):
+        """
+        Args:
+            layers: 各层 (weight [out, in], bias [out])，与 torch.nn.Linear 的布局一致
+        """
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32))
+                       for w, b in layers]
+    
+    @classmethod
+    def from_linear(cls, modules: Sequence) -> 'ClassifierHead':
+        """从 torch.nn.Linear 层导出权重"""
+        return cls([(m.weight.detach().cpu().numpy(), m.bias.detach().cpu().numpy()) for m in modules])
+    
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """嵌入 [n, dim] → 欺诈概率 [n]"""
+        h = np.asarray(embeddings, dtype=np.float32)
+        for i, (weight, bias) in enumerate(self.layers):
+            h = h @ weight.T + bias
+            if i < len(self.layers) - 1:
+                np.maximum(h, 0.0, out=h)
+        h = h - h.max(axis=1, keepdims=True)
+        exp = np.exp(h)
+        return exp[:, 1] / exp.sum(axis=1)
+
+
+class NodeEmbeddingCache:
+    """实体嵌入缓存（线程安全）"""
+    
+    def __init__(self, dim: int, max_entries: int = 100000, max_staleness_s: float = 60.0,
+                 dtype: str = 'float32'):
+        """
+        Args:
+            dim: 嵌入维度（GNN hidden_dim）
+            max_entries: 缓存实体数上限，超出后淘汰最久未访问的
+            max_staleness_s: 嵌入计算后的最长使用时间
+            dtype: 矩阵存储精度（float32 / float16，float16 内存减半，读取时转回 float32）
+        """
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"不支持的嵌入存储精度: {dtype}")
+        self.dim = int(dim)
+        self.max_entries = max(1, int(max_entries))
+        self.max_staleness = float(max_staleness_s)
+        self.model_version: Optional[str] = None
+        
+        # 实体 → 矩阵行（按访问顺序，用于 LRU 淘汰），淘汰的行放入空闲表复用
+        capacity = min(self.max_entries, 1024)
+        self._slots: 'OrderedDict[EntityKey, int]' = OrderedDict()
+        self._free: List[int] = []
+        self._size = 0
+        self._matrix = np.zeros((capacity, self.dim), dtype=dtype)
+        self._versions = np.zeros(capacity, dtype=np.int64)
+        self._computed_at = np.zeros(capacity, dtype=np.float64)
+        self._lock = threading.Lock()
+        
+        # 统计信息
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'expired': 0,
+            'puts': 0,
+            'rejected': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict, dim: int) -> Optional['NodeEmbeddingCache']:
+        """按 performance.embedding_cache 配置创建，未启用时返回 None"""
+        if not config.get('enabled', True):
+            return None
+        cache = cls(dim, config.get('max_entries', 100000), config.get('max_staleness_s', 60),
+                    config.get('dtype', 'float32'))
+        logger.info(f"节点嵌入缓存已启用: 上限 {cache.max_entries} 个实体 ({cache._matrix.dtype}), "
+                    f"最长使用 {cache.max_staleness:g}s")
+        return cache
+    
+    def set_model_version(self, version: str):
+        """模型权重变化时清空缓存"""
+        with self._lock:
+            if version == self.model_version:
+                return
+            if self._slots:
+                self.stats['invalidations'] += 1
+                logger.info(f"模型版本变化 ({self.model_version} → {version})，清空 {len(self._slots)} 个嵌入")
+            self.model_version = version
+            self._slots.clear()
+            self._free = []
+            self._size = 0
+    
+    def get(self, key: Optional[EntityKey], version: int, now: Optional[float] = None) -> Optional[np.ndarray]:
+        """结构版本一致且未超过最长使用时间时返回嵌入（副本），否则返回 None"""
+        if key is None:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.stats['misses'] += 1
+                return None
+            if self._versions[slot] != version:
+                self.stats['stale'] += 1
+                return None
+            if now - self._computed_at[slot] > self.max_staleness:
+                self.stats['expired'] += 1
+                return None
+            self._slots.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._matrix[slot].astype(np.float32)
+    
+    def put(self, key: Optional[EntityKey], version: int, embedding: np.ndarray,
+            model_version: Optional[str], now: Optional[float] = None):
+        """
+        写入嵌入
+        
+        model_version 为开始计算时的模型版本，计算期间模型已更新则丢弃
+        """
+        if key is None:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            if model_version != self.model_version:
+                self.stats['rejected'] += 1
+                return
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._allocate()
+                self._slots[key] = slot
+            else:
+                self._slots.move_to_end(key)
+            self._matrix[slot] = embedding
+            self._versions[slot] = version
+            self._computed_at[slot] = now
+            self.stats['puts'] += 1
+    
+    def _allocate(self) -> int:
+        """分配一行（持有锁）"""
+        if self._free:
+            return self._free.pop()
+        if self._size >= self.max_entries:
+            _, slot = self._slots.popitem(last=False)
+            self.stats['evictions'] += 1
+            return slot
+        if self._size >= len(self._matrix):
+            size = min(len(self._matrix) * 2, self.max_entries)
+            for name in ('_matrix', '_versions', '_computed_at'):
+                array = getattr(self, name)
+                grown = np.zeros((size,) + array.shape[1:], dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+        self._size += 1
+        return self._size - 1
+    
+    def stale_keys(self, keys: Iterable[EntityKey], versions: Callable[[EntityKey], Optional[int]]) -> List[EntityKey]:
+        """已缓存且版本落后于当前结构版本的实体（versions 返回 None 的实体已不在图中，直接移除）"""
+        cached = []
+        with self._lock:
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is not None:
+                    cached.append((key, int(self._versions[slot])))
+        stale = []
+        for key, cached_version in cached:
+            version = versions(key)
+            if version is None:
+                self.discard(key)
+            elif version != cached_version:
+                stale.append(key)
+        return stale
+    
+    def discard(self, key: EntityKey):
+        """移除实体的嵌入"""
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._free.append(slot)
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses'] + self.stats['stale'] + self.stats['expired']
+            return {
+                **self.stats,
+                'entries': len(self._slots),
+                'hit_rate': self.stats['hits'] / lookups if lookups > 0 else 0,
+                'model_version': self.model_version,
+                'matrix_bytes': self._matrix.nbytes
+            }
+
+
+class EmbeddingRefresher:
+    """后台重算结构变化过的已缓存实体"""
+    
+    def __init__(self, cache: NodeEmbeddingCache, graph_store, embed_fn,
+                 interval_s: float = 1.0, batch_size: int = 128):
+        """
+        Args:
+            cache: 节点嵌入缓存
+            graph_store: TransactionGraphStore（会开启结构变化跟踪）
+            embed_fn: 并图推理函数，返回每个节点的嵌入 [num_nodes, dim]
+            interval_s: 刷新间隔
+            batch_size: 每次合并推理的子图数
+        """
+        self.cache = cache
+        self.graph_store = graph_store
+        self.embed_fn = embed_fn
+        self.interval = max(0.01, float(interval_s))
+        self.batch_size = max(1, int(batch_size))
+        graph_store.track_changes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='embedding-refresh', daemon=True)
+        self._thread.start()
+        
+        # 统计信息
+        self.stats = {
+            'rounds': 0,
+            'changed': 0,
+            'refreshed': 0,
+            'errors': 0
+        }
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"节点嵌入刷新失败: {e}")
+    
+    def refresh_once(self) -> int:
+        """重算一轮，返回重算的实体数"""
+        changed = self.graph_store.drain_changed()
+        self.stats['rounds'] += 1
+        self.stats['changed'] += len(changed)
+        # 请求路径已经按新版本重算过的实体不再重复计算
+        keys = self.cache.stale_keys(changed, self.graph_store.version_of)
+        refreshed = 0
+        for i in range(0, len(keys), self.batch_size):
+            model_version = self.cache.model_version
+            subgraphs = [subgraph for subgraph in map(self.graph_store.sample_entity, keys[i:i + self.batch_size])
+                         if subgraph is not None]
+            if not subgraphs:
+                continue
+            embeddings = predict_batched(self.embed_fn, subgraphs)
+            for subgraph, embedding in zip(subgraphs, embeddings):
+                self.cache.put(subgraph.key, subgraph.version, embedding, model_version)
+            refreshed += len(subgraphs)
+        self.stats['refreshed'] += refreshed
+        return refreshed
+    
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+    
+    def close(self):
+        """停止后台线程"""
+        self._stop.set()
+        self._thread.join(timeout=5)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引擎故障切换 - 扩展功能
+完整版（GNN）引擎与精简版引擎同时加载在同一进程内，运行时按延迟 SLO 自动切换，无需重启：
+
+- 正常模式（full）：请求由完整版引擎处理，滚动窗口统计其 p99 延迟与错误率；
+  p99 超过 slo_p99_ms 或错误率超过 max_error_rate 时切换到精简版
+- 降级模式（lite）：请求由精简版引擎处理，每 probe_every 笔中有一笔仍交给完整版（探测），
+  降级至少 min_dwell_s 后，探测的 p99 低于 recover_p99_ms（低于 SLO，形成滞后区间）
+  且错误率达标时切回完整版；恢复判断至少需要 min_probes 个探测，低流量下 window_s 内
+  探测不足时取最近的 min_probes 个，不会因样本不足一直停留在降级模式
+- 完整版单笔失败时该笔由精简版重新检测，请求不失败
+- 每个结果的 engine_mode 记录处理时的模式，decision_tier 记录实际评分的引擎
+- 两个引擎的风险分与风险等级阈值相同（0-100，30/60/85），切换前后的结果可直接比较
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODE_FULL = 'full'
+MODE_LITE = 'lite'
+
+
+class EngineSupervisor:
+    """
+    按延迟 SLO 在完整版与精简版引擎之间切换
+    
+    对外接口与检测引擎一致（detect / detect_async / detect_batch / get_stats / close）
+    """
+    
+    def __init__(self, primary, fallback,
+                 slo_p99_ms: float = 100.0,
+                 max_error_rate: float = 0.05,
+                 recover_p99_ms: Optional[float] = None,
+                 window_size: int = 500,
+                 window_s: float = 30.0,
+                 min_samples: int = 50,
+                 min_probes: int = 10,
+                 min_dwell_s: float = 30.0,
+                 probe_every: int = 20,
+                 check_interval_s: float = 0.5):
+        """
+        Args:
+            primary: 完整版引擎（或以完整版为第二级的级联引擎）
+            fallback: 精简版引擎
+            slo_p99_ms: 完整版 p99 延迟目标，超过即切换到精简版
+            max_error_rate: 完整版错误率上限
+            recover_p99_ms: 切回完整版要求的探测 p99 上限，默认为 SLO 的 70%
+            window_size: 滚动窗口最多保留的样本数
+            window_s: 滚动窗口时长（更早的样本不参与统计）
+            min_samples: 作出切换判断所需的最少样本数
+            min_probes: 降级期间作出恢复判断所需的最少探测数
+            min_dwell_s: 降级后至少保持的时间
+            probe_every: 降级期间每多少笔请求探测一次完整版（0 为不探测，不会自动恢复）
+            check_interval_s: 两次 SLO 判断的最小间隔
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.slo_p99_ms = float(slo_p99_ms)
+        self.max_error_rate = float(max_error_rate)
+        self.recover_p99_ms = float(recover_p99_ms if recover_p99_ms is not None
+                                    else self.slo_p99_ms * 0.7)
+        self.window_s = float(window_s)
+        self.min_samples = max(1, int(min_samples))
+        self.min_probes = max(1, int(min_probes))
+        self.min_dwell_s = float(min_dwell_s)
+        self.probe_every = max(0, int(probe_every))
+        self.check_interval_s = float(check_interval_s)
+        
+        self.mode = MODE_FULL
+        self.mode_since = time.time()
+        # 完整版的样本: (完成时间, 耗时ms, 是否失败)；切换模式时清空
+        self._window = deque(maxlen=max(self.min_samples, self.min_probes, int(window_size)))
+        self._last_check = 0.0
+        self._requests = 0
+        self._last_p99 = 0.0
+        self._last_error_rate = 0.0
+        self._lock = threading.Lock()
+        
+        # 与精简版引擎共享配置、状态存储与监控指标
+        self.config = fallback.config
+        self.state_store = getattr(fallback, 'state_store', None)
+        self.metrics = getattr(fallback, 'metrics', None)
+        
+        # 统计信息
+        self.stats = {
+            'primary_requests': 0,
+            'fallback_requests': 0,
+            'probes': 0,
+            'primary_errors': 0,
+            'failovers': 0,
+            'recoveries': 0
+        }
+    
+    @classmethod
+    def from_config(cls, engine, config_path: str = 'config/config.yaml') -> 'EngineSupervisor':
+        """
+        按 performance.failover 配置创建
+        
+        engine 为级联引擎时以其作为完整版一侧、其第一级为精简版；
+        否则 engine 为精简版，完整版引擎在此加载（依赖 torch）
+        """
+        fallback = getattr(engine, 'lite', None)
+        if fallback is not None:
+            primary = engine
+        else:
+            from core.fraud_detection_engine import FraudDetectionEngine as FullDetectionEngine
+            primary, fallback = FullDetectionEngine(config_path), engine
+        
+        failover_cfg = fallback.config.get('performance', {}).get('failover', {})
+        supervisor = cls(
+            primary,
+            fallback,
+            slo_p99_ms=failover_cfg.get('slo_p99_ms', 100.0),
+            max_error_rate=failover_cfg.get('max_error_rate', 0.05),
+            recover_p99_ms=failover_cfg.get('recover_p99_ms'),
+            window_size=failover_cfg.get('window_size', 500),
+            window_s=failover_cfg.get('window_s', 30.0),
+            min_samples=failover_cfg.get('min_samples', 50),
+            min_probes=failover_cfg.get('min_probes', 10),
+            min_dwell_s=failover_cfg.get('min_dwell_s', 30.0),
+            probe_every=failover_cfg.get('probe_every', 20)
+        )
+        logger.info(f"引擎故障切换已启用: p99 > {supervisor.slo_p99_ms:g}ms 或错误率 > "
+                    f"{supervisor.max_error_rate:.0%} 时切换到精简版，"
+                    f"p99 < {supervisor.recover_p99_ms:g}ms 时恢复")
+        return supervisor
+    
+    # ---------- 路由 ----------
+    
+    def _route(self):
+        """返回 (处理引擎, 当前模式)"""
+        with self._lock:
+            mode = self.mode
+            self._requests += 1
+            if mode == MODE_FULL:
+                self.stats['primary_requests'] += 1
+                return self.primary, mode
+            if self.probe_every and self._requests % self.probe_every == 0:
+                self.stats['probes'] += 1
+                return self.primary, mode
+            self.stats['fallback_requests'] += 1
+            return self.fallback, mode
+    
+    def detect(self, transaction: Dict, deadline: Optional[float] = None):
+        """单笔检测"""
+        engine, mode = self._route()
+        if engine is self.primary:
+            start = time.perf_counter()
+            try:
+                result = engine.detect(transaction, deadline)
+            except Exception as e:
+                self._observe([(time.perf_counter() - start) * 1000], errors=1)
+                logger.warning(f"完整版引擎检测失败，由精简版处理: {e}")
+                result = self.fallback.detect(transaction, deadline)
+                return self._mark(result, mode, MODE_LITE)
+            self._observe([(time.perf_counter() - start) * 1000])
+            return self._mark(result, mode, MODE_FULL)
+        return self._mark(engine.detect(transaction, deadline), mode, MODE_LITE)
+    
+    async def detect_async(self, transaction: Dict, deadline: Optional[float] = None):
+        """异步检测"""
+        engine, mode = self._route()
+        if engine is self.primary:
+            start = time.perf_counter()
+            try:
+                result = await engine.detect_async(transaction, deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._observe([(time.perf_counter() - start) * 1000], errors=1)
+                logger.warning(f"完整版引擎检测失败，由精简版处理: {e}")
+                result = await self.fallback.detect_async(transaction, deadline)
+                return self._mark(result, mode, MODE_LITE)
+            self._observe([(time.perf_counter() - start) * 1000])
+            return self._mark(result, mode, MODE_FULL)
+        return self._mark(await engine.detect_async(transaction, deadline), mode, MODE_LITE)
+    
+    def detect_batch(self, transactions: List[Dict],
+                     return_exceptions: bool = True,
+                     deadline: Optional[float] = None) -> List:
+        """批量检测：整批路由到同一引擎，完整版失败的交易由精简版重新检测"""
+        engine, mode = self._route()
+        if engine is not self.primary:
+            results = engine.detect_batch(transactions, return_exceptions, deadline)
+            return [self._mark(r, mode, MODE_LITE) for r in results]
+        
+        start = time.perf_counter()
+        try:
+            results = engine.detect_batch(transactions, True, deadline)
+        except Exception as e:
+            logger.warning(f"完整版引擎批量检测失败，由精简版处理: {e}")
+            results = [e] * len(transactions)
+        # 整批完成时每笔请求都已等待了整批的耗时
+        elapsed = (time.perf_counter() - start) * 1000
+        failed = [i for i, r in enumerate(results) if isinstance(r, Exception)]
+        self._observe([elapsed] * len(transactions), errors=len(failed))
+        
+        results = [self._mark(r, mode, MODE_FULL) for r in results]
+        if failed:
+            retried = self.fallback.detect_batch([transactions[i] for i in failed],
+                                                 return_exceptions, deadline)
+            for i, result in zip(failed, retried):
+                results[i] = self._mark(result, mode, MODE_LITE)
+        return results
+    
+    @staticmethod
+    def _mark(result, mode: str, tier: str):
+        """结果记录模式与实际评分的引擎（级联引擎已记录的 decision_tier 保留）"""
+        if isinstance(result, Exception):
+            return result
+        result.engine_mode = mode
+        if getattr(result, 'decision_tier', None) is None:
+            result.decision_tier = tier
+        return result
+    
+    # ---------- SLO 判断 ----------
+    
+    def _observe(self, latencies_ms: List[float], errors: int = 0):
+        """记录完整版样本，按间隔判断是否切换"""
+        now = time.time()
+        with self._lock:
+            for i, latency in enumerate(latencies_ms):
+                self._window.append((now, latency, i < errors))
+            self.stats['primary_errors'] += errors
+            if now - self._last_check < self.check_interval_s:
+                return
+            self._last_check = now
+            self._evaluate(now)
+    
+    def _evaluate(self, now: float):
+        """按滚动窗口的 p99 与错误率切换模式（持有锁）"""
+        if self.mode == MODE_FULL:
+            while self._window and now - self._window[0][0] > self.window_s:
+                self._window.popleft()
+            samples, required = list(self._window), self.min_samples
+        else:
+            # 降级期间窗口中只有切换后的探测样本，不按时间淘汰：
+            # window_s 内探测不足 min_probes 个（低流量）时取最近的 min_probes 个
+            samples = [sample for sample in self._window if now - sample[0] <= self.window_s]
+            if len(samples) < self.min_probes:
+                samples = list(self._window)[-self.min_probes:]
+            required = self.min_probes
+        if len(samples) < required:
+            return
+        latencies = sorted(sample[1] for sample in samples)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        error_rate = sum(1 for sample in samples if sample[2]) / len(samples)
+        self._last_p99, self._last_error_rate = p99, error_rate
+        
+        if self.mode == MODE_FULL:
+            if p99 > self.slo_p99_ms or error_rate > self.max_error_rate:
+                self._switch(MODE_LITE, now)
+                self.stats['failovers'] += 1
+                logger.error(f"完整版引擎超出 SLO（p99 {p99:.1f}ms，错误率 {error_rate:.1%}），"
+                             f"切换到精简版引擎")
+        elif (now - self.mode_since >= self.min_dwell_s
+              and p99 <= self.recover_p99_ms and error_rate <= self.max_error_rate):
+            self._switch(MODE_FULL, now)
+            self.stats['recoveries'] += 1
+            logger.info(f"完整版引擎已恢复（探测 p99 {p99:.1f}ms，错误率 {error_rate:.1%}），"
+                        f"切回完整版引擎")
+    
+    def _switch(self, mode: str, now: float):
+        self.mode = mode
+        self.mode_since = now
+        # 切换前的样本不参与下一阶段的判断
+        self._window.clear()
+    
+    # ---------- 统计 ----------
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息（顶层为当前模式引擎的统计，engines 中为两个引擎各自的统计）"""
+        primary_stats = self.primary.get_stats()
+        fallback_stats = self.fallback.get_stats()
+        with self._lock:
+            failover = dict(self.stats)
+            failover.update(
+                mode=self.mode,
+                mode_since=self.mode_since,
+                window_samples=len(self._window),
+                window_p99_ms=round(self._last_p99, 2),
+                window_error_rate=round(self._last_error_rate, 4),
+                slo_p99_ms=self.slo_p99_ms,
+                recover_p99_ms=self.recover_p99_ms
+            )
+        total = primary_stats.get('total_requests', 0) + fallback_stats.get('total_requests', 0)
+        fraud = primary_stats.get('fraud_detected', 0) + fallback_stats.get('fraud_detected', 0)
+        avg = (primary_stats.get('avg_response_time', 0) * primary_stats.get('total_requests', 0)
+               + fallback_stats.get('avg_response_time', 0) * fallback_stats.get('total_requests', 0))
+        return {
+            'total_requests': total,
+            'fraud_detected': fraud,
+            'fraud_rate': fraud / total if total > 0 else 0,
+            'avg_response_time': round(avg / total, 2) if total > 0 else 0.0,
+            'failover': failover,
+            'engines': {'full': primary_stats, 'lite': fallback_stats}
+        }
+    
+    def close(self):
+        """关闭两个引擎"""
+        for engine in (self.primary, self.fallback):
+            close = getattr(engine, 'close', None)
+            if close is not None:
+                close()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速编解码 - 扩展功能
+请求字节直接解码为交易、检测结果直接编码为字节，
+替代 Pydantic 校验 + 默认JSON编码器；Redis/Kafka 序列化共用同一路径
+
+后端优先级：msgspec > orjson > 标准库json（均为可选依赖）
+"""
+
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+if MSGSPEC_AVAILABLE:
+    class TransactionStruct(msgspec.Struct):
+        """检测请求（字段与 api_server.DetectionRequest 一致）"""
+        user_id: str
+        item_id: Optional[str] = None
+        amount: Optional[float] = None
+        timestamp: Optional[float] = None
+        ip: Optional[str] = None
+        device_id: Optional[str] = None
+        action: Optional[str] = "purchase"
+        features: Optional[Dict[str, Any]] = None
+
+
+# 可选字符串字段
+_STR_FIELDS = ('item_id', 'ip', 'device_id', 'action')
+
+# 可选数值字段
+_NUM_FIELDS = ('amount', 'timestamp')
+
+
+def _numpy_hook(obj):
+    """numpy 标量转为 Python 原生类型"""
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"不支持序列化的类型: {type(obj).__name__}")
+
+
+class FastCodec:
+    """
+    检测请求/结果编解码器
+    
+    decode_transaction 校验失败时抛出 ValueError
+    """
+    
+    def __init__(self, backend: str = 'auto'):
+        self.backend = self._resolve_backend(backend)
+        
+        if self.backend == 'msgspec':
+            self._decoder = msgspec.json.Decoder(TransactionStruct)
+            self._encoder = msgspec.json.Encoder(enc_hook=_numpy_hook)
+        
+        logger.info(f"快速编解码后端: {self.backend}")
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['FastCodec']:
+        """从 performance 配置段创建，未启用或无可用后端时返回 None"""
+        codec_cfg = config.get('fast_codec', {})
+        if not codec_cfg.get('enabled', False):
+            return None
+        codec = cls(codec_cfg.get('backend', 'auto'))
+        if codec.backend == 'json':
+            return None
+        return codec
+    
+    @staticmethod
+    def _resolve_backend(backend: str) -> str:
+        if backend in ('auto', 'msgspec') and MSGSPEC_AVAILABLE:
+            return 'msgspec'
+        if backend in ('auto', 'msgspec', 'orjson') and ORJSON_AVAILABLE:
+            return 'orjson'
+        if backend not in ('auto', 'json'):
+            logger.warning(f"编解码后端 {backend} 不可用，使用标准库json")
+        return 'json'
+    
+    def decode_transaction(self, body: bytes) -> Dict:
+        """请求字节解码为引擎使用的交易字典"""
+        if self.backend == 'msgspec':
+            try:
+                req = self._decoder.decode(body)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e))
+            return {
+                'user_id': req.user_id,
+                'item_id': req.item_id or '',
+                'amount': req.amount or 0.0,
+                'timestamp': req.timestamp or time.time(),
+                'ip': req.ip or '',
+                'device_id': req.device_id or '',
+                'action': req.action,
+                'features': req.features or {}
+            }
+        
+        return self.to_transaction(self.loads(body))
+    
+    @staticmethod
+    def to_transaction(data: Any) -> Dict:
+        """校验已解析的请求并转换为交易字典"""
+        if not isinstance(data, dict):
+            raise ValueError("请求体必须是JSON对象")
+        if not isinstance(data.get('user_id'), str):
+            raise ValueError("user_id 必须是字符串")
+        
+        for name in _STR_FIELDS:
+            value = data.get(name)
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{name} 必须是字符串")
+        for name in _NUM_FIELDS:
+            value = data.get(name)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"{name} 必须是数值")
+        features = data.get('features')
+        if features is not None and not isinstance(features, dict):
+            raise ValueError("features 必须是JSON对象")
+        
+        return {
+            'user_id': data['user_id'],
+            'item_id': data.get('item_id') or '',
+            'amount': float(data.get('amount') or 0.0),
+            'timestamp': float(data.get('timestamp') or time.time()),
+            'ip': data.get('ip') or '',
+            'device_id': data.get('device_id') or '',
+            'action': data.get('action', 'purchase'),
+            'features': features or {}
+        }
+    
+    def encode_result(self, result) -> bytes:
+        """检测结果编码为JSON字节（字段以 DetectionResult.to_dict 为准）"""
+        return self.dumps(result.to_dict())
+    
+    def dumps(self, obj: Any) -> bytes:
+        """任意对象编码为JSON字节"""
+        if self.backend == 'msgspec':
+            return self._encoder.encode(obj)
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, default=_numpy_hook, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(obj, default=_numpy_hook).encode('utf-8')
+    
+    def loads(self, data: bytes) -> Any:
+        """JSON字节解码"""
+        if self.backend == 'msgspec':
+            try:
+                return msgspec.json.decode(data)
+            except msgspec.DecodeError as e:
+                raise ValueError(f"JSON解析失败: {e}")
+        try:
+            if self.backend == 'orjson':
+                return orjson.loads(data)
+            return json.loads(data)
+        except ValueError as e:
+            raise ValueError(f"JSON解析失败: {e}")
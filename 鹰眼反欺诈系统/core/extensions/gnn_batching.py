@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 批量推理 - 扩展功能
+单笔交易的子图只有几十个节点，逐笔调用 GraphNeuralNetworkDetector.forward 时耗时几乎都是
+torch 的算子调度开销。多笔交易的子图合并为一个不相交并图（节点编号按偏移量平移），
+一次前向传播后按各子图的中心节点取回推理结果（欺诈概率或节点嵌入）：
+
+- merge_subgraphs: 不相交并图；消息传递不跨越子图，GCN 归一化与 GAT 注意力只依赖各自的邻居，
+  结果与逐笔推理一致
+- predict_batched: 同步批量推理（批量检测接口，按 max_batch_size 分块）
+- GNNInferenceBatcher: 并发请求的单笔推理由后台线程合并为批次，
+  第一个请求到达后凑满 max_batch_size 或等待超过 max_wait_ms 即推理
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.extensions.graph_store import Subgraph
+
+logger = logging.getLogger(__name__)
+
+# (节点特征, 边索引, 边权重) → 每个节点的推理结果（欺诈概率 [num_nodes] 或嵌入 [num_nodes, dim]）
+InferFn = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+def merge_subgraphs(subgraphs: Sequence[Subgraph]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    合并为不相交并图
+    
+    Returns:
+        (节点特征, 边索引, 边权重, 各子图中心节点在并图中的下标)
+    """
+    sizes = np.fromiter((len(s.x) for s in subgraphs), dtype=np.int64, count=len(subgraphs))
+    offsets = np.zeros(len(subgraphs), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=offsets[1:])
+    x = np.concatenate([s.x for s in subgraphs])
+    edge_index = np.concatenate([s.edge_index + offset for s, offset in zip(subgraphs, offsets.tolist())],
+                                axis=1)
+    edge_weight = np.concatenate([s.edge_weight for s in subgraphs])
+    centers = offsets + np.fromiter((s.center for s in subgraphs), dtype=np.int64, count=len(subgraphs))
+    return x, edge_index, edge_weight, centers
+
+
+def predict_batched(infer_fn: InferFn, subgraphs: Sequence[Subgraph],
+                    max_batch_size: Optional[int] = None) -> np.ndarray:
+    """按 max_batch_size 分块合并推理，返回各子图中心节点的推理结果（第一维与 subgraphs 对应）"""
+    step = max_batch_size or len(subgraphs) or 1
+    outputs = []
+    for i in range(0, len(subgraphs), step):
+        x, edge_index, edge_weight, centers = merge_subgraphs(subgraphs[i:i + step])
+        outputs.append(np.asarray(infer_fn(x, edge_index, edge_weight))[centers])
+    return np.concatenate(outputs) if outputs else np.zeros(0, dtype=np.float32)
+
+
+class GNNInferenceBatcher:
+    """
+    并发单笔推理的批处理器
+    
+    推理只在后台线程中执行（模型不需要支持多线程并发调用）；
+    close() 后提交的子图直接抛出 RuntimeError，不会无限等待
+    """
+    
+    def __init__(self, infer_fn: InferFn, max_batch_size: int = 32, max_wait_ms: float = 1.0):
+        """
+        Args:
+            infer_fn: 并图推理函数，返回每个节点的推理结果
+            max_batch_size: 批次上限（子图数）
+            max_wait_ms: 第一个请求到达后最长等待时间（毫秒）
+        """
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: 'queue.Queue[Optional[Tuple[Subgraph, Future]]]' = queue.Queue()
+        # 提交与关闭在锁内进行：关闭标记（None）之前入队的子图都会被推理
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='gnn-batch', daemon=True)
+        self._worker.start()
+        
+        # 统计信息
+        self.stats = {
+            'batches': 0,
+            'items': 0,
+            'max_batch': 0,
+            'errors': 0
+        }
+    
+    @classmethod
+    def from_config(cls, infer_fn: InferFn, config: Dict) -> Optional['GNNInferenceBatcher']:
+        """按 performance.gnn_batching 配置创建，未启用时返回 None"""
+        if not config.get('enabled', False):
+            return None
+        batcher = cls(infer_fn, config.get('max_batch_size', 32), config.get('max_wait_ms', 1.0))
+        logger.info(f"GNN批量推理已启动: batch_size={batcher.max_batch_size}, "
+                    f"max_wait={batcher.max_wait * 1000:.1f}ms")
+        return batcher
+    
+    def predict(self, subgraph: Subgraph, timeout: Optional[float] = None) -> np.ndarray:
+        """提交单个子图，等待所在批次推理完成后返回中心节点的推理结果（已关闭时抛出 RuntimeError）"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("GNN批量推理已关闭")
+            self._queue.put((subgraph, future))
+        return future.result(timeout)
+    
+    def _run(self):
+        """收集批次并推理"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            
+            while len(batch) < self.max_batch_size:
+                # 先取走已排队的请求，队列为空时再等待剩余时间
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._flush(batch)
+            if stopping:
+                return
+    
+    def _flush(self, batch: List[Tuple[Subgraph, Future]]):
+        """推理一个批次并把结果分发给各个等待者"""
+        try:
+            outputs = predict_batched(self.infer_fn, [subgraph for subgraph, _ in batch])
+        except Exception as e:
+            logger.error(f"GNN批量推理失败: {len(batch)} 个子图, {e}")
+            self.stats['errors'] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        self.stats['batches'] += 1
+        self.stats['items'] += len(batch)
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+    
+    def get_stats(self) -> Dict:
+        """获取批量推理统计"""
+        batches = self.stats['batches']
+        return {
+            **self.stats,
+            'avg_batch': self.stats['items'] / batches if batches > 0 else 0,
+            'queue_depth': self._queue.qsize()
+        }
+    
+    def close(self):
+        """停止后台线程（处理完已排队的请求）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join(timeout=5)
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易关系图存储 - 扩展功能
+进程内维护 用户/商品/设备/IP 异构关系图，为完整版引擎的GNN推理提供以用户为中心的邻域子图
+
+- 增量写入：每次检测追加本笔交易的 用户-商品、用户-设备、用户-IP、设备-IP 边，
+  重复出现的边按半衰期衰减后累加权重
+- 邻接存储：压缩后的边保存为 CSR 数组（indptr / 边编号），之后新增的边记在增量表中；
+  增量边数超过已压缩边数的一定比例时由后台线程重建 CSR（排序不持有锁，重建期间旧 CSR 与增量表照常查询）
+- 内存有界：重建时淘汰超过 max_age_s 未出现的边与孤立节点，边数超过 max_edges 时淘汰最旧的边，
+  淘汰的节点/边槽位复用
+- k跳采样：每跳每个节点按衰减后的权重保留 fanout 个最强邻居，输出节点特征矩阵与边索引
+- 结构版本：节点新增或淘汰了相连的边时取一个新的全局版本号（嵌入缓存据此判断缓存是否失效），
+  开启变化跟踪后可以取走上次之后结构变化过的节点
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NODE_TYPES = ('user', 'item', 'device', 'ip')
+
+# 交易字段 → 节点类型
+NODE_FIELDS = (('user_id', 0), ('item_id', 1), ('device_id', 2), ('ip', 3))
+
+# 边类型（按编号）：两端节点类型
+EDGE_TYPES = ((0, 1), (0, 2), (0, 3), (2, 3))   # 用户-商品、用户-设备、用户-IP、设备-IP
+
+# 节点特征布局：类型独热(4)、交易数、平均金额、最大金额、活跃度、各类边的度(4)、是否中心节点
+MIN_FEATURE_DIM = 13
+
+
+@dataclass
+class Subgraph:
+    """以用户为中心的采样子图"""
+    x: np.ndarray             # 节点特征 [num_nodes, feature_dim] float32
+    edge_index: np.ndarray    # 边索引 [2, num_edges] int64（双向）
+    edge_weight: np.ndarray   # 衰减后的边权重 [num_edges] float32
+    center: int = 0           # 中心节点在子图中的下标
+    key: Optional[Tuple[int, str]] = None   # 中心节点 (类型, 值)，图中没有相关实体时为 None
+    version: int = 0          # 采样时中心节点的结构版本
+
+
+class TransactionGraphStore:
+    """交易关系图（线程安全）"""
+    
+    def __init__(self,
+                 feature_dim: int = 32,
+                 half_life_s: float = 86400.0,
+                 max_age_s: float = 604800.0,
+                 max_edges: int = 2000000,
+                 hops: int = 2,
+                 fanout: Sequence[int] = (10, 5),
+                 max_scan: int = 256,
+                 compact_interval_s: float = 60.0,
+                 compact_min_delta: int = 4096,
+                 compact_ratio: float = 0.25):
+        """
+        Args:
+            feature_dim: 节点特征维度（与GNN模型 input_dim 一致，不足的部分补零）
+            half_life_s: 边权重与节点活跃度的半衰期
+            max_age_s: 边超过该时间未出现即淘汰
+            max_edges: 边数上限，超出后淘汰最旧的边
+            hops: 采样跳数
+            fanout: 各跳每个节点保留的邻居数（跳数多于配置时沿用最后一个值）
+            max_scan: 每个节点最多比较的边数（热点节点保留最近新增的边，其余随机抽取）
+            compact_interval_s: 两次淘汰检查的最大间隔（增量边较少时按时间触发）
+            compact_min_delta: 触发重建 CSR 的最少增量边数
+            compact_ratio: 增量边数超过已压缩边数的该比例时重建 CSR
+        """
+        if feature_dim < MIN_FEATURE_DIM:
+            raise ValueError(f"节点特征维度至少为 {MIN_FEATURE_DIM}: {feature_dim}")
+        if hops < 1 or not fanout or min(fanout) < 1:
+            raise ValueError(f"采样参数无效: hops={hops}, fanout={list(fanout)}")
+        self.feature_dim = int(feature_dim)
+        self.half_life = float(half_life_s)
+        self.max_age = float(max_age_s)
+        self.max_edges = max(1, int(max_edges))
+        self.hops = int(hops)
+        self.fanout = tuple(int(f) for f in fanout)
+        self.max_scan = max(max(self.fanout), int(max_scan))
+        self.compact_interval = float(compact_interval_s)
+        self.compact_min_delta = max(1, int(compact_min_delta))
+        self.compact_ratio = float(compact_ratio)
+        
+        # 节点：(类型, 值) → 编号；数组按编号索引，淘汰后的编号放入空闲表复用
+        self._node_ids: Dict[Tuple[int, str], int] = {}
+        self._node_keys: List[Optional[Tuple[int, str]]] = []
+        self._free_nodes: List[int] = []
+        self._node_type = np.zeros(1024, dtype=np.int8)
+        self._node_count = np.zeros(1024, dtype=np.float64)
+        self._node_amount = np.zeros(1024, dtype=np.float64)
+        self._node_amount_max = np.zeros(1024, dtype=np.float64)
+        self._node_seen = np.zeros(1024, dtype=np.float64)
+        self._node_degree = np.zeros((1024, len(EDGE_TYPES)), dtype=np.int32)
+        self._node_version = np.zeros(1024, dtype=np.int64)
+        self._version_clock = 0
+        # 结构变化过的节点编号（None 表示未开启跟踪）
+        self._changed: Optional[set] = None
+        
+        # 边：(较小节点编号, 较大节点编号) → 编号（两个节点的类型确定了边类型）
+        self._edge_ids: Dict[Tuple[int, int], int] = {}
+        self._free_edges: List[int] = []
+        self._num_edges = 0
+        self._edge_src = np.zeros(4096, dtype=np.int64)
+        self._edge_dst = np.zeros(4096, dtype=np.int64)
+        self._edge_type = np.zeros(4096, dtype=np.int8)
+        self._edge_weight = np.zeros(4096, dtype=np.float64)
+        self._edge_ts = np.zeros(4096, dtype=np.float64)
+        self._edge_alive = np.zeros(4096, dtype=bool)
+        
+        # CSR：节点 u 的边编号为 csr_edges[indptr[u]:indptr[u+1]]
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._csr_edges = np.zeros(0, dtype=np.int64)
+        self._csr_edge_count = 0
+        # 上次重建之后新增的边：节点编号 → 边编号列表（重建期间旧增量表移到 pending_delta）
+        self._delta: Dict[int, List[int]] = {}
+        self._pending_delta: Dict[int, List[int]] = {}
+        self._delta_edges = 0
+        self._last_compact = time.time()
+        self._compacting = False
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        
+        # 统计信息
+        self.stats = {
+            'appends': 0,
+            'samples': 0,
+            'compactions': 0,
+            'evicted_edges': 0,
+            'evicted_nodes': 0
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict, feature_dim: int = 32) -> Optional['TransactionGraphStore']:
+        """按 performance.graph_store 配置创建，未启用时返回 None"""
+        if not config.get('enabled', True):
+            return None
+        store = cls(
+            feature_dim=feature_dim,
+            half_life_s=config.get('half_life_s', 86400),
+            max_age_s=config.get('max_age_s', 604800),
+            max_edges=config.get('max_edges', 2000000),
+            hops=config.get('hops', 2),
+            fanout=config.get('fanout', (10, 5)),
+            max_scan=config.get('max_scan', 256),
+            compact_interval_s=config.get('compact_interval_s', 60)
+        )
+        logger.info(f"交易关系图已启用: {store.hops} 跳采样 (fanout {list(store.fanout)}), "
+                    f"边半衰期 {store.half_life:g}s, 保留 {store.max_age:g}s, 上限 {store.max_edges} 条边")
+        return store
+    
+    # ---------- 写入 ----------
+    
+    def append(self, transaction: Dict, now: Optional[float] = None):
+        """追加一笔交易涉及的节点与边"""
+        now = time.time() if now is None else now
+        amount = float(transaction.get('amount') or 0.0)
+        with self._lock:
+            ids = {}
+            for field, node_type in NODE_FIELDS:
+                value = transaction.get(field)
+                if value:
+                    ids[node_type] = self._upsert_node(node_type, str(value), amount, now)
+            for edge_type, (a, b) in enumerate(EDGE_TYPES):
+                if a in ids and b in ids:
+                    self._upsert_edge(ids[a], ids[b], edge_type, now)
+            self.stats['appends'] += 1
+            
+            if not self._compacting and (
+                    self._delta_edges >= max(self.compact_min_delta,
+                                             self.compact_ratio * self._csr_edge_count)
+                    or now - self._last_compact >= self.compact_interval):
+                self._compacting = True
+                threading.Thread(target=self._compact_in_background, args=(now,),
+                                 name='graph-compact', daemon=True).start()
+    
+    def _upsert_node(self, node_type: int, value: str, amount: float, now: float) -> int:
+        key = (node_type, value)
+        node = self._node_ids.get(key)
+        if node is None:
+            if self._free_nodes:
+                node = self._free_nodes.pop()
+                self._node_keys[node] = key
+            else:
+                node = len(self._node_keys)
+                self._node_keys.append(key)
+                if node >= len(self._node_type):
+                    self._grow_nodes()
+            self._node_ids[key] = node
+            self._node_type[node] = node_type
+            self._node_count[node] = 0.0
+            self._node_amount[node] = 0.0
+            self._node_amount_max[node] = 0.0
+            self._touch(node)
+        self._node_count[node] += 1.0
+        self._node_amount[node] += amount
+        if amount > self._node_amount_max[node]:
+            self._node_amount_max[node] = amount
+        self._node_seen[node] = now
+        return node
+    
+    def _upsert_edge(self, u: int, v: int, edge_type: int, now: float):
+        key = (u, v) if u < v else (v, u)
+        edge = self._edge_ids.get(key)
+        if edge is not None:
+            # 已有的边：旧权重衰减到当前时刻后加1
+            self._edge_weight[edge] = self._edge_weight[edge] * self._decay(now - self._edge_ts[edge]) + 1.0
+            self._edge_ts[edge] = now
+            return
+        
+        if self._free_edges:
+            edge = self._free_edges.pop()
+        else:
+            edge = self._num_edges
+            self._num_edges += 1
+            if edge >= len(self._edge_src):
+                self._grow_edges()
+        self._edge_ids[key] = edge
+        self._edge_src[edge], self._edge_dst[edge] = key
+        self._edge_type[edge] = edge_type
+        self._edge_weight[edge] = 1.0
+        self._edge_ts[edge] = now
+        self._edge_alive[edge] = True
+        self._node_degree[u, edge_type] += 1
+        self._node_degree[v, edge_type] += 1
+        self._touch(u, v)
+        self._delta.setdefault(u, []).append(edge)
+        self._delta.setdefault(v, []).append(edge)
+        self._delta_edges += 1
+    
+    def _touch(self, *nodes):
+        """节点结构变化：取新的版本号（持有锁）"""
+        self._version_clock += 1
+        for node in nodes:
+            self._node_version[node] = self._version_clock
+        if self._changed is not None:
+            self._changed.update(nodes)
+    
+    def _decay(self, elapsed):
+        return 0.5 ** (np.maximum(elapsed, 0.0) / self.half_life)
+    
+    def _grow_nodes(self):
+        size = len(self._node_type) * 2
+        for name in ('_node_type', '_node_count', '_node_amount', '_node_amount_max', '_node_seen',
+                     '_node_version'):
+            array = getattr(self, name)
+            grown = np.zeros(size, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+        degree = np.zeros((size, len(EDGE_TYPES)), dtype=np.int32)
+        degree[:len(self._node_degree)] = self._node_degree
+        self._node_degree = degree
+    
+    def _grow_edges(self):
+        size = len(self._edge_src) * 2
+        for name in ('_edge_src', '_edge_dst', '_edge_type', '_edge_weight', '_edge_ts', '_edge_alive'):
+            array = getattr(self, name)
+            grown = np.zeros(size, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+    
+    # ---------- 淘汰与重建 ----------
+    
+    def compact(self, now: Optional[float] = None):
+        """淘汰过期的边与孤立节点并重建 CSR（同步执行）"""
+        with self._compact_lock:
+            self._compact(time.time() if now is None else now)
+    
+    def _compact_in_background(self, now: float):
+        try:
+            self.compact(now)
+        except Exception as e:
+            logger.error(f"交易关系图重建失败: {e}")
+        finally:
+            self._compacting = False
+    
+    def _compact(self, now: float):
+        """（持有 compact_lock）淘汰与快照持有锁，排序不持有锁"""
+        with self._lock:
+            evicted_edges, evicted_nodes = self._evict(now)
+            live = np.flatnonzero(self._edge_alive[:self._num_edges])
+            src = np.concatenate((self._edge_src[live], self._edge_dst[live]))
+            num_nodes = len(self._node_keys)
+            # 之后新增的边记入新的增量表，旧增量表在新 CSR 生效前继续参与查询
+            self._pending_delta, self._delta = self._delta, {}
+            self._delta_edges = 0
+            self._last_compact = now
+        
+        # 重建 CSR（每条边在两端各出现一次）
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+        csr_edges = np.concatenate((live, live))[order]
+        
+        with self._lock:
+            self._indptr, self._csr_edges = indptr, csr_edges
+            self._csr_edge_count = len(live)
+            self._pending_delta = {}
+            # 新 CSR 不再引用淘汰的边与节点，槽位可以复用
+            self._free_edges.extend(evicted_edges)
+            self._free_nodes.extend(evicted_nodes)
+            self.stats['compactions'] += 1
+    
+    def _evict(self, now: float) -> Tuple[List[int], List[int]]:
+        """淘汰过期的边与孤立节点，返回 (淘汰的边编号, 淘汰的节点编号)（持有锁）"""
+        n = self._num_edges
+        alive = self._edge_alive[:n]
+        evict = alive & (self._edge_ts[:n] < now - self.max_age)
+        excess = int(alive.sum()) - int(evict.sum()) - self.max_edges
+        if excess > 0:
+            # 超出边数上限：淘汰剩余边中最旧的
+            candidates = np.flatnonzero(alive & ~evict)
+            oldest = np.argpartition(self._edge_ts[candidates], excess - 1)[:excess]
+            evict[candidates[oldest]] = True
+        
+        evicted = np.flatnonzero(evict)
+        if len(evicted):
+            src, dst = self._edge_src[evicted], self._edge_dst[evicted]
+            for u, v in zip(src.tolist(), dst.tolist()):
+                del self._edge_ids[(u, v)]
+            types = self._edge_type[evicted]
+            np.subtract.at(self._node_degree, (src, types), 1)
+            np.subtract.at(self._node_degree, (dst, types), 1)
+            self._version_clock += 1
+            self._node_version[src] = self._version_clock
+            self._node_version[dst] = self._version_clock
+            if self._changed is not None:
+                self._changed.update(src.tolist())
+                self._changed.update(dst.tolist())
+            self._edge_alive[evicted] = False
+            self.stats['evicted_edges'] += len(evicted)
+        
+        # 没有边且超过保留时间未出现的节点
+        num_nodes = len(self._node_keys)
+        orphans = np.flatnonzero((self._node_degree[:num_nodes].sum(axis=1) == 0)
+                                 & (self._node_seen[:num_nodes] < now - self.max_age))
+        evicted_nodes = []
+        for node in orphans.tolist():
+            key = self._node_keys[node]
+            if key is not None:
+                del self._node_ids[key]
+                self._node_keys[node] = None
+                evicted_nodes.append(node)
+        self.stats['evicted_nodes'] += len(evicted_nodes)
+        return evicted.tolist(), evicted_nodes
+    
+    # ---------- 采样 ----------
+    
+    def _incident_edges(self, node: int) -> np.ndarray:
+        """
+        节点的边编号：CSR 部分加上增量表，超过 max_scan 时保留最近新增的边、其余随机抽取
+        
+        重建期间旧 CSR 可能仍引用已淘汰的边，返回前过滤
+        """
+        if node + 1 < len(self._indptr):
+            start, end = int(self._indptr[node]), int(self._indptr[node + 1])
+        else:
+            start = end = 0
+        delta = self._delta.get(node, [])
+        pending = self._pending_delta.get(node)
+        if pending:
+            delta = pending + delta
+        room = self.max_scan - len(delta)
+        if room <= 0:
+            edges = np.array(delta[-self.max_scan:], dtype=np.int64)
+        else:
+            if end - start > room:
+                edges = self._csr_edges[np.unique(self._rng.integers(start, end, room))]
+            else:
+                edges = self._csr_edges[start:end]
+            if delta:
+                edges = np.concatenate((edges, np.array(delta, dtype=np.int64)))
+        return edges[self._edge_alive[edges]]
+    
+    def sample(self, transaction: Dict, hops: Optional[int] = None,
+               fanout: Optional[Sequence[int]] = None,
+               now: Optional[float] = None) -> Subgraph:
+        """
+        以交易用户为中心采样 k 跳邻域（用户不在图中时以交易的其他实体为中心）
+        
+        图中没有任何相关实体时返回只有中心节点的子图
+        """
+        with self._lock:
+            self.stats['samples'] += 1
+            return self._sample_node(self._center_node(transaction), hops, fanout, now)
+    
+    def sample_entity(self, key: Tuple[int, str], hops: Optional[int] = None,
+                      fanout: Optional[Sequence[int]] = None,
+                      now: Optional[float] = None) -> Optional[Subgraph]:
+        """以指定实体 (类型, 值) 为中心采样，实体已被淘汰时返回 None"""
+        with self._lock:
+            node = self._node_ids.get(key)
+            if node is None:
+                return None
+            self.stats['samples'] += 1
+            return self._sample_node(node, hops, fanout, now)
+    
+    def center(self, transaction: Dict) -> Tuple[Optional[Tuple[int, str]], int]:
+        """交易采样时的中心实体 (类型, 值) 及其结构版本，图中没有相关实体时为 (None, 0)"""
+        with self._lock:
+            node = self._center_node(transaction)
+            if node is None:
+                return None, 0
+            return self._node_keys[node], int(self._node_version[node])
+    
+    def version_of(self, key: Tuple[int, str]) -> Optional[int]:
+        """实体的结构版本，不在图中时返回 None"""
+        with self._lock:
+            node = self._node_ids.get(key)
+            return None if node is None else int(self._node_version[node])
+    
+    def track_changes(self):
+        """开启结构变化跟踪（由 drain_changed 定期取走，否则集合会持续增长）"""
+        with self._lock:
+            if self._changed is None:
+                self._changed = set()
+    
+    def drain_changed(self) -> List[Tuple[int, str]]:
+        """取走上次调用之后结构变化过的实体 (类型, 值)（已淘汰的实体不返回）"""
+        with self._lock:
+            if not self._changed:
+                return []
+            changed, self._changed = self._changed, set()
+            keys = [self._node_keys[node] for node in changed if node < len(self._node_keys)]
+        return [key for key in keys if key is not None]
+    
+    def _center_node(self, transaction: Dict) -> Optional[int]:
+        """按 用户/商品/设备/IP 的顺序取第一个在图中的实体（持有锁）"""
+        for field, node_type in NODE_FIELDS:
+            value = transaction.get(field)
+            node = self._node_ids.get((node_type, str(value))) if value else None
+            if node is not None:
+                return node
+        return None
+    
+    def _sample_node(self, center: Optional[int], hops: Optional[int],
+                     fanout: Optional[Sequence[int]], now: Optional[float]) -> Subgraph:
+        """（持有锁）"""
+        now = time.time() if now is None else now
+        hops = self.hops if hops is None else hops
+        fanout = self.fanout if fanout is None else tuple(fanout)
+        if center is None:
+            x = np.zeros((1, self.feature_dim), dtype=np.float32)
+            x[0, 0] = x[0, MIN_FEATURE_DIM - 1] = 1.0
+            return Subgraph(x, np.zeros((2, 0), dtype=np.int64), np.zeros(0, dtype=np.float32))
+        
+        local = {center: 0}
+        nodes = [center]
+        frontier = [center]
+        pairs: List[Tuple[int, int]] = []
+        pair_edges: List[int] = []
+        taken = set()
+        for hop in range(hops):
+            cap = fanout[min(hop, len(fanout) - 1)]
+            next_frontier = []
+            for u in frontier:
+                edges = self._incident_edges(u)
+                if len(edges) > cap:
+                    weights = self._edge_weight[edges] * self._decay(now - self._edge_ts[edges])
+                    edges = edges[np.argpartition(-weights, cap - 1)[:cap]]
+                src = self._edge_src[edges]
+                neighbors = np.where(src == u, self._edge_dst[edges], src)
+                for v, edge in zip(neighbors.tolist(), edges.tolist()):
+                    if edge in taken:
+                        continue
+                    taken.add(edge)
+                    index = local.get(v)
+                    if index is None:
+                        index = local[v] = len(nodes)
+                        nodes.append(v)
+                        next_frontier.append(v)
+                    pairs.append((local[u], index))
+                    pair_edges.append(edge)
+            frontier = next_frontier
+            if not frontier:
+                break
+        
+        x = self._features(np.array(nodes, dtype=np.int64), now)
+        if pairs:
+            edges = np.array(pair_edges, dtype=np.int64)
+            weights = (self._edge_weight[edges] * self._decay(now - self._edge_ts[edges])).astype(np.float32)
+        else:
+            weights = np.zeros(0, dtype=np.float32)
+        pair_array = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        edge_index = np.concatenate((pair_array.T, pair_array.T[::-1]), axis=1)
+        return Subgraph(x, np.ascontiguousarray(edge_index), np.concatenate((weights, weights)),
+                        key=self._node_keys[center], version=int(self._node_version[center]))
+    
+    def _features(self, nodes: np.ndarray, now: float) -> np.ndarray:
+        """节点特征（持有锁）"""
+        x = np.zeros((len(nodes), self.feature_dim), dtype=np.float32)
+        x[np.arange(len(nodes)), self._node_type[nodes]] = 1.0
+        count = self._node_count[nodes]
+        x[:, 4] = np.log1p(count)
+        x[:, 5] = np.log1p(self._node_amount[nodes] / np.maximum(count, 1.0))
+        x[:, 6] = np.log1p(self._node_amount_max[nodes])
+        x[:, 7] = self._decay(now - self._node_seen[nodes])
+        x[:, 8:12] = np.log1p(self._node_degree[nodes])
+        x[0, 12] = 1.0
+        return x
+    
+    # ---------- 统计 ----------
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息（节点/边数量与占用内存）"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update(
+                nodes=len(self._node_ids),
+                edges=len(self._edge_ids),
+                delta_edges=self._delta_edges
+            )
+            arrays = (self._node_type, self._node_count, self._node_amount, self._node_amount_max,
+                      self._node_seen, self._node_degree, self._node_version, self._edge_src, self._edge_dst,
+                      self._edge_type, self._edge_weight, self._edge_ts, self._edge_alive,
+                      self._indptr, self._csr_edges)
+            stats['array_bytes'] = sum(array.nbytes for array in arrays)
+        return stats
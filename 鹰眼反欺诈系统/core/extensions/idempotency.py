@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幂等结果缓存 - 扩展功能
+上游支付重试会把同一笔交易重复提交到 /detect，
+按幂等键缓存首次检测的响应，重试直接返回原结果，不再执行检测、不再重复落库
+
+- 幂等键：客户端的 Idempotency-Key 请求头，或交易字段的规范化哈希
+- 客户端键同时记录请求内容指纹，同一个键携带不同的交易内容时拒绝（IdempotencyConflict）
+- 进程内 LRU + TTL，可选 Redis 二级缓存（多 worker 共享）
+- 并发到达的重复请求合并为一次检测（single-flight）
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.extensions.circuit_breaker import CircuitBreakerOpen, get_breaker
+
+logger = logging.getLogger(__name__)
+
+# 参与规范化哈希的交易字段
+# 未携带 timestamp 的请求由服务端生成时间戳，因此不会被判为重复，
+# 避免把真实的连续下单合并掉而绕过频率检测
+KEY_FIELDS = ('user_id', 'item_id', 'amount', 'timestamp', 'ip', 'device_id', 'action', 'features')
+
+# 参与请求内容指纹的字段：timestamp 可能由服务端生成，重试时不一致，不参与比较
+FINGERPRINT_FIELDS = tuple(name for name in KEY_FIELDS if name != 'timestamp')
+
+
+class IdempotencyConflict(Exception):
+    """同一个 Idempotency-Key 携带了与首次请求不同的交易内容"""
+
+
+def _digest(values) -> str:
+    """规范化（键排序）后取哈希"""
+    canonical = json.dumps(values, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class IdempotencyCache:
+    """
+    幂等结果缓存
+    
+    缓存值为检测响应的JSON字节及请求内容指纹；检测失败（过载、异常）不缓存
+    """
+    
+    def __init__(self,
+                 ttl_seconds: float = 60.0,
+                 max_entries: int = 10000,
+                 redis_client=None,
+                 prefix: str = 'fraud:idem'):
+        """
+        Args:
+            ttl_seconds: 结果保留时间
+            max_entries: 进程内缓存条数上限（超出后淘汰最久未使用的条目）
+            redis_client: 可选 Redis 客户端，进程内未命中时再查 Redis
+            prefix: Redis 键前缀
+        """
+        self.ttl = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.redis = redis_client
+        self.breaker = get_breaker('redis') if redis_client is not None else None
+        self.prefix = prefix
+        self._entries: 'OrderedDict[str, Tuple[float, str, bytes]]' = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        
+        # 统计信息
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'collapsed': 0,
+            'redis_hits': 0,
+            'evictions': 0,
+            'conflicts': 0
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict, redis_client=None) -> 'IdempotencyCache':
+        """从 performance.idempotency 配置段创建"""
+        return cls(
+            ttl_seconds=config.get('ttl_seconds', 60),
+            max_entries=config.get('max_entries', 10000),
+            redis_client=redis_client
+        )
+    
+    @staticmethod
+    def make_key(transaction: Dict, idempotency_key: Optional[str] = None) -> str:
+        """
+        生成幂等键
+        
+        客户端提供的键与用户一起哈希，按用户隔离（不做字符串拼接，避免 user_id 或键中的分隔符造成冲突）；
+        否则对交易字段做规范化（键排序）后取哈希
+        """
+        if idempotency_key:
+            return 'k:' + _digest([transaction['user_id'], idempotency_key])
+        return 'h:' + _digest([transaction.get(name) for name in KEY_FIELDS])
+    
+    @staticmethod
+    def make_fingerprint(transaction: Dict) -> str:
+        """请求内容指纹：同一个客户端键的重试必须携带相同的交易内容"""
+        return _digest([transaction.get(name) for name in FINGERPRINT_FIELDS])
+    
+    async def get_or_run(self, key: str, fn: Callable[[], Awaitable[bytes]],
+                         fingerprint: str = '') -> Tuple[bytes, bool]:
+        """
+        返回幂等键对应的响应，不存在时执行 fn 并缓存
+        
+        Args:
+            key: 幂等键
+            fn: 检测函数
+            fingerprint: 请求内容指纹（客户端键时提供）；与已缓存或在途请求的指纹不同时抛出 IdempotencyConflict
+        
+        Returns:
+            (响应字节, 是否为重放结果)
+        """
+        entry = self._get_local(key)
+        if entry is not None:
+            self._check_fingerprint(key, entry[0], fingerprint)
+            self.stats['hits'] += 1
+            return entry[1], True
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # 相同请求正在检测，等待其结果
+            self._check_fingerprint(key, inflight[0], fingerprint)
+            future = inflight[1]
+            self.stats['collapsed'] += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 首个请求被取消（客户端断开），由当前请求重新执行
+                return await self.get_or_run(key, fn, fingerprint)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            if self.redis is not None:
+                entry = await loop.run_in_executor(None, self._redis_get, key)
+                if entry is not None:
+                    self._put_local(key, *entry)
+                    self._check_fingerprint(key, entry[0], fingerprint)
+                    self.stats['redis_hits'] += 1
+                    future.set_result(entry[1])
+                    return entry[1], True
+            
+            self.stats['misses'] += 1
+            value = await fn()
+            self._put_local(key, fingerprint, value)
+            if self.redis is not None:
+                loop.run_in_executor(None, self._redis_set, key, fingerprint, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待者时避免"exception was never retrieved"告警
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    def _check_fingerprint(self, key: str, cached: str, fingerprint: str):
+        if cached != fingerprint:
+            self.stats['conflicts'] += 1
+            raise IdempotencyConflict(f"幂等键已用于内容不同的请求: {key}")
+    
+    def _get_local(self, key: str) -> Optional[Tuple[str, bytes]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fingerprint, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, value
+    
+    def _put_local(self, key: str, fingerprint: str, value: bytes):
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def _redis_get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """Redis 中的值为 指纹 + 换行 + 响应字节"""
+        try:
+            value = self._call(self.redis.get, f"{self.prefix}:{key}")
+        except CircuitBreakerOpen:
+            return None
+        except Exception as e:
+            logger.warning(f"幂等缓存读取失败: {e}")
+            return None
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        fingerprint, _, body = value.partition(b'\n')
+        return fingerprint.decode('ascii', 'replace'), body
+    
+    def _redis_set(self, key: str, fingerprint: str, value: bytes):
+        try:
+            self._call(self.redis.setex, f"{self.prefix}:{key}", max(1, int(self.ttl)),
+                       fingerprint.encode('ascii') + b'\n' + value)
+        except CircuitBreakerOpen:
+            pass
+        except Exception as e:
+            logger.warning(f"幂等缓存写入失败: {e}")
+    
+    def _call(self, fn, *args):
+        """经熔断器访问 Redis；熔断器打开时抛出 CircuitBreakerOpen"""
+        if self.breaker is None:
+            return fn(*args)
+        return self.breaker.call(fn, *args)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            **self.stats,
+            'size': len(self._entries),
+            'inflight': len(self._inflight),
+            'backend': 'redis' if self.redis is not None else 'local'
+        }
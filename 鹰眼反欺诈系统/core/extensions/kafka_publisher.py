@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测结果 Kafka 发布 - 扩展功能
+替代逐条 send、无投递回调的默认 KafkaProducer
+
+- 调优的生产者参数：linger/batch_size 攒批、压缩、max_block_ms 限制 send 阻塞时间
+- 紧凑的二进制消息体（msgpack，不可用时为JSON），消息头 content-type 标明编码
+- 投递结果异步回调统计；投递失败或 broker 不可达时写入本地磁盘暂存（spool），
+  后台线程探测恢复后按原顺序回放
+- 消息键为 user_id：同一用户的结果进入同一分区
+- InMemoryBroker：进程内 Kafka 替身（生产者 + 消费组），用于测试与本地开发
+"""
+
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict, namedtuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgspec
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+CONTENT_TYPES = {
+    'msgpack': b'application/x-msgpack',
+    'json': b'application/json'
+}
+
+# 暂存文件帧：键长度（-1 表示无键）、值长度、编码
+_FRAME = struct.Struct('>iIB')
+_ENCODING_IDS = {'json': 0, 'msgpack': 1}
+_ENCODING_NAMES = {v: k for k, v in _ENCODING_IDS.items()}
+
+
+def encode_value(obj: Any, encoding: str = 'msgpack') -> bytes:
+    """消息体编码"""
+    if encoding == 'msgpack':
+        return msgspec.msgpack.encode(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_value(value: bytes, headers: Optional[List[Tuple[str, bytes]]] = None) -> Any:
+    """按消息头 content-type 解码消息体（无消息头时视为JSON，兼容旧消息）"""
+    content_type = dict(headers or ()).get('content-type')
+    if content_type == CONTENT_TYPES['msgpack']:
+        return msgspec.msgpack.decode(value)
+    return json.loads(value)
+
+
+def _best_compression() -> Optional[str]:
+    """当前环境可用的压缩算法（zstd > lz4 > snappy > gzip）"""
+    try:
+        from kafka import codec
+    except ImportError:
+        return None
+    for name, available in (('zstd', codec.has_zstd), ('lz4', codec.has_lz4),
+                            ('snappy', codec.has_snappy), ('gzip', codec.has_gzip)):
+        if available():
+            return name
+    return None
+
+
+class KafkaResultPublisher:
+    """
+    检测结果发布器
+    
+    publish 不阻塞请求线程：正常时交给生产者攒批发送，投递结果在回调中统计；
+    broker 不可达（生产者创建失败、send 超时、投递失败）后转为写入暂存文件，
+    直到后台线程把暂存记录全部回放成功。暂存期间的新记录也追加到暂存文件，
+    保证同一用户的结果顺序不变
+    """
+    
+    def __init__(self,
+                 producer_factory: Callable[[], Any],
+                 topic: str,
+                 encoding: str = 'msgpack',
+                 spool_path: Optional[str] = None,
+                 max_spool_mb: float = 512,
+                 probe_interval_s: float = 5.0,
+                 replay_batch: int = 500,
+                 flush_timeout_s: float = 10.0,
+                 breaker=None):
+        """
+        Args:
+            producer_factory: 创建生产者的函数（KafkaProducer 或兼容对象），失败时抛出异常
+            topic: 结果主题
+            encoding: 消息体编码，msgpack 或 json
+            spool_path: 暂存文件路径，为 None 时 broker 不可达期间的结果直接丢弃
+            max_spool_mb: 暂存文件大小上限，超出后丢弃新记录
+            probe_interval_s: 不可达时的探测/回放间隔
+            replay_batch: 回放时每批发送的记录数
+            flush_timeout_s: 回放每批、关闭时等待投递完成的时间
+            breaker: 可选熔断器，投递结果计入其状态（用于 /health 展示依赖状态）
+        """
+        if encoding == 'msgpack' and not MSGPACK_AVAILABLE:
+            logger.warning("msgspec 不可用，Kafka 消息体使用JSON编码")
+            encoding = 'json'
+        self.producer_factory = producer_factory
+        self.topic = topic
+        self.encoding = encoding
+        self.spool_path = spool_path
+        self.max_spool_bytes = int(max_spool_mb * 1024 * 1024)
+        self.probe_interval = max(0.05, float(probe_interval_s))
+        self.replay_batch = max(1, int(replay_batch))
+        self.flush_timeout = float(flush_timeout_s)
+        self.breaker = breaker
+        
+        self.producer = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closing = False
+        # 为 True 时新记录写入暂存文件（broker 不可达或暂存记录尚未回放完）
+        self._spooling = False
+        
+        # 统计信息
+        self.stats = {
+            'published': 0,
+            'delivered': 0,
+            'delivery_errors': 0,
+            'send_errors': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'dropped': 0,
+            'bytes': 0
+        }
+        
+        self._connect()
+        if self._spool_exists():
+            # 上次运行留下的暂存记录先回放
+            self._spooling = True
+            self._wakeup.set()
+        
+        self._thread = threading.Thread(target=self._run, name='kafka-publisher', daemon=True)
+        self._thread.start()
+    
+    @classmethod
+    def from_config(cls, bootstrap_servers: List[str], topic: str,
+                    config: Dict, breaker=None) -> 'KafkaResultPublisher':
+        """按 performance.kafka_producer 配置创建"""
+        options = {
+            'linger_ms': 5,
+            'batch_size': 64 * 1024,
+            'compression_type': 'auto',
+            'acks': 1,
+            'retries': 3,
+            'max_block_ms': 200,
+            'request_timeout_ms': 5000,
+            'delivery_timeout_ms': 15000,
+            **config.get('producer', {})
+        }
+        if options['compression_type'] == 'auto':
+            options['compression_type'] = _best_compression()
+        
+        def create_producer():
+            from kafka import KafkaProducer
+            return KafkaProducer(bootstrap_servers=bootstrap_servers, **options)
+        
+        logger.info(f"Kafka 发布参数: linger_ms={options['linger_ms']}, "
+                    f"batch_size={options['batch_size']}, compression={options['compression_type']}")
+        return cls(
+            create_producer,
+            topic,
+            encoding=config.get('encoding', 'msgpack'),
+            spool_path=config.get('spool_path', 'data/kafka_spool.bin'),
+            max_spool_mb=config.get('max_spool_mb', 512),
+            probe_interval_s=config.get('probe_interval_s', 5.0),
+            replay_batch=config.get('replay_batch', 500),
+            breaker=breaker
+        )
+    
+    @property
+    def healthy(self) -> bool:
+        """broker 可达且没有待回放的暂存记录"""
+        return self.producer is not None and not self._spooling
+    
+    def publish(self, key: Optional[str], value: Dict):
+        """发布一条检测结果（不阻塞；broker 不可达时写入暂存文件）"""
+        key_bytes = key.encode('utf-8') if key is not None else None
+        payload = encode_value(value, self.encoding)
+        with self._lock:
+            self.stats['published'] += 1
+            self.stats['bytes'] += len(payload)
+            if self._spooling or self.producer is None:
+                self._spool_locked([(key_bytes, payload, self.encoding)])
+                return
+            producer = self.producer
+        
+        try:
+            future = producer.send(self.topic, value=payload, key=key_bytes, headers=self._headers())
+        except Exception as e:
+            # 元数据在 max_block_ms 内不可用或发送缓冲已满：视为 broker 不可达
+            with self._lock:
+                self.stats['send_errors'] += 1
+                self._spool_locked([(key_bytes, payload, self.encoding)])
+            self._mark_unavailable(e)
+            return
+        future.add_callback(self._on_delivered)
+        future.add_errback(self._on_failed, key_bytes, payload, self.encoding)
+    
+    def _headers(self, encoding: Optional[str] = None) -> List[Tuple[str, bytes]]:
+        return [('content-type', CONTENT_TYPES[encoding or self.encoding])]
+    
+    def _on_delivered(self, metadata):
+        with self._lock:
+            self.stats['delivered'] += 1
+            spooling = self._spooling
+        if self.breaker is not None and not spooling:
+            self.breaker.record_success()
+    
+    def _on_failed(self, key_bytes: Optional[bytes], payload: bytes, encoding: str, exc):
+        """投递失败（在生产者I/O线程中回调）：记录写入暂存文件，等待回放"""
+        with self._lock:
+            self.stats['delivery_errors'] += 1
+            self._spool_locked([(key_bytes, payload, encoding)])
+        self._mark_unavailable(exc)
+    
+    def _mark_unavailable(self, exc):
+        with self._lock:
+            if self._spooling:
+                return
+            self._spooling = True
+        if self.breaker is not None:
+            # 发布器已转入暂存，熔断器同步打开，回放完成后关闭
+            self.breaker.trip(exc)
+        logger.error(f"Kafka 不可达，检测结果转存本地暂存文件: {exc}")
+        self._wakeup.set()
+    
+    def _connect(self) -> bool:
+        """创建生产者（broker 不可达时失败）"""
+        try:
+            producer = self.producer_factory()
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            logger.warning(f"Kafka 生产者创建失败: {e}")
+            return False
+        with self._lock:
+            self.producer = producer
+        logger.info(f"Kafka 生产者已连接，主题: {self.topic}")
+        return True
+    
+    # ---------- 暂存文件 ----------
+    
+    def _spool_exists(self) -> bool:
+        return self.spool_path is not None and (
+            os.path.exists(self.spool_path) or os.path.exists(self.spool_path + '.replay')
+        )
+    
+    def _spool_locked(self, records: List[Tuple[Optional[bytes], bytes, str]]):
+        """追加到暂存文件（调用方持有 self._lock）"""
+        if self.spool_path is None:
+            self.stats['dropped'] += len(records)
+            return
+        try:
+            directory = os.path.dirname(self.spool_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if (os.path.exists(self.spool_path)
+                    and os.path.getsize(self.spool_path) >= self.max_spool_bytes):
+                self.stats['dropped'] += len(records)
+                return
+            with open(self.spool_path, 'ab') as f:
+                f.write(self._frames(records))
+            self.stats['spooled'] += len(records)
+        except OSError as e:
+            self.stats['dropped'] += len(records)
+            logger.error(f"Kafka 暂存文件写入失败: {e}")
+    
+    @staticmethod
+    def _frames(records: List[Tuple[Optional[bytes], bytes, str]]) -> bytes:
+        parts = []
+        for key_bytes, payload, encoding in records:
+            key_len = -1 if key_bytes is None else len(key_bytes)
+            parts.append(_FRAME.pack(key_len, len(payload), _ENCODING_IDS[encoding]))
+            if key_bytes:
+                parts.append(key_bytes)
+            parts.append(payload)
+        return b''.join(parts)
+    
+    @staticmethod
+    def _read_frames(f, limit: int) -> Tuple[List[Tuple[Optional[bytes], bytes, str]], int]:
+        """
+        从文件当前位置读取至多 limit 条记录
+        
+        Returns:
+            (记录列表, 最后一条完整记录之后的文件位置)
+        """
+        records = []
+        offset = f.tell()
+        while len(records) < limit:
+            header = f.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                if header:
+                    logger.warning(f"Kafka 暂存文件末尾有不完整记录，已忽略 ({len(header)} 字节)")
+                break
+            key_len, value_len, encoding_id = _FRAME.unpack(header)
+            body = f.read(max(key_len, 0) + value_len)
+            if len(body) < max(key_len, 0) + value_len:
+                # 进程在写入中途退出留下的不完整帧
+                logger.warning(f"Kafka 暂存文件末尾有不完整记录，已忽略 ({_FRAME.size + len(body)} 字节)")
+                break
+            key_bytes = body[:key_len] if key_len >= 0 else None
+            records.append((key_bytes, body[max(key_len, 0):], _ENCODING_NAMES.get(encoding_id, 'json')))
+            offset = f.tell()
+        return records, offset
+    
+    @staticmethod
+    def _read_replay_offset(offset_path: str) -> int:
+        """读取回放文件中已确认部分的字节位置（不存在或损坏时从头回放）"""
+        try:
+            with open(offset_path, 'r', encoding='utf-8') as f:
+                return max(0, int(f.read().strip()))
+        except (OSError, ValueError):
+            return 0
+    
+    # ---------- 后台探测与回放 ----------
+    
+    def _run(self):
+        while not self._closing:
+            self._wakeup.wait(self.probe_interval)
+            self._wakeup.clear()
+            if self._closing:
+                return
+            if not self._spooling:
+                continue
+            
+            if self.producer is None and not self._connect():
+                continue
+            if self._probe():
+                self._replay()
+    
+    def _probe(self) -> bool:
+        """获取结果主题的元数据，确认 broker 可达（没有暂存记录可回放时也不会误判恢复）"""
+        try:
+            self.producer.partitions_for(self.topic)
+            return True
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            logger.warning(f"Kafka 仍不可达，{self.probe_interval:g}s 后重试: {e}")
+            return False
+    
+    def _replay(self) -> bool:
+        """
+        回放暂存记录，全部成功后恢复直接发送
+        
+        回放期间新记录继续追加到暂存文件；回放文件发送完后若暂存文件又有新记录则继续回放。
+        回放文件按 replay_batch 逐批读取，已确认部分的字节位置记录在 .offset 文件中
+        """
+        replay_path = self.spool_path + '.replay' if self.spool_path else None
+        offset_path = replay_path + '.offset' if replay_path else None
+        while True:
+            with self._lock:
+                done = replay_path is None or not self._spool_exists()
+                if done:
+                    self._spooling = False
+                    if self.breaker is not None:
+                        # 回放已同步确认投递，等同半开试探成功（与恢复直接发送同时生效）
+                        self.breaker.recover()
+                elif not os.path.exists(replay_path):
+                    os.replace(self.spool_path, replay_path)
+            if done:
+                logger.info("Kafka 已恢复，暂存记录回放完成")
+                return True
+            
+            try:
+                with open(replay_path, 'rb') as f:
+                    f.seek(self._read_replay_offset(offset_path))
+                    while True:
+                        batch, offset = self._read_frames(f, self.replay_batch)
+                        if not batch:
+                            break
+                        if not self._send_batch(batch):
+                            # 未确认的部分留在回放文件，下次探测时从记录的位置继续（已确认的不再重发）
+                            return False
+                        with open(offset_path, 'w', encoding='utf-8') as o:
+                            o.write(str(offset))
+                        with self._lock:
+                            self.stats['replayed'] += len(batch)
+                # 先删除位置文件：两次删除之间中断时整个文件重新回放，而不是跳过新文件的开头
+                if os.path.exists(offset_path):
+                    os.remove(offset_path)
+                os.remove(replay_path)
+            except OSError as e:
+                logger.error(f"Kafka 暂存文件读取失败: {e}")
+                return False
+    
+    def _send_batch(self, batch: List[Tuple[Optional[bytes], bytes, str]]) -> bool:
+        """同步发送一批暂存记录，全部确认后返回 True"""
+        try:
+            futures = [
+                self.producer.send(self.topic, value=payload, key=key_bytes,
+                                   headers=self._headers(encoding))
+                for key_bytes, payload, encoding in batch
+            ]
+            self.producer.flush(self.flush_timeout)
+            for future in futures:
+                future.get(timeout=0)
+            with self._lock:
+                self.stats['delivered'] += len(batch)
+            return True
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            logger.warning(f"Kafka 暂存记录回放失败，{self.probe_interval:g}s 后重试: {e}")
+            return False
+    
+    def flush(self, timeout: Optional[float] = None):
+        """等待已发送的记录投递完成"""
+        if self.producer is not None:
+            self.producer.flush(timeout if timeout is not None else self.flush_timeout)
+    
+    def close(self, timeout: Optional[float] = None):
+        """投递完已发送的记录并关闭生产者；未回放的暂存记录留待下次启动"""
+        if self._closing:
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._thread.join(self.flush_timeout)
+        if self.producer is not None:
+            try:
+                self.producer.flush(timeout if timeout is not None else self.flush_timeout)
+                self.producer.close(timeout if timeout is not None else self.flush_timeout)
+            except Exception as e:
+                logger.warning(f"Kafka 生产者关闭失败: {e}")
+        logger.info(f"Kafka 发布器已关闭: {self.get_stats()}")
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['healthy'] = self.healthy
+        stats['encoding'] = self.encoding
+        stats['avg_bytes'] = round(stats['bytes'] / stats['published'], 1) if stats['published'] else 0.0
+        return stats
+
+
+# ---------- 进程内 Kafka 替身 ----------
+
+InMemoryRecord = namedtuple('InMemoryRecord', 'topic partition offset key value headers timestamp')
+InMemoryTopicPartition = namedtuple('InMemoryTopicPartition', 'topic partition')
+
+
+class _InMemoryFuture:
+    """与 kafka-python FutureRecordMetadata 兼容的最小实现（创建时即已完成）"""
+    
+    def __init__(self, value=None, exception: Optional[Exception] = None):
+        self.value = value
+        self.exception = exception
+    
+    def succeeded(self) -> bool:
+        return self.exception is None
+    
+    def failed(self) -> bool:
+        return self.exception is not None
+    
+    def add_callback(self, fn, *args, **kwargs):
+        if self.exception is None:
+            fn(*args, self.value, **kwargs)
+        return self
+    
+    def add_errback(self, fn, *args, **kwargs):
+        if self.exception is not None:
+            fn(*args, self.exception, **kwargs)
+        return self
+    
+    def get(self, timeout: Optional[float] = None):
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class InMemoryBroker:
+    """
+    进程内 Kafka 替身
+    
+    按消息键哈希分区保存记录；available=False 模拟 broker 不可达
+    （创建生产者、send、提交位点均失败）
+    
+    消费组：同组消费者按加入顺序均分分区，成员变化时重新分配，
+    新分配到的分区从组内已提交的位点继续消费
+    """
+    
+    def __init__(self, partitions: int = 4):
+        self.partitions = max(1, int(partitions))
+        self.available = True
+        self._topics: Dict[str, List[List[InMemoryRecord]]] = defaultdict(
+            lambda: [[] for _ in range(self.partitions)]
+        )
+        self._groups: Dict[str, List['_InMemoryConsumer']] = defaultdict(list)
+        self._committed: Dict[Tuple[str, InMemoryTopicPartition], int] = {}
+        self._lock = threading.Lock()
+    
+    def producer(self, **config) -> '_InMemoryProducer':
+        """创建生产者（broker 不可用时抛出异常，与 KafkaProducer 一致）"""
+        if not self.available:
+            raise ConnectionError("InMemoryBroker 不可用")
+        return _InMemoryProducer(self)
+    
+    def consumer(self, *topics: str, group_id: Optional[str] = None, **config) -> '_InMemoryConsumer':
+        """创建消费者并加入消费组（参数与 KafkaConsumer 一致，未识别的参数忽略）"""
+        if not self.available:
+            raise ConnectionError("InMemoryBroker 不可用")
+        consumer = _InMemoryConsumer(self, topics, group_id or '', config.get('max_poll_records', 500))
+        with self._lock:
+            self._groups[consumer.group_id].append(consumer)
+        return consumer
+    
+    def _assignment(self, consumer: '_InMemoryConsumer') -> List[InMemoryTopicPartition]:
+        with self._lock:
+            members = self._groups[consumer.group_id]
+            if consumer not in members:
+                return []
+            partitions = [InMemoryTopicPartition(topic, p)
+                          for topic in consumer.topics for p in range(self.partitions)]
+            return partitions[members.index(consumer)::len(members)]
+    
+    def _leave(self, consumer: '_InMemoryConsumer'):
+        with self._lock:
+            members = self._groups[consumer.group_id]
+            if consumer in members:
+                members.remove(consumer)
+    
+    def committed(self, group_id: str, tp: InMemoryTopicPartition) -> Optional[int]:
+        """消费组在分区上已提交的位点（下一条待消费记录的 offset）"""
+        with self._lock:
+            return self._committed.get((group_id, tp))
+    
+    def _commit(self, group_id: str, offsets: Dict[InMemoryTopicPartition, int]):
+        if not self.available:
+            raise ConnectionError("InMemoryBroker 不可用")
+        with self._lock:
+            for tp, offset in offsets.items():
+                self._committed[(group_id, tp)] = offset
+    
+    def partition_for(self, key: Optional[bytes]) -> int:
+        if key is None:
+            return 0
+        return zlib.crc32(key) % self.partitions
+    
+    def append(self, topic: str, key: Optional[bytes], value: bytes,
+               headers: Optional[List[Tuple[str, bytes]]]) -> InMemoryRecord:
+        if not self.available:
+            raise ConnectionError("InMemoryBroker 不可用")
+        with self._lock:
+            partition = self.partition_for(key)
+            log = self._topics[topic][partition]
+            record = InMemoryRecord(topic, partition, len(log), key, value,
+                                    list(headers or ()), time.time())
+            log.append(record)
+            return record
+    
+    def records(self, topic: str, partition: Optional[int] = None) -> List[InMemoryRecord]:
+        """读取主题记录（不指定分区时按分区依次返回）"""
+        with self._lock:
+            logs = self._topics[topic]
+            if partition is not None:
+                return list(logs[partition])
+            return list(itertools.chain.from_iterable(logs))
+
+
+class _InMemoryProducer:
+    """InMemoryBroker 的生产者"""
+    
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.closed = False
+    
+    def send(self, topic: str, value: bytes = None, key: bytes = None, headers=None, **kwargs):
+        try:
+            return _InMemoryFuture(self.broker.append(topic, key, value, headers))
+        except Exception as e:
+            return _InMemoryFuture(exception=e)
+    
+    def flush(self, timeout: Optional[float] = None):
+        pass
+    
+    def partitions_for(self, topic: str) -> set:
+        if not self.broker.available:
+            raise ConnectionError("InMemoryBroker 不可用")
+        return set(range(self.broker.partitions))
+    
+    def close(self, timeout: Optional[float] = None):
+        self.closed = True
+
+
+class _InMemoryConsumer:
+    """InMemoryBroker 的消费者（手动提交位点）"""
+    
+    def __init__(self, broker: InMemoryBroker, topics, group_id: str, max_poll_records: int):
+        self.broker = broker
+        self.topics = tuple(topics)
+        self.group_id = group_id
+        self.max_poll_records = max(1, int(max_poll_records))
+        self._assigned: List[InMemoryTopicPartition] = []
+        self._positions: Dict[InMemoryTopicPartition, int] = {}
+        self.closed = False
+    
+    def _sync_assignment(self):
+        """成员变化后重新分配：新分配到的分区从已提交位点开始"""
+        assigned = self.broker._assignment(self)
+        if assigned != self._assigned:
+            self._assigned = assigned
+            self._positions = {tp: self.broker.committed(self.group_id, tp) or 0 for tp in assigned}
+    
+    def assignment(self) -> set:
+        self._sync_assignment()
+        return set(self._assigned)
+    
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict:
+        """拉取一批记录，按分区返回；每个分区最多取 max_records 的均分份额"""
+        if not self.broker.available:
+            time.sleep(timeout_ms / 1000.0)
+            return {}
+        self._sync_assignment()
+        remaining = max_records or self.max_poll_records
+        share = max(1, -(-remaining // max(1, len(self._assigned))))
+        batches = {}
+        for tp in self._assigned:
+            if remaining <= 0:
+                break
+            position = self._positions[tp]
+            records = self.broker.records(tp.topic, tp.partition)[position:position + min(share, remaining)]
+            if records:
+                batches[tp] = records
+                self._positions[tp] = position + len(records)
+                remaining -= len(records)
+        if not batches and timeout_ms:
+            time.sleep(timeout_ms / 1000.0)
+        return batches
+    
+    def position(self, tp: InMemoryTopicPartition) -> int:
+        return self._positions[tp]
+    
+    def seek(self, tp: InMemoryTopicPartition, offset: int):
+        if tp in self._positions:
+            self._positions[tp] = offset
+    
+    def commit(self, offsets: Optional[Dict] = None):
+        """提交位点；不指定时提交当前消费位置（上次 poll 后组内已再均衡时失败，与 Kafka 一致）"""
+        if self.broker._assignment(self) != self._assigned:
+            raise RuntimeError("CommitFailedError: 消费组已再均衡，分区可能已分配给其他消费者")
+        if offsets is None:
+            offsets = dict(self._positions)
+        self.broker._commit(self.group_id, {tp: getattr(offset, 'offset', offset)
+                                            for tp, offset in offsets.items()})
+    
+    def close(self, autocommit: bool = False):
+        self.broker._leave(self)
+        self.closed = True
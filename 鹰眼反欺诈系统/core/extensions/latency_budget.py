@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟预算 - 扩展功能
+为单次检测设置截止时间，剩余时间不足以执行某个可选阶段时
+跳过该阶段或使用廉价的降级结果，保证尾延迟
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class StageCostModel:
+    """
+    各检测阶段的耗时估计（指数滑动平均）
+
+    阶段被跳过时估计值会逐步衰减，负载下降后该阶段会被重新尝试
+    """
+
+    def __init__(self, alpha: float = 0.2, skip_decay: float = 0.95):
+        self.alpha = alpha
+        self.skip_decay = skip_decay
+        self.costs: Dict[str, float] = {}
+
+    def estimate(self, stage: str) -> float:
+        """预计耗时（毫秒），未知阶段返回0"""
+        return self.costs.get(stage, 0.0)
+
+    def observe(self, stage: str, elapsed_ms: float):
+        """记录一次实际耗时"""
+        old = self.costs.get(stage)
+        if old is None:
+            self.costs[stage] = elapsed_ms
+        else:
+            self.costs[stage] = old + self.alpha * (elapsed_ms - old)
+
+    def decay(self, stage: str):
+        """阶段被跳过时衰减估计值"""
+        if stage in self.costs:
+            self.costs[stage] *= self.skip_decay
+
+    def snapshot(self) -> Dict[str, float]:
+        return {stage: round(cost, 3) for stage, cost in self.costs.items()}
+
+
+class LatencyBudget:
+    """单次检测的延迟预算"""
+
+    def __init__(self, deadline: Optional[float], cost_model: StageCostModel):
+        """
+        Args:
+            deadline: 截止时间（time.time() 时间戳），None 表示不限
+            cost_model: 阶段耗时估计
+        """
+        self.deadline = deadline
+        self.cost_model = cost_model
+        self.degraded: List[str] = []
+
+    def remaining_ms(self) -> float:
+        """剩余预算（毫秒）"""
+        if self.deadline is None:
+            return float('inf')
+        return (self.deadline - time.time()) * 1000
+
+    def allows(self, stage: str) -> bool:
+        """剩余预算是否足够执行该阶段"""
+        remaining = self.remaining_ms()
+        return remaining > 0 and remaining >= self.cost_model.estimate(stage)
+
+    def skip(self, stage: str):
+        """标记阶段已降级"""
+        self.degraded.append(stage)
+        self.cost_model.decay(stage)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """执行阶段并记录耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.cost_model.observe(stage, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监控指标 - 扩展功能
+以 Prometheus 文本格式输出请求计数、风险等级计数、各检测阶段延迟直方图
+以及存储/队列状态
+
+计数按线程分片：写入只修改本线程的数组，无锁；抓取时再汇总各分片
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 默认延迟分桶（秒）：覆盖 0.1ms ~ 1s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# 检测阶段（第0层环境检测、第1-7层防御、GNN、VPN、设备指纹）
+DETECTION_STAGES = ('environment', 'layer1', 'layer4', 'gnn',
+                    'layer5', 'layer6', 'layer7', 'vpn', 'device')
+
+
+class _ShardedArray:
+    """
+    按线程分片的数值数组
+    
+    热路径直接读取 self._local.array，首次访问时由 _new_shard 创建
+    """
+    
+    __slots__ = ('_local', '_arrays', '_lock', '_size')
+    
+    def __init__(self, size: int):
+        self._local = threading.local()
+        self._arrays: List[list] = []
+        self._lock = threading.Lock()
+        self._size = size
+    
+    def _new_shard(self) -> list:
+        """为当前线程创建分片"""
+        array = [0] * self._size
+        with self._lock:
+            self._arrays.append(array)
+        self._local.array = array
+        return array
+    
+    def collect(self) -> list:
+        """汇总所有分片"""
+        with self._lock:
+            arrays = list(self._arrays)
+        if not arrays:
+            return [0] * self._size
+        return [sum(column) for column in zip(*arrays)]
+
+
+class CounterChild(_ShardedArray):
+    """单个标签组合的计数器"""
+    
+    __slots__ = ()
+    
+    def __init__(self):
+        super().__init__(1)
+    
+    def inc(self, amount: float = 1):
+        try:
+            array = self._local.array
+        except AttributeError:
+            array = self._new_shard()
+        array[0] += amount
+    
+    def value(self) -> float:
+        return self.collect()[0]
+
+
+class HistogramChild(_ShardedArray):
+    """单个标签组合的直方图，分片布局为 [各分桶计数..., +Inf计数, 总和]"""
+    
+    __slots__ = ('_bounds',)
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        super().__init__(len(bounds) + 2)
+        self._bounds = bounds
+    
+    def observe(self, value: float):
+        try:
+            array = self._local.array
+        except AttributeError:
+            array = self._new_shard()
+        array[bisect_left(self._bounds, value)] += 1
+        array[-1] += value
+    
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """返回 (累计分桶计数, 总和, 总数)"""
+        array = self.collect()
+        cumulative = []
+        total = 0
+        for count in array[:-1]:
+            total += count
+            cumulative.append(total)
+        return cumulative, array[-1], total
+
+
+class _Metric:
+    """带标签的指标"""
+    
+    type_name = ''
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values):
+        """获取标签组合对应的子指标（首次访问时创建）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+    
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """计数器"""
+    
+    type_name = 'counter'
+    
+    def _new_child(self):
+        return CounterChild()
+    
+    def inc(self, amount: float = 1):
+        """无标签计数器直接计数"""
+        self.labels().inc(amount)
+    
+    def samples(self):
+        return [
+            (self.name, dict(zip(self.labelnames, values)), child.value())
+            for values, child in self._items()
+        ]
+
+
+class Histogram(_Metric):
+    """直方图"""
+    
+    type_name = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+    
+    def observe(self, value: float):
+        """无标签直方图直接记录"""
+        self.labels().observe(value)
+    
+    def samples(self):
+        result = []
+        for values, child in self._items():
+            labels = dict(zip(self.labelnames, values))
+            cumulative, total_sum, count = child.snapshot()
+            for bound, cum in zip(self.buckets + (math.inf,), cumulative):
+                result.append((self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cum))
+            result.append((self.name + '_sum', labels, total_sum))
+            result.append((self.name + '_count', labels, count))
+        return result
+
+
+class Gauge(_Metric):
+    """
+    仪表盘：抓取时调用回调取值
+    
+    回调返回单个数值，或 {标签值元组: 数值} 字典；
+    可按来源注册多个回调（如同一进程内的两个引擎），抓取时合并各来源的样本
+    """
+    
+    type_name = 'gauge'
+    
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable, labelnames: Tuple[str, ...] = (),
+                 source: Optional[str] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callbacks: Dict[Optional[str], Callable] = {source: callback}
+    
+    def samples(self):
+        result = []
+        for callback in list(self.callbacks.values()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            if not isinstance(value, dict):
+                result.append((self.name, {}, value))
+                continue
+            result.extend(
+                (self.name, dict(zip(self.labelnames, values)), v)
+                for values, v in value.items()
+            )
+        return result
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, metric: _Metric, replace: bool = False) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not replace:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def gauge(self, name: str, documentation: str, callback: Callable,
+              labelnames: Tuple[str, ...] = (), source: Optional[str] = None) -> Gauge:
+        """
+        注册回调仪表盘
+        
+        同名且标签一致时按 source 添加回调（同一 source 替换为新回调），
+        不同 source 的样本须用标签区分；标签不一致时整体替换
+        """
+        with self._lock:
+            existing = self._metrics.get(name)
+            if isinstance(existing, Gauge) and existing.labelnames == tuple(labelnames):
+                existing.callbacks[source] = callback
+                return existing
+        return self._register(Gauge(name, documentation, callback, labelnames, source), replace=True)
+    
+    def collect(self) -> List[Dict]:
+        """当前所有指标的样本快照（可 JSON 序列化，多 worker 部署时经共享存储汇总）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [
+            {'name': metric.name, 'type': metric.type_name,
+             'help': metric.documentation, 'samples': metric.samples()}
+            for metric in metrics
+        ]
+    
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（0.0.4）"""
+        return render_families(self.collect())
+
+
+class StageTimer:
+    """
+    阶段计时上下文：耗时记入阶段直方图，
+    同时更新延迟预算的阶段耗时估计（StageCostModel，可为 None）
+    """
+    
+    __slots__ = ('histogram', 'cost_model', 'stage', 'start')
+    
+    def __init__(self, histogram: Optional[HistogramChild], cost_model, stage: str):
+        self.histogram = histogram
+        self.cost_model = cost_model
+        self.stage = stage
+        self.start = time.perf_counter()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if self.histogram is not None:
+            self.histogram.observe(elapsed)
+        if self.cost_model is not None:
+            self.cost_model.observe(self.stage, elapsed * 1000)
+        return False
+
+
+class DetectionMetrics:
+    """检测服务的标准指标集"""
+    
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        
+        self.requests = self.registry.counter(
+            'fraud_api_requests_total', 'API请求数', ('endpoint', 'status'))
+        self.results = self.registry.counter(
+            'fraud_detection_results_total', '检测结果数（按风险等级）', ('risk_level',))
+        self.degraded = self.registry.counter(
+            'fraud_degraded_detections_total', '发生阶段降级的检测数')
+        self.early_exits = self.registry.counter(
+            'fraud_early_exits_total', '决定性规则提前拒绝的检测数（按规则）', ('rule',))
+        self.detection_latency = self.registry.histogram(
+            'fraud_detection_latency_seconds', '单笔检测总耗时')
+        self.stage_latency = self.registry.histogram(
+            'fraud_stage_latency_seconds', '检测阶段耗时', ('stage',))
+        
+        # 预先创建子指标，热路径只做字典查找
+        self._stages = {stage: self.stage_latency.labels(stage) for stage in DETECTION_STAGES}
+        self._levels = {}
+        self._latency = self.detection_latency.labels()
+        self._degraded = self.degraded.labels()
+    
+    def stage(self, name: str) -> HistogramChild:
+        """阶段延迟直方图"""
+        child = self._stages.get(name)
+        if child is None:
+            child = self._stages[name] = self.stage_latency.labels(name)
+        return child
+    
+    def observe_result(self, result):
+        """记录一次检测结果"""
+        # 枚举的 __hash__ 是 Python 实现，按成员 id 查找更快
+        level = result.risk_level
+        child = self._levels.get(id(level))
+        if child is None:
+            child = self._levels[id(level)] = self.results.labels(level.name)
+        child.inc()
+        self._latency.observe(result.response_time_ms / 1000.0)
+        if result.degraded_stages:
+            self._degraded.inc()
+        rule = getattr(result, 'early_exit', None)
+        if rule:
+            self.early_exits.labels(rule).inc()
+    
+    def count_request(self, endpoint: str, status: int):
+        """记录一次API请求"""
+        self.requests.labels(endpoint, str(status)).inc()
+    
+    def gauge(self, name: str, documentation: str, callback: Callable,
+              labelnames: Tuple[str, ...] = (), source: Optional[str] = None):
+        """注册回调仪表盘（存储状态、队列深度等），source 见 MetricsRegistry.gauge"""
+        self.registry.gauge(name, documentation, callback, labelnames, source)
+    
+    def collect(self) -> List[Dict]:
+        return self.registry.collect()
+    
+    def render(self) -> str:
+        return self.registry.render()
+
+
+_default_metrics: Optional[DetectionMetrics] = None
+_default_lock = threading.Lock()
+
+
+def get_metrics() -> DetectionMetrics:
+    """进程内共享的指标集"""
+    global _default_metrics
+    if _default_metrics is None:
+        with _default_lock:
+            if _default_metrics is None:
+                _default_metrics = DetectionMetrics()
+    return _default_metrics
+
+
+def merge_worker_families(snapshots: List[Dict]) -> List[Dict]:
+    """
+    合并多个 worker 的指标快照（{'worker': ..., 'families': collect() 的结果}）
+    
+    样本加 worker 标签，各 worker 的计数序列保持单调，不论请求落到哪个 worker 输出都一致；
+    跨 worker 汇总在 Prometheus 中 sum without (worker)
+    """
+    merged: Dict[str, Dict] = {}
+    for snapshot in sorted(snapshots, key=lambda s: s['worker']):
+        for family in snapshot['families']:
+            target = merged.setdefault(family['name'], {**family, 'samples': []})
+            target['samples'].extend(
+                (name, {'worker': snapshot['worker'], **labels}, value)
+                for name, labels, value in family['samples']
+            )
+    return list(merged.values())
+
+
+def render_families(families: List[Dict]) -> str:
+    """指标快照输出为 Prometheus 文本格式（0.0.4）"""
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family['name']} {_escape_help(family['help'])}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family['samples']:
+            if labels:
+                label_str = ','.join(f'{k}="{_escape_label(str(v))}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求微批处理 - 扩展功能
+将并发到达的单笔检测请求合并成批次，一次调用完成评分，
+分摊每个请求的 Python 调度开销
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    微批处理器
+    
+    第一个请求到达后开始计时，满足以下任一条件即刷新批次：
+    - 批次大小达到 max_batch_size
+    - 等待时间超过 max_wait_ms
+    """
+    
+    def __init__(self,
+                 detect_batch_fn: Callable[[List[Dict]], List[Any]],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 2.0,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            detect_batch_fn: 批量检测函数，返回与输入等长的结果列表，
+                             单条失败时对应位置为异常对象
+            max_batch_size: 批次上限
+            max_wait_ms: 最长等待时间（毫秒）
+            executor: 执行批量检测的线程池，默认单线程
+        """
+        self.detect_batch_fn = detect_batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='micro-batch'
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        
+        # 统计信息
+        self.stats = {
+            'batches': 0,
+            'items': 0,
+            'max_batch': 0
+        }
+    
+    async def start(self):
+        """启动后台批处理任务"""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+            logger.info(f"微批处理已启动: batch_size={self.max_batch_size}, "
+                        f"max_wait={self.max_wait * 1000:.1f}ms")
+    
+    async def stop(self):
+        """
+        停止后台任务，处理完队列中剩余的请求
+        
+        不取消后台任务（取消可能打断正在收集或检测的批次，其等待者永远得不到结果），
+        而是放入结束标记，由后台任务刷新当前批次后退出
+        """
+        if self._worker is None:
+            return
+        self._queue.put_nowait(None)
+        await self._worker
+        self._worker = None
+        
+        # 结束标记之后才入队的请求
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            await self._flush(pending)
+    
+    async def submit(self, transaction: Dict) -> Any:
+        """提交单笔交易，等待所在批次完成后返回其结果"""
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((transaction, future))
+        return await future
+    
+    async def _run(self):
+        """收集批次并刷新"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            stopping = False
+            
+            while len(batch) < self.max_batch_size:
+                # 先取走已排队的请求，队列为空时再等待剩余时间
+                if not self._queue.empty():
+                    item = self._queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            await self._flush(batch)
+            if stopping:
+                return
+    
+    async def _flush(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """执行一个批次并把结果分发给各个等待者"""
+        transactions = [txn for txn, _ in batch]
+        loop = asyncio.get_running_loop()
+        
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.detect_batch_fn, transactions
+            )
+        except Exception as e:
+            logger.error(f"批次检测失败: {len(batch)} 笔, {e}", exc_info=True)
+            results = [e] * len(batch)
+        
+        self.stats['batches'] += 1
+        self.stats['items'] += len(batch)
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+        
+        for (_, future), result in zip(batch, results):
+            # 客户端已断开时 future 会被取消
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def get_stats(self) -> Dict:
+        """获取微批处理统计"""
+        batches = self.stats['batches']
+        return {
+            **self.stats,
+            'avg_batch': self.stats['items'] / batches if batches > 0 else 0,
+            'queue_depth': self._queue.qsize() if self._queue else 0
+        }
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 模型导出与推理运行时 - 扩展功能
+训练得到的权重保存为 state_dict（detection.model.gnn_model），导出为 CPU 上的图编译产物：
+
+- TorchScript（detection.model.torchscript_model）：优先 torch.jit.script，不支持时 trace；
+  冻结后做 optimize_for_inference（算子融合、常量折叠）
+- ONNX（detection.model.onnx_model）：节点数、边数为动态维度，由 onnxruntime 加载
+- int8：启动时对 float 权重做动态 int8 量化（GCN/GAT 的线性变换与分类层），不需要导出件
+
+导出件的输入为 (节点特征 x, 边索引 edge_index, 边权重 edge_weight)，输出为 (节点嵌入, 各类别对数概率)，
+并记录导出时的权重指纹。启动时按 detection.model.runtime 加载：显式设置线程数，
+校验权重指纹并在随机图上与 eager 模式比对输出，不一致或加载失败时回退到 eager 模式
+"""
+
+import copy
+import inspect
+import io
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from core.extensions.embedding_cache import ClassifierHead, model_fingerprint
+
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 比对输出用的随机图：节点数（包含没有边的单节点图，即中心实体不在关系图中的情况）
+PARITY_GRAPH_SIZES = (1, 2, 8, 25, 60, 200)
+
+
+class ExportWrapper(nn.Module):
+    """导出用：forward 同时输出节点嵌入与对数概率"""
+    
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, x, edge_index, edge_weight):
+        embedding = self.model.embed(x, edge_index, edge_weight)
+        return embedding, self.model.classify(embedding)
+
+
+def random_graph(num_nodes: int, feature_dim: int,
+                 rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """随机图（双向边，平均度约 4，边权重在 (0, 1] 内）"""
+    x = rng.random((num_nodes, feature_dim), dtype=np.float32)
+    if num_nodes < 2:
+        return x, np.zeros((2, 0), dtype=np.int64), np.zeros(0, dtype=np.float32)
+    src = rng.integers(0, num_nodes, num_nodes * 2)
+    dst = (src + rng.integers(1, num_nodes, num_nodes * 2)) % num_nodes
+    edge_index = np.stack((np.concatenate((src, dst)), np.concatenate((dst, src))))
+    weight = 1.0 - rng.random(num_nodes * 2, dtype=np.float32)
+    return x, edge_index.astype(np.int64), np.concatenate((weight, weight))
+
+
+def unit_weights(edge_index: np.ndarray) -> np.ndarray:
+    """未提供边权重时各边权重为 1（与 GCN 不传 edge_weight 等价）"""
+    return np.ones(edge_index.shape[1], dtype=np.float32)
+
+
+def parity_graphs(feature_dim: int, seed: int = 0) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    rng = np.random.default_rng(seed)
+    return [random_graph(n, feature_dim, rng) for n in PARITY_GRAPH_SIZES]
+
+
+# ---------- 权重 ----------
+
+def save_weights(model: nn.Module, path: str):
+    """保存权重（state_dict 与权重指纹）"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    torch.save({'state_dict': model.state_dict(), 'fingerprint': model_fingerprint(model)}, path)
+    logger.info(f"GNN权重已保存: {path}")
+
+
+def load_weights(model: nn.Module, path: str) -> bool:
+    """加载权重（也接受直接保存的 state_dict），文件不存在时返回 False"""
+    if not Path(path).exists():
+        return False
+    checkpoint = torch.load(path, map_location='cpu', weights_only=True)
+    state_dict = checkpoint.get('state_dict', checkpoint)
+    model.load_state_dict(state_dict)
+    logger.info(f"GNN权重已加载: {path}")
+    return True
+
+
+def configure_threads(intra_op_threads: int = 0, inter_op_threads: int = 0):
+    """设置 torch 的算子内/算子间线程数（0 为保持默认）；算子间线程数只能在首次并行计算前设置"""
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError as e:
+            logger.warning(f"无法设置 torch 算子间线程数: {e}")
+
+
+# ---------- 导出 ----------
+
+def export_torchscript(model: nn.Module, path: str, feature_dim: int) -> str:
+    """导出 TorchScript，返回使用的方式（script / trace）"""
+    wrapper = ExportWrapper(model).eval()
+    inputs = tuple(torch.from_numpy(a) for a in
+                   random_graph(PARITY_GRAPH_SIZES[-1], feature_dim, np.random.default_rng(0)))
+    with torch.no_grad():
+        try:
+            compiled = torch.jit.script(wrapper)
+            method = 'script'
+        except Exception as e:
+            logger.info(f"torch.jit.script 不支持该模型，改用 trace: {e}")
+            compiled = torch.jit.trace(wrapper, inputs, check_trace=False)
+            method = 'trace'
+        compiled = torch.jit.optimize_for_inference(torch.jit.freeze(compiled.eval()))
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    torch.jit.save(compiled, path, _extra_files={'fingerprint': model_fingerprint(model)})
+    logger.info(f"TorchScript 已导出 ({method}): {path}")
+    return method
+
+
+def export_onnx(model: nn.Module, path: str, feature_dim: int, opset: int = 18):
+    """导出 ONNX（GAT 的分组 softmax 需要 ScatterElements 的 max 归约，opset >= 18）"""
+    wrapper = ExportWrapper(model).eval()
+    inputs = tuple(torch.from_numpy(a) for a in
+                   random_graph(PARITY_GRAPH_SIZES[-1], feature_dim, np.random.default_rng(0)))
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    options = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # 新版 torch 默认使用基于 torch.export 的导出器，不支持 GAT 中依赖数据的形状，改用 TorchScript 导出器
+        options['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper, inputs, path,
+            input_names=['x', 'edge_index', 'edge_weight'],
+            output_names=['embedding', 'log_probs'],
+            dynamic_axes={'x': {0: 'num_nodes'}, 'edge_index': {1: 'num_edges'},
+                          'edge_weight': {0: 'num_edges'},
+                          'embedding': {0: 'num_nodes'}, 'log_probs': {0: 'num_nodes'}},
+            opset_version=opset,
+            do_constant_folding=True,
+            **options
+        )
+    
+    import onnx
+    onnx_model = onnx.load(path)
+    entry = onnx_model.metadata_props.add()
+    entry.key, entry.value = 'fingerprint', model_fingerprint(model)
+    onnx.save(onnx_model, path)
+    logger.info(f"ONNX 已导出 (opset {opset}): {path}")
+
+
+# ---------- 量化 ----------
+
+def quantize_model(model: nn.Module) -> nn.Module:
+    """
+    动态 int8 量化（返回量化后的副本）：线性层权重按输出通道量化为 int8，激活在推理时按批动态量化
+    
+    GCN/GAT 的线性变换是 torch_geometric 的 Linear，先换成等价的 nn.Linear（共享的层仍然共享）再量化；
+    消息传递（GCN 归一化、注意力 softmax、scatter 聚合）没有 int8 实现，保持 float32
+    """
+    quantized = copy.deepcopy(model).eval()
+    replaced: Dict[int, nn.Linear] = {}
+    for parent in list(quantized.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child).__name__ != 'Linear' or not type(child).__module__.startswith('torch_geometric'):
+                continue
+            linear = replaced.get(id(child))
+            if linear is None:
+                linear = nn.Linear(child.in_channels, child.out_channels, bias=child.bias is not None)
+                with torch.no_grad():
+                    linear.weight.copy_(child.weight)
+                    if child.bias is not None:
+                        linear.bias.copy_(child.bias)
+                replaced[id(child)] = linear
+            setattr(parent, name, linear)
+    return torch.ao.quantization.quantize_dynamic(
+        quantized, {nn.Linear: torch.ao.quantization.per_channel_dynamic_qconfig}, dtype=torch.qint8
+    )
+
+
+def state_dict_bytes(model: nn.Module) -> int:
+    """模型权重序列化后的字节数（量化模型的权重为打包的 int8）"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+# ---------- 运行时 ----------
+
+class ModelRuntime:
+    """推理运行时：run 返回 (节点嵌入, 对数概率)；edge_weight 为 None 时各边权重为 1"""
+    
+    backend = 'eager'
+    fingerprint: Optional[str] = None
+    
+    def run(self, x: np.ndarray, edge_index: np.ndarray,
+            edge_weight: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+    
+    def embed(self, x: np.ndarray, edge_index: np.ndarray,
+              edge_weight: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.run(x, edge_index, edge_weight)[0]
+    
+    def classifier_head(self, model: nn.Module):
+        """嵌入 → 欺诈概率的分类层（嵌入缓存命中时只计算该层），与运行时的分类层使用相同权重"""
+        return ClassifierHead.from_linear([model.fc1, model.fc2])
+    
+    def describe(self) -> Dict:
+        return {'backend': self.backend, 'fingerprint': self.fingerprint}
+
+
+class EagerRuntime(ModelRuntime):
+    """eager 模式（参照实现）"""
+    
+    backend = 'eager'
+    
+    def __init__(self, model: nn.Module):
+        self.model = model.eval()
+        self.fingerprint = model_fingerprint(model)
+    
+    def run(self, x, edge_index, edge_weight=None):
+        with torch.inference_mode():
+            embedding = self._embed(x, edge_index, edge_weight)
+            return embedding.numpy(), self.model.classify(embedding).numpy()
+    
+    def embed(self, x, edge_index, edge_weight=None):
+        with torch.inference_mode():
+            return self._embed(x, edge_index, edge_weight).numpy()
+    
+    def _embed(self, x, edge_index, edge_weight):
+        weight = torch.from_numpy(edge_weight) if edge_weight is not None else None
+        return self.model.embed(torch.from_numpy(x), torch.from_numpy(edge_index), weight)
+
+
+class QuantizedHead:
+    """int8 量化模型的分类层（接口与 ClassifierHead 一致）"""
+    
+    def __init__(self, model: nn.Module):
+        self.model = model
+    
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """嵌入 [n, dim] → 欺诈概率 [n]"""
+        with torch.inference_mode():
+            log_probs = self.model.classify(torch.from_numpy(np.asarray(embeddings, dtype=np.float32)))
+            return torch.exp(log_probs[:, 1]).numpy()
+
+
+class QuantizedRuntime(EagerRuntime):
+    """eager 模式 + 动态 int8 量化"""
+    
+    backend = 'int8'
+    
+    def __init__(self, model: nn.Module):
+        # 权重指纹对应量化前的 float 权重
+        self.fingerprint = model_fingerprint(model)
+        self.model = quantize_model(model)
+    
+    def classifier_head(self, model: nn.Module):
+        """分类层同样使用量化后的 int8 权重"""
+        return QuantizedHead(self.model)
+
+
+class TorchScriptRuntime(ModelRuntime):
+    """TorchScript 导出件"""
+    
+    backend = 'torchscript'
+    
+    def __init__(self, path: str):
+        extra_files = {'fingerprint': ''}
+        self.module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        fingerprint = extra_files['fingerprint']
+        self.fingerprint = fingerprint.decode() if isinstance(fingerprint, bytes) else fingerprint
+        # 参数含 self
+        if len(self.module.forward.schema.arguments) != 4:
+            raise RuntimeError("导出件的输入不含 edge_weight，需重新导出")
+    
+    def run(self, x, edge_index, edge_weight=None):
+        if edge_weight is None:
+            edge_weight = unit_weights(edge_index)
+        with torch.inference_mode():
+            embedding, log_probs = self.module(torch.from_numpy(x), torch.from_numpy(edge_index),
+                                               torch.from_numpy(edge_weight))
+            return embedding.numpy(), log_probs.numpy()
+
+
+class OnnxRuntime(ModelRuntime):
+    """ONNX 导出件（onnxruntime CPU）"""
+    
+    backend = 'onnx'
+    
+    def __init__(self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise RuntimeError("onnxruntime 未安装")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = int(intra_op_threads)
+        options.inter_op_num_threads = int(inter_op_threads)
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.fingerprint = self.session.get_modelmeta().custom_metadata_map.get('fingerprint')
+        if 'edge_weight' not in {i.name for i in self.session.get_inputs()}:
+            raise RuntimeError("导出件的输入不含 edge_weight，需重新导出")
+    
+    def run(self, x, edge_index, edge_weight=None):
+        if edge_weight is None:
+            edge_weight = unit_weights(edge_index)
+        embedding, log_probs = self.session.run(
+            None, {'x': x, 'edge_index': edge_index, 'edge_weight': edge_weight})
+        return embedding, log_probs
+
+
+def max_deviation(reference: ModelRuntime, candidate: ModelRuntime,
+                  graphs: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> float:
+    """两个运行时在各测试图上输出（嵌入与对数概率）的最大绝对偏差"""
+    deviation = 0.0
+    for graph in graphs:
+        for expected, actual in zip(reference.run(*graph), candidate.run(*graph)):
+            deviation = max(deviation, float(np.abs(np.asarray(actual) - expected).max()))
+    return deviation
+
+
+def max_probability_delta(reference: ModelRuntime, candidate: ModelRuntime,
+                          graphs: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> float:
+    """两个运行时在各测试图上欺诈概率的最大绝对偏差（量化模型按概率而不是嵌入比对）"""
+    delta = 0.0
+    for graph in graphs:
+        expected = np.exp(reference.run(*graph)[1][:, 1])
+        actual = np.exp(np.asarray(candidate.run(*graph)[1])[:, 1])
+        delta = max(delta, float(np.abs(actual - expected).max()))
+    return delta
+
+
+def load_runtime(model: nn.Module, model_cfg: Dict, feature_dim: int) -> ModelRuntime:
+    """
+    按 detection.model.runtime 配置加载推理运行时
+    
+    导出件不存在、权重指纹与当前权重不一致或输出偏差超过 parity_atol
+    （int8 为欺诈概率偏差超过 int8_max_prob_delta）时回退到 eager 模式
+    """
+    runtime_cfg = model_cfg.get('runtime', {})
+    backend = runtime_cfg.get('backend', 'eager')
+    intra_op_threads = runtime_cfg.get('intra_op_threads', 0)
+    inter_op_threads = runtime_cfg.get('inter_op_threads', 0)
+    configure_threads(intra_op_threads, inter_op_threads)
+    eager = EagerRuntime(model)
+    if backend == 'eager':
+        return eager
+    
+    try:
+        if backend == 'torchscript':
+            candidate = TorchScriptRuntime(model_cfg.get('torchscript_model', 'models/gnn_detector_ts.pt'))
+        elif backend == 'onnx':
+            candidate = OnnxRuntime(model_cfg.get('onnx_model', 'models/gnn_model.onnx'),
+                                    intra_op_threads, inter_op_threads)
+        elif backend == 'int8':
+            candidate = QuantizedRuntime(model)
+        else:
+            raise ValueError(f"未知的推理运行时: {backend}")
+    except Exception as e:
+        logger.warning(f"{backend} 运行时加载失败（可运行 export_gnn_model.py 导出），使用 eager 模式: {e}")
+        return eager
+    
+    if candidate.fingerprint != eager.fingerprint:
+        logger.warning(f"{backend} 导出件的权重指纹 {candidate.fingerprint} 与当前权重 {eager.fingerprint} "
+                       f"不一致，使用 eager 模式")
+        return eager
+    if runtime_cfg.get('verify_parity', True):
+        if backend == 'int8':
+            atol = float(runtime_cfg.get('int8_max_prob_delta', 0.02))
+            check = max_probability_delta
+        else:
+            atol = float(runtime_cfg.get('parity_atol', 1e-4))
+            check = max_deviation
+        try:
+            deviation = check(eager, candidate, parity_graphs(feature_dim))
+        except Exception as e:
+            logger.warning(f"{backend} 运行时校验失败，使用 eager 模式: {e}")
+            return eager
+        if deviation > atol:
+            logger.warning(f"{backend} 运行时与 eager 模式的输出偏差 {deviation:.2e} 超过 {atol:g}，使用 eager 模式")
+            return eager
+    logger.info(f"GNN推理运行时: {backend} (算子内线程 {torch.get_num_threads()})")
+    return candidate
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis 连接池与写入合并 - 扩展功能
+- create_redis_client: 按 database.redis.max_connections 创建有界连接池，
+  同一进程内的引擎、共享状态、幂等缓存共用
+- RedisWriteCoalescer: 并发请求的写入命令由后台线程合并成管道发送，
+  请求线程不再等待逐条写入的往返
+- 连接与读写设置超时（socket_connect_timeout_s / socket_timeout_s），
+  Redis 无响应时调用方在超时后失败，由熔断器接管
+"""
+
+import logging
+import queue
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_pools: Dict[Tuple, object] = {}
+_pools_lock = threading.Lock()
+
+
+def redis_settings(config: Dict) -> Dict:
+    """从引擎配置读取 Redis 连接参数（平铺的 redis_* 优先，其次 database.redis）"""
+    redis_cfg = config.get('database', {}).get('redis', {})
+    return {
+        'host': config.get('redis_host', redis_cfg.get('host', 'localhost')),
+        'port': int(config.get('redis_port', redis_cfg.get('port', 6379))),
+        'db': int(config.get('redis_db', redis_cfg.get('db', 0))),
+        'password': config.get('redis_password', redis_cfg.get('password')) or None,
+        'max_connections': int(redis_cfg.get('max_connections', 50)),
+        'timeout': float(redis_cfg.get('pool_timeout_s', 1.0)),
+        'socket_connect_timeout': float(redis_cfg.get('socket_connect_timeout_s', 0.5)),
+        'socket_timeout': float(redis_cfg.get('socket_timeout_s', 0.5))
+    }
+
+
+def create_redis_client(config: Dict, decode_responses: bool = True):
+    """
+    创建使用共享连接池的 Redis 客户端
+    
+    连接池为 BlockingConnectionPool：连接用尽时最多等待 pool_timeout_s，
+    不会无限制地新建连接
+    """
+    import redis
+    
+    settings = redis_settings(config)
+    key = (settings['host'], settings['port'], settings['db'], decode_responses)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = redis.BlockingConnectionPool(
+                host=settings['host'],
+                port=settings['port'],
+                db=settings['db'],
+                password=settings['password'],
+                max_connections=settings['max_connections'],
+                timeout=settings['timeout'],
+                socket_connect_timeout=settings['socket_connect_timeout'],
+                socket_timeout=settings['socket_timeout'],
+                decode_responses=decode_responses
+            )
+            _pools[key] = pool
+            logger.info(f"Redis连接池: {settings['host']}:{settings['port']}/{settings['db']}, "
+                        f"max_connections={settings['max_connections']}")
+    return redis.Redis(connection_pool=pool)
+
+
+class RedisWriteCoalescer:
+    """
+    Redis 写入合并
+    
+    submit 把命令放入队列后立即返回；后台线程每次取出队列中的全部命令
+    （不超过 max_batch 条）用一个非事务管道发送。Redis 往返期间到达的写入
+    自动并入下一个管道，并发越高每个管道越大
+    """
+    
+    def __init__(self, client, max_batch: int = 1000, max_pending: int = 100000,
+                 name: str = 'redis-writer', breaker=None):
+        """
+        Args:
+            client: Redis 客户端
+            max_batch: 单个管道的命令数上限
+            max_pending: 队列中的命令上限，超出时丢弃新写入（结果缓存可丢失，不阻塞检测）
+            name: 后台线程名
+            breaker: 可选熔断器，打开期间丢弃写入而不是逐批等待超时
+        """
+        self.client = client
+        self.breaker = breaker
+        self.max_batch = max(1, int(max_batch))
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._closed = False
+        
+        # 统计信息
+        self.stats = {
+            'commands': 0,
+            'pipelines': 0,
+            'dropped': 0,
+            'errors': 0
+        }
+        
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, commands: List[tuple]):
+        """
+        提交写入命令（不阻塞）
+        
+        Args:
+            commands: [(方法名, 参数...), ...]，如 ('setex', key, ttl, value)
+        """
+        for command in commands:
+            try:
+                self._queue.put_nowait(command)
+            except queue.Full:
+                self.stats['dropped'] += 1
+    
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            batch = [command]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    command = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command is None:
+                    stop = True
+                    break
+                batch.append(command)
+            
+            self._flush(batch)
+            if stop:
+                return
+    
+    def _flush(self, batch: List[tuple]):
+        if self.breaker is not None and not self.breaker.allow():
+            self.stats['dropped'] += len(batch)
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for name, *args in batch:
+                getattr(pipe, name)(*args)
+            pipe.execute()
+            self.stats['commands'] += len(batch)
+            self.stats['pipelines'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.stats['dropped'] += len(batch)
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            logger.error(f"Redis管道写入失败（{len(batch)} 条）: {e}")
+            return
+        if self.breaker is not None:
+            self.breaker.record_success()
+    
+    def close(self, timeout: float = 5.0):
+        """发送完队列中的命令后停止"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Redis写入队列已满，关闭时放弃剩余写入")
+            return
+        self._thread.join(timeout)
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        commands = self.stats['commands']
+        pipelines = self.stats['pipelines']
+        return {
+            **self.stats,
+            'pending': self._queue.qsize(),
+            'avg_pipeline_size': round(commands / pipelines, 1) if pipelines else 0.0
+        }
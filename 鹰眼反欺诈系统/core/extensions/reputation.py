@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+受信实体信誉缓存 - 扩展功能
+大部分流量来自长期稳定、从未触发规则的 用户/设备/IP 组合。连续多次完整检测都是低风险的组合
+标记为受信，之后在 TTL 内走快速通道：只做决定性规则与第1/4层检查，跳过VPN分析、
+设备指纹、环境扫描、GNN推理等耗时阶段
+
+- 晋升：同一 (user_id, device_id, ip) 连续 promote_after 次完整检测低于 max_risk_score、
+  无检测模式、无VPN、无降级
+- 失效：任一结果带有风险信号（检测模式、VPN、高风险等级、提前拒绝）时，
+  包含该用户、设备或IP的所有组合立即失效；受信到期后需重新晋升
+- 有界：最多 max_entries 个组合（含候选），超出后淘汰最久未使用的条目
+- 进程内缓存：多 worker 部署时各进程独立晋升，跨进程的失效以 TTL 为上限
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 受信组合的键
+EntityKey = Tuple[str, str, str]
+
+
+class ReputationCache:
+    """受信实体组合缓存（线程安全）"""
+    
+    def __init__(self,
+                 max_entries: int = 100000,
+                 ttl_seconds: float = 600.0,
+                 promote_after: int = 3,
+                 max_risk_score: float = 30.0):
+        """
+        Args:
+            max_entries: 缓存组合数上限（含尚未晋升的候选）
+            ttl_seconds: 受信有效期（从晋升开始计算，快速通道的结果不延长有效期）
+            promote_after: 晋升所需的连续低风险完整检测次数
+            max_risk_score: 低风险结果的风险分上限（不含）
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.promote_after = max(1, int(promote_after))
+        self.max_risk_score = float(max_risk_score)
+        
+        # 键 → [连续低风险次数, 受信到期时间（0 为未受信）]
+        self._entries: 'OrderedDict[EntityKey, list]' = OrderedDict()
+        # 实体 → 包含该实体的组合（按实体失效）
+        self._index: Dict[Tuple[int, str], set] = {}
+        self._lock = threading.Lock()
+        
+        # 统计信息
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'promotions': 0,
+            'invalidations': 0,
+            'expired': 0,
+            'evictions': 0,
+            'fast_lane_requests': 0,
+            'fast_lane_time_ms': 0.0,
+            'full_path_requests': 0,
+            'full_path_time_ms': 0.0
+        }
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['ReputationCache']:
+        """按 performance.reputation 配置创建，未启用时返回 None"""
+        if not config.get('enabled', True):
+            return None
+        cache = cls(
+            max_entries=config.get('max_entries', 100000),
+            ttl_seconds=config.get('ttl_s', 600),
+            promote_after=config.get('promote_after', 3),
+            max_risk_score=config.get('max_risk_score', 30.0)
+        )
+        logger.info(f"受信实体快速通道已启用: 连续 {cache.promote_after} 次低风险晋升, "
+                    f"有效期 {cache.ttl:g}s, 上限 {cache.max_entries} 个组合")
+        return cache
+    
+    @staticmethod
+    def key(transaction: Dict) -> Optional[EntityKey]:
+        """(user_id, device_id, ip)，缺少任一字段时不参与信誉缓存"""
+        user_id = transaction.get('user_id')
+        device_id = transaction.get('device_id')
+        ip = transaction.get('ip')
+        if not (user_id and device_id and ip):
+            return None
+        return (user_id, device_id, ip)
+    
+    def is_trusted(self, transaction: Dict) -> bool:
+        """查询组合是否受信（计入命中率；到期的组合移除）"""
+        key = self.key(transaction)
+        if key is None:
+            return False
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry[1]:
+                self.stats['misses'] += 1
+                return False
+            if now >= entry[1]:
+                self._remove(key)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return False
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return True
+    
+    def peek(self, transaction: Dict) -> bool:
+        """查询组合是否受信（不计入统计、不更新使用顺序），用于预取共享状态前的分流"""
+        key = self.key(transaction)
+        if key is None:
+            return False
+        entry = self._entries.get(key)
+        return entry is not None and time.time() < entry[1]
+    
+    def observe(self, transaction: Dict, result):
+        """根据检测结果晋升或失效"""
+        if self._has_risk_signal(result):
+            self.invalidate(transaction.get('user_id'), transaction.get('device_id'),
+                            transaction.get('ip'))
+            return
+        key = self.key(transaction)
+        if key is None or getattr(result, 'fast_lane', False):
+            # 快速通道的结果未经完整检测，不用于晋升
+            return
+        
+        clean = (result.risk_score < self.max_risk_score
+                 and not getattr(result, 'degraded_stages', None))
+        with self._lock:
+            entry = self._entries.get(key)
+            if not clean:
+                if entry is not None:
+                    entry[0], entry[1] = 0, 0.0
+                return
+            if entry is None:
+                entry = self._insert(key)
+            else:
+                self._entries.move_to_end(key)
+            entry[0] += 1
+            if entry[0] >= self.promote_after and not entry[1]:
+                entry[1] = time.time() + self.ttl
+                self.stats['promotions'] += 1
+    
+    def invalidate(self, user_id: Optional[str] = None, device_id: Optional[str] = None,
+                   ip: Optional[str] = None) -> int:
+        """使包含指定用户、设备或IP的所有组合失效，返回失效的组合数"""
+        removed = 0
+        with self._lock:
+            for position, value in enumerate((user_id, device_id, ip)):
+                if not value:
+                    continue
+                for key in list(self._index.get((position, value), ())):
+                    self._remove(key)
+                    removed += 1
+            self.stats['invalidations'] += removed
+        return removed
+    
+    def record_latency(self, fast_lane: bool, response_time_ms: float):
+        """记录快速通道/完整检测的耗时（用于估算节省的延迟）"""
+        prefix = 'fast_lane' if fast_lane else 'full_path'
+        with self._lock:
+            self.stats[f'{prefix}_requests'] += 1
+            self.stats[f'{prefix}_time_ms'] += response_time_ms
+    
+    def _has_risk_signal(self, result) -> bool:
+        return bool(result.detected_patterns or result.vpn_detected
+                    or getattr(result, 'early_exit', None)
+                    or result.risk_level.name in ('HIGH', 'CRITICAL'))
+    
+    def _insert(self, key: EntityKey) -> list:
+        entry = self._entries[key] = [0, 0.0]
+        for position, value in enumerate(key):
+            self._index.setdefault((position, value), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats['evictions'] += 1
+        return entry
+    
+    def _remove(self, key: EntityKey):
+        self._entries.pop(key, None)
+        for position, value in enumerate(key):
+            keys = self._index.get((position, value))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(position, value)]
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息（命中率与快速通道节省的延迟）"""
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        fast_avg = (stats['fast_lane_time_ms'] / stats['fast_lane_requests']
+                    if stats['fast_lane_requests'] else 0.0)
+        full_avg = (stats['full_path_time_ms'] / stats['full_path_requests']
+                    if stats['full_path_requests'] else 0.0)
+        saved = (full_avg - fast_avg) * stats['fast_lane_requests'] if full_avg else 0.0
+        return {
+            'entries': entries,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            'promotions': stats['promotions'],
+            'invalidations': stats['invalidations'],
+            'expired': stats['expired'],
+            'evictions': stats['evictions'],
+            'fast_lane_requests': stats['fast_lane_requests'],
+            'fast_lane_avg_ms': round(fast_avg, 3),
+            'full_path_avg_ms': round(full_avg, 3),
+            'saved_ms': round(max(0.0, saved), 1)
+        }
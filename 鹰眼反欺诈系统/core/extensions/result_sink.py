@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测结果写后缓冲 - 扩展功能
+检测结果先进入内存缓冲，由后台线程按批量大小或时间间隔
+通过连接池批量写入 PostgreSQL（COPY 或多行 INSERT），请求线程不再等待逐行提交
+
+- 内存有界：缓冲超过 max_buffer 时按 overflow 策略溢出到本地文件（spill）或丢弃（drop）
+- PostgreSQL 不可用时保留缓冲并退避重试，恢复后回放溢出文件
+- 数据错误（如超出列精度）时二分定位出错行写入死信文件，其余行照常写入，不计入熔断失败
+- 关闭时（close / 进程退出）写完剩余结果
+"""
+
+import atexit
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# fraud_detection_results 写入列（与 scripts/init.sql 一致）
+RESULT_COLUMNS = ('user_id', 'risk_score', 'risk_level', 'fraud_probability',
+                  'detected_patterns', 'defense_layers', 'timestamp')
+
+
+def result_row(result) -> tuple:
+    """DetectionResult 转为写入行（仅含可JSON序列化的原生类型，便于溢出到文件）"""
+    return (
+        result.user_id,
+        float(result.risk_score),
+        result.risk_level.name,
+        float(result.fraud_probability),
+        json.dumps(result.detected_patterns),
+        json.dumps(result.defense_layers_triggered),
+        float(result.timestamp)
+    )
+
+
+def _utc_timestamp(timestamp: float) -> datetime:
+    """Unix 时间戳转为 UTC 的 naive datetime（timestamp 列为 TIMESTAMP，两种写入方式一致，不受会话时区影响）"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+class PostgresResultWriter:
+    """
+    批量写入 fraud_detection_results
+    
+    连接池在首次写入时创建，PostgreSQL 启动较晚或暂时不可用时不影响引擎初始化
+    """
+    
+    def __init__(self, dsn: str, pool_size: int = 4, method: str = 'copy'):
+        """
+        Args:
+            dsn: PostgreSQL 连接串
+            pool_size: 连接池上限
+            method: copy（COPY FROM STDIN）或 values（多行 INSERT）
+        """
+        self.dsn = dsn
+        self.pool_size = max(1, int(pool_size))
+        self.method = method
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    @staticmethod
+    def data_errors() -> Tuple[Type[BaseException], ...]:
+        """行数据导致的写入错误（重试无效，需定位出错行）；未安装 psycopg2 时为空"""
+        try:
+            import psycopg2
+        except ImportError:
+            return ()
+        return (psycopg2.DataError, psycopg2.IntegrityError)
+    
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    self._pool = ThreadedConnectionPool(1, self.pool_size, self.dsn)
+        return self._pool
+    
+    def __call__(self, rows: Sequence[tuple]):
+        """写入一批结果并提交，失败时抛出异常"""
+        rows = [row[:-1] + (_utc_timestamp(row[-1]),) for row in rows]
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                if self.method == 'copy':
+                    cursor.copy_expert(
+                        f"COPY fraud_detection_results ({', '.join(RESULT_COLUMNS)}) "
+                        f"FROM STDIN WITH (FORMAT csv)",
+                        self._csv_buffer(rows)
+                    )
+                else:
+                    from psycopg2.extras import execute_values
+                    execute_values(
+                        cursor,
+                        f"INSERT INTO fraud_detection_results ({', '.join(RESULT_COLUMNS)}) VALUES %s",
+                        rows,
+                        page_size=len(rows)
+                    )
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            pool.putconn(conn, close=broken or bool(conn.closed))
+    
+    @staticmethod
+    def _csv_buffer(rows: Sequence[tuple]) -> io.StringIO:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(row[:-1] + (row[-1].isoformat(sep=' '),))
+        buffer.seek(0)
+        return buffer
+    
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+
+
+class WriteBehindSink:
+    """
+    写后缓冲
+    
+    submit 只把行放入内存缓冲并立即返回；后台写线程在缓冲达到 batch_size
+    或距上次写入超过 flush_interval_ms 时取出一批调用 write_fn
+    """
+    
+    def __init__(self,
+                 write_fn: Callable[[List[tuple]], None],
+                 batch_size: int = 500,
+                 flush_interval_ms: float = 200,
+                 max_buffer: int = 100000,
+                 overflow: str = 'spill',
+                 spill_path: Optional[str] = None,
+                 writers: int = 2,
+                 max_backoff_ms: float = 5000,
+                 name: str = 'result-sink',
+                 breaker=None,
+                 data_errors: Tuple[Type[BaseException], ...] = (),
+                 dead_letter_path: Optional[str] = None):
+        """
+        Args:
+            write_fn: 批量写入函数，失败时抛出异常（整批重试，data_errors 除外）
+            batch_size: 单次写入行数上限
+            flush_interval_ms: 最长缓冲时间
+            max_buffer: 内存缓冲行数上限
+            overflow: 缓冲已满时的策略，spill（写入 spill_path）或 drop（丢弃新结果）
+            spill_path: 溢出文件路径（JSONL）
+            writers: 后台写线程数
+            max_backoff_ms: 写入失败后的最长退避时间
+            breaker: 可选熔断器，写入结果计入其状态（用于 /health 展示依赖状态）
+            data_errors: 行数据错误的异常类型；出现时二分批次定位出错行，不重试也不计入熔断失败
+            dead_letter_path: 出错行的死信文件路径（JSONL，含错误信息）；为空时只记录日志后丢弃
+        """
+        self.write_fn = write_fn
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval_ms)) / 1000.0
+        self.max_buffer = max(self.batch_size, int(max_buffer))
+        self.overflow = overflow if (overflow != 'spill' or spill_path) else 'drop'
+        self.spill_path = spill_path
+        self.max_backoff = max_backoff_ms / 1000.0
+        self.name = name
+        self.breaker = breaker
+        self.data_errors = tuple(data_errors)
+        self.dead_letter_path = dead_letter_path
+        self.writer = None
+        
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._dead_letter_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._closing = False
+        self._last_flush = time.monotonic()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._inflight = 0
+        self.healthy = True
+        
+        # 统计信息
+        self.stats = {
+            'submitted': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'write_errors': 0,
+            'dead_lettered': 0
+        }
+        
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(max(1, int(writers)))
+        ]
+        for thread in self._threads:
+            thread.start()
+        atexit.register(self.close)
+    
+    @classmethod
+    def for_postgres(cls, dsn: str, config: Dict, breaker=None) -> 'WriteBehindSink':
+        """按 performance.result_sink 配置创建 PostgreSQL 写后缓冲"""
+        writers = config.get('writers', 2)
+        writer = PostgresResultWriter(dsn, pool_size=writers, method=config.get('method', 'copy'))
+        sink = cls(
+            writer,
+            batch_size=config.get('batch_size', 500),
+            flush_interval_ms=config.get('flush_interval_ms', 200),
+            max_buffer=config.get('max_buffer', 100000),
+            overflow=config.get('overflow', 'spill'),
+            spill_path=config.get('spill_path', 'data/result_spill.jsonl'),
+            writers=writers,
+            name='pg-sink',
+            breaker=breaker,
+            data_errors=writer.data_errors(),
+            dead_letter_path=config.get('dead_letter_path', 'data/result_dead_letter.jsonl')
+        )
+        sink.writer = writer
+        return sink
+    
+    def submit(self, rows: List[tuple]):
+        """放入缓冲（不阻塞）；缓冲已满时按溢出策略处理超出部分"""
+        if not rows:
+            return
+        overflow = []
+        with self._cond:
+            self.stats['submitted'] += len(rows)
+            # 写入中的批次也计入容量：写入失败时会放回缓冲
+            room = 0 if self._closing else max(0, self.max_buffer - len(self._buffer) - self._inflight)
+            if room < len(rows):
+                overflow = rows[room:]
+                rows = rows[:room]
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        if overflow:
+            self._handle_overflow(overflow)
+    
+    def _handle_overflow(self, rows: List[tuple]):
+        if self.overflow == 'spill' and self._spill(rows):
+            return
+        with self._cond:
+            self.stats['dropped'] += len(rows)
+        logger.warning(f"结果缓冲已满，丢弃 {len(rows)} 条检测结果")
+    
+    def _spill(self, rows: List[tuple]) -> bool:
+        """追加写入溢出文件"""
+        try:
+            with self._spill_lock:
+                directory = os.path.dirname(self.spill_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(row) + '\n' for row in rows))
+            with self._cond:
+                self.stats['spilled'] += len(rows)
+            return True
+        except OSError as e:
+            logger.error(f"结果溢出文件写入失败: {e}")
+            return False
+    
+    def _run(self):
+        """后台写线程"""
+        while True:
+            with self._cond:
+                while not self._closing and not self._ready():
+                    self._cond.wait(self._wait_time())
+                if not self._buffer:
+                    if self._closing:
+                        return
+                    continue
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                self._inflight += len(batch)
+                self._last_flush = time.monotonic()
+            
+            pending = self._write(batch)
+            with self._cond:
+                self._inflight -= len(batch)
+                if pending:
+                    self._requeue(pending)
+                    if self._closing:
+                        return
+                    continue
+            self._replay_spill()
+    
+    def _requeue(self, rows: List[tuple]):
+        """未写入的行放回队首，退避结束前所有写线程暂停写入（调用方持有 _cond）"""
+        self._buffer.extendleft(reversed(rows))
+        backoff = min(self.max_backoff, 0.1 * (2 ** min(self._failures - 1, 10)))
+        self._retry_at = time.monotonic() + backoff
+    
+    def _ready(self) -> bool:
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if len(self._buffer) >= self.batch_size:
+            return True
+        return bool(self._buffer) and now - self._last_flush >= self.flush_interval
+    
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        if not self._buffer:
+            return max(self.flush_interval, 0.05)
+        return max(0.0, self.flush_interval - (now - self._last_flush))
+    
+    def _write(self, batch: List[tuple]) -> List[tuple]:
+        """写入一批，返回因连接等错误未写入、需要重试的行（全部写入或已转入死信时为空）"""
+        try:
+            self.write_fn(batch)
+        except self.data_errors as e:
+            return self._isolate(batch, e)
+        except Exception as e:
+            with self._cond:
+                self._failures += 1
+                self.stats['write_errors'] += 1
+                self.healthy = False
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            logger.error(f"结果批量写入失败（{len(batch)} 条）: {e}")
+            return batch
+        with self._cond:
+            self._failures = 0
+            self.healthy = True
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return []
+    
+    def _isolate(self, batch: List[tuple], error: Exception) -> List[tuple]:
+        """
+        数据错误：二分批次，单独出错的行写入死信文件，其余行正常写入
+        
+        二分过程中出现连接错误时返回尚未写入的行（已写入的一半不再重试）
+        """
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return []
+        mid = len(batch) // 2
+        halves = (batch[:mid], batch[mid:])
+        for i, half in enumerate(halves):
+            pending = self._write(half)
+            if pending:
+                return pending + [row for rest in halves[i + 1:] for row in rest]
+        return []
+    
+    def _dead_letter(self, row: tuple, error: Exception):
+        """出错行追加到死信文件（无法写入时只记录日志）"""
+        with self._cond:
+            self.stats['dead_lettered'] += 1
+        logger.error(f"检测结果数据错误，转入死信: user_id={row[0]}, error={error}")
+        if self.dead_letter_path is None:
+            return
+        try:
+            with self._dead_letter_lock:
+                directory = os.path.dirname(self.dead_letter_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'row': row, 'error': str(error).strip()}) + '\n')
+        except OSError as e:
+            logger.error(f"死信文件写入失败: {e}")
+    
+    def _replay_spill(self):
+        """
+        写入恢复后回放溢出文件（同一时间只有一个线程回放）
+        
+        按 batch_size 逐批读取，不把整个文件读入内存；已写入部分的字节位置记录在
+        .offset 文件中，写入失败时下次从该位置继续，不重写剩余内容
+        """
+        if self.spill_path is None:
+            return
+        replay_path = self.spill_path + '.replay'
+        offset_path = replay_path + '.offset'
+        if not os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+            return
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            # 上次回放未完成时先处理剩余部分
+            with self._spill_lock:
+                if not os.path.exists(replay_path):
+                    os.replace(self.spill_path, replay_path)
+            offset = self._read_replay_offset(offset_path)
+            replayed = 0
+            with open(replay_path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    batch = []
+                    while len(batch) < self.batch_size:
+                        line = f.readline()
+                        if not line:
+                            break
+                        if line.strip():
+                            batch.append(tuple(json.loads(line)))
+                    if not batch:
+                        break
+                    pending = self._write(batch)
+                    if len(pending) == len(batch):
+                        # 剩余部分留在回放文件，下次写入成功后从记录的位置继续
+                        return
+                    with open(offset_path, 'w', encoding='utf-8') as o:
+                        o.write(str(f.tell()))
+                    replayed += len(batch) - len(pending)
+                    with self._cond:
+                        self.stats['replayed'] += len(batch) - len(pending)
+                        if pending:
+                            # 批次部分写入后连接中断：未写入的行转入内存缓冲，避免重写已写入部分
+                            self._requeue(pending)
+                    if pending:
+                        return
+            # 先删除位置文件：两次删除之间中断时整个文件重新回放（重复写入），而不是跳过新文件的开头
+            if os.path.exists(offset_path):
+                os.remove(offset_path)
+            os.remove(replay_path)
+            logger.info(f"已回放 {replayed} 条溢出的检测结果")
+        except (OSError, ValueError) as e:
+            logger.error(f"结果溢出文件回放失败: {e}")
+        finally:
+            self._replay_lock.release()
+    
+    @staticmethod
+    def _read_replay_offset(offset_path: str) -> int:
+        """读取回放文件中已写入部分的字节位置（不存在或损坏时从头回放）"""
+        try:
+            with open(offset_path, 'r', encoding='utf-8') as f:
+                return max(0, int(f.read().strip()))
+        except (OSError, ValueError):
+            return 0
+    
+    def close(self, timeout: float = 10.0):
+        """写完缓冲中的结果并停止写线程；超时或写入失败时剩余结果按溢出策略处理"""
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        
+        with self._cond:
+            remaining = list(self._buffer)
+            self._buffer.clear()
+        if remaining:
+            self._handle_overflow(remaining)
+        
+        if self.writer is not None:
+            self.writer.close()
+        logger.info(f"{self.name} 已关闭: {self.get_stats()}")
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        with self._cond:
+            return {
+                **self.stats,
+                'buffered': len(self._buffer),
+                'healthy': self.healthy,
+                'overflow': self.overflow
+            }
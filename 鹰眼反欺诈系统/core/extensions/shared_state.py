@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享检测状态 - 扩展功能
+用户操作频率、设备历史和 IP-设备映射的存储
+
+- LocalStateStore: 进程内存储（单进程部署）
+- RedisStateStore: Redis 存储，多 worker 进程共享同一份状态；
+  每次检测的状态读写合并为一次管道往返，批量检测时整批合并为一次往返（prefetch）；
+  Redis 故障时经熔断器直接跳过（按无历史处理），不逐次等待超时
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from core.extensions.circuit_breaker import CircuitBreakerOpen, get_breaker
+
+logger = logging.getLogger(__name__)
+
+try:
+    from core.extensions.redis_pool import create_redis_client
+    REDIS_POOL_AVAILABLE = True
+except ImportError:
+    REDIS_POOL_AVAILABLE = False
+
+
+@dataclass
+class DeviceState:
+    """写入本次记录之前的设备状态"""
+    history: List[Dict] = field(default_factory=list)
+    devices_on_ip: int = 0
+    device_ip_count: int = 0
+
+
+class LocalStateStore:
+    """进程内状态存储"""
+    
+    shared = False
+    
+    def __init__(self, degraded_reason: Optional[str] = None):
+        """
+        Args:
+            degraded_reason: 需要共享存储但不可用而回退时的原因（/health 据此报告 degraded）
+        """
+        self.degraded_reason = degraded_reason
+        self.user_history = defaultdict(list)
+        self.device_history = defaultdict(list)
+        self.ip_device_mapping = defaultdict(set)
+        self.device_ip_mapping = defaultdict(set)
+        self._lock = threading.Lock()
+    
+    def record_action(self, user_id: str, action: str, now: float, window: float) -> int:
+        """记录一次用户操作，返回窗口内的操作次数（含本次）"""
+        with self._lock:
+            history = self.user_history[user_id]
+            history.append({'action': action, 'timestamp': now})
+            
+            # 清理窗口外的记录
+            if now - history[0]['timestamp'] >= window:
+                history[:] = [h for h in history if now - h['timestamp'] < window]
+            return len(history)
+    
+    def observe_device(self, device_id: str, ip: str, record: Dict,
+                       max_history: int = 50, read: bool = True) -> Optional[DeviceState]:
+        """
+        读取设备状态并写入本次记录
+        
+        Returns:
+            写入前的设备状态，read=False 时返回 None
+        """
+        with self._lock:
+            state = None
+            if read:
+                state = DeviceState(
+                    history=list(self.device_history.get(device_id, ())),
+                    devices_on_ip=len(self.ip_device_mapping.get(ip, ())),
+                    device_ip_count=len(self.device_ip_mapping.get(device_id, ()))
+                )
+            
+            history = self.device_history[device_id]
+            history.append(record)
+            if len(history) > max_history:
+                del history[:-max_history]
+            
+            self.ip_device_mapping[ip].add(device_id)
+            self.device_ip_mapping[device_id].add(ip)
+            return state
+    
+    @contextmanager
+    def prefetch(self, actions: List[Tuple[str, str, float]], window: float,
+                 devices: List[Tuple[str, str, Dict]], max_history: int = 50):
+        """进程内存储无需预取"""
+        yield
+    
+    def device_profile(self, device_id: str):
+        """返回 (历史记录, IP集合)"""
+        return (list(self.device_history.get(device_id, ())),
+                set(self.device_ip_mapping.get(device_id, ())))
+
+
+class RedisStateStore:
+    """
+    Redis 状态存储
+    
+    - 用户操作：有序集合 {prefix}:actions:{user_id}，按时间戳清理窗口外成员
+    - 设备历史：列表 {prefix}:device:{device_id}，保留最近 max_history 条
+    - 映射关系：集合 {prefix}:ip_devices:{ip} / {prefix}:device_ips:{device_id}
+    
+    Redis 异常或熔断器打开时放行（视为无历史），不阻塞检测
+    """
+    
+    shared = True
+    
+    def __init__(self, client, prefix: str = 'fraud:state', ttl: int = 7 * 86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._seq = itertools.count()
+        self._member_prefix = f"{os.getpid()}:{id(self)}"
+        # prefetch 的预取结果（按线程隔离）
+        self._local = threading.local()
+        self.breaker = get_breaker('redis')
+    
+    @classmethod
+    def from_config(cls, config: Dict, ttl: int = 7 * 86400) -> 'RedisStateStore':
+        """使用引擎配置中的 Redis 地址创建（共享连接池，大小为 database.redis.max_connections）"""
+        if REDIS_POOL_AVAILABLE:
+            return cls(create_redis_client(config), ttl=ttl)
+        import redis
+        redis_cfg = config.get('database', {}).get('redis', {})
+        client = redis.Redis(
+            host=config.get('redis_host', 'localhost'),
+            port=config.get('redis_port', 6379),
+            db=config.get('redis_db', 0),
+            password=config.get('redis_password'),
+            max_connections=redis_cfg.get('max_connections', 50),
+            decode_responses=True
+        )
+        return cls(client, ttl=ttl)
+    
+    def ping(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception as e:
+            logger.warning(f"共享状态 Redis 连接失败: {e}")
+            return False
+    
+    def record_action(self, user_id: str, action: str, now: float, window: float) -> int:
+        """记录一次用户操作，返回窗口内的操作次数（含本次）"""
+        prefetched = self._take_prefetched(('a', user_id, action))
+        if prefetched is not None:
+            return prefetched
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            self._queue_action(pipe, user_id, action, now, window)
+            return self._call(pipe.execute)[2]
+        except CircuitBreakerOpen:
+            return 0
+        except Exception as e:
+            logger.error(f"共享状态写入失败: {e}")
+            return 0
+    
+    def observe_device(self, device_id: str, ip: str, record: Dict,
+                       max_history: int = 50, read: bool = True) -> Optional[DeviceState]:
+        """读取设备状态并写入本次记录（同一事务内完成）"""
+        prefetched = self._take_prefetched(('d', device_id, ip))
+        if prefetched is not None:
+            return prefetched if read else None
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            self._queue_device(pipe, device_id, ip, record, max_history, read)
+            results = self._call(pipe.execute)
+        except CircuitBreakerOpen:
+            return DeviceState() if read else None
+        except Exception as e:
+            logger.error(f"共享状态写入失败: {e}")
+            return DeviceState() if read else None
+        
+        if not read:
+            return None
+        return self._device_state(results)
+    
+    @contextmanager
+    def prefetch(self, actions: List[Tuple[str, str, float]], window: float,
+                 devices: List[Tuple[str, str, Dict]], max_history: int = 50):
+        """
+        在一次管道往返内完成多笔交易的状态读写
+        
+        with 块内当前线程的 record_action / observe_device 按提交顺序取用预取结果，
+        未预取的调用照常访问 Redis；退出时丢弃未取用的结果。
+        预取失败时预取结果为无历史状态（与单笔调用失败时一致）
+        
+        Args:
+            actions: [(user_id, action, now), ...]
+            window: 操作频率统计窗口（秒）
+            devices: [(device_id, ip, record), ...]
+            max_history: 设备历史保留条数
+        """
+        prefetched = {}
+        if actions or devices:
+            try:
+                pipe = self.client.pipeline(transaction=True)
+                for user_id, action, now in actions:
+                    self._queue_action(pipe, user_id, action, now, window)
+                for device_id, ip, record in devices:
+                    self._queue_device(pipe, device_id, ip, record, max_history, True)
+                results = self._call(pipe.execute)
+                
+                offset = 0
+                for user_id, action, _ in actions:
+                    prefetched.setdefault(('a', user_id, action), deque()).append(results[offset + 2])
+                    offset += self._ACTION_OPS
+                for device_id, ip, _ in devices:
+                    state = self._device_state(results[offset:offset + self._DEVICE_OPS])
+                    prefetched.setdefault(('d', device_id, ip), deque()).append(state)
+                    offset += self._DEVICE_OPS
+            except Exception as e:
+                # 熔断或读写失败：整批按无历史处理，各层不再逐笔重试 Redis
+                if not isinstance(e, CircuitBreakerOpen):
+                    logger.error(f"共享状态批量读写失败: {e}")
+                prefetched = {}
+                for user_id, action, _ in actions:
+                    prefetched.setdefault(('a', user_id, action), deque()).append(0)
+                for device_id, ip, _ in devices:
+                    prefetched.setdefault(('d', device_id, ip), deque()).append(DeviceState())
+        
+        self._local.prefetched = prefetched
+        try:
+            yield
+        finally:
+            self._local.prefetched = None
+    
+    def _call(self, fn, *args):
+        """经熔断器访问 Redis；熔断器打开时抛出 CircuitBreakerOpen"""
+        if self.breaker is None:
+            return fn(*args)
+        return self.breaker.call(fn, *args)
+    
+    # 单笔操作在管道中的命令数
+    _ACTION_OPS = 4
+    _DEVICE_OPS = 10
+    
+    def _queue_action(self, pipe, user_id: str, action: str, now: float, window: float):
+        key = f"{self.prefix}:actions:{user_id}"
+        member = f"{now:.6f}:{action}:{self._member_prefix}:{next(self._seq)}"
+        pipe.zremrangebyscore(key, '-inf', now - window)
+        pipe.zadd(key, {member: now})
+        pipe.zcard(key)
+        pipe.expire(key, int(window) + 1)
+    
+    def _queue_device(self, pipe, device_id: str, ip: str, record: Dict,
+                      max_history: int, read: bool):
+        history_key = f"{self.prefix}:device:{device_id}"
+        ip_key = f"{self.prefix}:ip_devices:{ip}"
+        device_key = f"{self.prefix}:device_ips:{device_id}"
+        if read:
+            pipe.lrange(history_key, 0, -1)
+            pipe.scard(ip_key)
+            pipe.scard(device_key)
+        pipe.rpush(history_key, json.dumps(record))
+        pipe.ltrim(history_key, -max_history, -1)
+        pipe.sadd(ip_key, device_id)
+        pipe.sadd(device_key, ip)
+        for key in (history_key, ip_key, device_key):
+            pipe.expire(key, self.ttl)
+    
+    @staticmethod
+    def _device_state(results: List) -> DeviceState:
+        return DeviceState(
+            history=[json.loads(item) for item in results[0]],
+            devices_on_ip=results[1],
+            device_ip_count=results[2]
+        )
+    
+    def _take_prefetched(self, key: tuple):
+        prefetched = getattr(self._local, 'prefetched', None)
+        if not prefetched:
+            return None
+        values = prefetched.get(key)
+        if not values:
+            return None
+        return values.popleft()
+    
+    def device_profile(self, device_id: str):
+        """返回 (历史记录, IP集合)"""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.lrange(f"{self.prefix}:device:{device_id}", 0, -1)
+            pipe.smembers(f"{self.prefix}:device_ips:{device_id}")
+            history, ips = self._call(pipe.execute)
+            return [json.loads(item) for item in history], set(ips)
+        except CircuitBreakerOpen:
+            return [], set()
+        except Exception as e:
+            logger.error(f"共享状态读取失败: {e}")
+            return [], set()
+    
+    def publish_stats(self, worker_id: str, stats: Dict, ttl: int = 10):
+        """发布本 worker 的统计快照（过期后视为 worker 已退出）"""
+        self._publish_snapshot('stats', worker_id, stats, ttl)
+    
+    def collect_stats(self) -> List[Dict]:
+        """读取所有 worker 的统计快照"""
+        return self._collect_snapshots('stats')
+    
+    def publish_metrics(self, worker_id: str, families: List[Dict], ttl: int = 10):
+        """发布本 worker 的指标快照（MetricsRegistry.collect 的结果）"""
+        self._publish_snapshot('metrics', worker_id, {'worker': worker_id, 'families': families}, ttl)
+    
+    def collect_metrics(self) -> List[Dict]:
+        """读取所有 worker 的指标快照"""
+        return self._collect_snapshots('metrics')
+    
+    def _publish_snapshot(self, kind: str, worker_id: str, payload: Dict, ttl: int):
+        try:
+            self._call(self.client.setex, f"{self.prefix}:{kind}:{worker_id}", ttl, json.dumps(payload))
+        except CircuitBreakerOpen:
+            pass
+        except Exception as e:
+            logger.warning(f"{kind} 快照发布失败: {e}")
+    
+    def _collect_snapshots(self, kind: str) -> List[Dict]:
+        try:
+            keys = self._call(lambda: list(self.client.scan_iter(match=f"{self.prefix}:{kind}:*", count=100)))
+            if not keys:
+                return []
+            return [json.loads(value) for value in self._call(self.client.mget, keys) if value]
+        except CircuitBreakerOpen:
+            return []
+        except Exception as e:
+            logger.warning(f"{kind} 快照读取失败: {e}")
+            return []
+
+
+# 可以跨 worker 直接相加的计数
+_SUMMABLE_STATS = ('total_requests', 'fraud_detected', 'vpn_detected',
+                   'environment_threats', 'degraded_requests', 'early_exits', 'escalated')
+
+
+def aggregate_stats(snapshots: List[Dict]) -> Dict:
+    """合并多个 worker 的统计快照"""
+    total = sum(s.get('total_requests', 0) for s in snapshots)
+    merged = {key: sum(s.get(key, 0) for s in snapshots)
+              for key in _SUMMABLE_STATS if any(key in s for s in snapshots)}
+    merged['total_requests'] = total
+    merged['fraud_rate'] = merged.get('fraud_detected', 0) / total if total > 0 else 0
+    merged['avg_response_time'] = round(
+        sum(s.get('avg_response_time', 0) * s.get('total_requests', 0) for s in snapshots) / total, 2
+    ) if total > 0 else 0.0
+    merged['workers'] = len(snapshots)
+    return merged
+
+
+def create_state_store(config: Dict):
+    """
+    按 performance.serving 配置创建状态存储
+    
+    state_store（环境变量 API_STATE_STORE 优先）为 auto 时，多 worker 使用 Redis、
+    单 worker 使用进程内存储；Redis 不可用时回退到进程内存储并报错（此时各 worker 状态不一致），
+    回退的存储带 degraded_reason，/health 报告 degraded 直到重启后连上 Redis
+    """
+    serving_cfg = config.get('performance', {}).get('serving', {})
+    backend = os.getenv('API_STATE_STORE') or serving_cfg.get('state_store', 'auto')
+    workers = serving_workers(config)
+    if backend == 'auto':
+        backend = 'redis' if workers > 1 else 'local'
+    
+    if backend == 'redis':
+        try:
+            store = RedisStateStore.from_config(config, ttl=serving_cfg.get('state_ttl', 7 * 86400))
+            if store.ping():
+                logger.info("检测状态使用 Redis 共享存储")
+                return store
+        except Exception as e:
+            logger.warning(f"共享状态存储初始化失败: {e}")
+        reason = f"共享状态存储不可用，使用进程内状态（{workers} 个 worker 的状态将互相独立）"
+        logger.error(reason)
+        return LocalStateStore(degraded_reason=reason)
+    
+    return LocalStateStore()
+
+
+def serving_workers(config: Dict) -> int:
+    """worker 进程数：环境变量 API_WORKERS 优先，其次 performance.serving.workers（0 为CPU核数）"""
+    workers = os.getenv('API_WORKERS') or config.get('performance', {}).get('serving', {}).get('workers', 1)
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        return 1
+    # 0 表示使用全部CPU核
+    return workers if workers > 0 else (os.cpu_count() or 1)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测阶段依赖图 - 扩展功能
+检测流程表示为阶段的依赖图：互不依赖的阶段（环境检测、GNN、VPN、设备指纹）并发执行，
+全部完成后由调用方融合评分，单次检测的耗时接近最慢的阶段而不是各阶段之和
+
+- 预计耗时（StageCostModel）不低于 parallel_min_ms 的阶段才提交到线程池，
+  轻量阶段在调用线程内执行，避免线程切换开销超过阶段本身
+- 调用线程只有轻量阶段时执行就绪阶段中最耗时的一个，不空等
+- 线程池由所有请求线程共用，在途阶段达到 max_offload 时就绪阶段改在调用线程执行，
+  不排在其他请求的阶段之后等待
+- inline 阶段固定在调用线程执行（如读取线程内预取的共享状态的阶段）
+- 每个阶段的耗时记录在 StageRun.timings_ms
+- 阶段返回 ShortCircuit 时不再调度其余阶段（如黑名单命中后跳过 GNN、VPN）
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    检测阶段
+    
+    fn 接收已完成阶段的输出字典（按阶段名索引），返回本阶段输出
+    """
+    
+    __slots__ = ('name', 'fn', 'deps', 'inline')
+    
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Any],
+                 deps: Iterable[str] = (), inline: bool = False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.inline = inline
+
+
+class ShortCircuit:
+    """
+    提前结束标记：阶段返回该对象后不再调度新的阶段
+    
+    已提交到线程池的阶段照常完成，未执行的阶段记录在 StageRun.skipped
+    """
+    
+    __slots__ = ('reason',)
+    
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class StageRun:
+    """一次依赖图执行的结果"""
+    
+    __slots__ = ('outputs', 'timings_ms', 'errors', 'short_circuit', 'skipped')
+    
+    def __init__(self):
+        self.outputs: Dict[str, Any] = {}
+        self.timings_ms: Dict[str, float] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.short_circuit: Optional[ShortCircuit] = None
+        self.skipped: List[str] = []
+    
+    def raise_first_error(self):
+        """有阶段抛出异常时重新抛出（按阶段完成顺序的第一个）"""
+        for error in self.errors.values():
+            raise error
+
+
+class StageGraph:
+    """检测阶段依赖图"""
+    
+    def __init__(self, stages: List[Stage],
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 cost_model=None,
+                 parallel_min_ms: float = 0.2,
+                 max_offload: Optional[int] = None):
+        """
+        Args:
+            stages: 阶段列表（依赖须在列表中，不能成环）
+            executor: 并发执行阶段的线程池，为 None 时所有阶段在调用线程按依赖顺序执行
+            cost_model: 阶段耗时估计（StageCostModel），为 None 时所有阶段视为耗时阶段
+            parallel_min_ms: 预计耗时不低于该值的阶段才提交到线程池
+            max_offload: 线程池中同时执行的阶段上限（通常为线程池大小），None 表示不限制
+        """
+        self.stages = self._topological_order(stages)
+        self.executor = executor
+        self.cost_model = cost_model
+        self.parallel_min_ms = parallel_min_ms
+        self.max_offload = max_offload
+        self._offloaded = 0
+        self._offload_lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls, stages: List[Stage], config: Dict, cost_model=None,
+                    request_workers: int = 1) -> 'StageGraph':
+        """
+        按 performance.stage_graph 配置创建（parallel: false 时各阶段在调用线程顺序执行）
+        
+        max_workers 为 auto 时按 request_workers（请求线程数）× stages_per_request 设置，
+        所有请求线程同时检测时阶段也不必排队
+        """
+        executor = None
+        max_workers = None
+        if config.get('parallel', True):
+            max_workers = config.get('max_workers', 'auto')
+            if max_workers == 'auto':
+                max_workers = request_workers * int(config.get('stages_per_request', 2))
+            max_workers = max(1, int(max_workers))
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='detect-stage')
+        return cls(stages, executor, cost_model, config.get('parallel_min_ms', 0.2), max_workers)
+    
+    def close(self):
+        """关闭阶段线程池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _topological_order(stages: List[Stage]) -> List[Stage]:
+        """按依赖排序并校验（重名、未知依赖、成环时抛出 ValueError）"""
+        by_name = {}
+        for stage in stages:
+            if stage.name in by_name:
+                raise ValueError(f"阶段重名: {stage.name}")
+            by_name[stage.name] = stage
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in by_name]
+            if unknown:
+                raise ValueError(f"阶段 {stage.name} 依赖未知阶段: {unknown}")
+        
+        ordered, visiting, visited = [], set(), set()
+        
+        def visit(stage: Stage):
+            if stage.name in visited:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"阶段依赖成环: {stage.name}")
+            visiting.add(stage.name)
+            for dep in stage.deps:
+                visit(by_name[dep])
+            visiting.discard(stage.name)
+            visited.add(stage.name)
+            ordered.append(stage)
+        
+        for stage in stages:
+            visit(stage)
+        return ordered
+    
+    def _estimate(self, stage: Stage) -> float:
+        if self.cost_model is None:
+            return float('inf')
+        return self.cost_model.estimate(stage.name)
+    
+    def run(self, initial: Optional[Dict[str, Any]] = None) -> StageRun:
+        """
+        执行依赖图
+        
+        Args:
+            initial: 已知的阶段输出（如批量检测中共享的环境检测结果），对应阶段不再执行
+        
+        Returns:
+            StageRun：各阶段输出、耗时与异常；阶段异常不中断其他阶段，
+            依赖失败阶段的阶段不执行；有阶段返回 ShortCircuit 时其余阶段跳过
+        """
+        run = StageRun()
+        if initial:
+            run.outputs.update(initial)
+        pending = [stage for stage in self.stages if stage.name not in run.outputs]
+        futures = {}
+        
+        while pending or futures:
+            if run.short_circuit is not None and pending:
+                run.skipped.extend(stage.name for stage in pending)
+                pending = []
+            ready, blocked = [], []
+            for stage in pending:
+                failed = [dep for dep in stage.deps if dep in run.errors]
+                if failed:
+                    run.errors[stage.name] = RuntimeError(f"阶段 {stage.name} 的依赖阶段失败: {failed}")
+                elif all(dep in run.outputs for dep in stage.deps):
+                    ready.append(stage)
+                else:
+                    blocked.append(stage)
+            pending = blocked
+            
+            if ready:
+                inline = self._dispatch(ready, run, futures)
+                for stage in inline:
+                    if run.short_circuit is not None:
+                        run.skipped.append(stage.name)
+                    else:
+                        self._run_stage(stage, run)
+                continue
+            
+            if not futures:
+                break
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                futures.pop(future)
+                # 线程池中的阶段把结果写入 run，这里只需等待完成
+                future.result()
+        return run
+    
+    def _dispatch(self, ready: List[Stage], run: StageRun, futures: Dict) -> List[Stage]:
+        """
+        耗时阶段提交到线程池，返回需在调用线程执行的阶段
+
+        调用线程本身只有轻量阶段时，留下最耗时的一个自己执行，不空等；
+        线程池名额用尽时其余阶段也留在调用线程
+        """
+        if self.executor is None:
+            return ready
+        offload = [stage for stage in ready
+                   if not stage.inline and self._estimate(stage) >= self.parallel_min_ms]
+        if not offload:
+            return ready
+        local_ms = sum(self._estimate(stage) for stage in ready if stage not in offload)
+        if local_ms < self.parallel_min_ms:
+            offload.sort(key=self._estimate)
+            offload.pop()
+        submitted = []
+        for stage in offload:
+            if not self._reserve():
+                break
+            futures[self.executor.submit(self._run_offloaded, stage, run)] = stage.name
+            submitted.append(stage)
+        return [stage for stage in ready if stage not in submitted]
+    
+    def _reserve(self) -> bool:
+        """占用一个线程池名额（已达 max_offload 时返回 False）"""
+        with self._offload_lock:
+            if self.max_offload is not None and self._offloaded >= self.max_offload:
+                return False
+            self._offloaded += 1
+            return True
+    
+    def _run_offloaded(self, stage: Stage, run: StageRun):
+        try:
+            self._run_stage(stage, run)
+        finally:
+            with self._offload_lock:
+                self._offloaded -= 1
+    
+    @staticmethod
+    def _run_stage(stage: Stage, run: StageRun):
+        start = time.perf_counter()
+        try:
+            output = stage.fn(run.outputs)
+        except Exception as e:
+            run.errors[stage.name] = e
+        else:
+            run.outputs[stage.name] = output
+            if isinstance(output, ShortCircuit) and run.short_circuit is None:
+                run.short_circuit = output
+        finally:
+            run.timings_ms[stage.name] = round((time.perf_counter() - start) * 1000, 3)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kafka 流式检测 - 扩展功能
+批量消费 kafka.topics.detection_requests，评分后发布到 detection_results，完全不经过 HTTP
+
+- 批量：每次 poll 最多 max_poll_records 条，每个分区的记录整批交给 detect_batch
+  （共享状态一次 Redis 往返）
+- 顺序：请求以 user_id 为消息键，同一用户落在同一分区；分区内按 offset 顺序评分、
+  按顺序发布结果，结果主题同样以 user_id 为键
+- 持久化后提交：一批结果全部投递确认（或写入发布器的本地暂存文件）后才提交位点；
+  否则回退到批次起点重新消费（至少一次语义，下游按 request_id 去重）
+- 结果统一由 worker 发布并带上 request_id；复用完整版引擎的发布器时，detect_batch 不再自行发布
+- 检测失败：分区内有记录检测失败时整批不发布、回退重新消费；同一条记录连续失败
+  max_attempts 次后发布错误结果（status=failed）代替检测结果，持久化后照常提交，避免阻塞分区
+- 并行度：单进程内最多 partition_threads 个分区并行评分；
+  多个进程加入同一消费组，由 Kafka 按分区分配，分区数即并行度上限
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.extensions.kafka_publisher import KafkaResultPublisher, decode_value
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionStreamWorker:
+    """
+    流式检测 worker
+    
+    run_once 完成一轮 拉取 → 分区并行评分 → 等待结果持久化 → 提交位点；
+    任一环节失败时不提交，所有分区回退到本轮起点，下一轮重新消费
+    """
+    
+    def __init__(self,
+                 engine,
+                 consumer_factory: Callable[[], Any],
+                 publisher,
+                 engine_publishes: bool = False,
+                 max_poll_records: int = 500,
+                 poll_timeout_ms: int = 100,
+                 partition_threads: int = 4,
+                 flush_timeout_s: float = 10.0,
+                 retry_backoff_s: float = 1.0,
+                 max_attempts: int = 3,
+                 stats_interval_s: float = 30.0):
+        """
+        Args:
+            engine: 检测引擎（需提供 detect_batch）
+            consumer_factory: 创建消费者的函数（KafkaConsumer 或兼容对象，enable_auto_commit 须关闭）
+            publisher: 结果发布器（KafkaResultPublisher 或兼容对象）
+            engine_publishes: publisher 为引擎自带的发布器：detect_batch 传入 publish=False，
+                              结果仍由 worker 发布，发布器随引擎关闭
+            max_poll_records: 每轮最多拉取的记录数
+            poll_timeout_ms: 无新记录时 poll 的等待时间
+            partition_threads: 单进程内并行评分的分区数
+            flush_timeout_s: 提交位点前等待结果投递的上限
+            retry_backoff_s: 结果未能持久化时，重新消费前的等待
+            max_attempts: 同一条记录检测失败的最多次数，之后发布错误结果
+            stats_interval_s: 统计日志间隔（0 为不输出）
+        """
+        self.engine = engine
+        self.consumer_factory = consumer_factory
+        self.publisher = publisher
+        self.engine_publishes = engine_publishes
+        self.max_poll_records = max(1, int(max_poll_records))
+        self.poll_timeout_ms = max(0, int(poll_timeout_ms))
+        self.flush_timeout = float(flush_timeout_s)
+        self.retry_backoff = max(0.0, float(retry_backoff_s))
+        self.max_attempts = max(1, int(max_attempts))
+        self.stats_interval = float(stats_interval_s)
+        
+        self.consumer = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(partition_threads)),
+                                            thread_name_prefix='stream-partition')
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        # 检测失败的记录 (主题, 分区, offset) → 已失败次数
+        self._attempts: Dict[Tuple[str, int, int], int] = {}
+        self._started_at = time.time()
+        
+        # 统计信息
+        self.stats = {
+            'polls': 0,
+            'consumed': 0,
+            'scored': 0,
+            'published': 0,
+            'invalid': 0,
+            'failed': 0,
+            'retried': 0,
+            'commits': 0,
+            'commit_errors': 0,
+            'redelivered': 0
+        }
+    
+    @classmethod
+    def from_config(cls, engine, config: Dict, worker_index: int = 0,
+                    consumer_factory: Optional[Callable[[], Any]] = None,
+                    publisher=None) -> 'DetectionStreamWorker':
+        """
+        按 kafka 与 performance.stream_worker 配置创建
+        
+        完整版引擎已有结果发布器时复用（检测时关闭引擎自身的发布，由 worker 发布）；
+        否则按 performance.kafka_producer 创建，每个进程使用独立的暂存文件
+        """
+        stream_cfg = config.get('performance', {}).get('stream_worker', {})
+        kafka_cfg = config.get('kafka', {})
+        servers = kafka_cfg.get('bootstrap_servers', ['localhost:9092'])
+        topics = kafka_cfg.get('topics', {})
+        request_topic = topics.get('detection_requests', 'fraud_detection_requests')
+        max_poll_records = stream_cfg.get('max_poll_records', 500)
+        
+        if consumer_factory is None:
+            options = {
+                'auto_offset_reset': 'earliest',
+                'session_timeout_ms': 10000,
+                'max_poll_interval_ms': 300000,
+                'fetch_max_wait_ms': 50,
+                **stream_cfg.get('consumer', {})
+            }
+            group_id = kafka_cfg.get('consumer_group', 'fraud_detection_group')
+            
+            def consumer_factory():
+                from kafka import KafkaConsumer
+                return KafkaConsumer(request_topic, bootstrap_servers=servers, group_id=group_id,
+                                     enable_auto_commit=False, max_poll_records=max_poll_records,
+                                     **options)
+        
+        engine_publishes = False
+        if publisher is None and getattr(engine, 'kafka_publisher', None) is not None:
+            publisher = engine.kafka_publisher
+            engine_publishes = True
+        elif publisher is None:
+            if getattr(engine, 'kafka_producer', None) is not None:
+                raise RuntimeError("引擎使用未跟踪投递结果的默认生产者，"
+                                   "流式 worker 需要启用 performance.kafka_producer")
+            producer_cfg = dict(config.get('performance', {}).get('kafka_producer', {}))
+            spool_path = producer_cfg.get('spool_path', 'data/kafka_spool.bin')
+            if spool_path:
+                # 暂存文件按进程序号区分，重启后由同一序号的进程回放
+                producer_cfg['spool_path'] = f"{spool_path}.stream{worker_index}"
+            publisher = KafkaResultPublisher.from_config(
+                servers, topics.get('detection_results', 'fraud_detection_results'), producer_cfg
+            )
+        
+        return cls(
+            engine,
+            consumer_factory,
+            publisher,
+            engine_publishes=engine_publishes,
+            max_poll_records=max_poll_records,
+            poll_timeout_ms=stream_cfg.get('poll_timeout_ms', 100),
+            partition_threads=stream_cfg.get('partition_threads', 4),
+            flush_timeout_s=stream_cfg.get('flush_timeout_s', 10.0),
+            retry_backoff_s=stream_cfg.get('retry_backoff_s', 1.0),
+            max_attempts=stream_cfg.get('max_attempts', 3),
+            stats_interval_s=stream_cfg.get('stats_interval_s', 30.0)
+        )
+    
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+    
+    # ---------- 消费循环 ----------
+    
+    def run(self, max_polls: Optional[int] = None):
+        """消费直到 stop()（或完成 max_polls 轮拉取）"""
+        last_report = time.time()
+        polls = 0
+        while not self._stop.is_set() and (max_polls is None or polls < max_polls):
+            polls += 1
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"流式检测出错，{self.retry_backoff:g}s 后重试: {e}")
+                self._reset_consumer()
+                self._stop.wait(self.retry_backoff)
+            if self.stats_interval and time.time() - last_report >= self.stats_interval:
+                last_report = time.time()
+                logger.info(f"流式检测统计: {self.get_stats()}")
+    
+    def run_once(self) -> int:
+        """
+        一轮 拉取 → 评分 → 持久化 → 提交
+        
+        Returns:
+            本轮评分并提交的记录数（未能持久化而回退时为 0）
+        """
+        if self.consumer is None:
+            self.consumer = self.consumer_factory()
+            logger.info("Kafka 消费者已连接")
+        
+        batches = self.consumer.poll(timeout_ms=self.poll_timeout_ms,
+                                     max_records=self.max_poll_records)
+        self._count('polls')
+        if not batches:
+            return 0
+        consumed = sum(len(records) for records in batches.values())
+        self._count('consumed', consumed)
+        
+        dropped_before = self._publisher_dropped()
+        futures = [self._executor.submit(self._process_partition, records)
+                   for records in batches.values()]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        
+        if errors or not self._wait_durable(dropped_before):
+            if errors:
+                logger.error(f"分区评分失败，回退重新消费: {errors[0]}")
+            self._rewind(batches)
+            self._stop.wait(self.retry_backoff)
+            return 0
+        
+        try:
+            self.consumer.commit()
+        except Exception as e:
+            # 通常是再均衡：分区已分给其他消费者，从上次提交的位点重新消费（结果可能重复发布）
+            self._count('commit_errors')
+            logger.warning(f"位点提交失败，本批记录可能被重新消费: {e}")
+            return 0
+        self._count('commits')
+        return consumed
+    
+    def _process_partition(self, records: List) -> int:
+        """
+        评分一个分区的记录（分区内按 offset 顺序），按顺序发布结果
+        
+        有记录检测失败且未达到 max_attempts 时抛出异常（本分区不发布任何结果），由 run_once 回退
+        """
+        valid = []
+        transactions = []
+        for record in records:
+            try:
+                transaction = decode_value(record.value, record.headers)
+                if not isinstance(transaction, dict) or not transaction.get('user_id'):
+                    raise ValueError("缺少 user_id")
+            except Exception as e:
+                self._count('invalid')
+                logger.warning(f"无效的检测请求 {record.topic}[{record.partition}]@{record.offset}: {e}")
+                continue
+            valid.append(record)
+            transactions.append(transaction)
+        if not transactions:
+            return 0
+        
+        if self.engine_publishes:
+            results = self.engine.detect_batch(transactions, publish=False)
+        else:
+            results = self.engine.detect_batch(transactions)
+        self._check_failures(valid, results)
+        scored = published = 0
+        for record, transaction, result in zip(valid, transactions, results):
+            if isinstance(result, Exception):
+                # 已达到重试上限：发布错误结果，与检测结果一样持久化后才提交
+                self._count('failed')
+                self.publisher.publish(transaction['user_id'], {
+                    'request_id': transaction.get('request_id'),
+                    'user_id': transaction['user_id'],
+                    'status': 'failed',
+                    'error': f"{type(result).__name__}: {result}"
+                })
+                published += 1
+                continue
+            scored += 1
+            payload = result.to_dict()
+            if 'request_id' in transaction:
+                payload['request_id'] = transaction['request_id']
+            self.publisher.publish(result.user_id, payload)
+            published += 1
+        self._count('scored', scored)
+        self._count('published', published)
+        return scored
+    
+    def _check_failures(self, records: List, results: List):
+        """记录失败次数；有记录未达到重试上限时抛出异常"""
+        failed = [(record.topic, record.partition, record.offset)
+                  for record, result in zip(records, results) if isinstance(result, Exception)]
+        if not failed:
+            return
+        with self._stats_lock:
+            retry = False
+            for key in failed:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+                if self._attempts[key] < self.max_attempts:
+                    retry = True
+            if retry:
+                self.stats['retried'] += len(failed)
+            else:
+                for key in failed:
+                    del self._attempts[key]
+        if retry:
+            error = next(result for result in results if isinstance(result, Exception))
+            raise RuntimeError(f"{len(failed)} 条记录检测失败: {error}")
+    
+    def _publisher_dropped(self) -> int:
+        return self.publisher.get_stats().get('dropped', 0)
+    
+    def _wait_durable(self, dropped_before: int) -> bool:
+        """等待本轮结果投递确认；失败的记录由发布器写入暂存文件，仅被丢弃时视为未持久化"""
+        try:
+            self.publisher.flush(self.flush_timeout)
+        except Exception as e:
+            logger.warning(f"等待结果投递超时: {e}")
+            return False
+        dropped = self._publisher_dropped() - dropped_before
+        if dropped > 0:
+            logger.error(f"{dropped} 条检测结果未能投递或暂存，不提交位点")
+            return False
+        return True
+    
+    def _rewind(self, batches: Dict):
+        """所有分区回退到本轮起点，下一轮重新消费"""
+        for tp, records in batches.items():
+            try:
+                self.consumer.seek(tp, records[0].offset)
+            except Exception as e:
+                # 分区已被再均衡分走：新的消费者从已提交的位点开始
+                logger.warning(f"分区 {tp} 回退失败: {e}")
+        self._count('redelivered', sum(len(records) for records in batches.values()))
+    
+    def _reset_consumer(self):
+        """关闭出错的消费者，下一轮重新创建（从已提交的位点继续）"""
+        if self.consumer is None:
+            return
+        try:
+            self.consumer.close()
+        except Exception as e:
+            logger.warning(f"Kafka 消费者关闭失败: {e}")
+        self.consumer = None
+    
+    def stop(self):
+        """请求停止（当前一轮完成后退出 run）"""
+        self._stop.set()
+    
+    def close(self):
+        """关闭消费者与线程池；worker 自建的发布器一并关闭"""
+        self.stop()
+        self._reset_consumer()
+        self._executor.shutdown(wait=True)
+        if not self.engine_publishes:
+            self.publisher.close()
+        logger.info(f"流式检测 worker 已关闭: {self.get_stats()}")
+    
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        elapsed = max(1e-6, time.time() - self._started_at)
+        stats['records_per_sec'] = round(stats['scored'] / elapsed, 1)
+        stats['avg_batch_size'] = round(stats['consumed'] / stats['polls'], 1) if stats['polls'] else 0.0
+        stats['publisher'] = self.publisher.get_stats()
+        return stats
@@ -11,18 +11,97 @@
 import numpy as np
 import json
 import time
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple, Optional
+from dataclasses import dataclass, field
 from enum import Enum
 import logging
 from datetime import datetime
 from pathlib import Path
 from copy import deepcopy
+from contextlib import nullcontext
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch_geometric.data import Data
+from torch_geometric.nn import GCNConv, GATConv
 
 import yaml
 import redis
+import redis.asyncio
 import psycopg2
-from kafka import KafkaProducer, KafkaConsumer
+from kafka import KafkaProducer
+
+# 熔断器与检测阶段图位于每次检测的主路径上（各依赖调用捕获 CircuitBreakerOpen，detect 经阶段图执行），为必需依赖
+from core.extensions.circuit_breaker import CircuitBreakerOpen, configure_breakers, get_breaker
+from core.extensions.stage_graph import ShortCircuit, Stage, StageGraph
+
+try:
+    from core.extensions.early_exit import EarlyExitPolicy
+    EARLY_EXIT_AVAILABLE = True
+except ImportError:
+    EARLY_EXIT_AVAILABLE = False
+
+try:
+    from core.extensions.reputation import ReputationCache
+    REPUTATION_AVAILABLE = True
+except ImportError:
+    REPUTATION_AVAILABLE = False
+
+try:
+    from core.extensions.model_runtime import EagerRuntime, load_runtime, load_weights
+    MODEL_RUNTIME_AVAILABLE = True
+except ImportError:
+    MODEL_RUNTIME_AVAILABLE = False
+
+# 关系图子图推理需要关系图、推理运行时、批量推理与分类层（嵌入缓存模块）；
+# 任一不可用时按单笔交易构图，直接调用 GNN 模型
+try:
+    from core.extensions.embedding_cache import (ClassifierHead, EmbeddingRefresher, NodeEmbeddingCache,
+                                                 model_fingerprint)
+    from core.extensions.gnn_batching import GNNInferenceBatcher, predict_batched
+    from core.extensions.graph_store import TransactionGraphStore
+    GRAPH_GNN_AVAILABLE = MODEL_RUNTIME_AVAILABLE
+except ImportError:
+    GRAPH_GNN_AVAILABLE = False
+
+try:
+    from core.extensions.latency_budget import LatencyBudget, StageCostModel
+    LATENCY_BUDGET_AVAILABLE = True
+except ImportError:
+    LATENCY_BUDGET_AVAILABLE = False
+
+try:
+    from core.extensions.metrics import get_metrics, StageTimer
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+try:
+    from core.extensions.shared_state import create_state_store
+    SHARED_STATE_AVAILABLE = True
+except ImportError:
+    SHARED_STATE_AVAILABLE = False
+
+try:
+    from core.extensions.result_sink import WriteBehindSink, result_row
+    RESULT_SINK_AVAILABLE = True
+except ImportError:
+    RESULT_SINK_AVAILABLE = False
+
+try:
+    from core.extensions.kafka_publisher import KafkaResultPublisher
+    KAFKA_PUBLISHER_AVAILABLE = True
+except ImportError:
+    KAFKA_PUBLISHER_AVAILABLE = False
+
+try:
+    from core.extensions.redis_pool import create_redis_client, redis_settings, RedisWriteCoalescer
+    REDIS_POOL_AVAILABLE = True
+except ImportError:
+    REDIS_POOL_AVAILABLE = False
 
 # 配置日志
 logging.basicConfig(
@@ -31,6 +110,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# GNN 节点特征维度（关系图采样的节点特征与模型输入一致）
+GNN_INPUT_DIM = 32
+
 
 class RiskLevel(Enum):
     """风险等级"""
@@ -54,6 +136,12 @@ class DetectionResult:
     vpn_detected: bool = False
     vpn_type: str = "None"
     vpn_confidence: float = 0.0
+    degraded_stages: List[str] = field(default_factory=list)
+    stage_timings_ms: Dict[str, float] = field(default_factory=dict)
+    early_exit: Optional[str] = None
+    decision_tier: Optional[str] = None
+    fast_lane: bool = False
+    engine_mode: Optional[str] = None
     
     def to_dict(self) -> Dict:
         return {
@@ -67,7 +155,13 @@ class DetectionResult:
             'response_time_ms': self.response_time_ms,
             'vpn_detected': self.vpn_detected,
             'vpn_type': self.vpn_type,
-            'vpn_confidence': self.vpn_confidence
+            'vpn_confidence': self.vpn_confidence,
+            'degraded_stages': self.degraded_stages,
+            'stage_timings_ms': self.stage_timings_ms,
+            'early_exit': self.early_exit,
+            'decision_tier': self.decision_tier,
+            'fast_lane': self.fast_lane,
+            'engine_mode': self.engine_mode
         }
 
 
@@ -95,18 +189,23 @@ class GraphNeuralNetworkDetector(nn.Module):
         # Dropout防止过拟合
         self.dropout = nn.Dropout(0.5)
         
-    def forward(self, x, edge_index):
+    def forward(self, x, edge_index, edge_weight=None):
         """
         前向传播
         x: 节点特征 [num_nodes, input_dim]
         edge_index: 边索引 [2, num_edges]
+        edge_weight: 边权重 [num_edges]（关系图中按时间衰减的权重），None 时各边权重为 1
         """
-        # GCN层
-        x = self.conv1(x, edge_index)
+        return self.classify(self.embed(x, edge_index, edge_weight))
+    
+    def embed(self, x, edge_index, edge_weight=None):
+        """节点嵌入：GCN + GAT 消息传递的输出 [num_nodes, hidden_dim]（分类层的输入）"""
+        # GCN层（按边权重加权聚合，久未出现的关系影响小）
+        x = self.conv1(x, edge_index, edge_weight)
         x = F.relu(x)
         x = self.dropout(x)
         
-        x = self.conv2(x, edge_index)
+        x = self.conv2(x, edge_index, edge_weight)
         x = F.relu(x)
         x = self.dropout(x)
         
@@ -116,9 +215,10 @@ class GraphNeuralNetworkDetector(nn.Module):
         x = self.dropout(x)
         
         x = self.gat2(x, edge_index)
-        x = F.relu(x)
-        
-        # 分类
+        return F.relu(x)
+    
+    def classify(self, x):
+        """分类层：节点嵌入 → 各类别的对数概率"""
         x = self.fc1(x)
         x = F.relu(x)
         x = self.dropout(x)
@@ -391,6 +491,16 @@ class SevenLayerDefenseSystem:
         return 0.2  # 简化实现
 
 
+class EnvironmentRejection(ShortCircuit):
+    """严重环境威胁：环境检测阶段返回该标记，依赖它的阶段不再执行"""
+    
+    __slots__ = ('env_result',)
+    
+    def __init__(self, env_result):
+        super().__init__('environment_critical')
+        self.env_result = env_result
+
+
 class FraudDetectionEngine:
     """
     欺诈检测引擎主类
@@ -400,8 +510,16 @@ class FraudDetectionEngine:
     def __init__(self, config_path: str = 'config/config.yaml'):
         self.config = self._load_config(config_path)
         
-        # 初始化GNN模型
+        # 依赖熔断器：Redis/PostgreSQL/Kafka 连续失败后直接跳过，恢复超时后半开试探
+        self.breakers = self._init_breakers()
+        
+        # 检测状态存储（多 worker 部署时使用 Redis 共享）
+        self.state_store = create_state_store(self.config) if SHARED_STATE_AVAILABLE else None
+        
+        # 初始化GNN模型（按 detection.model.runtime 加载 TorchScript/ONNX 导出件，默认回退 eager 模式）
         self.gnn_model = self._load_gnn_model()
+        self.gnn_runtime = (load_runtime(self.gnn_model, self.config.get('detection', {}).get('model', {}),
+                                         GNN_INPUT_DIM) if MODEL_RUNTIME_AVAILABLE else None)
         
         # 初始化7层防御
         self.defense_system = SevenLayerDefenseSystem(self.config)
@@ -418,7 +536,7 @@ class FraudDetectionEngine:
         # 初始化设备指纹检测器
         try:
             from core.extensions.device_fingerprint import DeviceFingerprintDetector
-            self.device_detector = DeviceFingerprintDetector()
+            self.device_detector = DeviceFingerprintDetector(self.state_store)
             logger.info("设备指纹检测器初始化成功")
         except Exception as e:
             logger.warning(f"设备指纹检测器初始化失败: {e}")
@@ -433,25 +551,145 @@ class FraudDetectionEngine:
             logger.warning(f"环境检测器初始化失败: {e}")
             self.environment_detector = None
         
+        perf_cfg = self.config.get('performance', {})
+        
+        # 快速编解码：Redis/Kafka 序列化使用 msgspec/orjson（不可用时使用标准库json）
+        try:
+            from core.extensions.fast_codec import FastCodec
+            self.codec = FastCodec.from_config(perf_cfg)
+        except Exception as e:
+            logger.warning(f"快速编解码初始化失败: {e}")
+            self.codec = None
+        
         # 初始化数据库连接
         self.redis_client = self._init_redis()
-        self.pg_conn = self._init_postgres()
         
-        # 初始化Kafka
-        self.kafka_producer = self._init_kafka_producer()
+        # Redis写入合并：并发请求的结果写入由后台线程合并为管道发送
+        self.redis_writer = self._init_redis_writer(perf_cfg)
+        
+        # PostgreSQL：启用写后缓冲时由后台线程经连接池批量写入，不再使用共享连接逐行提交
+        self.result_sink = self._init_result_sink(perf_cfg)
+        self.pg_conn = self._init_postgres() if self.result_sink is None else None
+        # 共享连接上的 cursor/commit/rollback 来自多个 I/O 线程，须串行执行，避免回滚其他线程写入的行
+        self._pg_lock = threading.Lock()
+        
+        # 初始化Kafka：启用调优发布器时攒批压缩发送，broker 不可达期间暂存到本地磁盘
+        self.kafka_publisher = self._init_kafka_publisher(perf_cfg)
+        self.kafka_producer = self._init_kafka_producer() if self.kafka_publisher is None else None
+        
+        # 异步检测线程池：CPU计算与同步I/O（PostgreSQL/Kafka）分开，互不阻塞
+        try:
+            from core.extensions.async_executor import BoundedExecutor
+            self.cpu_executor = BoundedExecutor(perf_cfg.get('workers', 16), name='detect-cpu')
+            self.io_executor = BoundedExecutor(perf_cfg.get('io_workers', 8), name='detect-io')
+        except Exception as e:
+            logger.warning(f"异步线程池初始化失败，使用默认线程池: {e}")
+            self.cpu_executor = None
+            self.io_executor = None
+        
+        # 异步Redis客户端在首次异步检测时创建（需绑定事件循环）
+        self.async_redis_client = None
+        
+        # 延迟预算：默认 performance.timeout_ms，超时后可选阶段降级
+        budget_cfg = perf_cfg.get('latency_budget', {})
+        self.timeout_ms = perf_cfg.get('timeout_ms', 0)
+        self.env_max_age = budget_cfg.get('environment_max_age_s', 5)
+        if LATENCY_BUDGET_AVAILABLE and budget_cfg.get('enabled', True):
+            self.stage_costs = StageCostModel()
+        else:
+            self.stage_costs = None
+        self._last_env_result = None
+        
+        # 监控指标（/metrics）
+        if METRICS_AVAILABLE and perf_cfg.get('metrics', {}).get('enabled', True):
+            self.metrics = get_metrics()
+            self.metrics.gauge(
+                'fraud_storage_up', '存储/消息队列连接状态（1=可用）',
+                lambda: {
+                    ('redis',): int(self.redis_client is not None and self._backend_up('redis')),
+                    ('postgres',): int(self.result_sink.healthy if self.result_sink is not None
+                                       else self.pg_conn is not None and not self.pg_conn.closed),
+                    ('kafka',): int(self.kafka_publisher.healthy if self.kafka_publisher is not None
+                                    else self.kafka_producer is not None)
+                },
+                ('backend',)
+            )
+            self.metrics.gauge(
+                'fraud_executor_in_flight', '检测线程池在途任务数',
+                lambda: {
+                    ('full', executor.name): executor.get_stats()['in_flight']
+                    for executor in (self.cpu_executor, self.io_executor) if executor is not None
+                },
+                ('engine', 'executor'),
+                source='full'
+            )
+            if self.result_sink is not None:
+                self.metrics.gauge(
+                    'fraud_result_sink_buffered', '等待写入PostgreSQL的检测结果数',
+                    lambda: self.result_sink.get_stats()['buffered']
+                )
+        else:
+            self.metrics = None
+        
+        # 决定性规则（IP/设备黑名单）命中时跳过GNN、VPN等阶段，直接拒绝
+        self.early_exit = EarlyExitPolicy.from_config(
+            perf_cfg.get('early_exit', {}),
+            ip_blacklists=[self.config.get('ip_blacklist'),
+                           self.device_detector.blacklisted_ips if self.device_detector else None],
+            device_blacklists=[self.device_detector.blacklisted_devices if self.device_detector else None]
+        ) if EARLY_EXIT_AVAILABLE else None
+        
+        # 受信实体快速通道：长期低风险的 用户/设备/IP 组合跳过环境扫描、GNN、VPN、设备指纹
+        self.reputation = (ReputationCache.from_config(perf_cfg.get('reputation', {}))
+                           if REPUTATION_AVAILABLE else None)
+        
+        # 交易关系图：每次检测追加 用户/商品/设备/IP 关系，GNN 推理采样以用户为中心的邻域
+        self.graph_store = (TransactionGraphStore.from_config(perf_cfg.get('graph_store', {}),
+                                                              feature_dim=GNN_INPUT_DIM)
+                            if GRAPH_GNN_AVAILABLE else None)
+        
+        # GNN 批量推理：多笔交易的子图合并为一次前向传播（批量检测接口总是整批推理）
+        gnn_batch_cfg = perf_cfg.get('gnn_batching', {})
+        self.gnn_batch_size = gnn_batch_cfg.get('max_batch_size', 32)
+        self.gnn_batcher = (GNNInferenceBatcher.from_config(self._gnn_node_embeddings, gnn_batch_cfg)
+                            if self.graph_store is not None else None)
+        
+        # 节点嵌入缓存：邻域结构未变化的实体查表后只计算分类层，后台线程重算结构变化过的已缓存实体
+        self.gnn_head = None
+        self.gnn_model_version = None
+        self.embedding_cache = None
+        self.embedding_refresher = None
+        if self.graph_store is not None:
+            self.embedding_cache = NodeEmbeddingCache.from_config(perf_cfg.get('embedding_cache', {}),
+                                                                  dim=self.gnn_model.fc1.in_features)
+            self.refresh_gnn_model()
+            if self.embedding_cache is not None:
+                embedding_cfg = perf_cfg.get('embedding_cache', {})
+                self.embedding_refresher = EmbeddingRefresher(
+                    self.embedding_cache, self.graph_store, self._gnn_node_embeddings,
+                    interval_s=embedding_cfg.get('refresh_interval_s', 1.0),
+                    batch_size=embedding_cfg.get('refresh_batch_size', 128)
+                )
         
-        # 统计信息
+        # 检测阶段依赖图：环境检测、GNN、VPN、设备指纹互不依赖，并发执行后融合评分
+        self.stage_graph = self._init_stage_graph(perf_cfg)
+        self.fast_lane_graph = self._init_fast_lane_graph() if self.reputation is not None else None
+        
+        # 统计信息（detect 在多线程中执行，更新与读取都持有 _stats_lock）
+        self._stats_lock = threading.Lock()
         self.stats = {
             'total_requests': 0,
             'fraud_detected': 0,
             'avg_response_time': 0.0,
             'vpn_detected': 0,
-            'environment_threats': 0
+            'environment_threats': 0,
+            'degraded_requests': 0,
+            'early_exits': 0
         }
         
         logger.info("欺诈检测引擎初始化完成")
     
-    def detect(self, transaction: Dict) -> DetectionResult:
+    def detect(self, transaction: Dict, deadline: Optional[float] = None) -> DetectionResult:
         """
         主检测方法
         
@@ -466,206 +704,605 @@ class FraudDetectionEngine:
                     'device_id': str,
                     'features': list
                 }
+            deadline: 截止时间（time.time() 时间戳），默认为当前时间 + performance.timeout_ms；
+                      预算耗尽后GNN/VPN/设备历史等可选阶段降级，降级阶段记录在 degraded_stages
         
         Returns:
             DetectionResult: 检测结果
         """
         start_time = time.time()
-        user_id = transaction['user_id']
-        triggered_layers = []
-        detected_patterns = []
+        budget = self._new_budget(start_time, deadline)
         
         try:
-            # 第0层：环境安全检测（在所有检测之前）
-            if self.environment_detector:
+            # 第0层环境检测与各检测阶段并发执行，严重环境威胁时拒绝
+            result, rejected = self._evaluate_transaction(transaction, start_time, budget)
+            if rejected:
+                return result
+            
+            # 发送到Kafka进行异步处理
+            self._send_to_kafka(result)
+            
+            # 存储结果
+            self._store_result(result)
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"检测过程出错: {str(e)}", exc_info=True)
+            raise
+    
+    def detect_batch(self, transactions: List[Dict],
+                     return_exceptions: bool = True,
+                     deadline: Optional[float] = None,
+                     publish: bool = True) -> List:
+        """
+        批量检测：一次调用完成整批评分
+        
+        与交易无关的环境检测（第0层）在批次内只执行一次，整批的GNN推理合并为一次前向传播，
+        整批的设备状态读写合并为一次Redis往返，结果落库也合并为一次提交
+        
+        Args:
+            transactions: 交易列表
+            return_exceptions: 为True时单笔失败以异常对象返回，不影响其他交易
+            deadline: 截止时间，默认每笔交易各自使用 performance.timeout_ms 预算
+            publish: 为False时不发送到Kafka，由调用方发布（如流式 worker 附带 request_id 发布）
+        
+        Returns:
+            与输入顺序一致的结果列表
+        """
+        start_time = time.time()
+        env_budget = self._new_budget(start_time, deadline)
+        env_result = self._check_environment(env_budget)
+        if self._is_environment_critical(env_result):
+            return [
+                self._reject_by_environment(transaction, env_result, start_time)
+                for transaction in transactions
+            ]
+        
+        results = []
+        gnn_probs = self._predict_gnn_batch(transactions, env_budget)
+        with self._prefetch_state(transactions):
+            for transaction, gnn_prob in zip(transactions, gnn_probs):
+                budget = self._new_budget(time.time(), deadline)
+                if budget is not None:
+                    budget.degraded.extend(env_budget.degraded)
                 try:
-                    env_result = self.environment_detector.detect(transaction)
-                    
-                    if not env_result.is_safe:
-                        triggered_layers.append(0)
-                        self.stats['environment_threats'] += 1
-                        
-                        # 添加威胁信息到检测模式
-                        for threat_name in env_result.threats_detected:
-                            threat_info = env_result.threat_details.get(threat_name)
-                            if threat_info:
-                                detected_patterns.append(
-                                    f"🔴 环境威胁[{threat_info.severity}]: {threat_name}"
-                                )
-                        
-                        # 根据威胁等级决定是否拒绝服务
-                        if env_result.threat_level == "CRITICAL":
-                            logger.critical(
-                                f"检测到严重环境威胁，拒绝处理请求 - "
-                                f"用户: {user_id}, 威胁: {env_result.threats_detected}"
-                            )
-                            
-                            # 直接返回高风险结果
-                            return DetectionResult(
-                                user_id=user_id,
-                                risk_score=100.0,
-                                risk_level=RiskLevel.CRITICAL,
-                                fraud_probability=1.0,
-                                detected_patterns=detected_patterns,
-                                defense_layers_triggered=[0],
-                                timestamp=time.time(),
-                                response_time_ms=(time.time() - start_time) * 1000,
-                                vpn_detected=False,
-                                vpn_type="None",
-                                vpn_confidence=0.0
-                            )
-                        
-                        # HIGH 级别的威胁会大幅提高风险评分
-                        logger.warning(
-                            f"环境威胁检测 - 用户: {user_id}, "
-                            f"等级: {env_result.threat_level}, "
-                            f"风险: {env_result.risk_score:.2%}"
-                        )
-                        
+                    results.append(self._evaluate(transaction, env_result, start_time, budget, gnn_prob))
                 except Exception as e:
-                    logger.warning(f"环境检测失败: {e}")
+                    if not return_exceptions:
+                        raise
+                    logger.error(f"批量检测失败: {transaction.get('user_id')}, {str(e)}")
+                    results.append(e)
+        
+        completed = [r for r in results if isinstance(r, DetectionResult)]
+        if publish:
+            for result in completed:
+                self._send_to_kafka(result)
+        self._store_results(completed)
+        
+        return results
+    
+    async def detect_async(self, transaction: Dict,
+                           deadline: Optional[float] = None) -> DetectionResult:
+        """
+        异步检测方法
+        
+        检测计算在有界CPU线程池中执行，结果写入使用异步Redis客户端，
+        PostgreSQL/Kafka写入在独立的I/O线程池中执行，事件循环不被阻塞
+        
+        Args:
+            transaction: 交易数据字典，格式同 detect()
+            deadline: 截止时间，含义同 detect()
+        
+        Returns:
+            DetectionResult: 检测结果
+        """
+        start_time = time.time()
+        budget = self._new_budget(start_time, deadline)
+        
+        try:
+            result, rejected = await self._offload(
+                self.cpu_executor, self._evaluate_transaction, transaction, start_time, budget
+            )
+            if rejected:
+                return result
             
-            # 第1层：数据清洗
-            passed, msg = self.defense_system.layer1_data_purification(transaction)
-            if not passed:
-                detected_patterns.append(msg)
-                triggered_layers.append(1)
+            await asyncio.gather(
+                self._send_to_kafka_async(result),
+                self._store_redis_async([result]),
+                self._store_postgres_async([result])
+            )
             
-            # 第2-7层防御检查
-            # 第4层：实时监控
-            passed, alerts = self.defense_system.layer4_realtime_monitoring(
-                user_id, 
+            return result
+        
+        except Exception as e:
+            logger.error(f"检测过程出错: {str(e)}", exc_info=True)
+            raise
+    
+    def _prefetch_state(self, transactions: List[Dict]):
+        """预取共享状态：整批交易的设备状态在一次 Redis 管道内读写"""
+        if not self.device_detector or not getattr(self.state_store, 'shared', False):
+            return nullcontext()
+        if self.early_exit is not None:
+            # 提前拒绝的交易不执行设备指纹检测，不预取（否则预取结果错位）
+            transactions = self.early_exit.passing(transactions)
+        if self.reputation is not None:
+            # 受信实体走快速通道，不执行设备指纹检测
+            transactions = [t for t in transactions if not self.reputation.peek(t)]
+        try:
+            devices = [self.device_detector.history_entry(t) for t in transactions]
+        except Exception as e:
+            logger.warning(f"共享状态预取失败: {e}")
+            return nullcontext()
+        return self.state_store.prefetch([], 0, devices)
+    
+    async def _offload(self, executor, fn, *args):
+        """在指定线程池中执行同步函数"""
+        if executor is not None:
+            return await executor.run(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+    
+    def _new_budget(self, start_time: float, deadline: Optional[float] = None):
+        """创建单次检测的延迟预算"""
+        if self.stage_costs is None:
+            return None
+        if deadline is None and self.timeout_ms:
+            deadline = start_time + self.timeout_ms / 1000.0
+        return LatencyBudget(deadline, self.stage_costs)
+    
+    def _stage_allowed(self, budget, stage: str) -> bool:
+        """剩余预算是否足够执行可选阶段，不足时记为降级"""
+        if budget is None or budget.allows(stage):
+            return True
+        budget.skip(stage)
+        return False
+    
+    def _measure(self, budget, stage: str):
+        """记录阶段耗时（监控直方图 + 延迟预算耗时估计）"""
+        if self.metrics is not None:
+            cost_model = budget.cost_model if budget is not None else None
+            return StageTimer(self.metrics.stage(stage), cost_model, stage)
+        return budget.measure(stage) if budget is not None else nullcontext()
+    
+    def _check_environment(self, budget=None):
+        """
+        第0层：运行环境检测（与具体交易无关，批次内可共享）
+        
+        预算不足时复用最近一次的检测结果（不超过 environment_max_age_s）
+        """
+        if not self.environment_detector:
+            return None
+        
+        cached = self._last_env_result
+        if (cached is not None and budget is not None
+                and time.time() - cached.timestamp < self.env_max_age
+                and not budget.allows('environment')):
+            budget.skip('environment')
+            return cached
+        
+        try:
+            with self._measure(budget, 'environment'):
+                env_result = self.environment_detector.detect()
+            self._last_env_result = env_result
+            return env_result
+        except Exception as e:
+            logger.warning(f"环境检测失败: {e}")
+            return None
+    
+    def _is_environment_critical(self, env_result) -> bool:
+        """根据威胁等级决定是否拒绝服务"""
+        return (env_result is not None and not env_result.is_safe
+                and env_result.threat_level == "CRITICAL")
+    
+    def _environment_patterns(self, env_result) -> List[str]:
+        """把环境威胁转换为检测模式"""
+        patterns = []
+        for threat_name in env_result.threats_detected:
+            threat_info = env_result.threat_details.get(threat_name)
+            if threat_info:
+                patterns.append(f"🔴 环境威胁[{threat_info.severity}]: {threat_name}")
+        return patterns
+    
+    def _reject_by_environment(self, transaction: Dict, env_result,
+                               start_time: float) -> DetectionResult:
+        """严重环境威胁：拒绝处理请求，直接返回高风险结果"""
+        user_id = transaction['user_id']
+        with self._stats_lock:
+            self.stats['environment_threats'] += 1
+        logger.critical(
+            f"检测到严重环境威胁，拒绝处理请求 - "
+            f"用户: {user_id}, 威胁: {env_result.threats_detected}"
+        )
+        
+        result = DetectionResult(
+            user_id=user_id,
+            risk_score=100.0,
+            risk_level=RiskLevel.CRITICAL,
+            fraud_probability=1.0,
+            detected_patterns=self._environment_patterns(env_result),
+            defense_layers_triggered=[0],
+            timestamp=time.time(),
+            response_time_ms=(time.time() - start_time) * 1000,
+            vpn_detected=False,
+            vpn_type="None",
+            vpn_confidence=0.0
+        )
+        if self.metrics is not None:
+            self.metrics.observe_result(result)
+        return result
+    
+    def _init_stage_graph(self, perf_cfg: Dict) -> StageGraph:
+        """
+        构建检测阶段依赖图（performance.stage_graph）
+        
+        环境检测、第1层、VPN 互不依赖，并发执行；环境检测是准入关口：
+        写入状态的第4层（操作计数）、GNN（交易写入关系图后推理）与设备指纹（设备历史）
+        在环境检测之后执行，严重环境威胁时不再执行（VPN 只读，与环境检测重叠执行，未开始的同样跳过）。
+        设备指纹读取线程内预取的共享状态，固定在调用线程执行。
+        启用提前结束时各阶段都在决定性规则检查（screen）之后执行
+        """
+        stages, deps = self._screen_stages()
+        gated = deps + ('environment',)
+        return StageGraph.from_config(
+            stages + [
+                Stage('environment', self._stage_environment, deps),
+                Stage('layer1', self._stage_layer1, deps),
+                Stage('layer4', self._stage_layer4, gated),
+                Stage('gnn', self._stage_gnn, gated),
+                Stage('vpn', self._stage_vpn, deps),
+                Stage('device', self._stage_device, gated, inline=True)
+            ],
+            perf_cfg.get('stage_graph', {}),
+            self.stage_costs,
+            request_workers=perf_cfg.get('workers', 16)
+        )
+    
+    def _init_fast_lane_graph(self) -> StageGraph:
+        """
+        受信实体快速通道：只做决定性规则与第1/4层检查，GNN推理替换为基于金额的先验概率，
+        不执行环境扫描、VPN、设备指纹（均为轻量阶段，在调用线程执行）
+        """
+        stages, deps = self._screen_stages()
+        return StageGraph(
+            stages + [
+                Stage('layer1', self._stage_layer1, deps),
+                Stage('layer4', self._stage_layer4, deps),
+                Stage('gnn', self._stage_gnn_prior, deps)
+            ],
+            cost_model=self.stage_costs
+        )
+    
+    def _screen_stages(self) -> Tuple[List[Stage], Tuple[str, ...]]:
+        """决定性规则检查阶段及其余阶段对它的依赖（未启用提前结束时为空）"""
+        if self.early_exit is None:
+            return [], ()
+        return [Stage('screen', self._stage_screen, inline=True)], ('screen',)
+    
+    def _run_stages(self, transaction: Dict, budget=None, env_result=None, run_environment=True,
+                    gnn_prob: Optional[float] = None):
+        """
+        执行检测阶段依赖图；run_environment 为 False 时使用传入的环境检测结果
+        
+        受信实体组合执行快速通道；gnn_prob 为批量推理的结果（该交易已写入关系图），不再执行GNN阶段
+        """
+        fast_lane = self.reputation is not None and self.reputation.is_trusted(transaction)
+        inputs = {'transaction': transaction, 'budget': budget, 'fast_lane': fast_lane}
+        if not run_environment:
+            inputs['environment'] = env_result
+        if gnn_prob is not None and not fast_lane:
+            inputs['gnn'] = gnn_prob
+        graph = self.fast_lane_graph if fast_lane else self.stage_graph
+        return graph.run(inputs)
+    
+    def _evaluate_transaction(self, transaction: Dict, start_time: float,
+                              budget=None) -> Tuple[DetectionResult, bool]:
+        """
+        第0-8层检测（不含结果落库）
+        
+        Returns:
+            (检测结果, 是否因严重环境威胁拒绝)；决定性规则提前拒绝的结果照常落库
+        """
+        run = self._run_stages(transaction, budget)
+        if isinstance(run.short_circuit, EnvironmentRejection):
+            return self._reject_by_environment(transaction, run.short_circuit.env_result, start_time), True
+        result = self._fuse(transaction, run, start_time, budget)
+        self.update_reputation(transaction, result)
+        return result, False
+    
+    def _evaluate(self, transaction: Dict, env_result, start_time: float,
+                  budget=None, gnn_prob: Optional[float] = None) -> DetectionResult:
+        """对单笔交易执行第1-8层检测（环境检测结果由调用方提供，不含结果落库）"""
+        run = self._run_stages(transaction, budget, env_result, run_environment=False, gnn_prob=gnn_prob)
+        result = self._fuse(transaction, run, start_time, budget)
+        self.update_reputation(transaction, result)
+        return result
+    
+    def record_transaction(self, transaction: Dict):
+        """
+        交易关系写入关系图：在GNN阶段执行，提前拒绝与环境拒绝的交易不写入
+        （级联模式下未升级的交易由级联引擎调用）
+        """
+        if self.graph_store is not None:
+            self.graph_store.append(transaction)
+    
+    def update_reputation(self, transaction: Dict, result: DetectionResult):
+        """按检测结果晋升或失效受信实体组合"""
+        if self.reputation is not None:
+            self.reputation.observe(transaction, result)
+    
+    def score_with_stages(self, transaction: Dict, stage_outputs: Dict,
+                          start_time: Optional[float] = None,
+                          deadline: Optional[float] = None) -> DetectionResult:
+        """
+        级联模式：复用上一级引擎已完成的阶段输出（第1/4层、VPN、设备指纹），
+        只补充执行其余阶段（GNN推理、环境检测）后融合评分
+        
+        已完成的阶段不重复执行，操作计数与设备历史不会重复记录；
+        结果不发送Kafka、不落库，与精简版引擎的结果一样由调用方处理
+        
+        Args:
+            transaction: 交易数据
+            stage_outputs: 已完成阶段的输出（按阶段名索引）
+            start_time: 检测开始时间（响应时间从此计算），默认为当前时间
+            deadline: 截止时间，含义同 detect()
+        """
+        if start_time is None:
+            start_time = time.time()
+        budget = self._new_budget(start_time, deadline)
+        run = self.stage_graph.run({**stage_outputs, 'transaction': transaction, 'budget': budget})
+        if isinstance(run.short_circuit, EnvironmentRejection):
+            return self._reject_by_environment(transaction, run.short_circuit.env_result, start_time)
+        return self._fuse(transaction, run, start_time, budget)
+    
+    # ---------- 检测阶段（互不依赖，可并发执行） ----------
+    
+    def _stage_screen(self, inputs: Dict):
+        """决定性规则检查（命中时返回 EarlyExit，其余阶段不再执行）"""
+        return self.early_exit.check(inputs['transaction'])
+    
+    def _stage_environment(self, inputs: Dict):
+        """第0层：运行环境检测（严重威胁时返回 EnvironmentRejection，其余阶段不再执行）"""
+        env_result = self._check_environment(inputs['budget'])
+        if self._is_environment_critical(env_result):
+            return EnvironmentRejection(env_result)
+        return env_result
+    
+    def _stage_layer1(self, inputs: Dict) -> Tuple[bool, str]:
+        """第1层：数据清洗"""
+        with self._measure(inputs['budget'], 'layer1'):
+            return self.defense_system.layer1_data_purification(inputs['transaction'])
+    
+    def _stage_layer4(self, inputs: Dict) -> Tuple[bool, List[str]]:
+        """第4层：实时监控"""
+        transaction = inputs['transaction']
+        with self._measure(inputs['budget'], 'layer4'):
+            return self.defense_system.layer4_realtime_monitoring(
+                transaction['user_id'],
                 transaction.get('action', 'purchase')
             )
-            if not passed:
-                detected_patterns.extend(alerts)
-                triggered_layers.append(4)
-            
-            # 使用GNN模型进行预测
-            fraud_prob = self._predict_with_gnn(transaction)
-            
-            # 计算综合风险评分
-            risk_score = self._calculate_risk_score(fraud_prob, detected_patterns)
+    
+    def _stage_gnn(self, inputs: Dict) -> float:
+        """交易写入关系图后做GNN模型预测（预算不足时使用基于金额的先验概率）"""
+        self.record_transaction(inputs['transaction'])
+        budget = inputs['budget']
+        if self._stage_allowed(budget, 'gnn'):
+            with self._measure(budget, 'gnn'):
+                return self._predict_with_gnn(inputs['transaction'])
+        return self._fallback_fraud_probability(inputs['transaction'])
+    
+    def _stage_gnn_prior(self, inputs: Dict) -> float:
+        """快速通道：交易写入关系图，不做GNN推理，使用基于金额的先验概率"""
+        self.record_transaction(inputs['transaction'])
+        return self._fallback_fraud_probability(inputs['transaction'])
+    
+    def _stage_vpn(self, inputs: Dict):
+        """VPN检测（未启用、预算不足或失败时返回 None）"""
+        budget = inputs['budget']
+        if not self.vpn_detector or not self._stage_allowed(budget, 'vpn'):
+            return None
+        try:
+            with self._measure(budget, 'vpn'):
+                return self.vpn_detector.detect(inputs['transaction'])
+        except Exception as e:
+            logger.warning(f"VPN检测失败: {e}")
+            return None
+    
+    def _stage_device(self, inputs: Dict):
+        """设备指纹检测（预算不足时只做无需历史比对的快速检查；失败时返回 None）"""
+        if not self.device_detector:
+            return None
+        budget = inputs['budget']
+        try:
+            if self._stage_allowed(budget, 'device'):
+                with self._measure(budget, 'device'):
+                    return self.device_detector.detect(inputs['transaction'])
+            return self.device_detector.detect_quick(inputs['transaction'])
+        except Exception as e:
+            logger.warning(f"设备指纹检测失败: {e}")
+            return None
+    
+    def _fuse(self, transaction: Dict, run, start_time: float, budget=None) -> DetectionResult:
+        """融合各阶段输出：综合评分、风险等级与第5-7层经济/法律防御"""
+        run.raise_first_error()
+        if run.short_circuit is not None:
+            return self._reject_early(transaction, run, start_time, budget)
+        outputs = run.outputs
+        env_result = outputs.get('environment')
+        user_id = transaction['user_id']
+        triggered_layers = []
+        detected_patterns = []
+        
+        if env_result is not None and not env_result.is_safe:
+            triggered_layers.append(0)
+            with self._stats_lock:
+                self.stats['environment_threats'] += 1
             
-            # 确定风险等级
-            risk_level = self._determine_risk_level(risk_score)
+            # 添加威胁信息到检测模式
+            detected_patterns.extend(self._environment_patterns(env_result))
             
-            # 如果是高风险，应用经济防御
-            if risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
-                # 第5层：提高成本
+            # HIGH 级别的威胁会大幅提高风险评分
+            logger.warning(
+                f"环境威胁检测 - 用户: {user_id}, "
+                f"等级: {env_result.threat_level}, "
+                f"风险: {env_result.risk_score:.2%}"
+            )
+        
+        # 第1层：数据清洗
+        passed, msg = outputs['layer1']
+        if not passed:
+            detected_patterns.append(msg)
+            triggered_layers.append(1)
+        
+        # 第2-7层防御检查
+        # 第4层：实时监控
+        passed, alerts = outputs['layer4']
+        if not passed:
+            detected_patterns.extend(alerts)
+            triggered_layers.append(4)
+        
+        fraud_prob = outputs['gnn']
+        
+        # 计算综合风险评分
+        risk_score = self._calculate_risk_score(fraud_prob, detected_patterns)
+        
+        # 确定风险等级
+        risk_level = self._determine_risk_level(risk_score)
+        
+        # 如果是高风险，应用经济防御
+        if risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
+            # 第5层：提高成本
+            with self._measure(budget, 'layer5'):
                 cost_measures = self.defense_system.layer5_increase_cost(user_id)
-                triggered_layers.append(5)
-                
-                # 第6层：降低收益
+            triggered_layers.append(5)
+            
+            # 第6层：降低收益
+            with self._measure(budget, 'layer6'):
                 profit_measures = self.defense_system.layer6_decrease_profit(
                     user_id,
                     transaction.get('item_id', '')
                 )
-                triggered_layers.append(6)
-                
-                # 第7层：法律威慑
-                if risk_level == RiskLevel.CRITICAL:
+            triggered_layers.append(6)
+            
+            # 第7层：法律威慑
+            if risk_level == RiskLevel.CRITICAL:
+                with self._measure(budget, 'layer7'):
                     legal_actions = self.defense_system.layer7_legal_deterrence(
                         user_id,
                         detected_patterns
                     )
-                    triggered_layers.append(7)
-            
-            # VPN检测
-            vpn_detected = False
-            vpn_type = "None"
-            vpn_confidence = 0.0
-            
-            if self.vpn_detector:
-                try:
-                    vpn_result = self.vpn_detector.detect(transaction)
-                    vpn_detected = vpn_result.is_vpn
-                    vpn_type = vpn_result.vpn_type
-                    vpn_confidence = vpn_result.confidence
-                    
-                    if vpn_detected:
-                        detected_patterns.append(f"VPN检测: {vpn_type}")
-                        self.stats['vpn_detected'] += 1
-                        # VPN使用提高风险评分
-                        risk_score = min(100, risk_score * 1.2)
-                except Exception as e:
-                    logger.warning(f"VPN检测失败: {e}")
-            
-            # 设备指纹检测
-            device_risk = 0.0
-            if self.device_detector:
-                try:
-                    device_result = self.device_detector.detect(transaction)
-                    device_risk = device_result.risk_score
-                    
-                    # 添加设备风险因素到检测模式
-                    if device_result.risk_factors:
-                        detected_patterns.extend(device_result.risk_factors)
-                    
-                    # 刷机/Root设备直接列入高风险
-                    if device_result.is_rooted or device_result.is_suspicious:
-                        detected_patterns.append("🔴 高风险设备")
-                        risk_score = min(100, risk_score * 1.5)
-                        triggered_layers.append(8)  # 标记为设备层检测
-                    
-                    # 模拟器设备提高风险
-                    if device_result.is_emulator:
-                        risk_score = min(100, risk_score * 1.3)
-                    
-                    # 设备风险分数直接影响总风险
-                    risk_score = min(100, risk_score + device_risk * 30)
-                    
-                except Exception as e:
-                    logger.warning(f"设备指纹检测失败: {e}")
-            
-            # 计算响应时间
-            response_time = (time.time() - start_time) * 1000  # 转换为毫秒
+                triggered_layers.append(7)
+        
+        # VPN检测
+        vpn_detected = False
+        vpn_type = "None"
+        vpn_confidence = 0.0
+        
+        vpn_result = outputs.get('vpn')
+        if vpn_result is not None:
+            vpn_detected = vpn_result.is_vpn
+            vpn_type = vpn_result.vpn_type
+            vpn_confidence = vpn_result.confidence
             
-            # 构建结果
-            result = DetectionResult(
-                user_id=user_id,
-                risk_score=risk_score,
-                risk_level=risk_level,
-                fraud_probability=fraud_prob,
-                detected_patterns=detected_patterns,
-                defense_layers_triggered=triggered_layers,
-                timestamp=time.time(),
-                response_time_ms=response_time,
-                vpn_detected=vpn_detected,
-                vpn_type=vpn_type,
-                vpn_confidence=vpn_confidence
-            )
+            if vpn_detected:
+                detected_patterns.append(f"VPN检测: {vpn_type}")
+                with self._stats_lock:
+                    self.stats['vpn_detected'] += 1
+                # VPN使用提高风险评分
+                risk_score = min(100, risk_score * 1.2)
+        
+        # 设备指纹检测
+        device_result = outputs.get('device')
+        if device_result is not None:
+            device_risk = device_result.risk_score
             
-            # 更新统计
-            self._update_stats(result)
+            # 添加设备风险因素到检测模式
+            if device_result.risk_factors:
+                detected_patterns.extend(device_result.risk_factors)
             
-            # 发送到Kafka进行异步处理
-            self._send_to_kafka(result)
+            # 刷机/Root设备直接列入高风险
+            if device_result.is_rooted or device_result.is_suspicious:
+                detected_patterns.append("🔴 高风险设备")
+                risk_score = min(100, risk_score * 1.5)
+                triggered_layers.append(8)  # 标记为设备层检测
             
-            # 存储结果
-            self._store_result(result)
+            # 模拟器设备提高风险
+            if device_result.is_emulator:
+                risk_score = min(100, risk_score * 1.3)
             
-            logger.info(f"检测完成: {user_id}, 风险等级: {risk_level.name}, "
-                       f"响应时间: {response_time:.2f}ms")
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"检测过程出错: {str(e)}", exc_info=True)
-            raise
+            # 设备风险分数直接影响总风险
+            risk_score = min(100, risk_score + device_risk * 30)
+        
+        # 计算响应时间
+        response_time = (time.time() - start_time) * 1000  # 转换为毫秒
+        
+        # 构建结果
+        result = DetectionResult(
+            user_id=user_id,
+            risk_score=risk_score,
+            risk_level=risk_level,
+            fraud_probability=fraud_prob,
+            detected_patterns=detected_patterns,
+            defense_layers_triggered=triggered_layers,
+            timestamp=time.time(),
+            response_time_ms=response_time,
+            vpn_detected=vpn_detected,
+            vpn_type=vpn_type,
+            vpn_confidence=vpn_confidence,
+            degraded_stages=list(budget.degraded) if budget is not None else [],
+            stage_timings_ms=run.timings_ms,
+            fast_lane=bool(outputs.get('fast_lane'))
+        )
+        
+        # 更新统计
+        self._update_stats(result)
+        
+        logger.info(f"检测完成: {user_id}, 风险等级: {risk_level.name}, "
+                   f"响应时间: {response_time:.2f}ms")
+        
+        return result
+    
+    def _reject_early(self, transaction: Dict, run, start_time: float,
+                      budget=None) -> DetectionResult:
+        """决定性规则命中：跳过GNN、VPN等阶段与第5-7层防御，直接返回拒绝结果"""
+        decision = run.short_circuit
+        user_id = transaction['user_id']
+        result = DetectionResult(
+            user_id=user_id,
+            risk_score=100.0,
+            risk_level=RiskLevel.CRITICAL,
+            fraud_probability=1.0,
+            detected_patterns=[decision.message],
+            defense_layers_triggered=[decision.layer],
+            timestamp=time.time(),
+            response_time_ms=(time.time() - start_time) * 1000,
+            degraded_stages=list(budget.degraded) if budget is not None else [],
+            stage_timings_ms=run.timings_ms,
+            early_exit=decision.reason,
+            fast_lane=bool(run.outputs.get('fast_lane'))
+        )
+        self._update_stats(result)
+        logger.info(f"提前拒绝: {user_id}, 规则: {decision.reason}, "
+                    f"响应时间: {result.response_time_ms:.2f}ms")
+        return result
     
     def _predict_with_gnn(self, transaction: Dict) -> float:
-        """使用GNN模型进行预测"""
+        """使用GNN模型进行预测（关系图子图推理见 _predict_from_graph）"""
         try:
+            if self.graph_store is not None:
+                return self._predict_from_graph(transaction)
+            
             # 构建图数据
             graph_data = self._build_graph(transaction)
             
             # 模型推理
             with torch.no_grad():
                 self.gnn_model.eval()
-                output = self.gnn_model(graph_data.x, graph_data.edge_index)
+                output = self.gnn_model(graph_data.x, graph_data.edge_index,
+                                        getattr(graph_data, 'edge_weight', None))
                 probs = torch.exp(output)
-                fraud_prob = probs[:, 1].mean().item()  # 欺诈类别的概率
+                # 欺诈类别的概率：关系图子图取中心用户节点，否则取全图平均
+                center = getattr(graph_data, 'center', None)
+                fraud_prob = (probs[center, 1] if center is not None else probs[:, 1].mean()).item()
             
             return fraud_prob
             
@@ -673,35 +1310,139 @@ class FraudDetectionEngine:
             logger.error(f"GNN预测失败: {str(e)}")
             return 0.5  # 返回默认值
     
+    def _predict_from_graph(self, transaction: Dict) -> float:
+        """
+        关系图子图推理：嵌入缓存命中时只计算分类层，
+        否则采样子图计算中心实体的嵌入（启用批量推理时与并发请求合并为一次前向传播）并写入缓存
+        """
+        if self.embedding_cache is not None:
+            embedding = self.embedding_cache.get(*self.graph_store.center(transaction))
+            if embedding is not None:
+                return float(self.gnn_head.predict(embedding[None])[0])
+        
+        model_version = self.gnn_model_version
+        subgraph = self.graph_store.sample(transaction)
+        if self.gnn_batcher is not None:
+            embedding = self.gnn_batcher.predict(subgraph)
+        else:
+            embedding = predict_batched(self._gnn_node_embeddings, [subgraph])[0]
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(subgraph.key, subgraph.version, embedding, model_version)
+        return float(self.gnn_head.predict(embedding[None])[0])
+    
+    def _gnn_node_embeddings(self, x: np.ndarray, edge_index: np.ndarray,
+                             edge_weight: np.ndarray) -> np.ndarray:
+        """对（合并后的）子图做一次消息传递，返回每个节点的嵌入（分类层由 gnn_head 计算）"""
+        return self.gnn_runtime.embed(x, edge_index, edge_weight)
+    
+    def refresh_gnn_model(self):
+        """
+        GNN 模型权重加载或更新后调用：重新导出分类层并按权重指纹使嵌入缓存失效
+        
+        分类层由运行时提供（int8 运行时为量化后的分类层）
+        """
+        self.gnn_model_version = model_fingerprint(self.gnn_model)
+        if self.gnn_runtime.fingerprint != self.gnn_model_version:
+            # 导出件对应的是旧权重
+            logger.warning(f"GNN权重已更新，{self.gnn_runtime.backend} 运行时改为 eager 模式")
+            self.gnn_runtime = EagerRuntime(self.gnn_model)
+        self.gnn_head = self.gnn_runtime.classifier_head(self.gnn_model)
+        if self.embedding_cache is not None:
+            self.embedding_cache.set_model_version(self.gnn_model_version)
+        logger.info(f"GNN模型版本: {self.gnn_model_version}")
+    
+    def _predict_gnn_batch(self, transactions: List[Dict], budget=None) -> List[Optional[float]]:
+        """
+        批量检测：整批交易的子图合并为不相交并图推理（按 gnn_batching.max_batch_size 分块）
+        
+        返回与输入对齐的欺诈概率；提前拒绝、受信快速通道的交易为 None（由各自的阶段处理），
+        已推理的交易在此写入关系图
+        """
+        probs: List[Optional[float]] = [None] * len(transactions)
+        if self.graph_store is None or (budget is not None and not budget.allows('gnn')):
+            # 预算不足时由各笔交易的GNN阶段各自降级
+            return probs
+        indices = [
+            i for i, transaction in enumerate(transactions)
+            if not (self.early_exit is not None and self.early_exit.check(transaction))
+            and not (self.reputation is not None and self.reputation.peek(transaction))
+        ]
+        if not indices:
+            return probs
+        
+        for i in indices:
+            self.record_transaction(transactions[i])
+        try:
+            embeddings: Dict[int, np.ndarray] = {}
+            if self.embedding_cache is not None:
+                for i in indices:
+                    embedding = self.embedding_cache.get(*self.graph_store.center(transactions[i]))
+                    if embedding is not None:
+                        embeddings[i] = embedding
+            misses = [i for i in indices if i not in embeddings]
+            if misses:
+                model_version = self.gnn_model_version
+                subgraphs = [self.graph_store.sample(transactions[i]) for i in misses]
+                computed = predict_batched(self._gnn_node_embeddings, subgraphs, self.gnn_batch_size)
+                for i, subgraph, embedding in zip(misses, subgraphs, computed):
+                    embeddings[i] = embedding
+                    if self.embedding_cache is not None:
+                        self.embedding_cache.put(subgraph.key, subgraph.version, embedding, model_version)
+            batch_probs = self.gnn_head.predict(np.stack([embeddings[i] for i in indices])).tolist()
+        except Exception as e:
+            logger.error(f"GNN批量预测失败: {str(e)}")
+            batch_probs = [0.5] * len(indices)  # 与单笔预测失败时的默认值一致
+        for i, prob in zip(indices, batch_probs):
+            probs[i] = prob
+        return probs
+    
     def _build_graph(self, transaction: Dict) -> Data:
         """
         根据交易构建图数据
-        包括用户-商品、用户-用户、商品-商品关系
+        从交易关系图采样以用户为中心的k跳邻域（用户-商品、用户-设备、用户-IP、设备-IP关系）
         """
-        # 简化实现 - 实际应该从数据库获取完整的关系图
+        if self.graph_store is not None:
+            subgraph = self.graph_store.sample(transaction)
+            data = Data(x=torch.from_numpy(subgraph.x),
+                        edge_index=torch.from_numpy(subgraph.edge_index),
+                        edge_weight=torch.from_numpy(subgraph.edge_weight))
+            data.center = subgraph.center
+            return data
+        
+        # 未启用关系图时的简化实现
         num_nodes = 10
         features = torch.randn(num_nodes, 32)  # 节点特征
         edge_index = torch.tensor([[0, 1, 2], [1, 2, 0]], dtype=torch.long)
         
         return Data(x=features, edge_index=edge_index)
     
+    def _fallback_fraud_probability(self, transaction: Dict) -> float:
+        """GNN降级时的先验欺诈概率（按金额阈值）"""
+        amount_cfg = self.config.get('rules', {}).get('amount_threshold', {})
+        amount = transaction.get('amount') or 0.0
+        if amount >= amount_cfg.get('critical', 10000.0):
+            return 0.8
+        if amount >= amount_cfg.get('suspicious', 1000.0):
+            return 0.5
+        return 0.2
+    
     def _calculate_risk_score(self, fraud_prob: float, patterns: List[str]) -> float:
-        """计算综合风险评分"""
-        base_score = fraud_prob
+        """计算综合风险评分（0-100，与精简版引擎同一量纲）"""
+        base_score = fraud_prob * 100
         
         # 根据检测到的模式调整评分
-        pattern_penalty = len(patterns) * 0.1
+        pattern_penalty = len(patterns) * 10
         
-        final_score = min(base_score + pattern_penalty, 1.0)
+        final_score = min(base_score + pattern_penalty, 100.0)
         return final_score
     
     def _determine_risk_level(self, risk_score: float) -> RiskLevel:
         """确定风险等级"""
-        if risk_score < 0.3:
+        if risk_score < 30:
             return RiskLevel.LOW
-        elif risk_score < 0.6:
+        elif risk_score < 60:
             return RiskLevel.MEDIUM
-        elif risk_score < 0.85:
+        elif risk_score < 85:
             return RiskLevel.HIGH
         else:
             return RiskLevel.CRITICAL
@@ -736,10 +1477,10 @@ class FraudDetectionEngine:
                 }
             }
         }
-
+        
         config = deepcopy(default_config)
         config_path_obj = Path(config_path)
-
+        
         if config_path_obj.exists():
             try:
                 with config_path_obj.open('r', encoding='utf-8') as f:
@@ -750,11 +1491,11 @@ class FraudDetectionEngine:
                 logger.warning("加载配置文件失败，使用默认配置: %s", exc)
         else:
             logger.warning("配置文件 %s 不存在，使用默认配置", config_path_obj)
-
+        
         redis_cfg = config.get('database', {}).get('redis', {})
         postgres_cfg = config.get('database', {}).get('postgresql', {})
         kafka_cfg = config.get('kafka', {})
-
+        
         flattened = {
             'ip_blacklist': self._load_ip_blacklist(config),
             'redis_host': redis_cfg.get('host', 'localhost'),
@@ -764,11 +1505,11 @@ class FraudDetectionEngine:
             'postgres_dsn': postgres_cfg.get('dsn') or self._build_postgres_dsn(postgres_cfg),
             'kafka_servers': kafka_cfg.get('bootstrap_servers', ['localhost:9092'])
         }
-
+        
         # 合并平铺配置供旧逻辑使用
         config.update(flattened)
         return config
-
+    
     def _merge_dicts(self, base: Dict, override: Dict) -> Dict:
         """递归合并配置字典"""
         result = deepcopy(base)
@@ -778,7 +1519,7 @@ class FraudDetectionEngine:
             else:
                 result[key] = value
         return result
-
+    
     def _build_postgres_dsn(self, cfg: Dict) -> str:
         host = cfg.get('host', 'localhost')
         port = cfg.get('port', 5432)
@@ -786,22 +1527,22 @@ class FraudDetectionEngine:
         user = cfg.get('user', 'postgres')
         password = cfg.get('password', 'postgres')
         return f"postgresql://{user}:{password}@{host}:{port}/{database}"
-
+    
     def _load_ip_blacklist(self, config: Dict) -> set:
         rules_cfg = config.get('rules', {}).get('ip_blacklist', {})
         if not rules_cfg.get('enabled', False):
             return set()
-
+        
         file_path = rules_cfg.get('file')
         if not file_path:
             logger.warning("IP 黑名单已启用但未提供文件路径")
             return set()
-
+        
         path = Path(file_path)
         if not path.exists():
             logger.warning("IP 黑名单文件不存在: %s", file_path)
             return set()
-
+        
         ip_set = set()
         try:
             with path.open('r', encoding='utf-8') as f:
@@ -812,19 +1553,34 @@ class FraudDetectionEngine:
         except Exception as exc:
             logger.warning("读取 IP 黑名单失败: %s", exc)
             return set()
-
+        
         logger.info("已加载 %d 条 IP 黑名单记录", len(ip_set))
         return ip_set
     
     def _load_gnn_model(self) -> nn.Module:
-        """加载GNN模型"""
-        model = GraphNeuralNetworkDetector(input_dim=32, hidden_dim=64)
-        # 实际应该加载预训练权重
+        """加载GNN模型（detection.model.gnn_model 权重文件不存在时使用随机初始化的权重）"""
+        model_cfg = self.config.get('detection', {}).get('model', {})
+        model = GraphNeuralNetworkDetector(input_dim=GNN_INPUT_DIM,
+                                           hidden_dim=model_cfg.get('hidden_dim', 64),
+                                           output_dim=model_cfg.get('output_dim', 2))
+        weights_path = model_cfg.get('gnn_model', 'models/gnn_detector.pt')
+        if not MODEL_RUNTIME_AVAILABLE:
+            logger.warning(f"模型运行时扩展不可用，未加载GNN权重: {weights_path}，使用随机初始化的权重")
+            model.eval()
+            return model
+        try:
+            if not load_weights(model, weights_path):
+                logger.warning(f"GNN权重文件不存在: {weights_path}，使用随机初始化的权重")
+        except Exception as e:
+            logger.error(f"GNN权重加载失败: {weights_path}, {e}")
+        model.eval()
         return model
     
     def _init_redis(self):
-        """初始化Redis连接"""
+        """初始化Redis连接（共享连接池，大小为 database.redis.max_connections）"""
         try:
+            if REDIS_POOL_AVAILABLE:
+                return create_redis_client(self.config)
             return redis.Redis(
                 host=self.config['redis_host'],
                 port=self.config['redis_port'],
@@ -834,6 +1590,54 @@ class FraudDetectionEngine:
             logger.warning(f"Redis连接失败: {str(e)}")
             return None
     
+    def _init_async_redis(self):
+        """初始化异步Redis连接"""
+        if REDIS_POOL_AVAILABLE:
+            settings = redis_settings(self.config)
+            return redis.asyncio.Redis(
+                host=settings['host'],
+                port=settings['port'],
+                db=settings['db'],
+                password=settings['password'],
+                max_connections=settings['max_connections'],
+                decode_responses=True
+            )
+        return redis.asyncio.Redis(
+            host=self.config['redis_host'],
+            port=self.config['redis_port'],
+            decode_responses=True
+        )
+    
+    def _init_redis_writer(self, perf_cfg: Dict):
+        """初始化Redis写入合并（performance.redis_pipeline）"""
+        pipeline_cfg = perf_cfg.get('redis_pipeline', {})
+        if not REDIS_POOL_AVAILABLE or self.redis_client is None or not pipeline_cfg.get('enabled', True):
+            return None
+        return RedisWriteCoalescer(
+            self.redis_client,
+            max_batch=pipeline_cfg.get('max_batch', 1000),
+            max_pending=pipeline_cfg.get('max_pending', 100000),
+            breaker=self.breakers.get('redis')
+        )
+    
+    def _init_breakers(self) -> Dict:
+        """按 performance.circuit_breaker 配置各依赖的熔断器（禁用时为空）"""
+        configure_breakers(self.config.get('performance', {}).get('circuit_breaker', {}))
+        breakers = {name: get_breaker(name) for name in ('redis', 'postgres', 'kafka')}
+        return {name: breaker for name, breaker in breakers.items() if breaker is not None}
+    
+    def _backend_up(self, name: str) -> bool:
+        """依赖的熔断器未打开"""
+        breaker = self.breakers.get(name)
+        return breaker is None or breaker.state != 'open'
+    
+    def _call_backend(self, name: str, fn, *args):
+        """经熔断器调用依赖；熔断器打开时抛出 CircuitBreakerOpen"""
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            return fn(*args)
+        return breaker.call(fn, *args)
+    
     def _init_postgres(self):
         """初始化PostgreSQL连接"""
         try:
@@ -842,45 +1646,169 @@ class FraudDetectionEngine:
             logger.warning(f"PostgreSQL连接失败: {str(e)}")
             return None
     
+    def _init_result_sink(self, perf_cfg: Dict):
+        """初始化检测结果写后缓冲（performance.result_sink）"""
+        sink_cfg = perf_cfg.get('result_sink', {})
+        if not RESULT_SINK_AVAILABLE or not sink_cfg.get('enabled', False):
+            return None
+        try:
+            sink = WriteBehindSink.for_postgres(self.config['postgres_dsn'], sink_cfg,
+                                                breaker=self.breakers.get('postgres'))
+            logger.info(f"检测结果写后缓冲已启用: method={sink_cfg.get('method', 'copy')}, "
+                        f"batch_size={sink.batch_size}, overflow={sink.overflow}")
+            return sink
+        except Exception as e:
+            logger.warning(f"写后缓冲初始化失败，使用逐批同步写入: {e}")
+            return None
+    
     def _init_kafka_producer(self):
         """初始化Kafka生产者"""
         try:
             return KafkaProducer(
                 bootstrap_servers=self.config['kafka_servers'],
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
+                value_serializer=self._serialize
             )
         except Exception as e:
             logger.warning(f"Kafka连接失败: {str(e)}")
             return None
     
+    def _init_kafka_publisher(self, perf_cfg: Dict):
+        """初始化Kafka结果发布器（performance.kafka_producer）"""
+        producer_cfg = perf_cfg.get('kafka_producer', {})
+        if not KAFKA_PUBLISHER_AVAILABLE or not producer_cfg.get('enabled', False):
+            return None
+        try:
+            return KafkaResultPublisher.from_config(
+                self.config['kafka_servers'],
+                self.config.get('kafka', {}).get('topics', {}).get(
+                    'detection_results', 'fraud_detection_results'),
+                producer_cfg,
+                breaker=self.breakers.get('kafka')
+            )
+        except Exception as e:
+            logger.warning(f"Kafka发布器初始化失败，使用默认生产者: {e}")
+            return None
+    
+    def _serialize(self, value) -> bytes:
+        """Redis/Kafka 消息序列化"""
+        if self.codec is not None:
+            return self.codec.dumps(value)
+        return json.dumps(value).encode('utf-8')
+    
     def _send_to_kafka(self, result: DetectionResult):
         """发送结果到Kafka"""
+        if self.kafka_publisher is not None:
+            self.kafka_publisher.publish(result.user_id, result.to_dict())
+            return
         if self.kafka_producer:
             try:
-                self.kafka_producer.send('fraud_detection_results', result.to_dict())
+                self._call_backend('kafka', self.kafka_producer.send,
+                                   'fraud_detection_results', result.to_dict())
+            except CircuitBreakerOpen:
+                pass
             except Exception as e:
                 logger.error(f"发送Kafka消息失败: {str(e)}")
     
+    async def _send_to_kafka_async(self, result: DetectionResult):
+        """发送结果到Kafka（发布器只需入队，不占用I/O线程）"""
+        if self.kafka_publisher is not None:
+            self._send_to_kafka(result)
+            return
+        await self._offload(self.io_executor, self._send_to_kafka, result)
+    
     def _store_result(self, result: DetectionResult):
         """存储检测结果"""
+        self._store_results([result])
+    
+    def _store_results(self, results: List[DetectionResult]):
+        """批量存储检测结果（Redis管道 + PostgreSQL单次提交）"""
+        if not results:
+            return
+        
         # 存储到Redis（快速查询）
-        if self.redis_client:
-            try:
-                key = f"fraud:result:{result.user_id}:{int(result.timestamp)}"
-                self.redis_client.setex(key, 3600, json.dumps(result.to_dict()))
-            except Exception as e:
-                logger.error(f"Redis存储失败: {str(e)}")
+        self._store_redis(results)
         
         # 存储到PostgreSQL（持久化）
-        if self.pg_conn:
+        self._store_postgres(results)
+    
+    def _redis_entries(self, results: List[DetectionResult]) -> List[Tuple[str, bytes]]:
+        """生成Redis键值"""
+        return [
+            (f"fraud:result:{result.user_id}:{int(result.timestamp)}",
+             self._serialize(result.to_dict()))
+            for result in results
+        ]
+    
+    def _store_redis(self, results: List[DetectionResult]):
+        """写入Redis"""
+        if not self.redis_client:
+            return
+        if self.redis_writer is not None:
+            self.redis_writer.submit([
+                ('setex', key, 3600, value) for key, value in self._redis_entries(results)
+            ])
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in self._redis_entries(results):
+                pipe.setex(key, 3600, value)
+            self._call_backend('redis', pipe.execute)
+        except CircuitBreakerOpen:
+            pass
+        except Exception as e:
+            logger.error(f"Redis存储失败: {str(e)}")
+    
+    async def _store_redis_async(self, results: List[DetectionResult]):
+        """使用异步客户端写入Redis（启用写入合并时只需入队）"""
+        if not self.redis_client:
+            return
+        if self.redis_writer is not None:
+            self._store_redis(results)
+            return
+        breaker = self.breakers.get('redis')
+        if breaker is not None and not breaker.allow():
+            return
+        try:
+            if self.async_redis_client is None:
+                self.async_redis_client = self._init_async_redis()
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            for key, value in self._redis_entries(results):
+                pipe.setex(key, 3600, value)
+            await pipe.execute()
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure(e)
+            logger.error(f"Redis存储失败: {str(e)}")
+            return
+        if breaker is not None:
+            breaker.record_success()
+    
+    async def _store_postgres_async(self, results: List[DetectionResult]):
+        """写入PostgreSQL（写后缓冲只需入队，不占用I/O线程）"""
+        if self.result_sink is not None:
+            self._store_postgres(results)
+            return
+        await self._offload(self.io_executor, self._store_postgres, results)
+    
+    def _store_postgres(self, results: List[DetectionResult]):
+        """写入PostgreSQL"""
+        if self.result_sink is not None:
+            self.result_sink.submit([result_row(result) for result in results])
+            return
+        if not self.pg_conn or not results:
+            return
+        breaker = self.breakers.get('postgres')
+        if breaker is not None and not breaker.allow():
+            return
+        with self._pg_lock:
             try:
                 cursor = self.pg_conn.cursor()
-                cursor.execute("""
+                cursor.executemany("""
                     INSERT INTO fraud_detection_results 
                     (user_id, risk_score, risk_level, fraud_probability, 
                      detected_patterns, defense_layers, timestamp)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
+                """, [(
                     result.user_id,
                     result.risk_score,
                     result.risk_level.name,
@@ -888,31 +1816,90 @@ class FraudDetectionEngine:
                     json.dumps(result.detected_patterns),
                     json.dumps(result.defense_layers_triggered),
                     result.timestamp
-                ))
+                ) for result in results])
                 self.pg_conn.commit()
             except Exception as e:
+                if breaker is not None:
+                    breaker.record_failure(e)
                 logger.error(f"PostgreSQL存储失败: {str(e)}")
-                self.pg_conn.rollback()
+                try:
+                    self.pg_conn.rollback()
+                except Exception:
+                    pass
+                return
+        if breaker is not None:
+            breaker.record_success()
     
     def _update_stats(self, result: DetectionResult):
         """更新统计信息"""
-        self.stats['total_requests'] += 1
+        with self._stats_lock:
+            self.stats['total_requests'] += 1
+            
+            if result.risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
+                self.stats['fraud_detected'] += 1
+            
+            if result.degraded_stages:
+                self.stats['degraded_requests'] += 1
+            
+            if result.early_exit:
+                self.stats['early_exits'] += 1
+            
+            # 更新平均响应时间
+            n = self.stats['total_requests']
+            avg = self.stats['avg_response_time']
+            self.stats['avg_response_time'] = (avg * (n - 1) + result.response_time_ms) / n
         
-        if result.risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
-            self.stats['fraud_detected'] += 1
+        if not result.early_exit and self.reputation is not None:
+            self.reputation.record_latency(result.fast_lane, result.response_time_ms)
         
-        # 更新平均响应时间
-        n = self.stats['total_requests']
-        avg = self.stats['avg_response_time']
-        self.stats['avg_response_time'] = (avg * (n - 1) + result.response_time_ms) / n
+        if self.metrics is not None:
+            self.metrics.observe_result(result)
     
     def get_stats(self) -> Dict:
         """获取统计信息"""
-        return {
-            **self.stats,
-            'fraud_rate': self.stats['fraud_detected'] / max(self.stats['total_requests'], 1),
-            'detection_rate': 1.0 if self.stats['fraud_detected'] > 0 else 0.0
+        with self._stats_lock:
+            counters = dict(self.stats)
+        stats = {
+            **counters,
+            'fraud_rate': counters['fraud_detected'] / max(counters['total_requests'], 1),
+            'detection_rate': 1.0 if counters['fraud_detected'] > 0 else 0.0,
+            'stage_cost_ms': self.stage_costs.snapshot() if self.stage_costs else {}
         }
+        if self.result_sink is not None:
+            stats['result_sink'] = self.result_sink.get_stats()
+        if self.redis_writer is not None:
+            stats['redis_pipeline'] = self.redis_writer.get_stats()
+        if self.kafka_publisher is not None:
+            stats['kafka_publisher'] = self.kafka_publisher.get_stats()
+        if self.reputation is not None:
+            stats['reputation'] = self.reputation.get_stats()
+        if self.gnn_runtime is not None:
+            stats['gnn_runtime'] = self.gnn_runtime.describe()
+        if self.graph_store is not None:
+            stats['graph_store'] = self.graph_store.get_stats()
+        if self.gnn_batcher is not None:
+            stats['gnn_batching'] = self.gnn_batcher.get_stats()
+        if self.embedding_cache is not None:
+            stats['embedding_cache'] = {**self.embedding_cache.get_stats(),
+                                        'refresher': self.embedding_refresher.get_stats()}
+        if self.breakers:
+            stats['circuit_breakers'] = {name: breaker.get_stats()
+                                         for name, breaker in self.breakers.items()}
+        return stats
+    
+    def close(self):
+        """关闭引擎：写完缓冲中的检测结果"""
+        if self.kafka_publisher is not None:
+            self.kafka_publisher.close()
+        if self.redis_writer is not None:
+            self.redis_writer.close()
+        if self.result_sink is not None:
+            self.result_sink.close()
+        if self.gnn_batcher is not None:
+            self.gnn_batcher.close()
+        if self.embedding_refresher is not None:
+            self.embedding_refresher.close()
+        self.stage_graph.close()
 
 
 def main():
@@ -954,7 +1941,7 @@ def main():
         result = engine.detect(transaction)
         
         print(f"用户ID: {result.user_id}")
-        print(f"风险评分: {result.risk_score:.3f}")
+        print(f"风险评分: {result.risk_score:.2f}")
         print(f"风险等级: {result.risk_level.name}")
         print(f"欺诈概率: {result.fraud_probability:.3f}")
         print(f"检测模式: {', '.join(result.detected_patterns) if result.detected_patterns else '无'}")
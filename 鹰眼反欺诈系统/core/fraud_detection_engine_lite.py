@@ -9,16 +9,42 @@ import numpy as np
 import json
 import time
 import os
+import asyncio
+import threading
 from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 import logging
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
+from contextlib import nullcontext
 
 import yaml
 
+from core.extensions.early_exit import EarlyExitPolicy
+from core.extensions.reputation import ReputationCache
+from core.extensions.stage_graph import Stage, StageGraph
+
+try:
+    from core.extensions.latency_budget import LatencyBudget, StageCostModel
+    LATENCY_BUDGET_AVAILABLE = True
+except ImportError:
+    LATENCY_BUDGET_AVAILABLE = False
+
+try:
+    from core.extensions.metrics import get_metrics, StageTimer
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+try:
+    from core.extensions.circuit_breaker import configure_breakers
+    from core.extensions.shared_state import create_state_store
+    SHARED_STATE_AVAILABLE = True
+except ImportError:
+    SHARED_STATE_AVAILABLE = False
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -49,6 +75,12 @@ class DetectionResult:
     vpn_detected: bool = False
     vpn_type: str = "None"
     vpn_confidence: float = 0.0
+    degraded_stages: List[str] = field(default_factory=list)
+    stage_timings_ms: Dict[str, float] = field(default_factory=dict)
+    early_exit: Optional[str] = None
+    decision_tier: Optional[str] = None
+    fast_lane: bool = False
+    engine_mode: Optional[str] = None
     
     def to_dict(self) -> Dict:
         return {
@@ -62,18 +94,29 @@ class DetectionResult:
             'response_time_ms': self.response_time_ms,
             'vpn_detected': self.vpn_detected,
             'vpn_type': self.vpn_type,
-            'vpn_confidence': self.vpn_confidence
+            'vpn_confidence': self.vpn_confidence,
+            'degraded_stages': self.degraded_stages,
+            'stage_timings_ms': self.stage_timings_ms,
+            'early_exit': self.early_exit,
+            'decision_tier': self.decision_tier,
+            'fast_lane': self.fast_lane,
+            'engine_mode': self.engine_mode
         }
 
 
 class SimplifiedDefenseSystem:
     """简化防御系统 - 基于规则引擎"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, state_store=None):
         self.config = config
+        self.state_store = state_store
         self.user_history = defaultdict(list)
         self.ip_blacklist = config.get('ip_blacklist', set())
         
+        window_cfg = config.get('rules', {}).get('time_window', {})
+        self.frequency_window = window_cfg.get('high_frequency_seconds', 60)
+        self.max_operations = window_cfg.get('max_operations', 100)
+        
     def layer1_data_purification(self, data: Dict) -> Tuple[bool, str]:
         """第1层：数据清洗"""
         ip = data.get('ip', '')
@@ -93,18 +136,21 @@ class SimplifiedDefenseSystem:
     def layer4_realtime_monitoring(self, user_id: str, action: str) -> Tuple[bool, List[str]]:
         """第4层：实时监控"""
         alerts = []
+        now = time.time()
         
-        # 记录用户行为
-        self.user_history[user_id].append({
-            'action': action,
-            'timestamp': time.time()
-        })
+        # 记录用户行为并统计窗口内的操作次数
+        if self.state_store is not None:
+            recent_count = self.state_store.record_action(user_id, action, now, self.frequency_window)
+        else:
+            self.user_history[user_id].append({
+                'action': action,
+                'timestamp': now
+            })
+            recent_count = len([h for h in self.user_history[user_id] 
+                                if now - h['timestamp'] < self.frequency_window])
         
         # 检查频率异常
-        recent_actions = [h for h in self.user_history[user_id] 
-                         if time.time() - h['timestamp'] < 60]
-        
-        if len(recent_actions) > 100:
+        if recent_count > self.max_operations:
             alerts.append("高频操作异常")
         
         return len(alerts) == 0, alerts
@@ -131,8 +177,15 @@ class FraudDetectionEngine:
     def __init__(self, config_path: str = 'config/config.yaml'):
         self.config = self._load_config(config_path)
         
+        # 检测状态存储（多 worker 部署时使用 Redis 共享；Redis 故障时经熔断器跳过）
+        if SHARED_STATE_AVAILABLE:
+            configure_breakers(self.config.get('performance', {}).get('circuit_breaker', {}))
+            self.state_store = create_state_store(self.config)
+        else:
+            self.state_store = None
+        
         # 初始化防御系统
-        self.defense_system = SimplifiedDefenseSystem(self.config)
+        self.defense_system = SimplifiedDefenseSystem(self.config, self.state_store)
         
         # 初始化VPN检测器
         try:
@@ -146,145 +199,438 @@ class FraudDetectionEngine:
         # 初始化设备指纹检测器
         try:
             from core.extensions.device_fingerprint import DeviceFingerprintDetector
-            self.device_detector = DeviceFingerprintDetector()
+            self.device_detector = DeviceFingerprintDetector(self.state_store)
             logger.info("设备指纹检测器初始化成功")
         except Exception as e:
             logger.warning(f"设备指纹检测器初始化失败: {e}")
             self.device_detector = None
         
-        # 统计信息
+        # 异步检测线程池
+        try:
+            from core.extensions.async_executor import BoundedExecutor
+            self.cpu_executor = BoundedExecutor(
+                self.config.get('performance', {}).get('workers', 16),
+                name='detect-cpu'
+            )
+        except Exception as e:
+            logger.warning(f"异步线程池初始化失败，使用默认线程池: {e}")
+            self.cpu_executor = None
+        
+        # 延迟预算：默认 performance.timeout_ms，超时后可选阶段降级
+        perf_cfg = self.config.get('performance', {})
+        self.timeout_ms = perf_cfg.get('timeout_ms', 0)
+        if LATENCY_BUDGET_AVAILABLE and perf_cfg.get('latency_budget', {}).get('enabled', True):
+            self.stage_costs = StageCostModel()
+        else:
+            self.stage_costs = None
+        
+        # 监控指标（/metrics）
+        if METRICS_AVAILABLE and perf_cfg.get('metrics', {}).get('enabled', True):
+            self.metrics = get_metrics()
+            # 级联/故障切换模式下与完整版引擎共用该指标，按 engine 标签区分
+            self.metrics.gauge(
+                'fraud_executor_in_flight', '检测线程池在途任务数',
+                lambda: {('lite', self.cpu_executor.name): self.cpu_executor.get_stats()['in_flight']}
+                if self.cpu_executor is not None else {},
+                ('engine', 'executor'),
+                source='lite'
+            )
+        else:
+            self.metrics = None
+        
+        # 决定性规则（IP/设备黑名单）命中时跳过其余阶段，直接拒绝
+        self.early_exit = EarlyExitPolicy.from_config(
+            perf_cfg.get('early_exit', {}),
+            ip_blacklists=[self.defense_system.ip_blacklist,
+                           self.device_detector.blacklisted_ips if self.device_detector else None],
+            device_blacklists=[self.device_detector.blacklisted_devices if self.device_detector else None]
+        )
+        
+        # 受信实体快速通道：长期低风险的 用户/设备/IP 组合只做规则检查，跳过VPN、设备指纹
+        self.reputation = ReputationCache.from_config(perf_cfg.get('reputation', {}))
+        
+        # 检测阶段依赖图：互不依赖的阶段按预计耗时并发执行，结果中记录各阶段耗时
+        self.stage_graph = self._init_stage_graph(perf_cfg)
+        self.fast_lane_graph = self._init_fast_lane_graph() if self.reputation is not None else None
+        
+        # 统计信息（detect 在多线程中执行，更新与读取都持有 _stats_lock）
+        self._stats_lock = threading.Lock()
         self.stats = {
             'total_requests': 0,
             'fraud_detected': 0,
             'avg_response_time': 0.0,
-            'vpn_detected': 0
+            'vpn_detected': 0,
+            'degraded_requests': 0,
+            'early_exits': 0
         }
         
         logger.info("✅ 简化版欺诈检测引擎初始化完成")
     
-    def detect(self, transaction: Dict) -> DetectionResult:
-        """主检测方法"""
+    def detect(self, transaction: Dict, deadline: Optional[float] = None) -> DetectionResult:
+        """
+        主检测方法
+        
+        Args:
+            transaction: 交易数据
+            deadline: 截止时间（time.time() 时间戳），默认为当前时间 + performance.timeout_ms
+        """
+        # 第4层操作计数与设备状态的 Redis 读写合并为一次往返
+        with self._prefetch_state([transaction]):
+            return self._detect(transaction, deadline)
+    
+    def _detect(self, transaction: Dict, deadline: Optional[float] = None) -> DetectionResult:
+        """单笔检测（共享状态已由调用方预取）"""
+        return self._detect_staged(transaction, deadline)[0]
+    
+    def _detect_staged(self, transaction: Dict, deadline: Optional[float] = None,
+                       record: bool = True) -> Tuple[DetectionResult, Optional[Dict]]:
+        """
+        单笔检测并返回各阶段输出（检测异常时为 None）
+        
+        record 为 False 时不更新统计与监控指标，由调用方确定最终结果后调用 record_result
+        """
         start_time = time.time()
         user_id = transaction.get('user_id', 'unknown')
-        triggered_layers = []
-        detected_patterns = []
+        budget = self._new_budget(start_time, deadline)
         
         try:
-            # 第1层：数据清洗
-            passed, msg = self.defense_system.layer1_data_purification(transaction)
-            if not passed:
-                detected_patterns.append(msg)
-                triggered_layers.append(1)
+            fast_lane = self.reputation is not None and self.reputation.is_trusted(transaction)
+            graph = self.fast_lane_graph if fast_lane else self.stage_graph
+            run = graph.run({'transaction': transaction, 'budget': budget, 'fast_lane': fast_lane})
+            outputs = {name: value for name, value in run.outputs.items()
+                       if name not in ('transaction', 'budget', 'fast_lane')}
+            result = self._fuse(transaction, run, start_time, budget, record)
+            if record:
+                self.update_reputation(transaction, result)
+            return result, outputs
             
-            # 第4层：实时监控
-            passed, alerts = self.defense_system.layer4_realtime_monitoring(
-                user_id, 
+        except Exception as e:
+            logger.error(f"检测失败: {e}", exc_info=True)
+            return DetectionResult(
+                user_id=user_id,
+                risk_score=50.0,
+                risk_level=RiskLevel.MEDIUM,
+                fraud_probability=0.5,
+                detected_patterns=[f"检测异常: {str(e)}"],
+                defense_layers_triggered=[],
+                timestamp=time.time(),
+                response_time_ms=(time.time() - start_time) * 1000
+            ), None
+    
+    def _init_stage_graph(self, perf_cfg: Dict) -> StageGraph:
+        """
+        构建检测阶段依赖图（performance.stage_graph）
+        
+        第1/4层、VPN、设备指纹互不依赖；第4层与设备指纹读取线程内预取的共享状态，
+        固定在调用线程执行。启用提前结束时各阶段都在决定性规则检查（screen）之后执行
+        """
+        stages, deps = self._screen_stages()
+        return StageGraph.from_config(
+            stages + [
+                Stage('layer1', self._stage_layer1, deps),
+                Stage('layer4', self._stage_layer4, deps, inline=True),
+                Stage('vpn', self._stage_vpn, deps),
+                Stage('device', self._stage_device, deps, inline=True)
+            ],
+            perf_cfg.get('stage_graph', {}),
+            self.stage_costs,
+            request_workers=perf_cfg.get('workers', 16)
+        )
+    
+    def _init_fast_lane_graph(self) -> StageGraph:
+        """受信实体快速通道：只做决定性规则与第1/4层检查（均为轻量阶段，在调用线程执行）"""
+        stages, deps = self._screen_stages()
+        return StageGraph(
+            stages + [
+                Stage('layer1', self._stage_layer1, deps),
+                Stage('layer4', self._stage_layer4, deps, inline=True)
+            ],
+            cost_model=self.stage_costs
+        )
+    
+    def _screen_stages(self) -> Tuple[List[Stage], Tuple[str, ...]]:
+        """决定性规则检查阶段及其余阶段对它的依赖（未启用提前结束时为空）"""
+        if self.early_exit is None:
+            return [], ()
+        return [Stage('screen', self._stage_screen, inline=True)], ('screen',)
+    
+    # ---------- 检测阶段（互不依赖，可并发执行） ----------
+    
+    def _stage_screen(self, inputs: Dict):
+        """决定性规则检查（命中时返回 EarlyExit，其余阶段不再执行）"""
+        return self.early_exit.check(inputs['transaction'])
+    
+    def _stage_layer1(self, inputs: Dict) -> Tuple[bool, str]:
+        """第1层：数据清洗"""
+        with self._measure(inputs['budget'], 'layer1'):
+            return self.defense_system.layer1_data_purification(inputs['transaction'])
+    
+    def _stage_layer4(self, inputs: Dict) -> Tuple[bool, List[str]]:
+        """第4层：实时监控"""
+        transaction = inputs['transaction']
+        with self._measure(inputs['budget'], 'layer4'):
+            return self.defense_system.layer4_realtime_monitoring(
+                transaction.get('user_id', 'unknown'),
                 transaction.get('action', 'purchase')
             )
-            if not passed:
-                detected_patterns.extend(alerts)
-                triggered_layers.append(4)
-            
-            # 简化的风险评分（基于规则）
-            risk_score = self._calculate_simple_risk_score(transaction, detected_patterns)
-            fraud_prob = risk_score / 100.0
-            
-            # 确定风险等级
-            risk_level = self._determine_risk_level(risk_score)
-            
-            # 高风险应用防御
-            if risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
+    
+    def _stage_vpn(self, inputs: Dict):
+        """VPN检测（未启用、预算不足或失败时返回 None）"""
+        budget = inputs['budget']
+        if not self.vpn_detector or not self._stage_allowed(budget, 'vpn'):
+            return None
+        try:
+            with self._measure(budget, 'vpn'):
+                return self.vpn_detector.detect(inputs['transaction'])
+        except Exception as e:
+            logger.warning(f"VPN检测失败: {e}")
+            return None
+    
+    def _stage_device(self, inputs: Dict):
+        """设备指纹检测（预算不足时只做无需历史比对的快速检查；失败时返回 None）"""
+        if not self.device_detector:
+            return None
+        budget = inputs['budget']
+        try:
+            if self._stage_allowed(budget, 'device'):
+                with self._measure(budget, 'device'):
+                    return self.device_detector.detect(inputs['transaction'])
+            return self.device_detector.detect_quick(inputs['transaction'])
+        except Exception as e:
+            logger.warning(f"设备指纹检测失败: {e}")
+            return None
+    
+    def _fuse(self, transaction: Dict, run, start_time: float, budget=None,
+              record: bool = True) -> DetectionResult:
+        """融合各阶段输出：风险评分、风险等级与第5-7层防御"""
+        run.raise_first_error()
+        if run.short_circuit is not None:
+            return self._reject_early(transaction, run, start_time, budget, record)
+        outputs = run.outputs
+        user_id = transaction.get('user_id', 'unknown')
+        triggered_layers = []
+        detected_patterns = []
+        
+        # 第1层：数据清洗
+        passed, msg = outputs['layer1']
+        if not passed:
+            detected_patterns.append(msg)
+            triggered_layers.append(1)
+        
+        # 第4层：实时监控
+        passed, alerts = outputs['layer4']
+        if not passed:
+            detected_patterns.extend(alerts)
+            triggered_layers.append(4)
+        
+        # 简化的风险评分（基于规则）
+        risk_score = self._calculate_simple_risk_score(transaction, detected_patterns)
+        fraud_prob = risk_score / 100.0
+        
+        # 确定风险等级
+        risk_level = self._determine_risk_level(risk_score)
+        
+        # 高风险应用防御
+        if risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
+            with self._measure(budget, 'layer5'):
                 self.defense_system.layer5_increase_cost(user_id)
-                triggered_layers.append(5)
-                
+            triggered_layers.append(5)
+            
+            with self._measure(budget, 'layer6'):
                 self.defense_system.layer6_decrease_profit(
                     user_id,
                     transaction.get('item_id', '')
                 )
-                triggered_layers.append(6)
-                
-                if risk_level == RiskLevel.CRITICAL:
+            triggered_layers.append(6)
+            
+            if risk_level == RiskLevel.CRITICAL:
+                with self._measure(budget, 'layer7'):
                     self.defense_system.layer7_legal_deterrence(
                         user_id,
                         detected_patterns
                     )
-                    triggered_layers.append(7)
+                triggered_layers.append(7)
+        
+        # VPN检测
+        vpn_detected = False
+        vpn_type = "None"
+        vpn_confidence = 0.0
+        
+        vpn_result = outputs.get('vpn')
+        if vpn_result is not None:
+            vpn_detected = vpn_result.is_vpn
+            vpn_type = vpn_result.vpn_type
+            vpn_confidence = vpn_result.confidence
+            
+            if vpn_detected:
+                detected_patterns.append(f"VPN检测: {vpn_type}")
+                risk_score = min(100, risk_score * 1.2)
+        
+        # 设备指纹检测
+        device_result = outputs.get('device')
+        if device_result is not None:
+            if device_result.risk_factors:
+                detected_patterns.extend(device_result.risk_factors)
             
-            # VPN检测
-            vpn_detected = False
-            vpn_type = "None"
-            vpn_confidence = 0.0
+            if device_result.is_rooted or device_result.is_suspicious:
+                detected_patterns.append("🔴 高风险设备")
+                risk_score = min(100, risk_score * 1.5)
+                triggered_layers.append(8)
             
-            if self.vpn_detector:
+            if device_result.is_emulator:
+                risk_score = min(100, risk_score * 1.3)
+            
+            risk_score = min(100, risk_score + device_result.risk_score * 30)
+        
+        # 计算响应时间
+        response_time = (time.time() - start_time) * 1000
+        
+        # 构建结果
+        result = DetectionResult(
+            user_id=user_id,
+            risk_score=risk_score,
+            risk_level=risk_level,
+            fraud_probability=fraud_prob,
+            detected_patterns=detected_patterns,
+            defense_layers_triggered=triggered_layers,
+            timestamp=time.time(),
+            response_time_ms=response_time,
+            vpn_detected=vpn_detected,
+            vpn_type=vpn_type,
+            vpn_confidence=vpn_confidence,
+            degraded_stages=list(budget.degraded) if budget is not None else [],
+            stage_timings_ms=run.timings_ms,
+            fast_lane=bool(outputs.get('fast_lane'))
+        )
+        
+        # 更新统计
+        if record:
+            self._update_stats(result)
+        
+        return result
+    
+    def _reject_early(self, transaction: Dict, run, start_time: float,
+                      budget=None, record: bool = True) -> DetectionResult:
+        """决定性规则命中：不做评分与第5-7层防御，直接返回拒绝结果"""
+        decision = run.short_circuit
+        result = DetectionResult(
+            user_id=transaction.get('user_id', 'unknown'),
+            risk_score=100.0,
+            risk_level=RiskLevel.CRITICAL,
+            fraud_probability=1.0,
+            detected_patterns=[decision.message],
+            defense_layers_triggered=[decision.layer],
+            timestamp=time.time(),
+            response_time_ms=(time.time() - start_time) * 1000,
+            degraded_stages=list(budget.degraded) if budget is not None else [],
+            stage_timings_ms=run.timings_ms,
+            early_exit=decision.reason,
+            fast_lane=bool(run.outputs.get('fast_lane'))
+        )
+        if record:
+            self._update_stats(result)
+        return result
+    
+    async def detect_async(self, transaction: Dict,
+                           deadline: Optional[float] = None) -> DetectionResult:
+        """异步检测：在有界线程池中执行，不阻塞事件循环"""
+        if deadline is None and self.timeout_ms:
+            # 排队等待线程的时间也计入预算
+            deadline = time.time() + self.timeout_ms / 1000.0
+        if self.cpu_executor is not None:
+            return await self.cpu_executor.run(self.detect, transaction, deadline)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.detect, transaction, deadline
+        )
+    
+    def detect_batch(self, transactions: List[Dict],
+                     return_exceptions: bool = True,
+                     deadline: Optional[float] = None) -> List:
+        """批量检测：按输入顺序返回结果，单笔失败不影响其他交易"""
+        results = []
+        with self._prefetch_state(transactions):
+            for transaction in transactions:
                 try:
-                    vpn_result = self.vpn_detector.detect(transaction)
-                    vpn_detected = vpn_result.is_vpn
-                    vpn_type = vpn_result.vpn_type
-                    vpn_confidence = vpn_result.confidence
-                    
-                    if vpn_detected:
-                        detected_patterns.append(f"VPN检测: {vpn_type}")
-                        self.stats['vpn_detected'] += 1
-                        risk_score = min(100, risk_score * 1.2)
+                    results.append(self._detect(transaction, deadline))
                 except Exception as e:
-                    logger.warning(f"VPN检测失败: {e}")
-            
-            # 设备指纹检测
-            if self.device_detector:
+                    if not return_exceptions:
+                        raise
+                    results.append(e)
+        return results
+    
+    def detect_staged(self, transactions: List[Dict],
+                      deadline: Optional[float] = None) -> List[Tuple]:
+        """
+        批量检测并保留各阶段输出（级联模式据此把不确定的交易交给完整版引擎）
+        
+        不更新统计与监控指标，调用方确定最终结果后调用 record_result
+        
+        Returns:
+            与输入顺序一致的 [(结果或异常, 阶段输出或 None), ...]
+        """
+        staged = []
+        with self._prefetch_state(transactions):
+            for transaction in transactions:
                 try:
-                    device_result = self.device_detector.detect(transaction)
-                    
-                    if device_result.risk_factors:
-                        detected_patterns.extend(device_result.risk_factors)
-                    
-                    if device_result.is_rooted or device_result.is_suspicious:
-                        detected_patterns.append("🔴 高风险设备")
-                        risk_score = min(100, risk_score * 1.5)
-                        triggered_layers.append(8)
-                    
-                    if device_result.is_emulator:
-                        risk_score = min(100, risk_score * 1.3)
-                    
-                    risk_score = min(100, risk_score + device_result.risk_score * 30)
-                    
+                    staged.append(self._detect_staged(transaction, deadline, record=False))
                 except Exception as e:
-                    logger.warning(f"设备指纹检测失败: {e}")
-            
-            # 计算响应时间
-            response_time = (time.time() - start_time) * 1000
-            
-            # 构建结果
-            result = DetectionResult(
-                user_id=user_id,
-                risk_score=risk_score,
-                risk_level=risk_level,
-                fraud_probability=fraud_prob,
-                detected_patterns=detected_patterns,
-                defense_layers_triggered=triggered_layers,
-                timestamp=time.time(),
-                response_time_ms=response_time,
-                vpn_detected=vpn_detected,
-                vpn_type=vpn_type,
-                vpn_confidence=vpn_confidence
-            )
-            
-            # 更新统计
-            self._update_stats(result)
-            
-            return result
-            
+                    staged.append((e, None))
+        return staged
+    
+    def record_result(self, result: DetectionResult):
+        """记录由本引擎决定的最终结果（统计与监控指标）"""
+        self._update_stats(result)
+    
+    def update_reputation(self, transaction: Dict, result):
+        """按最终结果晋升或失效受信实体组合"""
+        if self.reputation is not None:
+            self.reputation.observe(transaction, result)
+    
+    def _prefetch_state(self, transactions: List[Dict]):
+        """
+        预取共享状态：整批交易的操作计数与设备状态在一次 Redis 管道内读写
+        进程内状态存储无需预取
+        """
+        if not getattr(self.state_store, 'shared', False):
+            return nullcontext()
+        if self.early_exit is not None:
+            # 提前拒绝的交易不执行第4层与设备指纹，不预取（否则预取结果错位）
+            transactions = self.early_exit.passing(transactions)
+        # 受信实体走快速通道，不执行设备指纹检测
+        device_transactions = ([t for t in transactions if not self.reputation.peek(t)]
+                               if self.reputation is not None else transactions)
+        try:
+            now = time.time()
+            actions = [(t.get('user_id', 'unknown'), t.get('action', 'purchase'), now)
+                       for t in transactions]
+            devices = ([self.device_detector.history_entry(t) for t in device_transactions]
+                       if self.device_detector else [])
         except Exception as e:
-            logger.error(f"检测失败: {e}", exc_info=True)
-            return DetectionResult(
-                user_id=user_id,
-                risk_score=50.0,
-                risk_level=RiskLevel.MEDIUM,
-                fraud_probability=0.5,
-                detected_patterns=[f"检测异常: {str(e)}"],
-                defense_layers_triggered=[],
-                timestamp=time.time(),
-                response_time_ms=(time.time() - start_time) * 1000
-            )
+            logger.warning(f"共享状态预取失败: {e}")
+            return nullcontext()
+        return self.state_store.prefetch(actions, self.defense_system.frequency_window, devices)
+    
+    def _new_budget(self, start_time: float, deadline: Optional[float] = None):
+        """创建单次检测的延迟预算"""
+        if self.stage_costs is None:
+            return None
+        if deadline is None and self.timeout_ms:
+            deadline = start_time + self.timeout_ms / 1000.0
+        return LatencyBudget(deadline, self.stage_costs)
+    
+    def _stage_allowed(self, budget, stage: str) -> bool:
+        """剩余预算是否足够执行可选阶段，不足时记为降级"""
+        if budget is None or budget.allows(stage):
+            return True
+        budget.skip(stage)
+        return False
+    
+    def _measure(self, budget, stage: str):
+        """记录阶段耗时（监控直方图 + 延迟预算耗时估计）"""
+        if self.metrics is not None:
+            cost_model = budget.cost_model if budget is not None else None
+            return StageTimer(self.metrics.stage(stage), cost_model, stage)
+        return budget.measure(stage) if budget is not None else nullcontext()
     
     def _calculate_simple_risk_score(self, transaction: Dict, patterns: List[str]) -> float:
         """简单风险评分"""
@@ -321,30 +667,56 @@ class FraudDetectionEngine:
     
     def _update_stats(self, result: DetectionResult):
         """更新统计信息"""
-        self.stats['total_requests'] += 1
+        with self._stats_lock:
+            self.stats['total_requests'] += 1
+            
+            if result.risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
+                self.stats['fraud_detected'] += 1
+            
+            if result.degraded_stages:
+                self.stats['degraded_requests'] += 1
+            
+            if result.vpn_detected:
+                self.stats['vpn_detected'] += 1
+            
+            if result.early_exit:
+                self.stats['early_exits'] += 1
+            
+            # 更新平均响应时间
+            n = self.stats['total_requests']
+            old_avg = self.stats['avg_response_time']
+            self.stats['avg_response_time'] = (old_avg * (n - 1) + result.response_time_ms) / n
         
-        if result.risk_level in [RiskLevel.HIGH, RiskLevel.CRITICAL]:
-            self.stats['fraud_detected'] += 1
+        if not result.early_exit and self.reputation is not None:
+            self.reputation.record_latency(result.fast_lane, result.response_time_ms)
         
-        # 更新平均响应时间
-        n = self.stats['total_requests']
-        old_avg = self.stats['avg_response_time']
-        self.stats['avg_response_time'] = (old_avg * (n - 1) + result.response_time_ms) / n
+        if self.metrics is not None:
+            self.metrics.observe_result(result)
     
     def get_stats(self) -> Dict:
         """获取统计信息"""
-        total = self.stats['total_requests']
-        fraud_rate = self.stats['fraud_detected'] / total if total > 0 else 0
+        with self._stats_lock:
+            counters = dict(self.stats)
+        total = counters['total_requests']
+        fraud_rate = counters['fraud_detected'] / total if total > 0 else 0
         
         return {
             'total_requests': total,
-            'fraud_detected': self.stats['fraud_detected'],
+            'fraud_detected': counters['fraud_detected'],
             'fraud_rate': fraud_rate,
-            'avg_response_time': round(self.stats['avg_response_time'], 2),
+            'avg_response_time': round(counters['avg_response_time'], 2),
             'requests_per_sec': 0,
-            'vpn_detected': self.stats.get('vpn_detected', 0)
+            'vpn_detected': counters.get('vpn_detected', 0),
+            'degraded_requests': counters['degraded_requests'],
+            'early_exits': counters['early_exits'],
+            'reputation': self.reputation.get_stats() if self.reputation is not None else {},
+            'stage_cost_ms': self.stage_costs.snapshot() if self.stage_costs else {}
         }
     
+    def close(self):
+        """关闭引擎：释放检测阶段线程池"""
+        self.stage_graph.close()
+    
     def _load_config(self, config_path: str) -> Dict:
         """加载配置"""
         base_config = {}
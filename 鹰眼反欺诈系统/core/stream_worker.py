@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kafka 流式检测 worker
+消费 fraud_detection_requests、评分并发布到 fraud_detection_results，不经过 HTTP
+
+processes > 1 时启动多个消费进程加入同一消费组（检测状态通过 Redis 共享），
+并行度随分区数扩展：进程数 × partition_threads 超过分区数后不再提升
+
+用法（在项目根目录）:
+    python -m core.stream_worker
+    python -m core.stream_worker --processes 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+
+import yaml
+
+try:
+    from core.fraud_detection_engine_lite import FraudDetectionEngine
+except ImportError:
+    from core.fraud_detection_engine import FraudDetectionEngine
+from core.extensions.stream_consumer import DetectionStreamWorker
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _load_config(config_path: str) -> dict:
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def stream_processes(config: dict) -> int:
+    """消费进程数：环境变量 STREAM_WORKERS 优先，其次 performance.stream_worker.processes（0 为CPU核数）"""
+    processes = os.getenv('STREAM_WORKERS') or config.get('performance', {}).get(
+        'stream_worker', {}).get('processes', 1)
+    try:
+        processes = int(processes)
+    except (TypeError, ValueError):
+        logger.warning(f"无效的消费进程数: {processes}，使用单进程")
+        return 1
+    return processes if processes > 0 else (os.cpu_count() or 1)
+
+
+def run_worker(config_path: str, worker_index: int = 0):
+    """单个消费进程：加载引擎并消费直到收到 SIGTERM/SIGINT"""
+    engine = FraudDetectionEngine(config_path)
+    worker = DetectionStreamWorker.from_config(engine, _load_config(config_path), worker_index)
+    
+    def handle_signal(signum, frame):
+        logger.info(f"worker {worker_index} 收到信号 {signum}，完成当前批次后退出")
+        worker.stop()
+    
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    
+    logger.info(f"流式检测 worker {worker_index} 已启动 (pid={os.getpid()})")
+    try:
+        worker.run()
+    finally:
+        worker.close()
+        if hasattr(engine, 'close'):
+            engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kafka 流式检测 worker')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='消费进程数（默认 performance.stream_worker.processes）')
+    args = parser.parse_args()
+    
+    config = _load_config(args.config)
+    processes = args.processes or stream_processes(config)
+    logger.info("=" * 60)
+    logger.info(f"🐍 Kafka 流式检测: {config.get('kafka', {}).get('topics', {}).get('detection_requests')}"
+                f" → {config.get('kafka', {}).get('topics', {}).get('detection_results')}")
+    logger.info("=" * 60)
+    
+    if processes <= 1:
+        run_worker(args.config)
+        return
+    
+    # 多进程：各进程独立加载引擎，用户频率、设备历史通过 Redis 共享
+    os.environ.setdefault('API_STATE_STORE', 'redis')
+    logger.info(f"多进程模式: {processes} 个消费进程")
+    children = [multiprocessing.Process(target=run_worker, args=(args.config, index),
+                                        name=f'stream-worker-{index}')
+                for index in range(processes)]
+    for child in children:
+        child.start()
+    
+    def forward_signal(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+    
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    main()
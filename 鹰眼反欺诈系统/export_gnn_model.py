@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 模型导出脚本
+读取 detection.model.gnn_model 的权重（不存在时保存随机初始化的权重，仅用于验证导出流程），
+导出 TorchScript 与 ONNX 产物到配置的路径，并在随机图与合成交易关系图的子图上
+比对各导出件与 eager 模式的输出，偏差超过 parity_atol 时以非零状态退出
+
+需要 torch 与 torch_geometric；导出 ONNX 还需要 onnx，校验 ONNX 需要 onnxruntime
+
+用法:
+    python3 export_gnn_model.py
+    python3 export_gnn_model.py --formats torchscript --config config/config.yaml
+"""
+
+import argparse
+import logging
+import sys
+
+import yaml
+
+from benchmark_graph_store import synthetic_traffic
+from core.extensions.graph_store import TransactionGraphStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GNN 模型导出")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--formats', nargs='+', default=['torchscript', 'onnx'], choices=['torchscript', 'onnx'])
+    parser.add_argument('--subgraphs', type=int, default=64, help="参与比对的关系图子图数")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        from core.extensions import model_runtime
+        from core.fraud_detection_engine import GNN_INPUT_DIM, GraphNeuralNetworkDetector
+    except ImportError as e:
+        print(f"⚠️  torch / torch_geometric 不可用（{type(e).__name__}: {e}），无法导出")
+        return 1
+    
+    with open(args.config, encoding='utf-8') as f:
+        model_cfg = (yaml.safe_load(f) or {}).get('detection', {}).get('model', {})
+    runtime_cfg = model_cfg.get('runtime', {})
+    weights_path = model_cfg.get('gnn_model', 'models/gnn_detector.pt')
+    paths = {
+        'torchscript': model_cfg.get('torchscript_model', 'models/gnn_detector_ts.pt'),
+        'onnx': model_cfg.get('onnx_model', 'models/gnn_model.onnx')
+    }
+    
+    model = GraphNeuralNetworkDetector(input_dim=GNN_INPUT_DIM, hidden_dim=model_cfg.get('hidden_dim', 64),
+                                       output_dim=model_cfg.get('output_dim', 2))
+    if not model_runtime.load_weights(model, weights_path):
+        print(f"⚠️  未找到训练权重 {weights_path}，保存随机初始化的权重（仅用于验证导出流程）")
+        model_runtime.save_weights(model, weights_path)
+    model.eval()
+    model_runtime.configure_threads(runtime_cfg.get('intra_op_threads', 0), runtime_cfg.get('inter_op_threads', 0))
+    
+    # 比对用例：不同规模的随机图，加上合成交易关系图中以用户为中心的子图
+    store = TransactionGraphStore(feature_dim=GNN_INPUT_DIM)
+    transactions = synthetic_traffic(20000, 5000, seed=11)
+    for transaction in transactions:
+        store.append(transaction)
+    graphs = model_runtime.parity_graphs(GNN_INPUT_DIM)
+    for transaction in transactions[-args.subgraphs:]:
+        subgraph = store.sample(transaction)
+        graphs.append((subgraph.x, subgraph.edge_index, subgraph.edge_weight))
+    
+    eager = model_runtime.EagerRuntime(model)
+    atol = float(runtime_cfg.get('parity_atol', 1e-4))
+    failed = False
+    for backend in args.formats:
+        if backend == 'torchscript':
+            model_runtime.export_torchscript(model, paths[backend], GNN_INPUT_DIM)
+            runtime = model_runtime.TorchScriptRuntime(paths[backend])
+        else:
+            model_runtime.export_onnx(model, paths[backend], GNN_INPUT_DIM)
+            if not model_runtime.ONNXRUNTIME_AVAILABLE:
+                print(f"⚠️  onnxruntime 未安装，跳过 {paths[backend]} 的比对")
+                continue
+            runtime = model_runtime.OnnxRuntime(paths[backend])
+        deviation = model_runtime.max_deviation(eager, runtime, graphs)
+        ok = runtime.fingerprint == eager.fingerprint and deviation <= atol
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {backend}: {paths[backend]}, {len(graphs)} 个图最大偏差 {deviation:.2e} "
+              f"(容差 {atol:g}), 权重指纹 {runtime.fingerprint}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
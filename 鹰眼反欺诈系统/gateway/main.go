@@ -6,6 +6,8 @@ import (
 	"fmt"
 	"log"
 	"net/http"
+	"net/http/httputil"
+	"net/url"
 	"os"
 	"os/signal"
 	"strconv"
@@ -351,6 +353,29 @@ func (gw *APIGateway) HealthCheck(c *gin.Context) {
 	})
 }
 
+// WebSocket 反向代理：连接升级后在网关与 Python 引擎之间双向转发
+// 升级后的帧不经网关解析，升级请求与 /detect 共用速率限制；连接内的逐条请求由引擎的准入控制（max_qps）限流
+func (gw *APIGateway) WebSocketProxy() gin.HandlerFunc {
+	target, err := url.Parse(gw.config.PythonAPIURL)
+	if err != nil {
+		log.Fatalf("PYTHON_API_URL 解析失败: %v", err)
+	}
+	proxy := httputil.NewSingleHostReverseProxy(target)
+
+	return func(c *gin.Context) {
+		if !gw.rateLimiter.Allow() {
+			requestsTotal.WithLabelValues("/ws", "rate_limited").Inc()
+			c.JSON(http.StatusTooManyRequests, gin.H{
+				"error": "Rate limit exceeded",
+			})
+			return
+		}
+
+		requestsTotal.WithLabelValues("/ws", "upgrade").Inc()
+		proxy.ServeHTTP(c.Writer, c.Request)
+	}
+}
+
 // 启动网关
 func (gw *APIGateway) Start() error {
 	gin.SetMode(gin.ReleaseMode)
@@ -369,6 +394,9 @@ func (gw *APIGateway) Start() error {
 		api.GET("/health", gw.HealthCheck)
 	}
 
+	// WebSocket 检测通道（转发到 Python 引擎 /ws）
+	router.GET("/ws", gw.WebSocketProxy())
+
 	// Prometheus 指标
 	router.GET("/metrics", gin.WrapH(promhttp.Handler()))
 
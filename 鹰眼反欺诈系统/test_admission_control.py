@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+准入控制测试脚本（令牌桶、优先级排队、过载拒绝、AIMD 并发上限）
+"""
+
+import asyncio
+import sys
+import time
+
+from core.extensions.admission_control import AdmissionController, Overloaded, TokenBucket
+from core.extensions.batch_detection import BatchDetectionEngine
+
+
+def test_token_bucket():
+    """测试令牌桶的突发容量与补充速率"""
+    print("\n[测试1] 令牌桶...")
+    bucket = TokenBucket(rate=20, burst=5)
+    granted = sum(bucket.try_acquire() for _ in range(10))
+    print(f"突发 10 次请求放行: {granted}")
+    assert granted == 5
+    
+    time.sleep(0.125)  # 按 20/s 补充 2.5 个令牌
+    granted = sum(bucket.try_acquire() for _ in range(10))
+    print(f"0.125s 后放行: {granted}")
+    assert granted == 2
+    
+    controller = AdmissionController(max_qps=3, adaptive=False)
+    
+    async def burst():
+        shed = 0
+        for _ in range(5):
+            try:
+                await controller.acquire()
+                controller.release()
+            except Overloaded as e:
+                assert e.reason == "超出QPS上限"
+                shed += 1
+        return shed
+    
+    shed = asyncio.run(burst())
+    assert shed == 2 and controller.get_stats()['shed_rate_limit'] == 2
+    print(f"max_qps=3 时 5 次请求拒绝 {shed} 次: ✅")
+
+
+async def priority_order():
+    """并发上限 1：排队请求按优先级（交易金额）从高到低放行"""
+    controller = AdmissionController(max_in_flight=1, min_limit=1, queue_timeout_ms=1000, adaptive=False)
+    order = []
+    
+    async def request(amount):
+        async with controller.admit(priority=amount):
+            order.append(amount)
+            await asyncio.sleep(0.01)
+    
+    await controller.acquire()  # 占住唯一的许可，后续请求全部排队
+    tasks = [asyncio.create_task(request(amount)) for amount in (10, 5000, 100, 5000, 1)]
+    await asyncio.sleep(0.01)
+    assert controller.get_stats()['queue_depth'] == 5
+    controller.release()
+    await asyncio.gather(*tasks)
+    return order, controller.get_stats()
+
+
+def test_priority_queue():
+    """测试优先级排队"""
+    print("\n[测试2] 优先级排队...")
+    order, stats = asyncio.run(priority_order())
+    print(f"放行顺序: {order}")
+    assert order == [5000, 5000, 100, 10, 1]
+    assert stats['in_flight'] == 0 and stats['queue_depth'] == 0
+    print("高金额优先、同金额先到先得: ✅")
+
+
+async def overload():
+    """在途 2、队列 2：第 5 个请求立即拒绝，排队请求超时拒绝，断开的请求不占用许可"""
+    controller = AdmissionController(max_in_flight=2, min_limit=1, max_queue=2,
+                                     queue_timeout_ms=50, adaptive=False)
+    await controller.acquire()
+    await controller.acquire()
+    
+    waiters = [asyncio.create_task(controller.acquire(priority=p)) for p in (1, 2)]
+    await asyncio.sleep(0)
+    try:
+        await controller.acquire(priority=1000)
+        raise AssertionError("队列已满时应当拒绝")
+    except Overloaded as e:
+        queue_full = e.reason
+    
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    timeouts = [r.reason for r in results if isinstance(r, Overloaded)]
+    
+    # 排队中断开的请求：取消后队列深度归还，释放的许可交给下一个排队请求
+    cancelled = asyncio.create_task(controller.acquire())
+    survivor = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    controller.release()
+    await survivor
+    controller.release()
+    controller.release()
+    return queue_full, timeouts, controller.get_stats()
+
+
+def test_overload_shedding():
+    """测试过载时的拒绝顺序"""
+    print("\n[测试3] 过载拒绝...")
+    queue_full, timeouts, stats = asyncio.run(overload())
+    print(f"队列满: {queue_full}, 排队超时: {timeouts}")
+    print(f"统计: {stats}")
+    assert queue_full == "请求队列已满" and timeouts == ["排队超时", "排队超时"]
+    assert stats['shed_queue_full'] == 1 and stats['shed_timeout'] == 2
+    assert stats['in_flight'] == 0 and stats['queue_depth'] == 0
+    print("先拒绝超出队列的请求，再拒绝排队超时的请求，许可无泄漏: ✅")
+
+
+def test_aimd():
+    """测试按 p90 延迟乘性下调、加性上调并发上限"""
+    print("\n[测试4] AIMD 自适应并发...")
+    controller = AdmissionController(max_in_flight=100, min_limit=60, target_latency_ms=50, window_size=10)
+    
+    def window(latency_ms):
+        for _ in range(10):
+            controller._in_flight += 1
+            controller.release(latency_ms)
+        return controller.get_stats()['limit']
+    
+    limits = [window(120) for _ in range(6)]
+    print(f"延迟超标时的并发上限: {limits}")
+    assert limits == [90, 81, 72, 65, 60, 60]  # 每个窗口 ×0.9，不低于 min_limit
+    assert controller.get_stats()['limit_decreases'] == 5
+    
+    window(49)  # p90 低于目标延迟
+    recovered = [controller.get_stats()['limit']] + [window(20) for _ in range(4)]
+    print(f"延迟达标后的并发上限: {recovered}")
+    assert recovered[0] > 60 and recovered == sorted(recovered) and recovered[-1] == 100
+    print("超标乘性下调、达标加性上调: ✅")
+
+
+class SlowBatchEngine:
+    """每个分块耗时 50ms 的检测引擎"""
+    
+    class Result:
+        def __init__(self, transaction):
+            self.transaction = transaction
+        
+        def to_dict(self):
+            return {'user_id': self.transaction['user_id']}
+    
+    def detect_batch(self, transactions):
+        time.sleep(0.05)
+        return [self.Result(t) for t in transactions]
+
+
+async def batch_stream(controller):
+    async def items():
+        for i in range(12):
+            yield {'user_id': f'u{i}', 'amount': float(i)}
+    
+    batch_engine = BatchDetectionEngine(SlowBatchEngine(), max_workers=4)
+    entries = [entry async for entry in batch_engine.detect_stream(items(), 3, controller)]
+    batch_engine.executor.shutdown()
+    return entries
+
+
+def test_batch_admission():
+    """测试批量检测按分块经过准入控制"""
+    print("\n[测试5] 批量检测分块准入...")
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout_ms=200, adaptive=False)
+    entries = asyncio.run(batch_stream(controller))
+    statuses = [entry.get('status') for entry in entries]
+    stats = controller.get_stats()
+    print(f"4 个分块同时在途、上限 1 排队 1: 状态 {statuses}, 统计 {stats}")
+    assert [entry['index'] for entry in entries] == list(range(12))
+    assert statuses.count(503) == 6 and all(s in (None, 503) for s in statuses)
+    assert all(entry['retry_after'] == 1 for entry in entries if entry.get('status') == 503)
+    assert stats['admitted'] == 2 and stats['shed_queue_full'] == 2
+    assert stats['in_flight'] == 0 and stats['queue_depth'] == 0
+    print("超出容量的分块被拒绝，其余照常检测，许可无泄漏: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🚦 准入控制测试")
+    print("=" * 60)
+    
+    test_token_bucket()
+    test_priority_queue()
+    test_overload_shedding()
+    test_aimd()
+    test_batch_admission()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+级联检测测试脚本（两级引擎风险分同一量纲、按不确定区间升级）
+
+使用真实的完整版引擎（依赖 torch），未安装时跳过
+"""
+
+import sys
+import time
+
+from core.extensions.cascade import CascadeDetectionEngine, in_uncertain_band
+from core.fraud_detection_engine_lite import FraudDetectionEngine, RiskLevel
+
+# 各风险等级的最低风险分（0-100，两级引擎共用）
+LEVEL_FLOOR = {RiskLevel.LOW: 0, RiskLevel.MEDIUM: 30, RiskLevel.HIGH: 60, RiskLevel.CRITICAL: 85}
+
+_engines = {}
+
+
+def engines():
+    """精简版与完整版引擎（完整版加载较慢，各测试共用）；未安装 torch 时返回 None"""
+    if not _engines:
+        try:
+            from core.fraud_detection_engine import FraudDetectionEngine as FullDetectionEngine
+        except ImportError as e:
+            print(f"⚠️  完整版引擎不可用，跳过: {e}")
+            return None
+        _engines['lite'] = FraudDetectionEngine('config/config.yaml')
+        _engines['full'] = FullDetectionEngine('config/config.yaml')
+        # 运行环境检测的结论随宿主机而定（如在调试/分析工具下判定为严重威胁而拒绝全部请求），
+        # 这里固定为不拒绝，使完整版结果经过融合评分
+        _engines['full']._is_environment_critical = lambda env_result: False
+    return _engines['lite'], _engines['full']
+
+
+def transaction(i: int):
+    return {
+        'user_id': f'cascade_user_{i % 10}',
+        'ip': f'10.0.2.{i % 40}',
+        'device_id': f'cascade_dev_{i % 15}',
+        'item_id': f'item_{i % 5}',
+        'amount': (50.0, 800.0, 3000.0, 20000.0)[i % 4],
+        'action': 'purchase',
+        'timestamp': time.time()
+    }
+
+
+def check_scale(result):
+    """风险分在 0-100 内且不低于其风险等级的下界（0-1 量纲的结果在 MEDIUM 及以上时不满足）"""
+    level = RiskLevel[result.risk_level.name]
+    assert 0 <= result.risk_score <= 100, f"{result.decision_tier}: {result.risk_score}"
+    assert result.risk_score >= LEVEL_FLOOR[level], \
+        f"{result.decision_tier}: 风险分 {result.risk_score} 低于 {level.name} 的下界"
+
+
+def test_shared_scale():
+    """测试升级与未升级的结果使用同一量纲"""
+    print("\n[测试1] 两级结果同一量纲...")
+    loaded = engines()
+    if loaded is None:
+        return
+    lite, full = loaded
+    # 区间覆盖 0-100：除提前拒绝外全部升级
+    cascade = CascadeDetectionEngine(lite, full, 0.0, 100.1)
+    escalated = [cascade.detect(transaction(i)) for i in range(12)]
+    lite_results = [lite.detect(transaction(i)) for i in range(12)]
+    
+    full_tier = [r for r in escalated if r.decision_tier == 'full']
+    assert full_tier, "没有结果升级到完整版"
+    for result in escalated + lite_results:
+        check_scale(result)
+    assert any(r.risk_level.name != 'LOW' for r in full_tier), "完整版结果全部为 LOW，未覆盖量纲检查"
+    for tier, results in (('full', full_tier), ('lite', lite_results)):
+        scores = [round(r.risk_score, 1) for r in results]
+        print(f"{tier}: {scores}")
+    print("完整版与精简版风险分均为 0-100，等级阈值一致: ✅")
+
+
+def test_uncertain_band():
+    """测试只有不确定区间内的结果升级"""
+    print("\n[测试2] 不确定区间升级...")
+    loaded = engines()
+    if loaded is None:
+        return
+    lite, full = loaded
+    cascade = CascadeDetectionEngine(lite, full, 30.0, 85.0)
+    for i in range(12):
+        result = cascade.detect(transaction(i))
+        check_scale(result)
+        if result.decision_tier == 'lite':
+            assert not in_uncertain_band(result, cascade.uncertain_low, cascade.uncertain_high)
+    stats = cascade.get_stats()
+    print(f"升级 {stats['escalated']}/{stats['total_requests']} 笔，区间 {stats['uncertain_band']}: ✅")
+    assert stats['escalation_errors'] == 0
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🪜 级联检测测试")
+    print("=" * 60)
+    
+    try:
+        test_shared_scale()
+        test_uncertain_band()
+    finally:
+        for engine in _engines.values():
+            engine.close()
+        _engines.clear()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
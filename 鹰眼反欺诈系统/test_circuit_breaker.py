@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+依赖熔断器测试脚本（故障注入）
+
+在检测引擎与本地 Redis 之间插入可控的 TCP 代理，运行中把 Redis 切换为
+"无响应"（黑洞），验证熔断器打开后检测延迟保持平稳、恢复后自动关闭
+
+需要本地 Redis（REDIS_PORT，默认 6379）
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+from core.extensions.circuit_breaker import CircuitBreaker, configure_breakers, breaker_states
+from core.extensions.kafka_publisher import KafkaResultPublisher, InMemoryBroker
+
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
+
+class FaultProxy:
+    """
+    故障注入 TCP 代理
+    
+    mode: pass（正常转发）/ blackhole（接收数据但不转发、不响应，模拟 Redis 挂起）
+    """
+    
+    def __init__(self, target_port: int):
+        self.target_port = target_port
+        self.mode = 'pass'
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+    
+    def _accept(self):
+        while True:
+            client, _ = self.server.accept()
+            try:
+                upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            except OSError:
+                client.close()
+                continue
+            threading.Thread(target=self._pipe, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(upstream, client), daemon=True).start()
+    
+    def _pipe(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if self.mode == 'blackhole':
+                    continue
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+
+
+def redis_available() -> bool:
+    try:
+        with socket.create_connection(('127.0.0.1', REDIS_PORT), timeout=0.5) as sock:
+            sock.sendall(b'PING\r\n')
+            return sock.recv(16).startswith(b'+PONG')
+    except OSError:
+        return False
+
+
+def run_detections(engine, count: int, prefix: str):
+    """逐笔检测，返回每笔耗时（毫秒）"""
+    latencies = []
+    for i in range(count):
+        transaction = {
+            'user_id': f'{prefix}_{i % 20}',
+            'ip': f'10.0.0.{i % 50}',
+            'device_id': f'dev_{i % 30}',
+            'amount': 100.0,
+            'action': 'purchase'
+        }
+        start = time.perf_counter()
+        engine.detect(transaction)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def test_breaker_states():
+    """测试熔断器状态转换"""
+    print("\n[测试1] 状态转换...")
+    breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout_s=0.2)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure(ConnectionError('down'))
+    assert breaker.state == 'open' and not breaker.allow()
+    breaker.record_success()  # 打开期间的成功（如打开前放行的调用）不关闭熔断器
+    assert breaker.state == 'open'
+    
+    time.sleep(0.25)
+    assert breaker.state == 'half_open'
+    assert breaker.allow() and not breaker.allow()  # 半开只放行一个试探调用
+    breaker.record_failure(ConnectionError('still down'))
+    assert breaker.state == 'open'
+    
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    print(f"关闭 → 打开 → 半开 → 打开 → 半开 → 关闭: ✅ {breaker.get_stats()}")
+
+
+def test_redis_outage():
+    """测试 Redis 无响应时的检测延迟"""
+    print("\n[测试2] Redis 无响应（故障注入）...")
+    if not redis_available():
+        import pytest
+        pytest.skip(f"本地 Redis（端口 {REDIS_PORT}）不可用")
+    from core.fraud_detection_engine_lite import FraudDetectionEngine
+    
+    proxy = FaultProxy(REDIS_PORT)
+    saved = {name: os.environ.get(name) for name in ('API_STATE_STORE', 'REDIS_PORT')}
+    os.environ['API_STATE_STORE'] = 'redis'
+    os.environ['REDIS_PORT'] = str(proxy.port)
+    try:
+        run_redis_outage(FraudDetectionEngine('config/config.yaml'), proxy)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run_redis_outage(engine, proxy):
+    assert getattr(engine.state_store, 'shared', False), "共享状态未使用 Redis"
+    configure_breakers({'failure_threshold': 3, 'recovery_timeout_s': 1.0})
+    
+    run_detections(engine, 20, 'warmup')
+    baseline = run_detections(engine, 300, 'baseline')
+    print(f"正常: p50={percentile(baseline, 0.5):.2f}ms, p99={percentile(baseline, 0.99):.2f}ms")
+    
+    proxy.mode = 'blackhole'
+    tripping = run_detections(engine, 3, 'trip')
+    print(f"熔断前 3 笔（等待 Redis 超时）: {', '.join(f'{v:.0f}ms' for v in tripping)}")
+    assert breaker_states()['redis']['state'] == 'open'
+    
+    outage = run_detections(engine, 300, 'outage')
+    print(f"熔断中: p50={percentile(outage, 0.5):.2f}ms, p99={percentile(outage, 0.99):.2f}ms")
+    assert percentile(outage, 0.99) < max(5.0, percentile(baseline, 0.99) * 2), "熔断期间延迟未保持平稳"
+    
+    proxy.mode = 'pass'
+    time.sleep(1.1)
+    run_detections(engine, 5, 'recover')
+    state = breaker_states()['redis']
+    print(f"恢复后: {state['state']}, 拒绝调用 {state['rejected']} 次")
+    assert state['state'] == 'closed'
+
+
+def test_kafka_outage():
+    """测试 Kafka 发布器转入暂存时熔断器同步打开，回放完成后关闭"""
+    print("\n[测试3] Kafka 不可达...")
+    broker = InMemoryBroker()
+    breaker = CircuitBreaker('kafka_test', recovery_timeout_s=60)
+    publisher = KafkaResultPublisher(broker.producer, 'results', spool_path=None,
+                                     probe_interval_s=0.1, breaker=breaker)
+    publisher.publish('u1', {'seq': 0})
+    broker.available = False
+    for seq in range(1, 10):
+        publisher.publish('u1', {'seq': seq})
+    print(f"不可达: 熔断器 {breaker.state}, 丢弃 {publisher.get_stats()['dropped']} 条（未配置暂存文件）")
+    assert breaker.state == 'open'
+    
+    broker.available = True
+    deadline = time.time() + 5
+    while not publisher.healthy and time.time() < deadline:
+        time.sleep(0.05)
+    print(f"恢复: 熔断器 {breaker.state}")
+    assert breaker.state == 'closed'
+    publisher.close()
+
+
+def run_all():
+    print("=" * 60)
+    print("🔌 依赖熔断器测试")
+    print("=" * 60)
+    
+    test_breaker_states()
+    if redis_available():
+        test_redis_outage()
+    else:
+        print(f"\n[测试2] 跳过：本地 Redis（端口 {REDIS_PORT}）不可用")
+    test_kafka_outage()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
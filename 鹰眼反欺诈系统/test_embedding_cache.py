@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+节点嵌入缓存测试脚本（结构版本、模型版本、过期、LRU 淘汰、后台刷新）
+"""
+
+import sys
+
+import numpy as np
+
+from core.extensions.embedding_cache import EmbeddingRefresher, NodeEmbeddingCache
+from core.extensions.graph_store import TransactionGraphStore
+
+DIM = 16
+T0 = 1_700_000_000.0
+USER = 0
+
+
+def vector(seed):
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+def test_versions():
+    """测试结构版本与模型版本不一致时不命中"""
+    print("\n[测试1] 结构版本与模型版本...")
+    cache = NodeEmbeddingCache(DIM, max_entries=10, max_staleness_s=60)
+    cache.set_model_version('m1')
+    key = (USER, 'u1')
+    embedding = vector(1)
+    cache.put(key, 5, embedding, 'm1', now=T0)
+    
+    hit = cache.get(key, 5, now=T0 + 1)
+    assert hit is not None and np.array_equal(hit, embedding)
+    hit[:] = 0  # 返回的是副本
+    assert np.array_equal(cache.get(key, 5, now=T0 + 1), embedding)
+    assert cache.get(key, 6, now=T0 + 1) is None, "结构版本变化后不应命中"
+    assert cache.get(key, 5, now=T0 + 61) is None, "超过最长使用时间不应命中"
+    
+    cache.set_model_version('m2')
+    assert cache.get(key, 5, now=T0 + 1) is None, "模型变化后不应命中"
+    cache.put(key, 5, embedding, 'm1', now=T0)  # 按旧模型算出、模型更新后才写回
+    assert cache.get(key, 5, now=T0 + 1) is None
+    cache.put(key, 5, embedding, 'm2', now=T0)
+    assert cache.get(key, 5, now=T0 + 1) is not None
+    
+    stats = cache.get_stats()
+    print(f"统计: {stats}")
+    assert stats['stale'] == 1 and stats['expired'] == 1 and stats['rejected'] == 1
+    assert stats['invalidations'] == 1 and stats['hits'] == 3 and stats['misses'] == 2
+    print("结构版本、过期、模型版本变化均不命中，旧模型的结果不写回: ✅")
+
+
+def test_lru():
+    """测试 LRU 淘汰与行复用"""
+    print("\n[测试2] LRU 淘汰...")
+    cache = NodeEmbeddingCache(DIM, max_entries=3)
+    cache.set_model_version('m1')
+    for i, name in enumerate('abc'):
+        cache.put((USER, name), 1, vector(i), 'm1')
+    assert cache.get((USER, 'a'), 1) is not None   # a 变为最近访问
+    cache.put((USER, 'd'), 1, vector(3), 'm1')       # 淘汰最久未访问的 b
+    present = {name: cache.get((USER, name), 1) is not None for name in 'abcd'}
+    print(f"写入 a/b/c、访问 a、写入 d 后: {present}")
+    assert present == {'a': True, 'b': False, 'c': True, 'd': True}
+    assert np.array_equal(cache.get((USER, 'd'), 1), vector(3)), "复用的行应写入新嵌入"
+    assert np.array_equal(cache.get((USER, 'a'), 1), vector(0))
+    assert cache.get_stats()['evictions'] == 1 and len(cache._matrix) == 3
+    
+    # 超过初始容量时扩容，已有的嵌入原样保留
+    cache = NodeEmbeddingCache(DIM, max_entries=3000)
+    cache.set_model_version('m1')
+    for i in range(2500):
+        cache.put((USER, f'u{i}'), i, vector(i), 'm1')
+    print(f"扩容到 {len(cache._matrix)} 行")
+    assert len(cache._matrix) == 3000
+    assert all(np.array_equal(cache.get((USER, f'u{i}'), i), vector(i)) for i in (0, 1023, 1024, 2499))
+    
+    # float16 存储：扩容后同样保留，误差在半精度范围内
+    cache = NodeEmbeddingCache(DIM, max_entries=3000, dtype='float16')
+    cache.set_model_version('m1')
+    for i in range(2500):
+        cache.put((USER, f'u{i}'), i, vector(i), 'm1')
+    errors = [np.abs(cache.get((USER, f'u{i}'), i) - vector(i)).max() for i in (0, 1023, 1024, 2499)]
+    print(f"float16 扩容到 {len(cache._matrix)} 行, 最大误差 {max(errors):.1e}")
+    assert len(cache._matrix) == 3000 and max(errors) < 1e-2 and cache._matrix.dtype == np.float16
+    print("淘汰最久未访问的实体，行复用与扩容不串数据: ✅")
+
+
+def embed(x, edge_index, edge_weight):
+    """并图推理函数：节点特征与加权邻居特征之和（随邻域结构变化）"""
+    out = x[:, :DIM].astype(np.float32).copy()
+    np.add.at(out, edge_index[0], x[edge_index[1], :DIM] * edge_weight[:, None])
+    return out
+
+
+def test_refresher():
+    """测试后台刷新只重算结构变化过的已缓存实体"""
+    print("\n[测试3] 后台刷新...")
+    store = TransactionGraphStore(feature_dim=32, max_age_s=86400, compact_interval_s=1e9,
+                                  compact_min_delta=1 << 30)
+    cache = NodeEmbeddingCache(DIM, max_entries=100, max_staleness_s=1e9)
+    cache.set_model_version('m1')
+    refresher = EmbeddingRefresher(cache, store, embed, interval_s=3600)
+    try:
+        for user in ('u1', 'u2'):
+            store.append({'user_id': user, 'device_id': f'd_{user}', 'ip': '10.0.0.1'}, now=T0)
+        # 请求路径缓存 u1 的嵌入；u2 未缓存
+        subgraph = store.sample_entity((USER, 'u1'), now=T0)
+        cache.put(subgraph.key, subgraph.version, embed(subgraph.x, subgraph.edge_index,
+                                                        subgraph.edge_weight)[0], 'm1')
+        assert refresher.refresh_once() == 0  # 首次写入的变化：u1 已按当前版本计算
+        
+        store.append({'user_id': 'u1', 'device_id': 'd_new', 'ip': '10.0.0.1'}, now=T0 + 1)
+        store.append({'user_id': 'u2', 'device_id': 'd_new2', 'ip': '10.0.0.2'}, now=T0 + 1)
+        version = store.version_of((USER, 'u1'))
+        assert version != subgraph.version and cache.get((USER, 'u1'), version) is None
+        
+        refreshed = refresher.refresh_once()
+        fresh = store.sample_entity((USER, 'u1'))
+        expected = embed(fresh.x, fresh.edge_index, fresh.edge_weight)[0]
+        cached = cache.get((USER, 'u1'), version)
+        print(f"结构变化后刷新 {refreshed} 个实体, 统计 {refresher.get_stats()}")
+        assert refreshed == 1 and cached is not None and np.allclose(cached, expected, atol=1e-5)
+        assert cache.get((USER, 'u2'), store.version_of((USER, 'u2'))) is None, "未缓存的实体不应刷新"
+        
+        # 实体从图中淘汰后重新出现：版本时钟单调递增，淘汰前缓存的嵌入不会命中
+        store.compact(now=T0 + 86400 * 2)
+        assert store.version_of((USER, 'u1')) is None
+        refresher.refresh_once()
+        store.append({'user_id': 'u1', 'device_id': 'd_back', 'ip': '10.0.0.3'}, now=T0 + 86400 * 2)
+        version = store.version_of((USER, 'u1'))
+        assert cache.get((USER, 'u1'), version) is None, "淘汰前的嵌入不应命中重新出现的实体"
+        assert refresher.refresh_once() == 1 and cache.get((USER, 'u1'), version) is not None
+        print(f"淘汰后重新出现的实体按新版本重算: {refresher.get_stats()}")
+    finally:
+        refresher.close()
+    print("只重算结构变化过的已缓存实体，淘汰前的嵌入不会命中: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🧠 节点嵌入缓存测试")
+    print("=" * 60)
+    
+    test_versions()
+    test_lru()
+    test_refresher()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
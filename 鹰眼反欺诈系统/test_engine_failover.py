@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引擎故障切换测试脚本（故障注入）
+
+用两个精简版引擎分别充当完整版与降级引擎，在"完整版"一侧注入延迟与异常，
+验证超出 SLO 后切换到精简版、降级期间探测、恢复后带滞后地切回，
+以及每个结果记录的 engine_mode / decision_tier；
+另以真实的完整版引擎（依赖 torch，未安装时跳过）验证切换前后风险分同为 0-100
+"""
+
+import asyncio
+import sys
+import time
+
+from core.extensions.engine_supervisor import EngineSupervisor
+from core.fraud_detection_engine_lite import FraudDetectionEngine, RiskLevel
+
+# 各风险等级的最低风险分（0-100，两个引擎共用）
+LEVEL_FLOOR = {RiskLevel.LOW: 0, RiskLevel.MEDIUM: 30, RiskLevel.HIGH: 60, RiskLevel.CRITICAL: 85}
+
+
+class FaultyEngine:
+    """
+    故障注入引擎：包装真实引擎，按设置为每次检测增加延迟或抛出异常
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.config = engine.config
+        self.delay_ms = 0.0
+        self.fail = False
+    
+    def _inject(self):
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000.0)
+        if self.fail:
+            raise RuntimeError("injected failure")
+    
+    def detect(self, transaction, deadline=None):
+        self._inject()
+        return self.engine.detect(transaction, deadline)
+    
+    async def detect_async(self, transaction, deadline=None):
+        self._inject()
+        return await self.engine.detect_async(transaction, deadline)
+    
+    def detect_batch(self, transactions, return_exceptions=True, deadline=None):
+        self._inject()
+        return self.engine.detect_batch(transactions, return_exceptions, deadline)
+    
+    def get_stats(self):
+        return self.engine.get_stats()
+    
+    def close(self):
+        self.engine.close()
+
+
+def transaction(i: int, amount: float = 100.0):
+    return {
+        'user_id': f'user_{i % 20}',
+        'ip': f'10.0.1.{i % 50}',
+        'device_id': f'dev_{i % 30}',
+        'amount': amount,
+        'action': 'purchase',
+        'timestamp': time.time()
+    }
+
+
+def check_scale(results):
+    """风险分在 0-100 内且不低于其风险等级的下界（0-1 量纲的结果在 MEDIUM 及以上时不满足）"""
+    for result in results:
+        level = RiskLevel[result.risk_level.name]
+        assert 0 <= result.risk_score <= 100, f"{result.decision_tier}: {result.risk_score}"
+        assert result.risk_score >= LEVEL_FLOOR[level], \
+            f"{result.decision_tier}: 风险分 {result.risk_score} 低于 {level.name} 的下界"
+
+
+def new_supervisor(**overrides):
+    primary = FaultyEngine(FraudDetectionEngine('config/config.yaml'))
+    fallback = FraudDetectionEngine('config/config.yaml')
+    options = dict(slo_p99_ms=20, max_error_rate=0.1, recover_p99_ms=10,
+                   window_size=100, window_s=30, min_samples=10,
+                   min_dwell_s=0.3, probe_every=5, check_interval_s=0)
+    options.update(overrides)
+    return EngineSupervisor(primary, fallback, **options), primary
+
+
+def test_latency_failover():
+    """测试延迟超出 SLO 时切换，恢复后切回"""
+    print("\n[测试1] 延迟超出 SLO...")
+    supervisor, primary = new_supervisor()
+    
+    results = [supervisor.detect(transaction(i)) for i in range(20)]
+    assert supervisor.mode == 'full'
+    assert all(r.engine_mode == 'full' and r.decision_tier == 'full' for r in results)
+    check_scale(results)
+    
+    primary.delay_ms = 30
+    i = 0
+    while supervisor.mode == 'full':
+        supervisor.detect(transaction(i))
+        i += 1
+        assert i <= 20, "完整版延迟超出 SLO 后未切换"
+    print(f"注入 30ms 延迟后 {i} 笔切换到精简版")
+    
+    results = [supervisor.detect(transaction(i)) for i in range(20)]
+    tiers = [r.decision_tier for r in results]
+    assert all(r.engine_mode == 'lite' for r in results)
+    assert tiers.count('full') == 4, f"降级期间应每 5 笔探测一次完整版: {tiers}"
+    check_scale(results)
+    
+    # 延迟回落到 SLO 与恢复阈值之间：滞后区间内保持降级
+    primary.delay_ms = 15
+    start = time.time()
+    while time.time() - start < 0.5:
+        supervisor.detect(transaction(i))
+        i += 1
+    assert supervisor.mode == 'lite', "p99 未低于恢复阈值时不应切回"
+    print("延迟 15ms（SLO 20ms、恢复阈值 10ms 之间）: 保持降级")
+    
+    primary.delay_ms = 0
+    start = time.time()
+    while supervisor.mode == 'lite':
+        supervisor.detect(transaction(i))
+        i += 1
+        assert time.time() - start < 5, "完整版恢复后未切回"
+    stats = supervisor.get_stats()['failover']
+    print(f"延迟恢复后 {time.time() - start:.2f}s 切回完整版: ✅ {stats}")
+    assert stats['failovers'] == 1 and stats['recoveries'] == 1
+    assert supervisor.detect(transaction(0)).engine_mode == 'full'
+    supervisor.close()
+
+
+def test_error_failover():
+    """测试完整版异常：请求由精简版处理，错误率超限后切换"""
+    print("\n[测试2] 完整版抛出异常...")
+    supervisor, primary = new_supervisor()
+    for i in range(10):
+        supervisor.detect(transaction(i))
+    
+    primary.fail = True
+    result = supervisor.detect(transaction(0))
+    assert result.engine_mode == 'full' and result.decision_tier == 'lite'
+    for i in range(5):
+        supervisor.detect(transaction(i))
+    stats = supervisor.get_stats()['failover']
+    print(f"错误率 {stats['window_error_rate']:.0%}: 模式 {stats['mode']}，完整版错误 {stats['primary_errors']} 次")
+    assert supervisor.mode == 'lite'
+    
+    # 批量检测：整批由精简版处理
+    results = supervisor.detect_batch([transaction(i) for i in range(4)])
+    assert all(r.engine_mode == 'lite' for r in results)
+    check_scale(results)
+    
+    # 异步检测
+    result = asyncio.run(supervisor.detect_async(transaction(0)))
+    assert result.engine_mode == 'lite' and result.to_dict()['engine_mode'] == 'lite'
+    print("批量/异步检测记录降级模式: ✅")
+    supervisor.close()
+
+
+def test_low_traffic_recovery():
+    """测试低流量下 window_s 内探测不足 min_samples 时仍能恢复"""
+    print("\n[测试3] 低流量恢复...")
+    supervisor, primary = new_supervisor(window_s=0.2, min_probes=3, min_dwell_s=0, probe_every=2)
+    primary.fail = True
+    for i in range(10):
+        supervisor.detect(transaction(i))
+    assert supervisor.mode == 'lite'
+    
+    # 每 0.1s 一笔、每 2 笔探测一次：window_s 内最多 1 个探测，远少于 min_samples
+    primary.fail = False
+    sent = 0
+    while supervisor.mode == 'lite':
+        supervisor.detect(transaction(sent))
+        sent += 1
+        assert sent <= 12, "低流量下完整版恢复后未切回"
+        time.sleep(0.1)
+    stats = supervisor.get_stats()['failover']
+    print(f"{sent} 笔（{stats['probes']} 次探测）后切回完整版: ✅")
+    assert stats['recoveries'] == 1 and stats['probes'] >= supervisor.min_probes
+    supervisor.close()
+
+
+def test_full_engine_scale():
+    """测试真实完整版引擎与精简版切换前后风险分同一量纲"""
+    print("\n[测试4] 完整版/精简版同一量纲...")
+    try:
+        from core.fraud_detection_engine import FraudDetectionEngine as FullDetectionEngine
+    except ImportError as e:
+        print(f"⚠️  完整版引擎不可用，跳过: {e}")
+        return
+    full = FullDetectionEngine('config/config.yaml')
+    # 运行环境检测的结论随宿主机而定，这里固定为不拒绝，使完整版结果经过融合评分
+    full._is_environment_critical = lambda env_result: False
+    primary = FaultyEngine(full)
+    fallback = FraudDetectionEngine('config/config.yaml')
+    supervisor = EngineSupervisor(primary, fallback, slo_p99_ms=10000, max_error_rate=0.1,
+                                  window_size=100, window_s=30, min_samples=5,
+                                  min_dwell_s=60, probe_every=3, check_interval_s=0)
+    amounts = (50.0, 800.0, 3000.0, 20000.0)
+    try:
+        results = [supervisor.detect(transaction(i, amounts[i % 4])) for i in range(8)]
+        assert all(r.decision_tier == 'full' for r in results)
+        
+        # 完整版失败：本笔由精简版处理，错误率超限后切换，降级期间的探测仍由完整版评分
+        primary.fail = True
+        results += [supervisor.detect(transaction(i, amounts[i % 4])) for i in range(5)]
+        assert supervisor.mode == 'lite'
+        primary.fail = False
+        results += [supervisor.detect(transaction(i, amounts[i % 4])) for i in range(9)]
+        
+        tiers = {tier: [round(r.risk_score, 1) for r in results if r.decision_tier == tier]
+                 for tier in ('full', 'lite')}
+        print(f"完整版评分: {tiers['full']}\n精简版评分: {tiers['lite']}")
+        assert tiers['full'] and tiers['lite']
+        assert any(r.risk_level.name != 'LOW' for r in results if r.decision_tier == 'full')
+        check_scale(results)
+        print("两个引擎的风险分均为 0-100，等级阈值一致: ✅")
+    finally:
+        supervisor.close()
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🔀 引擎故障切换测试")
+    print("=" * 60)
+    
+    test_latency_failover()
+    test_error_failover()
+    test_low_traffic_recovery()
+    test_full_engine_scale()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
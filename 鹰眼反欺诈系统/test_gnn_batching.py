@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 批量推理测试脚本（不相交并图、分块推理与逐笔一致、并发请求合并、关闭后拒绝提交）
+
+推理函数为 numpy 实现的两层加权消息传递（按度归一化），不依赖 torch；
+消息跨越子图时结果与逐笔推理不一致
+"""
+
+import sys
+import threading
+import time
+
+import numpy as np
+
+from core.extensions.gnn_batching import GNNInferenceBatcher, merge_subgraphs, predict_batched
+from core.extensions.graph_store import TransactionGraphStore
+
+T0 = 1_700_000_000.0
+
+
+def infer(x, edge_index, edge_weight):
+    """两层消息传递：自身特征加上按加权度归一化的邻居特征"""
+    h = x.astype(np.float64)
+    degree = np.ones(len(x))
+    np.add.at(degree, edge_index[1], edge_weight)
+    for _ in range(2):
+        out = h.copy()
+        np.add.at(out, edge_index[1], h[edge_index[0]] * edge_weight[:, None])
+        h = np.tanh(out / degree[:, None])
+    return h
+
+
+def sample_subgraphs(count=7):
+    """合成交易关系图中以用户为中心的子图（含一个不在图中的用户：只有中心节点）"""
+    store = TransactionGraphStore(feature_dim=16, half_life_s=3600)
+    rng = np.random.default_rng(3)
+    for i in range(200):
+        store.append({
+            'user_id': f'u{rng.integers(30)}', 'device_id': f'd{rng.integers(20)}',
+            'ip': f'10.0.0.{rng.integers(15)}', 'item_id': f'i{rng.integers(10)}', 'amount': 100.0
+        }, now=T0 + i * 60)
+    users = [f'u{i}' for i in range(count - 1)] + ['unknown']
+    return [store.sample({'user_id': user}, now=T0 + 200 * 60) for user in users]
+
+
+def single(subgraph):
+    """逐笔推理的中心节点结果"""
+    return infer(subgraph.x, subgraph.edge_index, subgraph.edge_weight)[subgraph.center]
+
+
+def test_merge():
+    """测试不相交并图的节点偏移与中心下标"""
+    print("\n[测试1] 不相交并图...")
+    subgraphs = sample_subgraphs()
+    x, edge_index, edge_weight, centers = merge_subgraphs(subgraphs)
+    sizes = [len(s.x) for s in subgraphs]
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    assert x.shape == (sum(sizes), 16)
+    assert edge_index.shape[1] == len(edge_weight) == sum(s.edge_index.shape[1] for s in subgraphs)
+    assert centers.tolist() == (offsets + [s.center for s in subgraphs]).tolist()
+    
+    # 每条边的两个端点落在同一子图的节点区间内
+    block = np.searchsorted(offsets, edge_index, side='right') - 1
+    assert np.array_equal(block[0], block[1])
+    assert sizes[-1] == 1, "不在图中的用户只有中心节点"
+    print(f"{len(subgraphs)} 个子图 → {len(x)} 个节点, {edge_index.shape[1]} 条边，边不跨子图: ✅")
+
+
+def test_predict_batched():
+    """测试分块合并推理与逐笔推理一致"""
+    print("\n[测试2] 分块推理...")
+    subgraphs = sample_subgraphs()
+    expected = np.stack([single(s) for s in subgraphs])
+    for max_batch_size in (None, 1, 3):
+        outputs = predict_batched(infer, subgraphs, max_batch_size)
+        deviation = float(np.abs(outputs - expected).max())
+        print(f"max_batch_size={max_batch_size}: 最大偏差 {deviation:.1e}")
+        assert outputs.shape == expected.shape and deviation < 1e-12
+    assert predict_batched(infer, []).shape == (0,)
+    print("合并推理与逐笔推理一致: ✅")
+
+
+def test_batcher():
+    """测试并发请求合并为批次，结果与逐笔推理一致"""
+    print("\n[测试3] 并发请求合并...")
+    subgraphs = sample_subgraphs()
+    def slow_infer(x, edge_index, edge_weight):
+        time.sleep(0.01)
+        return infer(x, edge_index, edge_weight)
+    
+    batcher = GNNInferenceBatcher(slow_infer, max_batch_size=4, max_wait_ms=20)
+    results = [None] * 16
+    
+    def client(i):
+        results[i] = batcher.predict(subgraphs[i % len(subgraphs)], timeout=5)
+    
+    try:
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = batcher.get_stats()
+        print(f"16 个并发请求: {stats}")
+        assert stats['items'] == 16 and stats['batches'] < 16 and stats['max_batch'] <= 4
+        for i, result in enumerate(results):
+            assert np.allclose(result, single(subgraphs[i % len(subgraphs)]), atol=1e-12)
+        
+        # 推理失败时同一批次的请求都收到异常
+        def failing(x, edge_index, edge_weight):
+            raise ValueError("bad batch")
+        
+        batcher.infer_fn = failing
+        try:
+            batcher.predict(subgraphs[0], timeout=5)
+            raise AssertionError("推理失败应抛出异常")
+        except ValueError:
+            pass
+    finally:
+        batcher.close()
+    print("并发请求合并为批次，结果与逐笔一致，失败传递给等待者: ✅")
+
+
+def test_close():
+    """测试关闭时处理完已排队的请求，之后的提交立即失败"""
+    print("\n[测试4] 关闭...")
+    subgraphs = sample_subgraphs()
+    gate = threading.Event()
+    
+    def gated_infer(x, edge_index, edge_weight):
+        gate.wait(5)
+        return infer(x, edge_index, edge_weight)
+    
+    batcher = GNNInferenceBatcher(gated_infer, max_batch_size=2, max_wait_ms=0)
+    results = []
+    threads = [threading.Thread(target=lambda s=s: results.append(batcher.predict(s, timeout=5)))
+               for s in subgraphs[:3]]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    gate.set()
+    closer.join()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 3, "关闭前排队的请求应完成推理"
+    
+    start = time.perf_counter()
+    try:
+        batcher.predict(subgraphs[0])
+        raise AssertionError("关闭后提交应抛出 RuntimeError")
+    except RuntimeError as e:
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"关闭后提交: {e}（{elapsed:.2f}ms）")
+    batcher.close()  # 重复关闭无影响
+    print("已排队的请求完成，关闭后的提交立即失败而不是无限等待: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🧮 GNN 批量推理测试")
+    print("=" * 60)
+    
+    test_merge()
+    test_predict_batched()
+    test_batcher()
+    test_close()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
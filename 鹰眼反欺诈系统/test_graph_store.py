@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易关系图测试脚本（采样、按时间/边数淘汰、槽位复用、CSR 重建一致性、结构版本、
+GCN 使用衰减后的边权重、拒绝的交易不写入关系图）
+
+后两项使用完整版引擎（依赖 torch），未安装时跳过
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from core.extensions.graph_store import EDGE_TYPES, TransactionGraphStore
+
+DAY = 86400.0
+T0 = 1_700_000_000.0
+
+
+def new_store(**kwargs):
+    """关闭自动重建，由测试显式调用 compact"""
+    options = dict(max_age_s=DAY, compact_interval_s=1e9, compact_min_delta=1 << 30)
+    options.update(kwargs)
+    return TransactionGraphStore(**options)
+
+
+def txn(user, device=None, ip=None, item=None, amount=100.0):
+    return {'user_id': user, 'device_id': device, 'ip': ip, 'item_id': item, 'amount': amount}
+
+
+def check_consistency(store):
+    """边表、节点度与 CSR 相互一致（重建后调用），返回存活的 (边数, 节点数)"""
+    n = store._num_edges
+    live = np.flatnonzero(store._edge_alive[:n])
+    assert sorted(store._edge_ids.values()) == sorted(live.tolist()), "边编号表与存活边不一致"
+    for (u, v), edge in store._edge_ids.items():
+        assert (store._edge_src[edge], store._edge_dst[edge]) == (u, v), f"边 {edge} 端点错误"
+        for node in (u, v):
+            assert store._node_keys[node] is not None, f"边 {edge} 引用已淘汰的节点 {node}"
+    assert not set(live.tolist()) & set(store._free_edges), "存活的边在空闲表中"
+    
+    num_nodes = len(store._node_keys)
+    degree = np.zeros((num_nodes, len(EDGE_TYPES)), dtype=np.int64)
+    np.add.at(degree, (store._edge_src[live], store._edge_type[live]), 1)
+    np.add.at(degree, (store._edge_dst[live], store._edge_type[live]), 1)
+    assert (store._node_degree[:num_nodes] == degree).all(), "节点度与存活边不一致"
+    
+    for key, node in store._node_ids.items():
+        assert store._node_keys[node] == key, f"节点编号表不一致: {key}"
+    assert len(store._node_ids) == sum(key is not None for key in store._node_keys)
+    
+    # CSR：每个节点恰好列出与之相连的存活边，不引用淘汰的边
+    assert not store._delta, "重建后增量表应为空"
+    incident = {node: set() for node in range(num_nodes)}
+    for edge in live.tolist():
+        incident[int(store._edge_src[edge])].add(edge)
+        incident[int(store._edge_dst[edge])].add(edge)
+    for node in range(num_nodes):
+        start, end = int(store._indptr[node]), int(store._indptr[node + 1])
+        listed = store._csr_edges[start:end].tolist()
+        assert len(listed) == len(set(listed)) and set(listed) == incident[node], f"节点 {node} 的 CSR 不一致"
+    return len(live), len(store._node_ids)
+
+
+def one_hop_keys(store, subgraph):
+    """一跳子图的中心实体与其邻居（按边表回查），并校验子图节点数一致"""
+    center = store._node_ids[subgraph.key]
+    keys = {subgraph.key}
+    for edge in store._incident_edges(center).tolist():
+        other = store._edge_dst[edge] if store._edge_src[edge] == center else store._edge_src[edge]
+        keys.add(store._node_keys[int(other)])
+    assert len(subgraph.x) == len(keys), "子图节点数与邻居数不一致"
+    return keys
+
+
+def test_sample():
+    """测试写入与采样"""
+    print("\n[测试1] 写入与采样...")
+    store = new_store()
+    store.append(txn('u1', 'd1', '1.1.1.1', 'item1'), now=T0)
+    store.append(txn('u2', 'd1', '2.2.2.2'), now=T0)
+    store.append(txn('u1', 'd1', '1.1.1.1', 'item1'), now=T0 + 10)  # 重复的边累加权重，不新增
+    stats = store.get_stats()
+    print(f"节点 {stats['nodes']}, 边 {stats['edges']}")
+    assert stats['nodes'] == 6 and stats['edges'] == 7
+    
+    subgraph = store.sample(txn('u1'), now=T0 + 10)
+    assert subgraph.key == (0, 'u1') and subgraph.center == 0
+    # 两跳：u1 → item1/d1/1.1.1.1 → u2、2.2.2.2（经 d1）
+    print(f"两跳子图: {len(subgraph.x)} 个节点, {subgraph.edge_index.shape[1]} 条有向边")
+    assert len(subgraph.x) == 6 and subgraph.x[0, 12] == 1.0
+    assert subgraph.x[0, 4] == np.float32(np.log1p(2))  # u1 两笔交易
+    pairs = set(map(tuple, subgraph.edge_index.T.tolist()))
+    assert all((b, a) in pairs for a, b in pairs), "边索引应为双向"
+    assert store.sample(txn('nobody'), now=T0).key is None
+    print("邻域与节点特征正确，未知用户返回只有中心节点的子图: ✅")
+
+
+def test_eviction_and_reuse():
+    """测试淘汰后节点/边槽位复用，CSR 重建后度与边编号一致"""
+    print("\n[测试2] 淘汰与槽位复用...")
+    store = new_store()
+    for i in range(20):
+        store.append(txn(f'old{i}', f'dev_old{i}', f'10.0.0.{i}'), now=T0)
+    for i in range(5):
+        store.append(txn(f'keep{i}', f'dev_old{i}', f'10.1.0.{i}'), now=T0 + DAY)
+    store.compact(now=T0 + DAY)
+    edges_before, nodes_before = check_consistency(store)
+    
+    # old* 的边超过保留时间；dev_old0-4 仍与 keep* 相连，保留
+    now = T0 + 2 * DAY - 1
+    store.compact(now=now)
+    edges, nodes = check_consistency(store)
+    stats = store.get_stats()
+    print(f"淘汰前 {edges_before} 条边 / {nodes_before} 个节点, 淘汰后 {edges} / {nodes}, "
+          f"淘汰边 {stats['evicted_edges']}, 节点 {stats['evicted_nodes']}")
+    assert edges == 15 and stats['evicted_edges'] == 60
+    assert nodes == 15 and stats['evicted_nodes'] == 20 + 15 + 20  # old0-19、dev_old5-19、10.0.0.*
+    assert store.sample_entity((0, 'old0')) is None and store.version_of((0, 'old0')) is None
+    assert store.version_of((2, 'dev_old0')) is not None
+    
+    # 新实体复用淘汰的槽位，不再扩展数组
+    free_nodes, free_edges = set(store._free_nodes), set(store._free_edges)
+    num_edges, num_node_slots = store._num_edges, len(store._node_keys)
+    for i in range(10):
+        store.append(txn(f'new{i}', f'dev_new{i}', f'10.2.0.{i}', amount=7.0), now=now)
+    reused_nodes = {store._node_ids[(0, f'new{i}')] for i in range(10)}
+    print(f"新节点复用槽位 {len(reused_nodes & free_nodes)}/10, 边数组长度 {num_edges} → {store._num_edges}")
+    assert reused_nodes <= free_nodes and len(store._node_keys) == num_node_slots
+    assert store._num_edges == num_edges and len(free_edges - set(store._free_edges)) == 30
+    
+    # 重建前（槽位刚复用、旧 CSR 仍在）采样只看到新实体自己的邻居，复用的槽位没有残留的度/交易数
+    for snapshot in ('重建前', '重建后'):
+        keys = one_hop_keys(store, store.sample_entity((0, 'new3'), hops=1, now=now))
+        assert keys == {(0, 'new3'), (2, 'dev_new3'), (3, '10.2.0.3')}, f"{snapshot}: {keys}"
+        node = store._node_ids[(2, 'dev_new3')]
+        assert store._node_count[node] == 1 and store._node_amount[node] == 7.0
+        assert store._node_degree[node].tolist() == [0, 1, 0, 1]  # 用户-设备、设备-IP
+        store.compact(now=now)
+    edges, nodes = check_consistency(store)
+    print(f"重建后 {edges} 条边 / {nodes} 个节点，度与边编号一致: ✅")
+    assert edges == 45 and nodes == 45
+
+
+def test_max_edges():
+    """测试边数上限：淘汰最旧的边"""
+    print("\n[测试3] 边数上限...")
+    store = new_store(max_edges=10, max_age_s=1e9)
+    for i in range(25):
+        store.append(txn(f'u{i}', ip=f'10.0.0.{i}'), now=T0 + i)
+    store.compact(now=T0 + 25)
+    edges, _ = check_consistency(store)
+    survivors = sorted(store._node_keys[int(u)][1] for (u, _) in store._edge_ids)
+    print(f"保留 {edges} 条边: {survivors}")
+    assert edges == 10 and survivors == sorted(f'u{i}' for i in range(15, 25))
+    
+    # 持续写入时始终受限，槽位循环复用
+    for i in range(25, 100):
+        store.append(txn(f'u{i}', ip=f'10.0.1.{i}'), now=T0 + i)
+        if i % 10 == 0:
+            store.compact(now=T0 + i)
+    store.compact(now=T0 + 100)
+    edges, _ = check_consistency(store)
+    assert edges == 10 and store._num_edges == 25
+    print(f"写入 100 笔后边数组长度 {store._num_edges}: ✅")
+
+
+def test_versions():
+    """测试结构版本与变化跟踪"""
+    print("\n[测试4] 结构版本...")
+    store = new_store()
+    store.track_changes()
+    store.append(txn('u1', 'd1', 'ip1'), now=T0)
+    v1 = store.version_of((0, 'u1'))
+    assert set(store.drain_changed()) == {(0, 'u1'), (2, 'd1'), (3, 'ip1')}
+    
+    store.append(txn('u1', 'd1', 'ip1'), now=T0 + 1)   # 只是重复的边
+    assert store.version_of((0, 'u1')) == v1 and store.drain_changed() == []
+    
+    store.append(txn('u1', 'd2', 'ip1'), now=T0 + DAY)  # 新设备
+    v2 = store.version_of((0, 'u1'))
+    assert v2 > v1 and set(store.drain_changed()) == {(0, 'u1'), (2, 'd2'), (3, 'ip1')}
+    
+    store.compact(now=T0 + DAY + 10)  # 淘汰 u1-d1、d1-ip1（u1-ip1 刚出现过）
+    v3 = store.version_of((0, 'u1'))
+    changed = set(store.drain_changed())
+    print(f"u1 版本 {v1} → {v2} → {v3}, 淘汰后变化的实体 {sorted(changed)}")
+    assert v3 > v2 and (0, 'u1') in changed and (2, 'd1') not in changed  # d1 已淘汰，不返回
+    print("新增或淘汰相连的边时版本变化，重复的边不变: ✅")
+
+
+def test_edge_weight_in_model():
+    """测试衰减后的边权重参与 GCN 聚合"""
+    print("\n[测试5] GCN 边权重...")
+    try:
+        from core.extensions.model_runtime import EagerRuntime, unit_weights
+        from core.fraud_detection_engine import GNN_INPUT_DIM, GraphNeuralNetworkDetector
+    except ImportError as e:
+        print(f"⚠️  完整版引擎不可用，跳过: {e}")
+        return
+    store = new_store(feature_dim=GNN_INPUT_DIM, half_life_s=DAY)
+    store.append(txn('u1', device='d1', ip='1.1.1.1'), now=T0)
+    store.append(txn('u1', device='d2', item='i1'), now=T0 + DAY / 2)
+    subgraph = store.sample(txn('u1'), now=T0 + DAY / 2)
+    assert len(set(subgraph.edge_weight.round(3))) > 1, subgraph.edge_weight
+    
+    runtime = EagerRuntime(GraphNeuralNetworkDetector(GNN_INPUT_DIM))
+    weighted = runtime.embed(subgraph.x, subgraph.edge_index, subgraph.edge_weight)
+    unweighted = runtime.embed(subgraph.x, subgraph.edge_index)
+    assert np.allclose(unweighted, runtime.embed(subgraph.x, subgraph.edge_index,
+                                                 unit_weights(subgraph.edge_index)), atol=1e-6)
+    deviation = float(np.abs(weighted - unweighted).max())
+    print(f"边权重 {sorted(set(round(float(w), 3) for w in subgraph.edge_weight))}，嵌入偏差 {deviation:.4f}")
+    assert deviation > 1e-4
+    print("衰减后的边权重改变节点嵌入，未提供时等价于权重全为 1: ✅")
+
+
+def test_rejected_not_recorded():
+    """测试提前拒绝与环境拒绝的交易不写入关系图"""
+    print("\n[测试6] 拒绝的交易不写入关系图...")
+    try:
+        from core.fraud_detection_engine import FraudDetectionEngine
+    except ImportError as e:
+        print(f"⚠️  完整版引擎不可用，跳过: {e}")
+        return
+    engine = FraudDetectionEngine('config/config.yaml')
+    
+    def transaction(user):
+        return {'user_id': user, 'ip': f'10.9.0.{len(user)}', 'device_id': f'dev_{user}',
+                'item_id': 'item_1', 'amount': 100.0, 'timestamp': time.time()}
+    
+    try:
+        store = engine.graph_store
+        assert store is not None
+        
+        blocked = transaction('graph_blocked')
+        engine.config['ip_blacklist'].add(blocked['ip'])
+        assert engine.detect(blocked).early_exit == 'ip_blacklist'
+        assert store.center(blocked) == (None, 0)
+        
+        # 环境检测判定为严重威胁（运行环境本身的检测结果随宿主机而定，这里固定判定）
+        rejected = transaction('graph_env')
+        engine._is_environment_critical = lambda env_result: True
+        assert engine.detect(rejected).risk_score == 100.0
+        assert store.center(rejected) == (None, 0)
+        
+        accepted = transaction('graph_ok')
+        engine._is_environment_critical = lambda env_result: False
+        engine.detect(accepted)
+        assert store.center(accepted)[0] == (0, 'graph_ok')
+        print("提前拒绝、环境拒绝的交易未写入，正常交易已写入: ✅")
+    finally:
+        engine.close()
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🕸️ 交易关系图测试")
+    print("=" * 60)
+    
+    test_sample()
+    test_eviction_and_reuse()
+    test_max_edges()
+    test_versions()
+    test_edge_weight_in_model()
+    test_rejected_not_recorded()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幂等结果缓存测试脚本（幂等键、并发重复请求合并、TTL 与 LRU、Redis 共享）
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+
+from core.extensions.idempotency import IdempotencyCache, IdempotencyConflict
+
+
+class CountingDetector:
+    """记录实际执行检测次数的检测函数"""
+    
+    def __init__(self, delay_s=0.05, error=None):
+        self.delay = delay_s
+        self.error = error
+        self.calls = 0
+    
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f'{{"risk_score": {self.calls}}}'.encode('utf-8')
+
+
+def test_make_key():
+    """测试幂等键"""
+    print("\n[测试1] 幂等键...")
+    transaction = {'user_id': 'u1', 'amount': 100.0, 'ip': '1.2.3.4', 'timestamp': '2026-01-01T00:00:00'}
+    reordered = {'timestamp': '2026-01-01T00:00:00', 'ip': '1.2.3.4', 'amount': 100.0, 'user_id': 'u1'}
+    assert IdempotencyCache.make_key(transaction) == IdempotencyCache.make_key(reordered)
+    assert IdempotencyCache.make_key(transaction) != IdempotencyCache.make_key({**transaction, 'amount': 101.0})
+    # 客户端的 Idempotency-Key 按用户隔离
+    assert (IdempotencyCache.make_key(transaction, 'retry-1')
+            != IdempotencyCache.make_key({**transaction, 'user_id': 'u2'}, 'retry-1'))
+    # 不做字符串拼接：user_id 'a:b' + 键 'c' 与 user_id 'a' + 键 'b:c' 不冲突
+    assert (IdempotencyCache.make_key({'user_id': 'a:b'}, 'c')
+            != IdempotencyCache.make_key({'user_id': 'a'}, 'b:c'))
+    # 内容指纹不含服务端生成的 timestamp，金额不同即不同
+    assert (IdempotencyCache.make_fingerprint(transaction)
+            == IdempotencyCache.make_fingerprint({**transaction, 'timestamp': 1.0}))
+    assert (IdempotencyCache.make_fingerprint(transaction)
+            != IdempotencyCache.make_fingerprint({**transaction, 'amount': 101.0}))
+    print("字段顺序无关、金额不同即不同、客户端键按用户隔离且无分隔符冲突: ✅")
+
+
+def test_fingerprint_conflict():
+    """测试同一个客户端键携带不同内容"""
+    print("\n[测试6] 客户端键复用于不同内容...")
+    
+    async def scenario():
+        cache = IdempotencyCache(ttl_seconds=60)
+        detector = CountingDetector(delay_s=0.02)
+        first = asyncio.create_task(cache.get_or_run('k', detector, 'fp-1'))
+        await asyncio.sleep(0.005)
+        outcomes = []
+        for stage in ('inflight', 'cached'):
+            # 在途请求与已缓存结果都要校验指纹
+            try:
+                await cache.get_or_run('k', detector, 'fp-2')
+                outcomes.append('replayed')
+            except IdempotencyConflict:
+                outcomes.append('conflict')
+            await first
+        value, is_replay = await cache.get_or_run('k', detector, 'fp-1')
+        return outcomes, is_replay, detector.calls, cache.get_stats()
+    
+    outcomes, is_replay, calls, stats = asyncio.run(scenario())
+    print(f"在途/已缓存时内容不同: {outcomes}, 相同内容重放: {is_replay}, 统计 {stats}")
+    assert outcomes == ['conflict', 'conflict'] and is_replay and calls == 1
+    assert stats['conflicts'] == 2
+    print("内容不同的请求被拒绝，不返回其他交易的结果: ✅")
+
+
+async def concurrent_duplicates(cache, detector, count):
+    return await asyncio.gather(*[cache.get_or_run('k', detector) for _ in range(count)],
+                                return_exceptions=True)
+
+
+def test_single_flight():
+    """测试并发到达的重复请求合并为一次检测"""
+    print("\n[测试2] 并发重复请求...")
+    cache = IdempotencyCache(ttl_seconds=60)
+    detector = CountingDetector()
+    results = asyncio.run(concurrent_duplicates(cache, detector, 20))
+    replayed = sum(1 for _, is_replay in results if is_replay)
+    print(f"20 个并发重复请求: 执行检测 {detector.calls} 次, 重放 {replayed} 个, 统计 {cache.get_stats()}")
+    assert detector.calls == 1 and replayed == 19
+    assert len({value for value, _ in results}) == 1
+    assert cache.get_stats()['collapsed'] == 19 and cache.get_stats()['inflight'] == 0
+    
+    # 检测失败不缓存：等待者收到同一个异常，之后的重试重新检测
+    cache = IdempotencyCache(ttl_seconds=60)
+    failing = CountingDetector(error=RuntimeError("引擎过载"))
+    results = asyncio.run(concurrent_duplicates(cache, failing, 5))
+    assert failing.calls == 1 and all(isinstance(r, RuntimeError) for r in results)
+    recovered = CountingDetector()
+    value, is_replay = asyncio.run(cache.get_or_run('k', recovered))
+    assert recovered.calls == 1 and not is_replay
+    print("失败结果不缓存，重试重新检测: ✅")
+
+
+async def first_cancelled():
+    """首个请求被取消（客户端断开）时，等待中的重复请求重新执行检测"""
+    cache = IdempotencyCache(ttl_seconds=60)
+    detector = CountingDetector()
+    first = asyncio.create_task(cache.get_or_run('k', detector))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(cache.get_or_run('k', detector))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    value, is_replay = await second
+    return detector.calls, is_replay, cache.get_stats()
+
+
+def test_cancelled_leader():
+    """测试首个请求断开"""
+    print("\n[测试3] 首个请求断开...")
+    calls, is_replay, stats = asyncio.run(first_cancelled())
+    print(f"执行检测 {calls} 次, 统计 {stats}")
+    assert calls == 2 and not is_replay and stats['inflight'] == 0
+    print("等待者接手检测，不会一直挂起: ✅")
+
+
+def test_ttl_and_lru():
+    """测试过期与淘汰"""
+    print("\n[测试4] TTL 与 LRU...")
+    
+    async def scenario():
+        cache = IdempotencyCache(ttl_seconds=0.1)
+        detector = CountingDetector(delay_s=0)
+        await cache.get_or_run('k', detector)
+        _, hit = await cache.get_or_run('k', detector)
+        await asyncio.sleep(0.15)
+        _, expired_hit = await cache.get_or_run('k', detector)
+        ttl_result = (hit, expired_hit, detector.calls)
+        
+        cache = IdempotencyCache(ttl_seconds=60, max_entries=2)
+        detector = CountingDetector(delay_s=0)
+        for key in ('a', 'b', 'a', 'c'):  # 访问 a 后写入 c，淘汰最久未使用的 b
+            await cache.get_or_run(key, detector)
+        calls = detector.calls
+        replays = {key: (await cache.get_or_run(key, detector))[1] for key in ('a', 'c', 'b')}
+        return ttl_result, calls, replays, cache.get_stats()
+    
+    (hit, expired_hit, ttl_calls), calls, replays, stats = asyncio.run(scenario())
+    print(f"TTL 内重放: {hit}, 过期后重放: {expired_hit}, 检测 {ttl_calls} 次")
+    assert hit and not expired_hit and ttl_calls == 2
+    print(f"LRU: 写入 a/b/a/c 检测 {calls} 次, 之后是否重放 {replays}, 统计 {stats}")
+    assert calls == 3 and replays == {'a': True, 'c': True, 'b': False}
+    assert stats['evictions'] == 2  # 写入 c 淘汰 b，重新写入 b 淘汰 a
+    print("过期后重新检测，超出上限淘汰最久未使用的条目: ✅")
+
+
+def test_redis_shared():
+    """测试多 worker 通过 Redis 共享结果"""
+    print("\n[测试5] Redis 共享...")
+    try:
+        import redis
+        client = redis.Redis(host='localhost', port=6379, socket_timeout=0.5)
+        client.ping()
+    except Exception as e:
+        print(f"⚠️  Redis 不可用，跳过: {e}")
+        return
+    
+    prefix = f"fraud:idem:test:{uuid.uuid4().hex[:8]}"
+    worker_a = IdempotencyCache(ttl_seconds=5, redis_client=client, prefix=prefix)
+    worker_b = IdempotencyCache(ttl_seconds=5, redis_client=client, prefix=prefix)
+    detector = CountingDetector(delay_s=0)
+    
+    async def scenario():
+        value, _ = await worker_a.get_or_run('k', detector)
+        deadline = time.time() + 2
+        while not client.exists(f"{prefix}:k") and time.time() < deadline:
+            await asyncio.sleep(0.01)  # Redis 写入在后台线程中完成
+        return value, await worker_b.get_or_run('k', detector)
+    
+    value, (replayed_value, is_replay) = asyncio.run(scenario())
+    print(f"worker B 重放: {is_replay}, 检测 {detector.calls} 次, 统计 {worker_b.get_stats()}")
+    assert is_replay and replayed_value == value and detector.calls == 1
+    assert worker_b.get_stats()['redis_hits'] == 1
+    client.delete(f"{prefix}:k")
+    print("另一个 worker 的重复请求直接返回原结果: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🔁 幂等结果缓存测试")
+    print("=" * 60)
+    
+    test_make_key()
+    test_single_flight()
+    test_cancelled_leader()
+    test_ttl_and_lru()
+    test_fingerprint_conflict()
+    test_redis_shared()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
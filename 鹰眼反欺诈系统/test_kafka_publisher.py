@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kafka结果发布测试脚本（使用进程内 Kafka 替身，无需启动 broker）
+"""
+
+import os
+import sys
+import tempfile
+import time
+from core.extensions.kafka_publisher import KafkaResultPublisher, InMemoryBroker, decode_value
+
+TOPIC = 'fraud_detection_results'
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def user_sequence(broker, user_id):
+    """按分区顺序读取某个用户的结果序号"""
+    return [decode_value(r.value, r.headers)['seq'] for r in broker.records(TOPIC)
+            if r.key == user_id.encode('utf-8')]
+
+
+def test_kafka_publisher():
+    """测试发布、断连暂存、恢复回放"""
+    print("=" * 60)
+    print("📨 Kafka结果发布测试")
+    print("=" * 60)
+    
+    spool_path = os.path.join(tempfile.mkdtemp(), 'kafka_spool.bin')
+    broker = InMemoryBroker(partitions=4)
+    publisher = KafkaResultPublisher(broker.producer, TOPIC, spool_path=spool_path,
+                                     probe_interval_s=0.1)
+    
+    # 测试1: 正常发布
+    print("\n[测试1] 正常发布...")
+    for seq in range(100):
+        publisher.publish(f"user_{seq % 5}", {'seq': seq, 'risk_score': 0.1})
+    stats = publisher.get_stats()
+    print(f"已投递: {stats['delivered']}, 平均消息大小: {stats['avg_bytes']} 字节")
+    assert stats['delivered'] == 100
+    assert len(broker.records(TOPIC)) == 100
+    
+    # 测试2: broker 不可达，结果暂存到本地文件
+    print("\n[测试2] broker 不可达...")
+    broker.available = False
+    start = time.time()
+    for seq in range(100, 300):
+        publisher.publish(f"user_{seq % 5}", {'seq': seq, 'risk_score': 0.1})
+    elapsed_ms = (time.time() - start) * 1000
+    stats = publisher.get_stats()
+    print(f"暂存: {stats['spooled']}, 可用: {stats['healthy']}, 耗时: {elapsed_ms:.1f}ms")
+    assert stats['spooled'] == 200 and not stats['healthy']
+    assert os.path.exists(spool_path)
+    
+    # 测试3: broker 恢复，按原顺序回放
+    print("\n[测试3] broker 恢复...")
+    broker.available = True
+    assert wait_for(lambda: publisher.healthy), "暂存记录未回放完成"
+    for seq in range(300, 400):
+        publisher.publish(f"user_{seq % 5}", {'seq': seq, 'risk_score': 0.1})
+    stats = publisher.get_stats()
+    print(f"回放: {stats['replayed']}, 主题记录数: {len(broker.records(TOPIC))}")
+    assert stats['replayed'] == 200
+    assert len(broker.records(TOPIC)) == 400
+    for user in range(5):
+        sequence = user_sequence(broker, f"user_{user}")
+        assert sequence == sorted(sequence) and len(sequence) == 80, f"user_{user} 顺序错误"
+    print("同一用户的结果顺序: ✅ 一致")
+    publisher.close()
+    
+    # 测试4: 启动时 broker 不可达，重启后回放上次留下的暂存记录
+    print("\n[测试4] 启动时不可达 + 重启回放...")
+    broker = InMemoryBroker(partitions=4)
+    broker.available = False
+    publisher = KafkaResultPublisher(broker.producer, TOPIC, spool_path=spool_path,
+                                     probe_interval_s=0.1)
+    for seq in range(50):
+        publisher.publish('user_0', {'seq': seq})
+    publisher.close()
+    
+    broker.available = True
+    publisher = KafkaResultPublisher(broker.producer, TOPIC, spool_path=spool_path,
+                                     probe_interval_s=0.1)
+    assert wait_for(lambda: publisher.healthy), "重启后未回放暂存记录"
+    print(f"回放: {publisher.get_stats()['replayed']}")
+    assert user_sequence(broker, 'user_0') == list(range(50))
+    assert not os.path.exists(spool_path)
+    publisher.close()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        test_kafka_publisher()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
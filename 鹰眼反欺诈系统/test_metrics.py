@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监控指标测试脚本（文本格式输出、多 worker 指标快照合并、Redis 共享）
+"""
+
+import json
+import re
+import sys
+import uuid
+
+from core.extensions.metrics import DetectionMetrics, merge_worker_families, render_families
+
+
+def sample_values(text, name):
+    """解析文本格式中某个序列的 {标签串: 数值}"""
+    return {
+        labels: float(value)
+        for labels, value in re.findall(rf'^{name}\{{(.*)\}} (\S+)$', text, re.M)
+    }
+
+
+def new_worker(requests):
+    """模拟一个 worker 的指标集"""
+    metrics = DetectionMetrics()
+    for _ in range(requests):
+        metrics.count_request('/detect', 200)
+    metrics.stage('gnn').observe(0.002)
+    metrics.gauge('fraud_queue_depth', '等待处理的请求数', lambda: {('admission',): requests}, ('queue',))
+    return metrics
+
+
+def test_render():
+    """测试单进程输出"""
+    print("\n[测试1] 单进程输出...")
+    text = new_worker(3).render()
+    assert sample_values(text, 'fraud_api_requests_total') == {'endpoint="/detect",status="200"': 3}
+    assert 'fraud_stage_latency_seconds_bucket{stage="gnn",le="+Inf"} 1' in text
+    print("计数与直方图: ✅")
+
+
+def test_merge_workers():
+    """测试多个 worker 的快照合并"""
+    print("\n[测试2] 多 worker 合并...")
+    # 快照经 JSON 存入共享存储，这里同样往返一次
+    snapshots = [
+        json.loads(json.dumps({'worker': worker, 'families': new_worker(count).collect()}))
+        for worker, count in (('w2', 5), ('w1', 2))
+    ]
+    text = render_families(merge_worker_families(snapshots))
+    print(text.splitlines()[2])
+    
+    # 每个指标只输出一次 HELP/TYPE，样本按 worker 标签区分
+    assert text.count('# TYPE fraud_api_requests_total counter') == 1
+    assert sample_values(text, 'fraud_api_requests_total') == {
+        'worker="w1",endpoint="/detect",status="200"': 2,
+        'worker="w2",endpoint="/detect",status="200"': 5
+    }
+    assert sample_values(text, 'fraud_queue_depth') == {
+        'worker="w1",queue="admission"': 2,
+        'worker="w2",queue="admission"': 5
+    }
+    assert 'fraud_stage_latency_seconds_count{worker="w2",stage="gnn"} 1' in text
+    print("各 worker 的计数分别输出，不随抓取落到的 worker 变化: ✅")
+
+
+def test_redis_shared():
+    """测试经 Redis 共享指标快照"""
+    print("\n[测试3] Redis 共享...")
+    try:
+        import redis
+        client = redis.Redis(host='localhost', port=6379, socket_timeout=0.5, decode_responses=True)
+        client.ping()
+    except Exception as e:
+        print(f"⚠️  Redis 不可用，跳过: {e}")
+        return
+    
+    from core.extensions.shared_state import RedisStateStore
+    store = RedisStateStore(client, prefix=f"fraud:state:test:{uuid.uuid4().hex[:8]}")
+    store.publish_metrics('w1', new_worker(2).collect())
+    store.publish_metrics('w2', new_worker(5).collect())
+    text = render_families(merge_worker_families(store.collect_metrics()))
+    assert len(sample_values(text, 'fraud_api_requests_total')) == 2
+    for key in client.scan_iter(match=f"{store.prefix}:*"):
+        client.delete(key)
+    print("两个 worker 的快照均可读取: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("📈 监控指标测试")
+    print("=" * 60)
+    
+    test_render()
+    test_merge_workers()
+    test_redis_shared()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
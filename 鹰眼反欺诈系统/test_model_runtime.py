@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GNN 推理运行时测试脚本（权重保存/加载、导出件与 eager 模式输出一致、权重指纹不一致与加载失败时回退到 eager）
+
+依赖 torch 与 torch_geometric，未安装时跳过；ONNX 部分另需 onnx 与 onnxruntime
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torch_geometric')
+
+import numpy as np
+
+from core.extensions import model_runtime
+from core.extensions.embedding_cache import model_fingerprint
+from core.fraud_detection_engine import GNN_INPUT_DIM, GraphNeuralNetworkDetector
+
+
+def new_model(seed):
+    torch.manual_seed(seed)
+    return GraphNeuralNetworkDetector(GNN_INPUT_DIM).eval()
+
+
+def runtime_config(backend, **paths):
+    return {'runtime': {'backend': backend}, **paths}
+
+
+def test_weights_roundtrip():
+    """测试权重保存后加载到另一个模型，输出与权重指纹一致"""
+    print("\n[测试1] 权重保存/加载...")
+    trained, fresh = new_model(1), new_model(2)
+    assert model_fingerprint(trained) != model_fingerprint(fresh)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'gnn.pt')
+        assert not model_runtime.load_weights(fresh, path), "文件不存在时应返回 False"
+        model_runtime.save_weights(trained, path)
+        assert model_runtime.load_weights(fresh, path)
+        assert model_fingerprint(fresh) == model_fingerprint(trained)
+        
+        # 也接受直接保存的 state_dict
+        other = new_model(3)
+        torch.save(trained.state_dict(), os.path.join(tmp, 'raw.pt'))
+        assert model_runtime.load_weights(other, os.path.join(tmp, 'raw.pt'))
+        assert model_fingerprint(other) == model_fingerprint(trained)
+    
+    graphs = model_runtime.parity_graphs(GNN_INPUT_DIM)
+    deviation = model_runtime.max_deviation(model_runtime.EagerRuntime(trained),
+                                            model_runtime.EagerRuntime(fresh), graphs)
+    print(f"加载后与原模型的输出偏差 {deviation:.1e}")
+    assert deviation == 0.0
+    print("加载后权重指纹与输出均一致: ✅")
+
+
+def test_exported_parity():
+    """测试导出件与 eager 模式输出一致（含边权重），load_runtime 采用导出件"""
+    print("\n[测试2] 导出件一致性...")
+    model = new_model(1)
+    eager = model_runtime.EagerRuntime(model)
+    graphs = model_runtime.parity_graphs(GNN_INPUT_DIM, seed=5)
+    with tempfile.TemporaryDirectory() as tmp:
+        ts_path = os.path.join(tmp, 'gnn_ts.pt')
+        model_runtime.export_torchscript(model, ts_path, GNN_INPUT_DIM)
+        runtime = model_runtime.load_runtime(model, runtime_config('torchscript', torchscript_model=ts_path),
+                                             GNN_INPUT_DIM)
+        deviation = model_runtime.max_deviation(eager, runtime, graphs)
+        print(f"torchscript: 偏差 {deviation:.1e}")
+        assert runtime.backend == 'torchscript' and deviation < 1e-4
+        
+        if not (model_runtime.ONNXRUNTIME_AVAILABLE and importlib.util.find_spec('onnx')):
+            print("⚠️  onnx / onnxruntime 未安装，跳过 ONNX")
+        else:
+            onnx_path = os.path.join(tmp, 'gnn.onnx')
+            model_runtime.export_onnx(model, onnx_path, GNN_INPUT_DIM)
+            runtime = model_runtime.load_runtime(model, runtime_config('onnx', onnx_model=onnx_path),
+                                                 GNN_INPUT_DIM)
+            deviation = model_runtime.max_deviation(eager, runtime, graphs)
+            print(f"onnx: 偏差 {deviation:.1e}")
+            assert runtime.backend == 'onnx' and deviation < 1e-4
+    
+    runtime = model_runtime.load_runtime(model, runtime_config('int8'), GNN_INPUT_DIM)
+    delta = model_runtime.max_probability_delta(eager, runtime, graphs)
+    print(f"int8: 欺诈概率偏差 {delta:.1e}")
+    assert runtime.backend == 'int8' and delta < 0.02
+    
+    # 嵌入缓存命中时的分类层：int8 运行时使用量化后的分类层，与其完整推理一致
+    x, edge_index, edge_weight = graphs[3]
+    embeddings, log_probs = runtime.run(x, edge_index, edge_weight)
+    int8_probs = runtime.classifier_head(model).predict(embeddings)
+    float_probs = eager.classifier_head(model).predict(embeddings)
+    print(f"int8 分类层: 与完整推理偏差 {np.abs(int8_probs - np.exp(log_probs[:, 1])).max():.1e}, "
+          f"与 float 分类层偏差 {np.abs(int8_probs - float_probs).max():.1e}")
+    assert np.allclose(int8_probs, np.exp(log_probs[:, 1]), atol=1e-5)
+    assert not np.array_equal(int8_probs, float_probs), "int8 运行时的分类层应为量化后的权重"
+    print("导出件与 eager 模式输出一致: ✅")
+
+
+def test_fingerprint_mismatch():
+    """测试导出件的权重指纹与当前权重不一致时回退到 eager"""
+    print("\n[测试3] 权重指纹不一致...")
+    exported, current = new_model(1), new_model(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'gnn_ts.pt')
+        model_runtime.export_torchscript(exported, path, GNN_INPUT_DIM)
+        assert model_runtime.TorchScriptRuntime(path).fingerprint == model_fingerprint(exported)
+        runtime = model_runtime.load_runtime(current, runtime_config('torchscript', torchscript_model=path),
+                                             GNN_INPUT_DIM)
+    print(f"旧权重的导出件 → {runtime.backend}")
+    assert runtime.backend == 'eager' and runtime.model is current
+    print("导出件对应旧权重时使用 eager 模式: ✅")
+
+
+def test_eager_fallback():
+    """测试导出件缺失、未知后端、输出偏差超限时回退到 eager"""
+    print("\n[测试4] 回退到 eager...")
+    model = new_model(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = {
+            '导出件不存在': runtime_config('torchscript', torchscript_model=os.path.join(tmp, 'missing.pt')),
+            '未知后端': runtime_config('tensorrt'),
+            # 量化必然带来偏差，上限为 0 时校验不通过
+            '偏差超限': {'runtime': {'backend': 'int8', 'int8_max_prob_delta': 0.0}}
+        }
+        if model_runtime.ONNXRUNTIME_AVAILABLE:
+            cases['ONNX 导出件不存在'] = runtime_config('onnx', onnx_model=os.path.join(tmp, 'missing.onnx'))
+        for name, cfg in cases.items():
+            runtime = model_runtime.load_runtime(model, cfg, GNN_INPUT_DIM)
+            print(f"{name}: {runtime.backend}")
+            assert runtime.backend == 'eager'
+    
+    # 回退后的 eager 运行时正常推理；未提供边权重时与权重全为 1 等价
+    x, edge_index, _ = model_runtime.parity_graphs(GNN_INPUT_DIM)[3]
+    embedding = runtime.embed(x, edge_index)
+    assert np.allclose(embedding, runtime.embed(x, edge_index, model_runtime.unit_weights(edge_index)))
+    print("加载失败或校验不通过时使用 eager 模式: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("⚙️ GNN 推理运行时测试")
+    print("=" * 60)
+    
+    test_weights_roundtrip()
+    test_exported_parity()
+    test_fingerprint_mismatch()
+    test_eager_fallback()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测阶段依赖图测试脚本（拓扑校验、并发执行、提前结束、异常传播、线程池占满）
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.extensions.stage_graph import ShortCircuit, Stage, StageGraph
+
+
+class Recorder:
+    """记录各阶段是否执行的阶段函数工厂"""
+    
+    def __init__(self):
+        self.called = []
+        self._lock = threading.Lock()
+    
+    def stage(self, name, deps=(), sleep_s=0.0, output=None, error=None, inline=False):
+        def fn(outputs):
+            with self._lock:
+                self.called.append(name)
+            missing = [dep for dep in deps if dep not in outputs]
+            assert not missing, f"{name} 执行时依赖 {missing} 尚未完成"
+            if sleep_s:
+                time.sleep(sleep_s)
+            if error is not None:
+                raise error
+            return output if output is not None else f"{name}_out"
+        return Stage(name, fn, deps, inline)
+
+
+def expect_error(stages, message):
+    try:
+        StageGraph(stages)
+    except ValueError as e:
+        assert message in str(e), str(e)
+        return str(e)
+    raise AssertionError(f"应当抛出 ValueError: {message}")
+
+
+def test_topology():
+    """测试依赖排序与校验"""
+    print("\n[测试1] 拓扑校验...")
+    r = Recorder()
+    graph = StageGraph([r.stage('fusion', ['gnn', 'vpn']), r.stage('gnn', ['env']),
+                        r.stage('vpn'), r.stage('env')])
+    order = [stage.name for stage in graph.stages]
+    print(f"排序: {order}")
+    assert order.index('env') < order.index('gnn') < order.index('fusion')
+    assert order.index('vpn') < order.index('fusion')
+    
+    print(expect_error([r.stage('a'), r.stage('a')], "阶段重名"))
+    print(expect_error([r.stage('a', ['missing'])], "依赖未知阶段"))
+    print(expect_error([r.stage('a', ['c']), r.stage('b', ['a']), r.stage('c', ['b'])], "阶段依赖成环"))
+    
+    run = graph.run()
+    assert not run.errors and r.called.index('env') < r.called.index('gnn') < r.called.index('fusion')
+    print("按依赖顺序执行，重名/未知依赖/成环在构建时拒绝: ✅")
+
+
+def test_parallel():
+    """测试互不依赖的阶段并发执行"""
+    print("\n[测试2] 并发执行...")
+    
+    def stages(r):
+        return [r.stage(name, sleep_s=0.05) for name in ('env', 'gnn', 'vpn', 'device')] + \
+            [r.stage('fusion', ['env', 'gnn', 'vpn', 'device'])]
+    
+    sequential = StageGraph(stages(Recorder()))
+    start = time.perf_counter()
+    sequential.run()
+    sequential_ms = (time.perf_counter() - start) * 1000
+    
+    executor = ThreadPoolExecutor(max_workers=4)
+    r = Recorder()
+    parallel = StageGraph(stages(r), executor)
+    start = time.perf_counter()
+    run = parallel.run()
+    parallel_ms = (time.perf_counter() - start) * 1000
+    executor.shutdown()
+    print(f"顺序 {sequential_ms:.0f}ms, 并发 {parallel_ms:.0f}ms, 阶段耗时 {run.timings_ms}")
+    assert sequential_ms >= 200 and parallel_ms < 150
+    assert r.called[-1] == 'fusion' and run.outputs['fusion'] == 'fusion_out'
+    assert set(run.timings_ms) == {'env', 'gnn', 'vpn', 'device', 'fusion'}
+    print("耗时接近最慢的阶段，融合阶段在全部依赖完成后执行: ✅")
+
+
+def test_short_circuit():
+    """测试阶段返回 ShortCircuit 后跳过其余阶段"""
+    print("\n[测试3] 提前结束...")
+    r = Recorder()
+    block = ShortCircuit('ip_blacklist')
+    graph = StageGraph([r.stage('blacklist', output=block), r.stage('gnn'), r.stage('vpn'),
+                        r.stage('fusion', ['gnn', 'vpn'])])
+    run = graph.run()
+    print(f"执行: {r.called}, 跳过: {run.skipped}, 原因: {run.short_circuit.reason}")
+    assert r.called == ['blacklist'] and run.short_circuit is block
+    assert run.skipped == ['gnn', 'vpn', 'fusion'] and 'fusion' not in run.outputs
+    
+    # 线程池模式：下游阶段不执行；已提交的并行阶段照常完成
+    executor = ThreadPoolExecutor(max_workers=4)
+    r = Recorder()
+    graph = StageGraph([r.stage('blacklist', output=block, inline=True), r.stage('env', sleep_s=0.03),
+                        r.stage('gnn', ['blacklist']), r.stage('fusion', ['env', 'gnn'])], executor)
+    run = graph.run()
+    executor.shutdown()
+    print(f"线程池模式 执行: {sorted(r.called)}, 跳过: {run.skipped}")
+    assert sorted(r.called) == ['blacklist', 'env'] and sorted(run.skipped) == ['fusion', 'gnn']
+    print("命中后跳过下游阶段: ✅")
+
+
+def test_saturated_pool():
+    """测试线程池名额用尽时阶段在调用线程执行，不排在其他请求之后"""
+    print("\n[测试5] 并发请求共用线程池...")
+    
+    def concurrent_runs(max_offload):
+        executor = ThreadPoolExecutor(max_workers=1)
+        r = Recorder()
+        graph = StageGraph([r.stage('gnn', sleep_s=0.05), r.stage('vpn', sleep_s=0.05)],
+                           executor, max_offload=max_offload)
+        elapsed = []
+        
+        def request():
+            start = time.perf_counter()
+            run = graph.run()
+            assert not run.errors and set(run.outputs) == {'gnn', 'vpn'}
+            elapsed.append((time.perf_counter() - start) * 1000)
+        
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        executor.shutdown()
+        # 名额在阶段完成后归还
+        assert len(r.called) == 8 and graph._offloaded == 0
+        return max(elapsed)
+    
+    # 不限名额：4 个请求各提交 1 个阶段到单线程池，最后一个请求等待前 3 个阶段
+    queued_ms = concurrent_runs(None)
+    limited_ms = concurrent_runs(1)
+    print(f"最慢请求：排队 {queued_ms:.0f}ms, 名额用尽后在调用线程执行 {limited_ms:.0f}ms")
+    assert queued_ms >= 180 and limited_ms < 150
+    print("线程池占满时不排队，最慢请求不超过各阶段顺序执行的耗时: ✅")
+
+
+def test_errors():
+    """测试阶段异常不中断其他阶段，依赖失败阶段的阶段不执行"""
+    print("\n[测试4] 异常传播...")
+    for executor in (None, ThreadPoolExecutor(max_workers=4)):
+        r = Recorder()
+        failure = RuntimeError('模型推理失败')
+        graph = StageGraph([r.stage('env'), r.stage('gnn', ['env'], error=failure), r.stage('vpn'),
+                            r.stage('fusion', ['gnn', 'vpn']), r.stage('report', ['fusion'])], executor)
+        run = graph.run()
+        mode = '线程池' if executor else '顺序'
+        print(f"{mode}: 执行 {sorted(r.called)}, 失败 {sorted(run.errors)}")
+        assert sorted(r.called) == ['env', 'gnn', 'vpn']
+        assert run.errors['gnn'] is failure and 'vpn' in run.outputs
+        assert '依赖阶段失败' in str(run.errors['fusion']) and '依赖阶段失败' in str(run.errors['report'])
+        try:
+            run.raise_first_error()
+            raise AssertionError("应当抛出阶段异常")
+        except RuntimeError as e:
+            assert e is failure
+        if executor is not None:
+            executor.shutdown()
+    
+    # 已知输出（如批量共享的环境检测结果）对应的阶段不再执行
+    r = Recorder()
+    run = StageGraph([r.stage('env'), r.stage('gnn', ['env'])]).run({'env': 'shared'})
+    assert r.called == ['gnn'] and run.outputs['env'] == 'shared'
+    print("失败沿依赖传播到所有下游阶段，无关阶段照常完成: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🧩 检测阶段依赖图测试")
+    print("=" * 60)
+    
+    test_topology()
+    test_parallel()
+    test_short_circuit()
+    test_errors()
+    test_saturated_pool()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kafka 流式检测 worker 测试脚本（使用进程内 Kafka 替身，无需启动 broker）
+"""
+
+import json
+import sys
+import threading
+import time
+
+from core.extensions.kafka_publisher import KafkaResultPublisher, InMemoryBroker, decode_value
+from core.extensions.stream_consumer import DetectionStreamWorker
+from core.fraud_detection_engine_lite import FraudDetectionEngine
+
+REQUESTS = 'fraud_detection_requests'
+RESULTS = 'fraud_detection_results'
+GROUP = 'fraud_detection_group'
+
+
+def produce_requests(broker, start, count, users=40):
+    for seq in range(start, start + count):
+        user_id = f"user_{seq % users}"
+        request = {'request_id': seq, 'user_id': user_id, 'ip': f'10.0.{seq % 7}.1',
+                   'device_id': f'dev_{seq % users}', 'amount': 100.0 + seq % 50}
+        broker.append(REQUESTS, user_id.encode('utf-8'),
+                      json.dumps(request).encode('utf-8'), [('content-type', b'application/json')])
+
+
+def new_worker(engine, requests_broker, results_broker):
+    publisher = KafkaResultPublisher(results_broker.producer, RESULTS, spool_path=None,
+                                     probe_interval_s=0.1)
+    return DetectionStreamWorker(
+        engine,
+        lambda: requests_broker.consumer(REQUESTS, group_id=GROUP, max_poll_records=200),
+        publisher,
+        poll_timeout_ms=10,
+        retry_backoff_s=0.05,
+        stats_interval_s=0
+    )
+
+
+class FlakyEngine:
+    """按 request_id 让检测失败指定次数（-1 为一直失败）的引擎包装"""
+    
+    def __init__(self, engine, failures):
+        self.engine = engine
+        self.failures = dict(failures)
+    
+    def detect_batch(self, transactions):
+        results = self.engine.detect_batch(transactions)
+        for i, transaction in enumerate(transactions):
+            remaining = self.failures.get(transaction['request_id'], 0)
+            if remaining:
+                self.failures[transaction['request_id']] = remaining - 1
+                results[i] = RuntimeError(f"模型推理失败 {transaction['request_id']}")
+        return results
+
+
+class PublishingEngine:
+    """自带结果发布器、在 detect_batch 中自行发布的引擎包装（同完整版引擎）"""
+    
+    def __init__(self, engine, publisher):
+        self.engine = engine
+        self.kafka_publisher = publisher
+    
+    def detect_batch(self, transactions, publish=True):
+        results = self.engine.detect_batch(transactions)
+        if publish:
+            for result in results:
+                self.kafka_publisher.publish(result.user_id, result.to_dict())
+        return results
+
+
+def result_ids(broker):
+    return [decode_value(r.value, r.headers)['request_id'] for r in broker.records(RESULTS)]
+
+
+def run_until(workers, condition, timeout=10.0):
+    threads = [threading.Thread(target=w.run, daemon=True) for w in workers]
+    for t in threads:
+        t.start()
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    for w in workers:
+        w.stop()
+    for t in threads:
+        t.join()
+    return condition()
+
+
+def test_stream_worker():
+    print("=" * 60)
+    print("🌊 Kafka 流式检测 worker 测试")
+    print("=" * 60)
+    
+    engine = FraudDetectionEngine('config/config.yaml')
+    
+    # 测试1: 两个 worker 同组消费，分区均分，每个用户的结果按请求顺序发布
+    print("\n[测试1] 两个 worker 同组消费...")
+    requests_broker, results_broker = InMemoryBroker(partitions=8), InMemoryBroker(partitions=8)
+    produce_requests(requests_broker, 0, 2000)
+    workers = [new_worker(engine, requests_broker, results_broker) for _ in range(2)]
+    for w in workers:
+        w.consumer = w.consumer_factory()  # 先全部加入消费组，避免首轮再均衡导致重复消费
+    start = time.time()
+    assert run_until(workers, lambda: len(results_broker.records(RESULTS)) >= 2000), "结果未全部发布"
+    elapsed = time.time() - start
+    assignments = [len(w.consumer.assignment()) for w in workers]
+    print(f"分区分配: {assignments}, 2000 条耗时 {elapsed * 1000:.0f}ms "
+          f"({2000 / elapsed:.0f} 条/秒)")
+    assert assignments == [4, 4]
+    ids = result_ids(results_broker)
+    assert sorted(ids) == list(range(2000)), "结果缺失或重复"
+    for user in range(40):
+        sequence = [i for i in ids if i % 40 == user]
+        assert sequence == sorted(sequence), f"user_{user} 结果顺序错误"
+    print("同一用户的结果顺序: ✅ 一致")
+    for w in workers:
+        w.close()
+    
+    # 测试2: 结果无法持久化时不提交位点，恢复后从批次起点重新消费
+    print("\n[测试2] 结果主题不可达（无暂存文件）...")
+    requests_broker, results_broker = InMemoryBroker(partitions=4), InMemoryBroker(partitions=4)
+    produce_requests(requests_broker, 0, 100)
+    worker = new_worker(engine, requests_broker, results_broker)
+    results_broker.available = False
+    assert worker.run_once() == 0
+    tps = sorted(worker.consumer.assignment())
+    committed = [requests_broker.committed(GROUP, tp) for tp in tps]
+    print(f"提交位点: {committed}, 回退重新消费: {worker.get_stats()['redelivered']} 条")
+    assert committed == [None] * len(tps)
+    
+    results_broker.available = True
+    deadline = time.time() + 5
+    while not worker.publisher.healthy and time.time() < deadline:
+        time.sleep(0.02)
+    while worker.run_once():
+        pass
+    committed = sum(requests_broker.committed(GROUP, tp) or 0 for tp in tps)
+    print(f"恢复后: 已发布 {len(results_broker.records(RESULTS))} 条, 已提交 {committed} 条")
+    assert committed == 100 and sorted(result_ids(results_broker)) == list(range(100))
+    worker.close()
+    
+    # 测试3: 消费中途加入新成员：再均衡前未提交的批次提交失败，由新成员重新消费（至少一次）
+    print("\n[测试3] 消费中途再均衡...")
+    requests_broker, results_broker = InMemoryBroker(partitions=4), InMemoryBroker(partitions=4)
+    produce_requests(requests_broker, 0, 400)
+    first = new_worker(engine, requests_broker, results_broker)
+    first.consumer = first.consumer_factory()
+    batches = first.consumer.poll(max_records=200)
+    second = new_worker(engine, requests_broker, results_broker)
+    second.consumer = second.consumer_factory()
+    for records in batches.values():
+        first._process_partition(records)
+    first.publisher.flush()
+    try:
+        first.consumer.commit()
+        raise AssertionError("再均衡后的提交应当失败")
+    except RuntimeError as e:
+        print(f"旧成员提交失败: {e}")
+    while first.run_once() + second.run_once():
+        pass
+    ids = result_ids(results_broker)
+    print(f"发布 {len(ids)} 条（其中重复 {len(ids) - len(set(ids))} 条）")
+    assert set(ids) == set(range(400))
+    first.close()
+    second.close()
+    
+    # 测试4: 无效消息跳过并计数，位点照常提交
+    print("\n[测试4] 无效消息...")
+    requests_broker, results_broker = InMemoryBroker(partitions=2), InMemoryBroker(partitions=2)
+    requests_broker.append(REQUESTS, b'user_x', b'not json', None)
+    produce_requests(requests_broker, 0, 10)
+    worker = new_worker(engine, requests_broker, results_broker)
+    while worker.run_once():
+        pass
+    stats = worker.get_stats()
+    print(f"无效: {stats['invalid']}, 评分: {stats['scored']}, 提交: {stats['commits']} 次")
+    assert stats['invalid'] == 1 and stats['scored'] == 10
+    worker.close()
+    
+    # 测试5: 检测失败的记录不提交位点，重新消费；恢复后发布真实结果，一直失败的发布错误结果
+    print("\n[测试5] 检测失败...")
+    requests_broker, results_broker = InMemoryBroker(partitions=2), InMemoryBroker(partitions=2)
+    produce_requests(requests_broker, 0, 6)
+    flaky = FlakyEngine(engine, {i: 1 for i in range(6)})
+    worker = new_worker(flaky, requests_broker, results_broker)
+    assert worker.run_once() == 0
+    tps = sorted(worker.consumer.assignment())
+    committed = [requests_broker.committed(GROUP, tp) for tp in tps]
+    print(f"首次全部失败: 提交位点 {committed}, 已发布 {len(results_broker.records(RESULTS))} 条")
+    assert committed == [None] * len(tps) and not results_broker.records(RESULTS)
+    assert worker.run_once() == 6
+    assert sorted(result_ids(results_broker)) == list(range(6))
+    assert sum(requests_broker.committed(GROUP, tp) for tp in tps) == 6
+    print("重新消费后: ✅ 6 条真实结果已发布并提交")
+    worker.close()
+    
+    requests_broker, results_broker = InMemoryBroker(partitions=2), InMemoryBroker(partitions=2)
+    produce_requests(requests_broker, 0, 6)
+    worker = new_worker(FlakyEngine(engine, {3: -1}), requests_broker, results_broker)
+    rounds = [worker.run_once() for _ in range(worker.max_attempts)]
+    tps = sorted(worker.consumer.assignment())
+    results = [decode_value(r.value, r.headers) for r in results_broker.records(RESULTS)]
+    errors = [r for r in results if r.get('status') == 'failed']
+    stats = worker.get_stats()
+    print(f"一直失败: 各轮提交 {rounds}, 重试 {stats['retried']} 次, 错误结果 {errors}")
+    assert sum(requests_broker.committed(GROUP, tp) for tp in tps) == 6
+    assert [r['request_id'] for r in errors] == [3] and stats['failed'] == 1
+    assert stats['retried'] == worker.max_attempts - 1
+    assert set(r['request_id'] for r in results) == set(range(6))
+    worker.close()
+    
+    # 测试6: 复用引擎自带的发布器时，结果只由 worker 发布一次且带 request_id
+    print("\n[测试6] 复用引擎发布器...")
+    requests_broker, results_broker = InMemoryBroker(partitions=2), InMemoryBroker(partitions=2)
+    produce_requests(requests_broker, 0, 20)
+    publisher = KafkaResultPublisher(results_broker.producer, RESULTS, spool_path=None)
+    worker = DetectionStreamWorker.from_config(
+        PublishingEngine(engine, publisher), {},
+        consumer_factory=lambda: requests_broker.consumer(REQUESTS, group_id=GROUP)
+    )
+    assert worker.engine_publishes and worker.publisher is publisher
+    assert worker.run_once() == 20
+    ids = result_ids(results_broker)
+    print(f"已发布 {len(ids)} 条，request_id 齐全: {sorted(ids) == list(range(20))}")
+    assert sorted(ids) == list(range(20))
+    worker.close()
+    publisher.close()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        test_stream_worker()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
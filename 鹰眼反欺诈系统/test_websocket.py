@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket 检测通道测试脚本（请求 id 关联、422 错误回复、在途上限暂停读取）
+
+直接以 ASGI 消息驱动 /ws，不启动服务器
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'core'))
+
+import api_server
+
+
+class GatedEngine:
+    """检测在 gate 打开前挂起的引擎，用于让请求停留在途"""
+    
+    def __init__(self, engine, max_in_flight):
+        self.engine = engine
+        self.config = {'performance': {'websocket': {'max_in_flight': max_in_flight}}}
+        self.gate = asyncio.Event()
+        self.started = 0
+    
+    async def detect_async(self, transaction):
+        self.started += 1
+        await self.gate.wait()
+        return await self.engine.detect_async(transaction)
+
+
+class WebSocketClient:
+    """ASGI websocket 会话：inbound 为客户端发出的消息，outbound 为服务端发出的消息"""
+    
+    def __init__(self):
+        self.inbound = asyncio.Queue()
+        self.outbound = asyncio.Queue()
+        self.task = None
+    
+    async def connect(self):
+        scope = {
+            'type': 'websocket', 'asgi': {'version': '3.0'}, 'scheme': 'ws',
+            'path': '/ws', 'raw_path': b'/ws', 'root_path': '', 'query_string': b'',
+            'headers': [], 'client': ('test', 50000), 'server': ('test', 80), 'subprotocols': []
+        }
+        await self.inbound.put({'type': 'websocket.connect'})
+        self.task = asyncio.create_task(api_server.app(scope, self.inbound.get, self.outbound.put))
+        message = await asyncio.wait_for(self.outbound.get(), 5)
+        assert message['type'] == 'websocket.accept', message
+    
+    async def send(self, payload):
+        await self.inbound.put({'type': 'websocket.receive', 'text': json.dumps(payload)})
+    
+    async def receive(self, count):
+        replies = []
+        for _ in range(count):
+            message = await asyncio.wait_for(self.outbound.get(), 10)
+            replies.append(json.loads(message['text']))
+        return replies
+    
+    async def close(self):
+        await self.inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+def transaction(user_id, request_id):
+    return {'id': request_id, 'user_id': user_id, 'amount': 100.0,
+            'ip': '10.0.0.1', 'device_id': f'dev_{user_id}'}
+
+
+def run_session(scenario, max_in_flight=64):
+    """在测试引擎上运行一个 websocket 会话"""
+    engine = api_server.FraudDetectionEngine('config/config.yaml')
+    
+    async def main():
+        gated = GatedEngine(engine, max_in_flight)
+        api_server.detection_engine = gated
+        client = WebSocketClient()
+        await client.connect()
+        try:
+            await scenario(client, gated)
+        finally:
+            await client.close()
+    
+    try:
+        asyncio.run(main())
+    finally:
+        api_server.detection_engine = None
+
+
+def test_id_correlation():
+    """测试结果按 id 关联"""
+    print("\n[测试1] 请求 id 关联...")
+    
+    async def scenario(client, engine):
+        engine.gate.set()
+        # 单帧多笔（JSON 数组）与单帧单笔混合发送
+        await client.send([transaction('u1', 'a'), transaction('u2', 'b')])
+        await client.send(transaction('u3', 'c'))
+        replies = {reply['id']: reply for reply in await client.receive(3)}
+        assert set(replies) == {'a', 'b', 'c'}, replies
+        assert {reply['result']['user_id'] for reply in replies.values()} == {'u1', 'u2', 'u3'}
+        assert replies['c']['result']['user_id'] == 'u3'
+    
+    run_session(scenario)
+    print("每个结果带原请求 id: ✅")
+
+
+def test_error_replies():
+    """测试格式错误返回 422"""
+    print("\n[测试2] 422 错误回复...")
+    
+    async def scenario(client, engine):
+        engine.gate.set()
+        await client.send({'id': 'bad', 'amount': 'x'})
+        (reply,) = await client.receive(1)
+        print(f"字段错误: {reply}")
+        assert reply['id'] == 'bad' and reply['status'] == 422 and 'error' in reply
+        
+        await client.inbound.put({'type': 'websocket.receive', 'text': '{not json'})
+        (reply,) = await client.receive(1)
+        assert reply['id'] is None and reply['status'] == 422
+        
+        # 错误不影响同一连接上的后续请求
+        await client.send(transaction('u1', 'ok'))
+        (reply,) = await client.receive(1)
+        assert reply['id'] == 'ok' and 'result' in reply
+        assert engine.started == 1
+    
+    run_session(scenario)
+    print("错误请求回复 422，连接继续可用: ✅")
+
+
+def test_backpressure():
+    """测试达到在途上限后暂停读取"""
+    print("\n[测试3] 在途上限暂停读取...")
+    
+    async def scenario(client, engine):
+        for i in range(5):
+            await client.send(transaction(f'u{i}', i))
+        await asyncio.sleep(0.2)
+        
+        # 2 笔在途；第 3 帧已读出并等待名额，其余 2 帧留在连接中未被读取
+        print(f"已开始检测 {engine.started} 笔，未读取 {client.inbound.qsize()} 帧")
+        assert engine.started == 2
+        assert client.inbound.qsize() == 2
+        
+        engine.gate.set()
+        replies = await client.receive(5)
+        assert sorted(reply['id'] for reply in replies) == list(range(5))
+        assert client.inbound.qsize() == 0
+    
+    run_session(scenario, max_in_flight=2)
+    print("结果发出后释放名额，继续读取: ✅")
+
+
+def run_all_tests():
+    print("=" * 60)
+    print("🔌 WebSocket 检测通道测试")
+    print("=" * 60)
+    
+    test_id_correlation()
+    test_error_replies()
+    test_backpressure()
+    
+    print("\n✅ 测试完成！")
+
+
+if __name__ == "__main__":
+    try:
+        run_all_tests()
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)